@@ -1,13 +1,24 @@
 from flask import Flask
 import threading
-from app.src.monitor_cam import create_status_listener
-from app.src.sqllite import init_db, init_task_table
+from app.src.monitor_cam import create_status_listener, fleet_view
+from app.src.sqllite import init_db, init_task_table, init_scan_tables, init_archive_tables
+from app.src.spy_blocker.vendor_db import vendor_db
+from app.src.record_control import command_analytics, task_retention
+from app.src.api_response import FastJSONProvider
+from app.src.metrics import RequestMetrics
+from app.src.logger import configure_logging
 
 def create_app():
+    # 结构化日志（LOG_LEVEL / LOG_FORMAT / LOG_SAMPLING），由后台线程写出
+    configure_logging()
     app = Flask(__name__)
+    # jsonify 使用快速JSON序列化（安装了 orjson 时）
+    app.json = FastJSONProvider(app)
 
     from .routes import main
     app.register_blueprint(main)
+    # 按路由统计请求耗时、状态码和响应大小（/metrics），并记录慢请求
+    app.extensions['request_metrics'] = RequestMetrics(app)
 
     # 在应用上下文中执行初始化任务，确保Flask应用已正确配置
     with app.app_context():
@@ -16,7 +27,12 @@ def create_app():
         try:
             init_db()  # 初始化设备表
             init_task_table()  # 初始化任务表
+            init_scan_tables()  # 初始化扫描历史表
+            init_archive_tables()  # 初始化任务归档汇总表
             print("✅ 数据库初始化完成")
+            restored = command_analytics.bootstrap()
+            print(f"✅ 已从最近 {restored} 条任务记录恢复命令时延统计")
+            print(f"✅ 设备列表视图已加载 {fleet_view.load()} 台设备")
         except Exception as e:
             print(f"❌ 数据库初始化失败: {e}")
         # --- 初始化数据库 ---
@@ -27,4 +43,12 @@ def create_app():
         print("✅ 摄像头状态监听器已在后台启动")
         # --- 后台线程启动状态监听器 ---
 
+        # --- 厂商数据库热更新 ---
+        vendor_db.start_watcher()
+        # --- 厂商数据库热更新 ---
+
+        # --- 任务记录定时归档 ---
+        task_retention.start()
+        # --- 任务记录定时归档 ---
+
     return app
\ No newline at end of file
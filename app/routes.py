@@ -1,54 +1,152 @@
-from flask import Blueprint, render_template, jsonify, request
+from flask import Blueprint, render_template, jsonify, request, Response, stream_with_context, g
 import json
 import requests
-import hashlib
 from requests.auth import HTTPBasicAuth
-from app.src.monitor_cam import device_status_manager
+from app.src.monitor_cam import device_status_manager, fleet_view, traffic_capture
 from app.src.mqtt.mqtt_publisher import mqtt_publisher
-from app.src.record_control import command_response_manager
+from app.src.mqtt.upload_scheduler import upload_scheduler
+from app.src.record_control import command_response_manager, task_writer, command_analytics, task_retention, command_tracer
 from app.src.video_manage import video_list_manager, upload_progress_manager
-from app.src.sqllite import list_devices, get_device, update_device, insert_device, list_tasks, get_client_id_by_hardware_id, delete_device
-from app.src.spy_blocker.spy import lookup_macs_from_string
+from app.src.sqllite import get_device, update_device, insert_device, get_client_id_by_hardware_id, delete_device
+from app.src.sqllite import record_scan, top_suspicious_rooms, list_room_sightings
+from app.src.sqllite import list_archive_months, list_archived_tasks, get_task_rollup
+from app.src.sqllite.sqllite_time import to_epoch_ms
+from app.src.spy_blocker.spy import lookup_macs_from_string, iter_mac_tokens, lookup_macs_stream, classify_scan
+from app.src.spy_blocker.vendor_db import vendor_db
+from app.src.provisioning import (
+    make_client_id, build_config, parse_device_list, validate_devices, provision_devices,
+    iter_ndjson, iter_zip, MAX_BATCH_DEVICES
+)
+from app.src.api_response import json_response, compress_response
+from app.src.metrics import registry as metrics_registry
+from app.src.profiling import cpu_profiler, memory_profiler, lock_profiler, container_sizes
 import sqlite3
+import os
+import hmac
+import time
+from datetime import datetime, timezone
+from pathlib import Path
 from app.src.oss.oss_manager import getMultipartUploadPresignUrls, confirmCompleteMultipartUpload
 
 main = Blueprint('main', __name__)
+# 超过阈值的文本类响应按 Accept-Encoding 压缩
+main.after_request(compress_response)
+
+
+@main.before_request
+def _mark_request_start():
+    # 命令追踪的 http 阶段从这里开始计时
+    g.request_started = time.time()
 
 # ==================== 辅助函数 ====================
 
-def convert_device_to_api_format(device_dict):
+def _require_admin():
     """
-    将数据库中的设备记录转换为API返回格式
-    
-    数据库字段 -> API字段映射：
-    - hardware_id -> camera_id
-    - status -> status (转换为 online/offline)
-    - last_online -> last_update
+    管理接口鉴权
+
+    设置了环境变量 CAMLINK_ADMIN_TOKEN 时要求请求头 X-Admin-Token 与之一致；
+    未设置时一律拒绝，除非显式设置 CAMLINK_ADMIN_ALLOW_LOOPBACK=1 允许本机访问
+    （经本机反向代理转发的请求来源同样是本机地址，部署在代理之后时不要开启）
+
+    Returns:
+        None 表示通过，否则返回可直接作为响应的 (json, 状态码)
     """
-    # 状态转换：中文 -> 英文
-    status_map = {
-        '在线': 'online',
-        '离线': 'offline',
-        'online': 'online',
-        'offline': 'offline'
-    }
-    
-    return {
-        'camera_id': device_dict.get('hardware_id', ''),
-        'status': status_map.get(device_dict.get('status', 'offline'), 'offline'),
-        'run_state': device_dict.get('run_state', 'stopped'),  # 默认为stopped
-        'left_storage': device_dict.get('left_storage', 0),
-        'electric_percent': device_dict.get('electric_percent', 0) / 100.0 if device_dict.get('electric_percent') else 0,  # 转换为0-1的小数
-        'network_signal_strength': device_dict.get('network_signal_strength', 0),
-        'last_update': device_dict.get('last_online', ''),
-        # 额外字段供详情页使用
-        'client_id': device_dict.get('client_id', ''),
-        'hotel': device_dict.get('hotel', ''),
-        'location': device_dict.get('location', ''),
-        'wifi': device_dict.get('wifi', ''),
-        'runtime': device_dict.get('runtime', ''),
-        'firmware': device_dict.get('fw', 'v2.1.3')
+    token = os.getenv('CAMLINK_ADMIN_TOKEN')
+    if token:
+        if hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token):
+            return None
+    elif os.getenv('CAMLINK_ADMIN_ALLOW_LOOPBACK') == '1' and request.remote_addr in ('127.0.0.1', '::1'):
+        return None
+    return jsonify({'success': False, 'message': '无权访问管理接口'}), 403
+
+
+# 进程启动标识：写入ETag，避免重启后版本号从头计数导致客户端缓存被误判为最新
+_ETAG_EPOCH = format(int(time.time() * 1000), 'x')
+
+
+def _validators(name, version, modified_at):
+    """根据数据版本号和修改时间生成条件GET所需的 ETag / Last-Modified"""
+    return {'etag': f'{name}-{_ETAG_EPOCH}-{version}', 'last_modified': modified_at}
+
+
+def _not_modified(validators):
+    """
+    处理条件GET（If-None-Match 优先，其次 If-Modified-Since）
+
+    Returns:
+        数据未变化时返回 304 响应，否则返回None（调用方继续生成响应）
+    """
+    if request.if_none_match:
+        hit = request.if_none_match.contains_weak(validators['etag'])
+    elif request.if_modified_since:
+        hit = int(validators['last_modified']) <= request.if_modified_since.timestamp()
+    else:
+        hit = False
+    return _add_validators(Response(status=304), validators) if hit else None
+
+
+def _add_validators(response, validators):
+    """给响应加上 ETag、Last-Modified，并要求客户端每次使用缓存前重新验证"""
+    response.set_etag(validators['etag'])
+    response.last_modified = datetime.fromtimestamp(int(validators['last_modified']), timezone.utc)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _trace_http(request_id, camera_id):
+    """记录命令追踪的 http 阶段（收到请求 -> 命令已发布/已排队）"""
+    command_tracer.span(request_id, 'http', g.get('request_started', time.time()), time.time(),
+                        camera_id=camera_id, endpoint=request.endpoint)
+
+
+# 游标翻页时单页最多返回的记录数
+MAX_PAGE_SIZE = 1000
+
+
+def _parse_fields():
+    """解析逗号分隔的 fields 查询参数，未提供时返回None"""
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    return [f.strip() for f in fields.split(',') if f.strip()]
+
+
+def _parse_task_filters():
+    """
+    解析任务列表的游标、过滤和投影参数（同 sqllite.list_tasks），since / until 转换为毫秒时间戳
+
+    Returns:
+        (过滤参数, None)；时间无法解析时返回 (None, 可直接作为响应的 (json, 400))
+    """
+    filters = {
+        'before_id': request.args.get('cursor', type=int),
+        'state': request.args.get('state'),
+        'requesttype': request.args.get('requesttype'),
+        'columns': _parse_fields()
     }
+    for name in ('since', 'until'):
+        try:
+            filters[name] = to_epoch_ms(request.args.get(name))
+        except ValueError:
+            return None, (jsonify({
+                'success': False,
+                'message': f'{name} 不是有效的时间（YYYY-MM-DD HH:MM:SS 或时间戳）',
+                'tasks': []
+            }), 400)
+    return filters, None
+
+
+def _next_cursor(rows, limit):
+    """
+    计算下一页游标（本页最小的id），没有更多数据时返回None
+
+    第一页可能包含尚未落库的任务（id为None），整页都是这类记录时从数据库最新一条开始翻页
+    """
+    if len(rows) < limit:
+        return None
+    ids = [row['id'] for row in rows if row.get('id') is not None]
+    return min(ids) if ids else 2 ** 63 - 1
+
 
 # ==================== 路由 ====================
 
@@ -76,18 +174,9 @@ def generate_config():
         return jsonify({'ok': False, 'message': 'hardware_id is required'}), 400
 
     # generate client_id as CAM- + first 12 chars of md5(hardware_id)
-    client_id = 'CAM-' + hashlib.md5(hardware_id.encode('utf-8')).hexdigest()[:12]
+    client_id = make_client_id(hardware_id)
 
-    config = {
-        'hardware_id': hardware_id,
-        'client_id': client_id,
-        'hotel_name': payload.get('hotel_name'),
-        'location': payload.get('location'),
-        'wifi': {
-            'ssid': payload.get('wifi_ssid'),
-            'password': payload.get('wifi_password')
-        }
-    }
+    config = build_config(payload, client_id)
 
     # Persist to DB unless client asks for preview only
     hardware_id = payload.get('hardware_id')
@@ -125,6 +214,57 @@ def generate_config():
     # Return pretty-printed JSON string
     return jsonify({'ok': True, 'config': json.dumps(config, ensure_ascii=False, indent=2)})
 
+@main.route('/api/devices/provision/bulk', methods=['POST'])
+def bulk_provision_devices():
+    """
+    批量开通设备：一次请求生成整批设备的 client_id 和配置，并在一个事务中写入设备表
+
+    请求体（任选一种）:
+    - CSV（Content-Type: text/csv），首行为列名
+    - JSON 数组或 {"devices": [...]}，也支持 NDJSON
+    - multipart 表单上传的文件（字段名 file）
+    列/字段: hardware_id（必填）, hotel_name, location, wifi_ssid, wifi_password, runtime, fw, last_online
+
+    查询参数:
+    - format: ndjson（默认，每行一台设备，最后一行为汇总）或 zip（每台设备一个配置文件）
+    - force: true 时用清单中的非空字段覆盖已存在的设备，否则已存在的设备不修改（status=exists）
+    - hotel_name / location / wifi_ssid / wifi_password / fw: 清单中未填写时使用的默认值
+
+    清单中有任何一行校验失败时整批不写入，返回 400 和错误列表
+    """
+    upload = request.files.get('file')
+    body = upload.read() if upload else request.get_data()
+    content_type = (upload.mimetype or upload.filename or '') if upload else (request.content_type or '')
+    try:
+        items = parse_device_list(body, content_type)
+    except (UnicodeDecodeError, ValueError) as e:
+        return jsonify({'success': False, 'message': f'无法解析设备清单: {e}'}), 400
+    if not items:
+        return jsonify({'success': False, 'message': '设备清单为空'}), 400
+    if len(items) > MAX_BATCH_DEVICES:
+        return jsonify({'success': False, 'message': f'单次最多开通 {MAX_BATCH_DEVICES} 台设备'}), 413
+
+    defaults = {k: request.args.get(k) for k in ('hotel_name', 'location', 'wifi_ssid', 'wifi_password', 'fw')}
+    valid, errors = validate_devices(items, defaults)
+    if errors:
+        return jsonify({'success': False, 'message': f'{len(errors)} 台设备校验失败', 'errors': errors}), 400
+
+    force = request.args.get('force', 'false').lower() in ('1', 'true', 'yes')
+    try:
+        result = provision_devices(valid, overwrite=force)
+    except (sqlite3.Error, ValueError) as e:
+        print(f"❌ 批量开通设备失败: {e}")
+        return jsonify({'success': False, 'message': f'批量开通设备失败: {str(e)}'}), 500
+    print(f"✅ 批量开通设备: {result['summary']}")
+
+    if request.args.get('format', 'ndjson').lower() == 'zip':
+        return Response(
+            stream_with_context(iter_zip(result)),
+            mimetype='application/zip',
+            headers={'Content-Disposition': 'attachment; filename="camera_configs.zip"'}
+        )
+    return Response(stream_with_context(iter_ndjson(result)), mimetype='application/x-ndjson')
+
 @main.route('/device_manage')
 def device_manage():
     return render_template('device_manage.html')
@@ -328,6 +468,8 @@ def refresh_camera_status(camera_id):
     success = mqtt_publisher.get_status(camera_id, request_id)
     
     if success:
+        if request_id:
+            _trace_http(request_id, camera_id)
         return jsonify({
             'success': True,
             'camera_id': camera_id,
@@ -346,52 +488,72 @@ def get_all_camera_status():
     """
     获取所有摄像头状态
     
+    支持 If-None-Match / If-Modified-Since 条件请求，状态未变化时返回 304
+    
     Returns:
         JSON格式的所有设备状态列表
     """
-    statuses = device_status_manager.get_all_statuses()
-    return jsonify({
-        'success': True,
-        'count': len(statuses),
-        'data': statuses
-    })
+    validators = _validators('status-all', *device_status_manager.version_info())
+    not_modified = _not_modified(validators)
+    if not_modified:
+        return not_modified
+    def build():
+        statuses = device_status_manager.get_all_statuses()
+        return {
+            'success': True,
+            'count': len(statuses),
+            'data': statuses
+        }
+    return _add_validators(json_response(build, cache_key=(validators['etag'],)), validators)
 
 
 @main.route('/api/camera/status/list', methods=['GET'])
 def get_camera_status_list():
     """
-    获取所有摄像头状态列表（从数据库读取）
-    
+    获取所有摄像头状态列表（从已合并实时状态的设备列表视图读取，不查询数据库）
+
+    查询参数:
+    - limit: 每页数量（默认100，最大1000）
+    - cursor: 上一页返回的 next_cursor
+    - hotel: 按酒店过滤
+    - status: online / offline（合并实时状态后的状态）
+    - fields: 逗号分隔的返回字段，如 camera_id,status,hotel
+
+    支持 If-None-Match / If-Modified-Since 条件请求，设备列表未变化时返回 304
+
     Returns:
-        JSON格式的设备状态列表
+        JSON格式的设备状态列表，next_cursor 不为空时还有下一页
     """
     try:
-        # 从数据库获取设备列表
-        db_devices = list_devices(limit=100)
-        
-        # 转换为API格式
-        api_devices = [convert_device_to_api_format(device) for device in db_devices]
-        
-        # 可选：与内存中的实时状态合并（如果需要更实时的数据）
-        # 这样可以获取到MQTT实时更新的状态
-        memory_statuses = device_status_manager.get_all_statuses()
-        for device in api_devices:
-            camera_id = device['camera_id']
-            if camera_id in memory_statuses:
-                # 用内存中的实时状态覆盖数据库的状态
-                memory_status = memory_statuses[camera_id]
-                device['status'] = memory_status.get('status', device['status'])
-                device['run_state'] = memory_status.get('run_state', device['run_state'])
-                device['left_storage'] = memory_status.get('left_storage', device['left_storage'])
-                device['electric_percent'] = memory_status.get('electric_percent', device['electric_percent'])
-                device['network_signal_strength'] = memory_status.get('network_signal_strength', device['network_signal_strength'])
-                device['last_update'] = memory_status.get('last_update', device['last_update'])
-        
-        return jsonify({
-            'success': True,
-            'count': len(api_devices),
-            'data': api_devices
-        })
+        limit = max(1, min(request.args.get('limit', 100, type=int), MAX_PAGE_SIZE))
+        fields = _parse_fields()
+        query = {
+            'limit': limit,
+            'before_id': request.args.get('cursor', type=int),
+            'hotel': request.args.get('hotel'),
+            'status': request.args.get('status')
+        }
+
+        validators = _validators('status-list', *fleet_view.version_info())
+        not_modified = _not_modified(validators)
+        if not_modified:
+            return not_modified
+
+        cache_key = (validators['etag'], *query.values(), tuple(fields or ()))
+
+        # 物化视图中已合并数据库记录和MQTT实时状态
+        if not fields:
+            return _add_validators(json_response(lambda: fleet_view.render_page(**query), cache_key=cache_key), validators)
+
+        def build():
+            api_devices, next_cursor = fleet_view.page(**query)
+            return {
+                'success': True,
+                'count': len(api_devices),
+                'next_cursor': next_cursor,
+                'data': [{k: v for k, v in device.items() if k in fields} for device in api_devices]
+            }
+        return _add_validators(json_response(build, cache_key=cache_key), validators)
     except Exception as e:
         print(f"Error fetching device list: {e}")
         import traceback
@@ -426,15 +588,17 @@ def delete_device_api(camera_id):
 @main.route('/api/spy/lookup', methods=['GET', 'POST'])
 def spy_lookup_api():
     """
-    Lookup MAC addresses against mac.json prefixes (first 4 bytes).
+    Lookup MAC addresses against the mac.json OUI index (longest match of
+    MA-S / MA-M / MA-L prefixes). MACs may be dash, colon, dot or
+    separator-free notation, in any case.
 
     Accepts:
-      - POST JSON: { "macs": "F4-E1-FC-01-02-09,F4-EA-B5-F1-21-C2" }
+      - POST JSON: { "macs": "F4-E1-FC-01-02-09,f4:ea:b5:f1:21:c2" }
       - POST form data: macs=...
       - GET query: /api/spy/lookup?macs=...
 
     Returns:
-      { success: true, count: N, matches: [ {mac,prefix,value}, ... ] }
+      { success: true, count: N, matches: [ {mac,prefix,value,registry,suspicious}, ... ] }
     """
     try:
         macs = None
@@ -459,6 +623,153 @@ def spy_lookup_api():
         return jsonify({'success': False, 'message': f'内部错误: {str(e)}'}), 500
 
 
+@main.route('/api/spy/lookup/batch', methods=['POST'])
+def spy_lookup_batch_api():
+    """
+    批量查询MAC厂商（流式输入、流式输出），用于嗅探器的整屋扫描结果
+
+    请求体（按首个非空白字符自动识别）:
+      - JSON数组: ["aa:bb:cc:dd:ee:ff", {"mac": "AA-BB-CC-DD-EE-FF"}, ...]
+      - 换行分隔: 每行一个MAC（也可以是NDJSON对象 {"mac": "..."}）
+
+    查询参数:
+    - batch_size: 每批查询的MAC数量（默认4096）
+
+    返回:
+      application/x-ndjson，每行一个查询结果 {mac,prefix,value,registry,suspicious}；
+      重复的MAC（不同写法视为同一个）只返回一次。输入格式错误时最后一行为 {"error": "..."}
+    """
+    batch_size = max(1, min(request.args.get('batch_size', 4096, type=int), 65536))
+    stream = request.stream
+
+    def read_chunks():
+        while True:
+            chunk = stream.read(65536)
+            if not chunk:
+                break
+            yield chunk
+
+    def generate():
+        try:
+            for result in lookup_macs_stream(iter_mac_tokens(read_chunks()), batch_size=batch_size):
+                yield json.dumps(result, ensure_ascii=False) + '\n'
+        except ValueError as e:
+            yield json.dumps({'error': str(e)}, ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@main.route('/api/spy/status', methods=['GET'])
+def spy_vendor_db_status():
+    """
+    查看当前厂商数据库版本
+
+    返回:
+      { success: true, loaded, stats: {version, loaded_at, load_ms, entries,
+        entries_by_registry, vendors, watchlist_entries}, watching, last_error }
+    """
+    return jsonify({'success': True, **vendor_db.status()})
+
+
+@main.route('/api/spy/reload', methods=['POST'])
+def spy_vendor_db_reload():
+    """
+    重新加载厂商数据库（mac.json + spy_vendors.json），仅管理员可用
+
+    新版本完整加载后才会替换旧版本，正在进行的查询不受影响；加载失败时继续使用旧版本
+
+    查询参数:
+    - force: true 时即使源文件未变化也重新生成索引
+
+    返回:
+      { success, reloaded, stats, error? }
+    """
+    denied = _require_admin()
+    if denied:
+        return denied
+    force = request.args.get('force', 'false').lower() in ('1', 'true', 'yes')
+    result = vendor_db.reload(force=force)
+    return jsonify({'success': 'error' not in result, **result}), 200 if 'error' not in result else 500
+
+
+@main.route('/api/spy/scan', methods=['POST'])
+def spy_scan_ingest():
+    """
+    上报一次房间扫描结果，保存扫描历史并增量更新房间可疑度评分
+
+    请求体:
+        {
+            "camera_id": "HW-001",          # 可选，提供时从设备信息取酒店和房间
+            "hotel": "测试酒店",             # 未提供 camera_id 时必填
+            "location": "702房间",          # 未提供 camera_id 时必填
+            "macs": ["aa:bb:cc:dd:ee:ff", ...]   # 或逗号分隔的字符串
+        }
+
+    返回:
+        { success, hotel, location, scan_id, macs, new_macs, suspicious_macs, score,
+          suspicious: [ {mac,vendor,registry}, ... ] }
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        camera_id = data.get('camera_id')
+        hotel, location = data.get('hotel'), data.get('location')
+        if camera_id:
+            device = get_device(camera_id)
+            if not device:
+                return jsonify({'success': False, 'message': f'设备不存在: {camera_id}'}), 404
+            hotel = hotel or device.get('hotel')
+            location = location or device.get('location')
+        if not hotel or not location:
+            return jsonify({'success': False, 'message': '缺少参数: hotel/location 或 camera_id'}), 400
+
+        macs = data.get('macs') or []
+        if isinstance(macs, str):
+            macs = [m.strip() for m in macs.split(',') if m.strip()]
+        if not isinstance(macs, list):
+            return jsonify({'success': False, 'message': 'macs 必须是列表或逗号分隔的字符串'}), 400
+
+        sightings = classify_scan([m for m in macs if isinstance(m, str)])
+        result = record_scan(hotel, location, sightings, hardware_id=camera_id)
+        suspicious = [
+            {'mac': s['mac'], 'vendor': s['vendor'], 'registry': s['registry']}
+            for s in sightings if s['suspicious']
+        ]
+        return jsonify({'success': True, 'hotel': hotel, 'location': location, **result, 'suspicious': suspicious})
+    except Exception as e:
+        print(f"❌ 保存扫描结果失败: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'message': f'内部错误: {str(e)}'}), 500
+
+
+@main.route('/api/spy/rooms/top', methods=['GET'])
+def spy_top_rooms():
+    """
+    查询酒店中可疑度最高的房间（直接读取增量维护的评分表）
+
+    查询参数:
+    - hotel: 酒店名称（必填）
+    - limit: 返回房间数（默认10，最大200）
+    - details: true 时附带每个房间中的可疑MAC
+
+    返回:
+        { success, hotel, count, rooms: [ {location, score, suspicious_macs, total_macs,
+          scan_count, first_scan, last_scan, sightings?}, ... ] }
+    """
+    hotel = request.args.get('hotel')
+    if not hotel:
+        return jsonify({'success': False, 'message': '缺少参数: hotel'}), 400
+    limit = max(1, min(request.args.get('limit', 10, type=int), 200))
+    details = request.args.get('details', 'false').lower() in ('1', 'true', 'yes')
+
+    rooms = top_suspicious_rooms(hotel, limit=limit)
+    for room in rooms:
+        room['score'] = round(room['score'], 2)
+        if details:
+            room['sightings'] = list_room_sightings(hotel, room['location'], suspicious_only=True, limit=50)
+    return jsonify({'success': True, 'hotel': hotel, 'count': len(rooms), 'rooms': rooms})
+
+
 # ==================== 录制控制接口 ====================
 
 @main.route('/api/camera/<camera_id>/record/start', methods=['POST'])
@@ -520,6 +831,7 @@ def start_camera_record(camera_id):
     success, req_id = mqtt_publisher.start_record(camera_id, pre_name, request_id)
     
     if success:
+        _trace_http(req_id, camera_id)
         return jsonify({
             'success': True,
             'camera_id': camera_id,
@@ -559,6 +871,7 @@ def stop_camera_record(camera_id):
     success, req_id = mqtt_publisher.stop_record(camera_id, request_id)
     
     if success:
+        _trace_http(req_id, camera_id)
         return jsonify({
             'success': True,
             'camera_id': camera_id,
@@ -587,6 +900,7 @@ def get_command_response(request_id):
     response = command_response_manager.get_response(request_id)
     
     if response:
+        command_tracer.retrieved(request_id, time.time(), endpoint=request.endpoint)
         return jsonify({
             'success': True,
             'request_id': request_id,
@@ -658,6 +972,7 @@ def list_camera_videos(camera_id):
     )
     
     if success:
+        _trace_http(req_id, camera_id)
         return jsonify({
             'success': True,
             'camera_id': camera_id,
@@ -686,7 +1001,8 @@ def get_video_list_result(request_id):
     video_list = video_list_manager.get_video_list(request_id)
     
     if video_list:
-        return jsonify({
+        command_tracer.retrieved(request_id, time.time(), endpoint=request.endpoint)
+        return json_response({
             'success': True,
             'request_id': request_id,
             'data': video_list
@@ -704,20 +1020,27 @@ def get_camera_latest_videos(camera_id):
     """
     获取指定摄像头的最新视频列表
     
+    支持 If-None-Match / If-Modified-Since 条件请求，视频列表未更新时返回 304
+    
     Args:
         camera_id: 摄像头ID
         
     Returns:
         JSON格式的最新视频列表
     """
-    video_list = video_list_manager.get_camera_latest_videos(camera_id)
-    
+    # 列表和版本号一起读取，避免两次读取之间收到新列表时 ETag 与内容不一致
+    video_list, version, modified_at = video_list_manager.get_camera_latest_videos_versioned(camera_id)
+
     if video_list:
-        return jsonify({
+        validators = _validators('videos', version, modified_at)
+        not_modified = _not_modified(validators)
+        if not_modified:
+            return not_modified
+        return _add_validators(json_response({
             'success': True,
             'camera_id': camera_id,
             'data': video_list
-        })
+        }, cache_key=(validators['etag'], camera_id)), validators)
     else:
         return jsonify({
             'success': False,
@@ -766,16 +1089,23 @@ def request_upload_videos(camera_id):
     
     request_id = data.get('request_id')
     
-    # 发送上传文件命令
-    success, req_id = mqtt_publisher.upload_file(camera_id, file_name_list, request_id)
+    # 交给上传调度器：同一站点并发已满时排队，空出名额后自动下发
+    success, req_id, queue_position = upload_scheduler.submit(camera_id, file_name_list, request_id)
     
     if success:
+        _trace_http(req_id, camera_id)
+        if queue_position > 0:
+            message = f'同一站点上传任务较多，已排队（第{queue_position}位），轮到后将自动下发'
+        else:
+            message = '文件上传命令已发送，请使用request_id查询结果和进度'
         return jsonify({
             'success': True,
             'camera_id': camera_id,
             'request_id': req_id,
             'file_name_list': file_name_list,
-            'message': '文件上传命令已发送，请使用request_id查询结果和进度'
+            'queued': queue_position > 0,
+            'queue_position': queue_position,
+            'message': message
         })
     else:
         return jsonify({
@@ -785,6 +1115,42 @@ def request_upload_videos(camera_id):
         }), 500
 
 
+@main.route('/api/upload/schedule', methods=['GET'])
+def get_upload_schedule():
+    """
+    查询上传调度状态（按站点分组的执行中和排队中的上传任务）
+    
+    查询参数:
+    - request_id: 可选，只查询指定请求的调度信息
+    
+    Returns:
+        JSON格式的调度状态
+    """
+    request_id = request.args.get('request_id')
+    if request_id:
+        job = upload_scheduler.get_job(request_id)
+        if not job:
+            return jsonify({
+                'success': False,
+                'request_id': request_id,
+                'message': '未找到该上传请求的调度信息'
+            }), 404
+        job['queue_position'] = upload_scheduler.get_queue_position(request_id)
+        return jsonify({
+            'success': True,
+            'request_id': request_id,
+            'data': job
+        })
+    
+    sites = upload_scheduler.snapshot()
+    return jsonify({
+        'success': True,
+        'max_per_site': upload_scheduler.max_per_site,
+        'count': len(sites),
+        'data': sites
+    })
+
+
 @main.route('/api/camera/<camera_id>/videos/upload/status', methods=['GET', 'POST'])
 def get_upload_progress(camera_id):
     """
@@ -832,6 +1198,7 @@ def get_upload_progress(camera_id):
                 'message': '发送上传进度查询命令失败，请检查MQTT连接'
             }), 500
         
+        _trace_http(req_id, camera_id)
         return jsonify({
             'success': True,
             'camera_id': camera_id,
@@ -858,13 +1225,20 @@ def get_camera_tasks(camera_id):
     获取指定摄像头的操作历史（从task表）
     
     查询参数:
-    - limit: 返回记录数量限制（默认50）
+    - limit: 返回记录数量限制（默认50，最大1000）
+    - cursor: 上一页返回的 next_cursor
+    - state / requesttype: 按状态、命令类型过滤
+    - since / until: 创建时间范围（YYYY-MM-DD HH:MM:SS）
+    - fields: 逗号分隔的返回字段，如 requestid,state,created_at
+    
+    支持 If-None-Match / If-Modified-Since 条件请求，任务数据未变化时返回 304
     
     返回格式:
     {
         "success": true,
         "camera_id": "HW-2024-001",
         "count": 10,
+        "next_cursor": 1,
         "tasks": [
             {
                 "id": 1,
@@ -879,7 +1253,7 @@ def get_camera_tasks(camera_id):
     }
     """
     try:
-        limit = request.args.get('limit', 50, type=int)
+        limit = max(1, min(request.args.get('limit', 50, type=int), MAX_PAGE_SIZE))
         
         # 获取client_id（因为task表使用client_id存储）
         client_id = get_client_id_by_hardware_id(camera_id)
@@ -890,16 +1264,28 @@ def get_camera_tasks(camera_id):
                 'tasks': []
             }), 404
         
-        # 从数据库查询该设备的任务列表
-        tasks = list_tasks(clientid=client_id, limit=limit)
-        
-        return jsonify({
-            'success': True,
-            'camera_id': camera_id,
-            'client_id': client_id,
-            'count': len(tasks),
-            'tasks': tasks
-        })
+        filters, invalid = _parse_task_filters()
+        if invalid:
+            return invalid
+
+        validators = _validators('tasks', *task_writer.version_info())
+        not_modified = _not_modified(validators)
+        if not_modified:
+            return not_modified
+
+        def build():
+            # 从数据库查询该设备的任务列表
+            tasks = task_writer.list_tasks(clientid=client_id, limit=limit, **filters)
+            return {
+                'success': True,
+                'camera_id': camera_id,
+                'client_id': client_id,
+                'count': len(tasks),
+                'next_cursor': _next_cursor(tasks, limit),
+                'tasks': tasks
+            }
+        cache_key = (validators['etag'], client_id, limit, request.query_string)
+        return _add_validators(json_response(build, cache_key=cache_key), validators)
     except Exception as e:
         print(f"❌ 获取任务历史失败: {e}")
         import traceback
@@ -911,30 +1297,82 @@ def get_camera_tasks(camera_id):
         }), 500
 
 
+@main.route('/api/analytics/commands', methods=['GET'])
+def get_command_analytics():
+    """
+    命令响应时延分析（增量统计，不扫描tasks表）
+
+    查询参数:
+    - group: 统计维度 camera / hotel / requesttype / all（默认 requesttype）
+    - key: 指定取值时返回该取值的时间趋势（如 group=camera&key=HW-001）
+    - sort: 排序字段（降序），如 p90_ms（默认）、p99_ms、failure_rate、timeout_rate、count
+    - limit: 返回条数（默认50）
+
+    返回格式:
+    {
+        "success": true,
+        "group": "camera",
+        "timeout_seconds": 30,
+        "inflight": 3,
+        "items": [{"key": "HW-001", "count": 120, "failure_rate": 0.02, "timeout_rate": 0.01,
+                   "p50_ms": 180.0, "p90_ms": 640.0, "p99_ms": 2400.0, ...}],
+        "trend": [{"bucket_start": "2025-11-08 10:05:00", "count": 12, "p90_ms": 700.0, ...}]   # 仅指定 key 时
+    }
+    """
+    group = request.args.get('group', 'requesttype')
+    if group not in ('camera', 'hotel', 'requesttype', 'all'):
+        return jsonify({'success': False, 'message': f'不支持的统计维度: {group}'}), 400
+    key = request.args.get('key')
+    sort = request.args.get('sort', 'p90_ms')
+    limit = max(1, min(request.args.get('limit', 50, type=int), 1000))
+
+    result = {
+        'success': True,
+        'group': group,
+        'timeout_seconds': command_analytics.timeout_seconds,
+        'bucket_seconds': command_analytics.bucket_seconds,
+        'inflight': command_analytics.inflight_count(),
+        'items': command_analytics.summary(group, sort=sort, limit=limit)
+    }
+    if key:
+        result['trend'] = command_analytics.trend(group, key)
+    return jsonify(result)
+
+
 @main.route('/api/tasks', methods=['GET'])
 def get_all_tasks():
     """
     获取所有设备的操作历史
     
     查询参数:
-    - limit: 返回记录数量限制（默认200）
+    - limit: 返回记录数量限制（默认200，最大1000）
+    - cursor: 上一页返回的 next_cursor
+    - state / requesttype: 按状态、命令类型过滤
+    - since / until: 创建时间范围（YYYY-MM-DD HH:MM:SS）
+    - hotel: 只返回该酒店设备的任务
+    - fields: 逗号分隔的返回字段
     
     返回格式:
     {
         "success": true,
         "count": 50,
+        "next_cursor": 1234,
         "tasks": [...]
     }
     """
     try:
-        limit = request.args.get('limit', 200, type=int)
+        limit = max(1, min(request.args.get('limit', 200, type=int), MAX_PAGE_SIZE))
+        filters, invalid = _parse_task_filters()
+        if invalid:
+            return invalid
         
         # 查询所有任务
-        tasks = list_tasks(limit=limit)
+        tasks = task_writer.list_tasks(limit=limit, hotel=request.args.get('hotel'), **filters)
         
-        return jsonify({
+        return json_response({
             'success': True,
             'count': len(tasks),
+            'next_cursor': _next_cursor(tasks, limit),
             'tasks': tasks
         })
     except Exception as e:
@@ -945,4 +1383,330 @@ def get_all_tasks():
             'success': False,
             'message': f'获取任务历史失败: {str(e)}',
             'tasks': []
-        }), 500
\ No newline at end of file
+        }), 500
+
+@main.route('/api/tasks/archive', methods=['GET'])
+def get_archived_tasks():
+    """
+    查询已归档的任务记录
+
+    查询参数:
+    - month: 归档月份（YYYYMM）；不提供时只返回可用月份和归档状态
+    - client_id: 只返回该设备的任务
+    - limit: 返回记录数量限制（默认200，最大1000）
+    - cursor: 上一页返回的 next_cursor
+
+    返回格式:
+    { success, months: [...], retention: {...}, count?, next_cursor?, tasks? }
+    """
+    try:
+        archive_db = task_retention.archive_db_path
+        result = {
+            'success': True,
+            'months': list_archive_months(archive_db_path=archive_db),
+            'retention': task_retention.status()
+        }
+        month = request.args.get('month')
+        if month:
+            limit = max(1, min(request.args.get('limit', 200, type=int), MAX_PAGE_SIZE))
+            tasks = list_archived_tasks(
+                month, clientid=request.args.get('client_id'),
+                before_id=request.args.get('cursor', type=int), limit=limit, archive_db_path=archive_db
+            )
+            result.update({'count': len(tasks), 'next_cursor': _next_cursor(tasks, limit), 'tasks': tasks})
+        return jsonify(result)
+    except Exception as e:
+        print(f"❌ 查询归档任务失败: {e}")
+        return jsonify({'success': False, 'message': f'查询归档任务失败: {str(e)}'}), 500
+
+
+@main.route('/api/tasks/rollup', methods=['GET'])
+def get_task_rollup_api():
+    """
+    已归档任务的按月汇总
+
+    查询参数:
+    - month: 月份（YYYY-MM）
+    - client_id: 设备ID
+
+    返回格式:
+    { success, count, items: [{month, clientid, requesttype, state, count, first_created, last_created}, ...] }
+    """
+    try:
+        items = get_task_rollup(month=request.args.get('month'), clientid=request.args.get('client_id'))
+        return jsonify({'success': True, 'count': len(items), 'items': items})
+    except Exception as e:
+        print(f"❌ 查询任务汇总失败: {e}")
+        return jsonify({'success': False, 'message': f'查询任务汇总失败: {str(e)}'}), 500
+
+
+@main.route('/api/admin/tasks/archive', methods=['POST'])
+def run_task_archive():
+    """
+    立即执行一次任务归档，仅管理员可用
+
+    请求体（可选）:
+    { "retention_days": 30, "max_batches": 10 }
+
+    返回:
+      { success, cutoff, moved, batches, months, compact, duration_ms }，已有归档在运行时返回 409
+    """
+    denied = _require_admin()
+    if denied:
+        return denied
+    data = request.get_json(silent=True) or {}
+    try:
+        retention_days = int(data['retention_days']) if data.get('retention_days') else None
+        max_batches = int(data['max_batches']) if data.get('max_batches') else None
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'retention_days / max_batches 必须是整数'}), 400
+    try:
+        result = task_retention.run_once(retention_days=retention_days, max_batches=max_batches)
+    except Exception as e:
+        print(f"❌ 任务归档失败: {e}")
+        return jsonify({'success': False, 'message': f'任务归档失败: {str(e)}'}), 500
+    if result.get('busy'):
+        return jsonify({'success': False, 'message': '归档正在进行中'}), 409
+    return jsonify({'success': True, **result})
+
+
+@main.route('/api/admin/tasks/compact', methods=['POST'])
+def compact_task_database():
+    """
+    回收数据库空闲页，仅管理员可用
+
+    请求体（可选）:
+    { "enable_incremental_vacuum": true }   # 一次性切换为 auto_vacuum=INCREMENTAL（执行完整 VACUUM）
+
+    返回:
+      { success, enable?, compact: {auto_vacuum, journal_mode, freelist_before, freelist_after, ...} }，
+      归档正在运行时返回 409
+    """
+    denied = _require_admin()
+    if denied:
+        return denied
+    data = request.get_json(silent=True) or {}
+    try:
+        result = task_retention.compact(enable_incremental=bool(data.get('enable_incremental_vacuum')))
+    except Exception as e:
+        print(f"❌ 数据库空间回收失败: {e}")
+        return jsonify({'success': False, 'message': f'数据库空间回收失败: {str(e)}'}), 500
+    if result.get('busy'):
+        return jsonify({'success': False, 'message': '归档正在进行中'}), 409
+    return jsonify({'success': True, **result})
+
+
+@main.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Prometheus 指标（文本格式）
+
+    包含各路由的请求耗时直方图、状态码计数、响应大小和并发请求数
+    """
+    return Response(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@main.route('/api/trace/<request_id>', methods=['GET'])
+def get_command_trace(request_id):
+    """
+    命令链路追踪：一条命令在各阶段的耗时
+
+    返回格式:
+    {
+        "success": true,
+        "request_id": "req_1234567890",
+        "camera_id": "HW-2024-001",
+        "started_at": "2025-11-08 10:00:00.120",
+        "spans": [{"name": "http", "start": "...", "offset_ms": 0.0, "duration_ms": 12.5, ...},
+                  {"name": "publish", ...}, {"name": "response", ...}, {"name": "task_update", ...}],
+        "breakdown": {"server_dispatch": 12.5, "broker_ack": 8.1, "device_round_trip": 640.2,
+                      "response_handling": 1.3, "db_commit": 21.0, "client_wait": 900.4, "total": 1583.5}
+    }
+    """
+    trace = command_tracer.get_trace(request_id)
+    if trace is None:
+        return jsonify({'success': False, 'request_id': request_id, 'message': '没有该命令的追踪记录'}), 404
+    return jsonify({'success': True, **trace})
+
+
+# ==================== 运行时剖析（管理接口） ====================
+
+@main.route('/api/admin/profile/cpu', methods=['GET'])
+def profile_cpu():
+    """
+    采样所有线程的调用栈（墙钟时间），请求会阻塞采样时长
+
+    查询参数:
+    - seconds: 采样时长（默认10，最长60）
+    - interval_ms: 采样间隔（默认5）
+    - format: folded（默认，flamegraph.pl / speedscope 可打开）、speedscope（JSON文件）、summary
+    - idle: 0 表示丢弃阻塞在等待/休眠中的样本
+    """
+    denied = _require_admin()
+    if denied:
+        return denied
+    seconds = request.args.get('seconds', 10, type=float)
+    interval = request.args.get('interval_ms', 5, type=float) / 1000
+    fmt = request.args.get('format', 'folded')
+    if fmt not in ('folded', 'speedscope', 'summary'):
+        return jsonify({'success': False, 'message': f'不支持的格式: {fmt}'}), 400
+    profile = cpu_profiler.profile(seconds, interval, include_idle=request.args.get('idle', '1') != '0')
+    if profile is None:
+        return jsonify({'success': False, 'message': '已有CPU剖析正在进行'}), 409
+    if fmt == 'summary':
+        return jsonify({'success': True, **profile.summary()})
+    filename = f"camlink-cpu-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    if fmt == 'speedscope':
+        response = Response(json.dumps(profile.speedscope()), mimetype='application/json')
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}.speedscope.json'
+        return response
+    response = Response(profile.folded(), mimetype='text/plain')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}.folded'
+    return response
+
+
+@main.route('/api/admin/profile/memory/start', methods=['POST'])
+def start_memory_profile():
+    """开启 tracemalloc（frames: 每次分配记录的调用栈深度，默认10），并把当前状态设为基线"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    frames = max(1, min(request.args.get('frames', 10, type=int), 100))
+    return jsonify({'success': True, **memory_profiler.start(frames)})
+
+
+@main.route('/api/admin/profile/memory/stop', methods=['POST'])
+def stop_memory_profile():
+    """关闭 tracemalloc，释放跟踪数据"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    return jsonify({'success': True, **memory_profiler.stop()})
+
+
+@main.route('/api/admin/profile/memory', methods=['GET'])
+def get_memory_profile():
+    """
+    内存占用报告
+
+    查询参数（tracemalloc 已开启时有效）:
+    - limit: 返回条数（默认30）
+    - group_by: lineno（默认）/ filename / traceback
+    - reset: 1 表示报告后把当前快照设为新的基线
+
+    返回格式:
+    {
+        "success": true,
+        "managers": {"device_status_manager": {"_statuses": {"entries": 120, "bytes": 98304}}, ...},
+        "tracemalloc": {"status": {...}, "top": [...], "diff": [...]}    # 未开启时为 null
+    }
+    """
+    denied = _require_admin()
+    if denied:
+        return denied
+    managers = {
+        'device_status_manager': device_status_manager,
+        'command_response_manager': command_response_manager,
+        'video_list_manager': video_list_manager,
+        'upload_progress_manager': upload_progress_manager,
+        'fleet_view': fleet_view
+    }
+    report = memory_profiler.report(
+        limit=max(1, min(request.args.get('limit', 30, type=int), 500)),
+        group_by=request.args.get('group_by', 'lineno'),
+        reset_baseline=request.args.get('reset') == '1'
+    )
+    return jsonify({
+        'success': True,
+        'managers': {name: container_sizes(manager) for name, manager in managers.items()},
+        'tracemalloc': report
+    })
+
+
+@main.route('/api/admin/profile/memory/snapshot', methods=['GET'])
+def download_memory_snapshot():
+    """下载当前 tracemalloc 快照（用 tracemalloc.Snapshot.load 读取后分析或与其他快照对比）"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    path = memory_profiler.dump_snapshot()
+    if path is None:
+        return jsonify({'success': False, 'message': '未开启 tracemalloc，请先调用 /api/admin/profile/memory/start'}), 409
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    finally:
+        os.remove(path)
+    response = Response(data, mimetype='application/octet-stream')
+    response.headers['Content-Disposition'] = (
+        f"attachment; filename=camlink-{datetime.now().strftime('%Y%m%d-%H%M%S')}.tracemalloc"
+    )
+    return response
+
+
+@main.route('/api/admin/profile/locks', methods=['GET', 'POST'])
+def profile_locks():
+    """
+    锁等待/持有时间统计
+
+    GET 返回统计；POST 修改设置:
+    - enabled: 1 开启 / 0 关闭统计（默认关闭，可用环境变量 LOCK_PROFILING=1 在启动时开启）
+    - reset: 1 清空已有统计
+    """
+    denied = _require_admin()
+    if denied:
+        return denied
+    if request.method == 'POST':
+        enabled = request.args.get('enabled')
+        if enabled is not None:
+            lock_profiler.enable(enabled == '1')
+        if request.args.get('reset') == '1':
+            lock_profiler.reset()
+    return jsonify({'success': True, **lock_profiler.report()})
+
+
+@main.route('/api/admin/capture', methods=['GET'])
+def get_traffic_capture():
+    """MQTT入站流量抓包状态（是否开启、目录、已写入消息数和分段文件）"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    return jsonify({'success': True, **traffic_capture.status()})
+
+
+@main.route('/api/admin/capture/start', methods=['POST'])
+def start_traffic_capture():
+    """
+    开始抓取状态监听器收到的MQTT消息，用 replay_capture.py 回放
+
+    查询参数:
+    - dir: 抓包根目录（环境变量 MQTT_CAPTURE_DIR，未设置时为 captures）下的子目录，默认直接写入根目录；
+      不接受绝对路径和 ..，解析符号链接后仍须位于根目录内
+    - segment_mb: 单个分段文件大小（MB，默认64）
+    - max_segments: 最多保留的分段数（默认0，不限制）
+    """
+    denied = _require_admin()
+    if denied:
+        return denied
+    base = Path(os.getenv('MQTT_CAPTURE_DIR') or 'captures').resolve()
+    subdir = request.args.get('dir', '')
+    directory = (base / subdir).resolve()
+    if (Path(subdir).is_absolute() or '..' in Path(subdir).parts
+            or (directory != base and base not in directory.parents)):
+        return jsonify({'success': False, 'message': 'dir 必须是抓包根目录下的相对路径'}), 400
+    segment_mb = max(1, request.args.get('segment_mb', 64, type=int))
+    max_segments = max(0, request.args.get('max_segments', 0, type=int))
+    try:
+        status = traffic_capture.start(directory, segment_bytes=segment_mb * 1024 * 1024, max_segments=max_segments)
+    except OSError as e:
+        return jsonify({'success': False, 'message': f'无法创建抓包文件: {e}'}), 400
+    return jsonify({'success': True, **status})
+
+
+@main.route('/api/admin/capture/stop', methods=['POST'])
+def stop_traffic_capture():
+    """停止抓包并关闭当前分段文件"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    return jsonify({'success': True, **traffic_capture.stop()})
\ No newline at end of file
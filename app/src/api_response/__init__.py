@@ -0,0 +1,23 @@
+"""
+API响应模块
+JSON快速序列化、按 Accept-Encoding 协商压缩，以及带版本号响应的编码结果缓存
+"""
+from .response_encoding import (
+    dumps,
+    loads,
+    FastJSONProvider,
+    json_response,
+    compress_response,
+    response_cache,
+    COMPRESS_MIN_SIZE
+)
+
+__all__ = [
+    'dumps',
+    'loads',
+    'FastJSONProvider',
+    'json_response',
+    'compress_response',
+    'response_cache',
+    'COMPRESS_MIN_SIZE'
+]
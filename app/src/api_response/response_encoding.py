@@ -0,0 +1,241 @@
+"""
+API响应序列化与压缩模块
+- JSON序列化：安装了 orjson 时使用 orjson，否则回退到标准库 json（输出等价）；
+  与 Flask 默认的 jsonify 一样遵循 app.json.sort_keys / compact（调试模式缩进），
+  区别只在于中文等非ASCII字符直接输出UTF-8而不转义为 \\uXXXX
+- 压缩：按请求头 Accept-Encoding 协商 br（需安装 brotli）/ gzip，只压缩超过阈值的文本类响应
+- 缓存：带版本号的响应（ETag 中包含数据版本）缓存序列化及压缩后的字节，数据不变时重复请求不再编码
+"""
+import gzip
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Union
+
+from flask import Response, current_app, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # 可选依赖
+    brotli = None
+
+# 小于该字节数的响应不压缩（压缩收益抵不过CPU开销和额外的头部）
+COMPRESS_MIN_SIZE = 1024
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# 会被压缩的响应类型
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/x-ndjson', 'application/javascript',
+    'text/html', 'text/plain', 'text/css', 'text/csv'
+}
+
+# 标准库回退时也能序列化 datetime / Decimal / UUID / dataclass 等（与 Flask 的 jsonify 一致）
+_default = DefaultJSONProvider.default
+
+
+def dumps(obj: Any, sort_keys: bool = False, indent: bool = False) -> bytes:
+    """
+    序列化为UTF-8编码的JSON字节（中文不转义）
+
+    Args:
+        sort_keys: 按键排序
+        indent: 缩进2格输出，否则为紧凑格式
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=_default, option=option)
+        except TypeError:
+            pass  # orjson 不支持的值（如超过64位的整数）交给标准库
+    return json.dumps(obj, ensure_ascii=False, sort_keys=sort_keys, default=_default,
+                      **({'indent': 2} if indent else {'separators': (',', ':')})).encode('utf-8')
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """让 jsonify / request.get_json 也使用 dumps / loads（遵循 sort_keys / compact 设置）"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj, sort_keys=self.sort_keys).decode('utf-8')
+
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(dumps(obj, sort_keys=self.sort_keys, indent=indent) + b'\n',
+                                        mimetype=self.mimetype)
+
+
+def negotiate_encoding() -> Optional[str]:
+    """根据当前请求的 Accept-Encoding 选择压缩算法：br 优先，其次 gzip，都不接受时返回None"""
+    accept = request.accept_encodings
+    if brotli is not None and accept.quality('br') > 0:
+        return 'br'
+    if accept.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class EncodedResponseCache:
+    """
+    编码结果缓存，线程安全
+    以 (cache_key, 压缩算法) 为键保存响应字节，按LRU淘汰，同时限制条目数和总字节数
+    """
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[tuple, bytes]' = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: tuple, body: bytes):
+        if len(body) > self.max_bytes // 4:
+            return  # 单个过大的响应不缓存，避免挤掉其他所有条目
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+# 全局单例
+response_cache = EncodedResponseCache()
+
+Payload = Union[dict, list, str, bytes]
+
+
+def json_response(payload: Union[Payload, Callable[[], Payload]], status: int = 200,
+                  cache_key: Optional[tuple] = None) -> Response:
+    """
+    生成（按需压缩的）JSON响应
+
+    Args:
+        payload: 要序列化的对象（按 app.json.sort_keys 排序键），或已序列化的 str / bytes；
+                 也可以是返回上述内容的函数，命中缓存时不会调用
+        status: HTTP状态码
+        cache_key: 缓存键，必须包含数据版本号（如 ETag）和所有影响内容的查询参数；
+                   为None时不缓存
+
+    Returns:
+        已设置 Content-Encoding / Vary 的响应；compress_response 不会再次处理
+    """
+    encoding = negotiate_encoding()
+    body = response_cache.get((cache_key, encoding)) if cache_key is not None and encoding else None
+    if body is None:
+        raw = response_cache.get((cache_key, None)) if cache_key is not None else None
+        if raw is None:
+            raw = _encode(payload() if callable(payload) else payload)
+            if cache_key is not None:
+                response_cache.put((cache_key, None), raw)
+        if encoding and len(raw) >= COMPRESS_MIN_SIZE:
+            body = compress(raw, encoding)
+            if cache_key is not None:
+                response_cache.put((cache_key, encoding), body)
+        else:
+            body, encoding = raw, None
+
+    response = Response(body, status=status, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.content_encoding = encoding
+    return response
+
+
+def compress_response(response: Response) -> Response:
+    """
+    after_request 钩子：压缩其余超过阈值的文本类响应（jsonify、页面等）
+
+    跳过流式响应、已编码的响应和非文本类型；
+    压缩后的响应与原文字节不同，强ETag改为弱ETag（条件GET按弱比较匹配）
+    """
+    if response.content_encoding:
+        _weaken_etag(response)
+        return response
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 206, 304) or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    if not encoding:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(compress(data, encoding))
+    response.content_encoding = encoding
+    _weaken_etag(response)
+    return response
+
+
+def _weaken_etag(response: Response):
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def _encode(data: Payload) -> bytes:
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, str):
+        return data.encode('utf-8')
+    return dumps(data, sort_keys=getattr(current_app.json, 'sort_keys', False))
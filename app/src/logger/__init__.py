@@ -0,0 +1,13 @@
+"""
+日志模块
+分级、按类别采样和限流的结构化日志，由后台线程写出
+"""
+from .structured_logger import (
+    get_logger,
+    configure_logging,
+    flush_logging,
+    CategoryLogger,
+    StructuredFormatter
+)
+
+__all__ = ['get_logger', 'configure_logging', 'flush_logging', 'CategoryLogger', 'StructuredFormatter']
@@ -0,0 +1,258 @@
+"""
+结构化日志模块
+基于标准库 logging：每条日志是一个简短事件名加 key=value 字段，按类别（camlink.<category>）分级；
+调用线程只做级别判断、采样/限流和入队，格式化与写 stdout 在后台线程完成
+
+配置（环境变量）:
+- LOG_LEVEL: 全局级别（DEBUG / INFO / WARNING / ERROR，默认 INFO）
+- LOG_FORMAT: text（默认）或 json（每行一个JSON对象）
+- LOG_SAMPLING: 按类别采样 DEBUG/INFO 日志，如 "mqtt.message=0.01,task=0.5"（WARNING及以上不采样）
+- LOG_RATE_LIMIT: 带 key 的重复日志在每个窗口内最多输出的条数（默认10）
+- LOG_RATE_WINDOW: 限流窗口（秒，默认60）
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from app.src.metrics import registry
+
+ROOT_LOGGER = 'camlink'
+
+# 日志队列容量，写出跟不上时丢弃新日志而不是阻塞调用线程
+QUEUE_SIZE = 10000
+
+log_dropped_total = registry.counter(
+    'camlink_log_dropped_total', 'Log records dropped because the log queue was full')
+log_suppressed_total = registry.counter(
+    'camlink_log_suppressed_total', 'Log records skipped by sampling or rate limiting', ('category', 'reason'))
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """非阻塞入队；不在调用线程格式化消息（字段在后台线程格式化）"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_dropped_total.inc()
+
+
+class StructuredFormatter(logging.Formatter):
+    """text: 时间 级别 类别 事件 key=value ...；json: 每行一个对象"""
+
+    def __init__(self, fmt: str = 'text'):
+        super().__init__()
+        self.fmt = fmt
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields: Dict[str, Any] = getattr(record, 'fields', {})
+        created = datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        category = record.name[len(ROOT_LOGGER) + 1:] if record.name.startswith(ROOT_LOGGER + '.') else record.name
+        message = record.getMessage()
+        if self.fmt == 'json':
+            entry = {'time': created, 'level': record.levelname, 'category': category, 'event': message, **fields}
+            if record.exc_info:
+                entry['exception'] = self.formatException(record.exc_info)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+        parts = [created, record.levelname.ljust(7), category, message]
+        parts.extend(f'{key}={_format_field(value)}' for key, value in fields.items())
+        line = ' '.join(parts)
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+def _format_field(value: Any) -> str:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    text = str(value)
+    return json.dumps(text, ensure_ascii=False) if (' ' in text or not text) else text
+
+
+class _RateLimiter:
+    """按 key 限流：每个窗口最多放行 limit 条，窗口结束后把被跳过的条数附在下一条上"""
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        # key -> [窗口开始时间, 已放行条数, 被跳过条数]
+        self._state: Dict[str, list] = {}
+
+    def allow(self, key: str) -> Optional[int]:
+        """放行时返回此前被跳过的条数（通常为0），不放行时返回None"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                if len(self._state) > 10000:
+                    self._state.clear()
+                self._state[key] = [now, 1, 0]
+                return suppressed
+            if state[1] < self.limit:
+                state[1] += 1
+                return 0
+            state[2] += 1
+            return None
+
+
+class _Settings:
+    """运行时配置（所有类别共享）"""
+
+    def __init__(self):
+        self.sampling: Dict[str, float] = {}
+        self.rate_limiter = _RateLimiter(10, 60.0)
+
+
+_settings = _Settings()
+_configure_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _parse_sampling(text: str) -> Dict[str, float]:
+    sampling = {}
+    for item in (text or '').split(','):
+        if '=' in item:
+            category, rate = item.split('=', 1)
+            try:
+                sampling[category.strip()] = max(0.0, min(1.0, float(rate)))
+            except ValueError:
+                pass
+    return sampling
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None,
+                      sampling: Optional[Dict[str, float]] = None, rate_limit: Optional[int] = None,
+                      rate_window: Optional[float] = None, stream=None) -> None:
+    """
+    配置日志（未传入的参数读取环境变量）；可重复调用，重复调用时替换输出目标和设置
+
+    Args:
+        level: 全局级别
+        fmt: text / json
+        sampling: {类别: 采样率0-1}，只作用于 DEBUG/INFO
+        rate_limit / rate_window: 带 key 的日志每个窗口最多输出的条数 / 窗口秒数
+        stream: 输出流，默认 stdout
+    """
+    global _listener
+    with _configure_lock:
+        level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+        fmt = fmt or os.getenv('LOG_FORMAT', 'text')
+        _settings.sampling = sampling if sampling is not None else _parse_sampling(os.getenv('LOG_SAMPLING', ''))
+        _settings.rate_limiter = _RateLimiter(
+            rate_limit if rate_limit is not None else int(os.getenv('LOG_RATE_LIMIT', '10')),
+            rate_window if rate_window is not None else float(os.getenv('LOG_RATE_WINDOW', '60'))
+        )
+
+        if _listener is not None:
+            _listener.stop()
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(StructuredFormatter(fmt))
+        log_queue: queue.Queue = queue.Queue(QUEUE_SIZE)
+        _listener = logging.handlers.QueueListener(log_queue, output)
+        _listener.start()
+
+        root = logging.getLogger(ROOT_LOGGER)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_DroppingQueueHandler(log_queue))
+        root.setLevel(level)
+        root.propagate = False
+
+
+def flush_logging() -> None:
+    """等待队列中的日志全部写出（停止并重启后台线程）"""
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener.start()
+
+
+def _shutdown():
+    if _listener is not None:
+        _listener.stop()
+
+
+atexit.register(_shutdown)
+
+
+class CategoryLogger:
+    """
+    某一类别的结构化日志
+
+    用法:
+        log = get_logger('mqtt.listener')
+        log.info('消息已处理', camera_id=camera_id, type=message_type)
+        log.warning('未知设备', key=f'unknown:{client_id}', client_id=client_id)   # 同一key限流
+
+    级别未启用时只有一次级别判断；DEBUG/INFO 按类别采样；传入 key 的日志按key限流
+    """
+
+    __slots__ = ('category', '_logger')
+
+    def __init__(self, category: str):
+        self.category = category
+        self._logger = logging.getLogger(f'{ROOT_LOGGER}.{category}')
+
+    def is_enabled(self, level: int) -> bool:
+        """用于跳过昂贵的字段计算：if log.is_enabled(logging.DEBUG): ..."""
+        return self._logger.isEnabledFor(level)
+
+    def _log(self, level: int, event: str, key: Optional[str], exc_info, fields: Dict[str, Any]):
+        if not self._logger.isEnabledFor(level):
+            return
+        if level < logging.WARNING:
+            rate = _settings.sampling.get(self.category)
+            if rate is not None and random.random() >= rate:
+                log_suppressed_total.inc(self.category, 'sampled')
+                return
+        if key is not None:
+            suppressed = _settings.rate_limiter.allow(f'{self.category}:{key}')
+            if suppressed is None:
+                log_suppressed_total.inc(self.category, 'rate_limited')
+                return
+            if suppressed:
+                fields['suppressed'] = suppressed
+        self._logger.log(level, event, exc_info=exc_info, extra={'fields': fields})
+
+    def debug(self, event: str, key: Optional[str] = None, **fields):
+        self._log(logging.DEBUG, event, key, None, fields)
+
+    def info(self, event: str, key: Optional[str] = None, **fields):
+        self._log(logging.INFO, event, key, None, fields)
+
+    def warning(self, event: str, key: Optional[str] = None, **fields):
+        self._log(logging.WARNING, event, key, None, fields)
+
+    def error(self, event: str, key: Optional[str] = None, **fields):
+        self._log(logging.ERROR, event, key, None, fields)
+
+    def exception(self, event: str, key: Optional[str] = None, **fields):
+        """ERROR级别并附带当前异常的堆栈（在 except 块中调用）"""
+        self._log(logging.ERROR, event, key, True, fields)
+
+
+_loggers: Dict[str, CategoryLogger] = {}
+
+
+def get_logger(category: str) -> CategoryLogger:
+    """获取类别日志（首次使用时按环境变量完成默认配置）"""
+    logger = _loggers.get(category)
+    if logger is None:
+        if _listener is None:
+            configure_logging()
+        logger = _loggers.setdefault(category, CategoryLogger(category))
+    return logger
@@ -0,0 +1,27 @@
+"""
+指标模块
+进程内的计数器 / 仪表 / 直方图，以及HTTP请求计时中间件，由 /metrics 以 Prometheus 文本格式导出
+"""
+from .prometheus import (
+    registry,
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+    histogram_quantile,
+    LATENCY_BUCKETS,
+    SIZE_BUCKETS
+)
+from .http_metrics import RequestMetrics
+
+__all__ = [
+    'registry',
+    'Counter',
+    'Gauge',
+    'Histogram',
+    'MetricsRegistry',
+    'histogram_quantile',
+    'LATENCY_BUCKETS',
+    'SIZE_BUCKETS',
+    'RequestMetrics'
+]
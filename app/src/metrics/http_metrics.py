@@ -0,0 +1,138 @@
+"""
+HTTP请求计时中间件
+包在 Flask 的 wsgi_app 外层，按路由记录请求耗时、状态码、响应大小和并发数；
+耗时统计到响应体发送完毕为止（包括流式响应），超过阈值的请求记入慢请求日志
+
+配置（环境变量）:
+- SLOW_REQUEST_MS: 慢请求阈值（毫秒，默认1000，0表示不记录）
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Iterable, List, Optional
+
+from flask import Flask, request
+
+from .prometheus import registry, SIZE_BUCKETS
+
+# 中间件在 environ 中读取的路由名（由 before_request 钩子写入）
+ENDPOINT_ENVIRON_KEY = 'camlink.endpoint'
+
+# 未匹配到路由的请求（404等）统一记为该名称，避免任意路径成为标签值
+UNMATCHED_ENDPOINT = 'unmatched'
+
+http_requests_total = registry.counter(
+    'camlink_http_requests_total', 'HTTP requests by endpoint, method and status code',
+    ('endpoint', 'method', 'status'))
+http_request_duration = registry.histogram(
+    'camlink_http_request_duration_seconds', 'HTTP request latency until the response body is sent',
+    ('endpoint', 'method'))
+http_response_size = registry.histogram(
+    'camlink_http_response_size_bytes', 'HTTP response body size as sent (after compression)',
+    ('endpoint',), buckets=SIZE_BUCKETS)
+http_requests_in_flight = registry.gauge(
+    'camlink_http_requests_in_flight', 'HTTP requests currently being handled')
+http_slow_requests_total = registry.counter(
+    'camlink_http_slow_requests_total', 'HTTP requests slower than SLOW_REQUEST_MS',
+    ('endpoint',))
+
+
+class RequestMetrics:
+    """WSGI中间件，线程安全"""
+
+    def __init__(self, app: Flask, slow_request_ms: Optional[float] = None, slow_log_size: int = 100):
+        """
+        Args:
+            app: Flask应用，包装其 wsgi_app，并注册记录路由名的 before_request 钩子
+            slow_request_ms: 慢请求阈值，默认读取 SLOW_REQUEST_MS（1000）
+            slow_log_size: 内存中保留的最近慢请求条数
+        """
+        if slow_request_ms is None:
+            slow_request_ms = float(os.getenv('SLOW_REQUEST_MS', '1000'))
+        self.slow_request_ms = slow_request_ms
+        # 日志模块导入时依赖 metrics 包，这里延迟导入避免循环导入
+        from app.src.logger import get_logger
+        self._log = get_logger('http')
+        self._lock = threading.Lock()
+        self._slow_requests = deque(maxlen=slow_log_size)
+        self.wsgi_app = app.wsgi_app
+        app.wsgi_app = self
+        app.before_request(self._record_endpoint)
+
+    @staticmethod
+    def _record_endpoint():
+        request.environ[ENDPOINT_ENVIRON_KEY] = request.endpoint or UNMATCHED_ENDPOINT
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        http_requests_in_flight.inc()
+        status = ['500']
+
+        def _start_response(status_line, headers, exc_info=None):
+            status[0] = status_line.split(' ', 1)[0]
+            return start_response(status_line, headers, exc_info)
+
+        try:
+            body = self.wsgi_app(environ, _start_response)
+        except BaseException:
+            self._finish(environ, status[0], started, 0)
+            raise
+        return _ResponseBody(body, lambda size: self._finish(environ, status[0], started, size))
+
+    def _finish(self, environ, status: str, started: float, size: int):
+        elapsed = time.perf_counter() - started
+        http_requests_in_flight.dec()
+        endpoint = environ.get(ENDPOINT_ENVIRON_KEY, UNMATCHED_ENDPOINT)
+        method = environ.get('REQUEST_METHOD', '')
+        http_requests_total.inc(endpoint, method, status)
+        http_request_duration.observe(elapsed, endpoint, method)
+        http_response_size.observe(size, endpoint)
+        elapsed_ms = elapsed * 1000
+        if self.slow_request_ms and elapsed_ms >= self.slow_request_ms:
+            http_slow_requests_total.inc(endpoint)
+            entry = {
+                'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'method': method,
+                'path': environ.get('PATH_INFO', ''),
+                'query': environ.get('QUERY_STRING', ''),
+                'endpoint': endpoint,
+                'status': status,
+                'duration_ms': round(elapsed_ms, 1),
+                'bytes': size
+            }
+            with self._lock:
+                self._slow_requests.append(entry)
+            self._log.warning('慢请求', key=f'slow:{endpoint}', method=method, path=entry['path'], endpoint=endpoint,
+                              status=status, duration_ms=entry['duration_ms'], bytes=size)
+
+    def slow_requests(self) -> List[dict]:
+        """最近的慢请求（新的在前）"""
+        with self._lock:
+            return list(reversed(self._slow_requests))
+
+
+class _ResponseBody:
+    """包装WSGI响应体：统计发送的字节数，在服务器关闭响应时结束计时（只结束一次）"""
+
+    def __init__(self, body: Iterable[bytes], on_close):
+        self._body = body
+        self._on_close = on_close
+        self._size = 0
+        self._closed = False
+
+    def __iter__(self):
+        for chunk in self._body:
+            self._size += len(chunk)
+            yield chunk
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            close = getattr(self._body, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self._on_close(self._size)
@@ -3,6 +3,10 @@
 包含状态数据管理和状态消息监听功能
 """
 from .device_status import device_status_manager, DeviceStatusManager
-from .status_listener import create_status_listener
+from .status_listener import create_status_listener, handle_message
+from .fleet_view import fleet_view, FleetView
+from .pipeline_metrics import pipeline_metrics, MqttPipelineMetrics
+from .traffic_capture import traffic_capture, TrafficCapture, read_capture
 
-__all__ = ['device_status_manager', 'DeviceStatusManager', 'create_status_listener']
+__all__ = ['device_status_manager', 'DeviceStatusManager', 'create_status_listener', 'handle_message', 'fleet_view',
+           'FleetView', 'pipeline_metrics', 'MqttPipelineMetrics', 'traffic_capture', 'TrafficCapture', 'read_capture']
@@ -3,16 +3,33 @@
 用于存储和管理摄像头设备的状态信息
 """
 import json
-import threading
+import time
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Callable, Dict, List, Optional, Tuple
+from app.src.logger import get_logger
+from app.src.profiling import ProfiledLock
+
+log = get_logger('device_status')
 
 class DeviceStatusManager:
     """设备状态管理器，线程安全"""
     
     def __init__(self):
         self._statuses: Dict[str, dict] = {}
-        self._lock = threading.Lock()
+        self._lock = ProfiledLock('device_status_manager')
+        self._listeners: List[Callable[[str, dict], None]] = []
+        # 变化计数与最后修改时间，用于条件GET（ETag / Last-Modified）
+        self._version = 0
+        self._modified_at = time.time()
+
+    def add_listener(self, callback: Callable[[str, dict], None]):
+        """
+        注册状态变化监听器，每次 update_status 后在调用线程中执行
+
+        Args:
+            callback: 参数为 (camera_id, 更新后的状态副本)
+        """
+        self._listeners.append(callback)
     
     def update_status(self, camera_id: str, status_data: dict):
         """
@@ -42,7 +59,21 @@ class DeviceStatusManager:
                 'last_update': datetime.now().isoformat(),
                 'request_id': status_data.get('request_id', '')
             })
+            snapshot = dict(self._statuses[camera_id])
+            self._version += 1
+            self._modified_at = time.time()
+
+        for listener in self._listeners:
+            try:
+                listener(camera_id, snapshot)
+            except Exception:
+                log.exception('设备状态监听器出错', key='listener', camera_id=camera_id)
     
+    def version_info(self) -> Tuple[int, float]:
+        """返回 (变化计数, 最后修改时间戳)"""
+        with self._lock:
+            return self._version, self._modified_at
+
     def get_status(self, camera_id: str) -> Optional[dict]:
         """
         获取设备状态
@@ -0,0 +1,333 @@
+"""
+设备列表物化视图模块
+把数据库中的设备记录与内存中的实时状态预先合并并序列化为JSON，
+设备表写入或实时状态变化时只增量更新受影响的设备；
+/api/camera/status/list 直接从内存返回，不再每次查询数据库并逐个合并
+"""
+import bisect
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.src.sqllite import list_devices, get_device, add_device_listener
+from app.src.logger import get_logger
+from app.src.profiling import ProfiledLock
+from .device_status import device_status_manager
+
+log = get_logger('fleet_view')
+
+# 状态转换：中文 -> 英文
+STATUS_MAP = {
+    '在线': 'online',
+    '离线': 'offline',
+    'online': 'online',
+    'offline': 'offline'
+}
+
+# 内存中的实时状态覆盖数据库记录的字段
+LIVE_FIELDS = ('status', 'run_state', 'left_storage', 'electric_percent', 'network_signal_strength', 'last_update')
+
+# 渲染结果缓存的最大条目数（不同的分页/过滤组合）
+PAGE_CACHE_SIZE = 256
+
+
+def convert_device_to_api_format(device_dict):
+    """
+    将数据库中的设备记录转换为API返回格式
+
+    数据库字段 -> API字段映射：
+    - hardware_id -> camera_id
+    - status -> status (转换为 online/offline)
+    - last_online -> last_update
+    """
+    return {
+        'camera_id': device_dict.get('hardware_id', ''),
+        'status': STATUS_MAP.get(device_dict.get('status', 'offline'), 'offline'),
+        'run_state': device_dict.get('run_state', 'stopped'),  # 默认为stopped
+        'left_storage': device_dict.get('left_storage', 0),
+        'electric_percent': device_dict.get('electric_percent', 0) / 100.0 if device_dict.get('electric_percent') else 0,  # 转换为0-1的小数
+        'network_signal_strength': device_dict.get('network_signal_strength', 0),
+        'last_update': device_dict.get('last_online', ''),
+        # 额外字段供详情页使用
+        'client_id': device_dict.get('client_id', ''),
+        'hotel': device_dict.get('hotel', ''),
+        'location': device_dict.get('location', ''),
+        'wifi': device_dict.get('wifi', ''),
+        'runtime': device_dict.get('runtime', ''),
+        'firmware': device_dict.get('fw', 'v2.1.3')
+    }
+
+
+def merge_live_status(device: dict, live: Optional[dict]) -> dict:
+    """用内存中的实时状态覆盖API格式的设备记录（返回新字典）"""
+    merged = dict(device)
+    if live:
+        for field in LIVE_FIELDS:
+            merged[field] = live.get(field, merged[field])
+    return merged
+
+
+class _Entry:
+    """一台设备：数据库记录、转换结果、合并实时状态后的结果及其JSON"""
+
+    __slots__ = ('id', 'hotel', 'row', 'base', 'data', 'json')
+
+    def __init__(self, row: dict, live: Optional[dict]):
+        self.id = row['id']
+        self.hotel = row.get('hotel') or ''
+        self.row = row
+        self.base = convert_device_to_api_format(row)
+        self.set_live(live)
+
+    def set_live(self, live: Optional[dict]):
+        self.data = merge_live_status(self.base, live)
+        self.json = json.dumps(self.data, ensure_ascii=False)
+
+
+class FleetView:
+    """设备列表物化视图，线程安全"""
+
+    def __init__(self, resync_seconds: float = 600.0):
+        """
+        Args:
+            resync_seconds: 定期从数据库全量重建的间隔（兜底其他进程直接修改数据库的情况）
+        """
+        self.resync_seconds = resync_seconds
+        self._lock = ProfiledLock('fleet_view')
+        # 串行化数据库回读，保证同一设备的多次修改按顺序生效
+        self._refresh_lock = threading.Lock()
+        self._entries: Dict[int, _Entry] = {}
+        self._by_hardware: Dict[str, int] = {}
+        # 设备id升序排列，按id倒序翻页时从末尾向前遍历
+        self._ids: List[int] = []
+        self._hotel_ids: Dict[str, List[int]] = {}
+        self._loaded_at = 0.0
+        self._resyncing = False
+        self._version = 0
+        self._modified_at = time.time()
+        self._page_cache: Dict[tuple, Tuple[int, str]] = {}
+        self.loads = 0
+        self.incremental_updates = 0
+
+    # ==================== 构建与增量更新 ====================
+
+    def load(self) -> int:
+        """从数据库全量构建视图，返回设备数"""
+        with self._refresh_lock:
+            rows = []
+            before_id = None
+            while True:
+                page = list_devices(limit=1000, before_id=before_id)
+                rows.extend(page)
+                if len(page) < 1000:
+                    break
+                before_id = page[-1]['id']
+            live = device_status_manager.get_all_statuses()
+            entries = {row['id']: _Entry(row, live.get(row['hardware_id'])) for row in rows}
+            hotel_ids: Dict[str, List[int]] = {}
+            for device_id in sorted(entries):
+                hotel_ids.setdefault(entries[device_id].hotel, []).append(device_id)
+            with self._lock:
+                self._entries = entries
+                self._by_hardware = {row['hardware_id']: row['id'] for row in rows}
+                self._ids = sorted(entries)
+                self._hotel_ids = hotel_ids
+                self._loaded_at = time.time()
+                self._changed()
+                self.loads += 1
+            return len(entries)
+
+    def _changed(self):
+        """视图内容变化（调用方需持有锁）"""
+        self._version += 1
+        self._modified_at = time.time()
+        self._page_cache.clear()
+
+    def _remove_locked(self, device_id: int):
+        entry = self._entries.pop(device_id, None)
+        if entry is None:
+            return
+        for ids in (self._ids, self._hotel_ids.get(entry.hotel)):
+            if ids is not None:
+                i = bisect.bisect_left(ids, device_id)
+                if i < len(ids) and ids[i] == device_id:
+                    del ids[i]
+        if not self._hotel_ids.get(entry.hotel):
+            self._hotel_ids.pop(entry.hotel, None)
+
+    def _put_locked(self, hardware_id: str, entry: _Entry):
+        self._remove_locked(entry.id)
+        old_id = self._by_hardware.get(hardware_id)
+        if old_id is not None and old_id != entry.id:
+            self._remove_locked(old_id)
+        self._entries[entry.id] = entry
+        self._by_hardware[hardware_id] = entry.id
+        bisect.insort(self._ids, entry.id)
+        bisect.insort(self._hotel_ids.setdefault(entry.hotel, []), entry.id)
+
+    def on_devices_changed(self, hardware_ids: List[str], deleted: bool = False, patch: Optional[dict] = None):
+        """
+        设备表写入后的监听器：只更新受影响的设备
+
+        update_device 会带上已写入的字段，已缓存的设备直接在内存中合并，不回读数据库；
+        合并实时状态后内容没有变化（如状态上报同时写库的字段已由实时状态覆盖）时不重新序列化
+        """
+        if not self._loaded_at:
+            return
+        with self._refresh_lock:
+            for hardware_id in hardware_ids:
+                if patch is not None and not deleted:
+                    with self._lock:
+                        device_id = self._by_hardware.get(hardware_id)
+                        entry = self._entries.get(device_id) if device_id is not None else None
+                        if entry is not None:
+                            self._apply_patch_locked(hardware_id, entry, patch)
+                            continue
+                row = None if deleted else get_device(hardware_id)
+                live = device_status_manager.get_status(hardware_id)
+                with self._lock:
+                    if row is None:
+                        device_id = self._by_hardware.pop(hardware_id, None)
+                        if device_id is not None:
+                            self._remove_locked(device_id)
+                    else:
+                        self._put_locked(hardware_id, _Entry(row, live))
+                    self._changed()
+                    self.incremental_updates += 1
+
+    def _apply_patch_locked(self, hardware_id: str, entry: _Entry, patch: dict):
+        row = {**entry.row, **patch}
+        base = convert_device_to_api_format(row)
+        if (row.get('hotel') or '') != entry.hotel:
+            # 酒店变化需要调整索引
+            self._put_locked(hardware_id, _Entry(row, device_status_manager.get_status(hardware_id)))
+        elif base == entry.base:
+            entry.row = row
+            return
+        else:
+            entry.row, entry.base = row, base
+            data = merge_live_status(base, device_status_manager.get_status(hardware_id))
+            if data == entry.data:
+                return
+            entry.data, entry.json = data, json.dumps(data, ensure_ascii=False)
+        self._changed()
+        self.incremental_updates += 1
+
+    def on_status_changed(self, camera_id: str, live: dict):
+        """内存实时状态变化后的监听器：只重新合并并序列化这一台设备"""
+        with self._lock:
+            device_id = self._by_hardware.get(camera_id)
+            if device_id is None:
+                return
+            self._entries[device_id].set_live(live)
+            self._changed()
+            self.incremental_updates += 1
+
+    def _ensure_loaded(self):
+        """首次使用时同步构建；超过 resync_seconds 时在后台重建，期间继续使用当前视图"""
+        if not self._loaded_at:
+            self.load()
+            return
+        if time.time() - self._loaded_at < self.resync_seconds:
+            return
+        with self._lock:
+            if self._resyncing:
+                return
+            self._resyncing = True
+
+        def resync():
+            try:
+                self.load()
+            except Exception:
+                log.exception('重建设备列表视图失败', key='resync')
+            finally:
+                with self._lock:
+                    self._resyncing = False
+
+        threading.Thread(target=resync, name='fleet-view-resync', daemon=True).start()
+
+    # ==================== 查询 ====================
+
+    def _select_locked(self, limit: int, before_id: Optional[int], hotel: Optional[str],
+                       status: Optional[str]) -> Tuple[List[_Entry], Optional[int]]:
+        ids = self._hotel_ids.get(hotel, []) if hotel else self._ids
+        end = bisect.bisect_left(ids, before_id) if before_id is not None else len(ids)
+        selected = []
+        for i in range(end - 1, -1, -1):
+            entry = self._entries[ids[i]]
+            if status and entry.data['status'] != status:
+                continue
+            selected.append(entry)
+            if len(selected) >= limit:
+                break
+        next_cursor = selected[-1].id if len(selected) >= limit else None
+        return selected, next_cursor
+
+    def page(self, limit: int = 100, before_id: Optional[int] = None, hotel: Optional[str] = None,
+             status: Optional[str] = None) -> Tuple[List[dict], Optional[int]]:
+        """
+        按设备id倒序分页
+
+        Args:
+            limit: 每页数量
+            before_id: 游标（上一页返回的 next_cursor）
+            hotel: 按酒店过滤
+            status: online / offline（合并实时状态后的状态）
+
+        Returns:
+            (API格式的设备列表（只读，勿修改）, next_cursor)
+        """
+        self._ensure_loaded()
+        with self._lock:
+            entries, next_cursor = self._select_locked(limit, before_id, hotel, status)
+            return [entry.data for entry in entries], next_cursor
+
+    def render_page(self, limit: int = 100, before_id: Optional[int] = None, hotel: Optional[str] = None,
+                    status: Optional[str] = None) -> str:
+        """
+        返回完整的响应JSON（{success, count, next_cursor, data}），
+        由各设备预先序列化的JSON拼接而成，并按版本缓存
+        """
+        self._ensure_loaded()
+        key = (limit, before_id, hotel, status)
+        with self._lock:
+            cached = self._page_cache.get(key)
+            if cached is not None:
+                return cached[1]
+            entries, next_cursor = self._select_locked(limit, before_id, hotel, status)
+            body = '{"success": true, "count": %d, "next_cursor": %s, "data": [%s]}' % (
+                len(entries), json.dumps(next_cursor), ', '.join(entry.json for entry in entries)
+            )
+            if len(self._page_cache) >= PAGE_CACHE_SIZE:
+                self._page_cache.clear()
+            self._page_cache[key] = (self._version, body)
+            return body
+
+    @property
+    def version(self) -> int:
+        """内容版本号，任何设备变化都会递增"""
+        return self._version
+
+    def version_info(self) -> Tuple[int, float]:
+        """返回 (内容版本号, 最后修改时间戳)；视图尚未构建时先构建"""
+        self._ensure_loaded()
+        with self._lock:
+            return self._version, self._modified_at
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'devices': len(self._entries),
+                'version': self._version,
+                'loaded_at': self._loaded_at,
+                'loads': self.loads,
+                'incremental_updates': self.incremental_updates,
+                'cached_pages': len(self._page_cache)
+            }
+
+
+# 全局单例，设备表写入和实时状态变化时自动增量更新
+fleet_view = FleetView()
+add_device_listener(fleet_view.on_devices_changed)
+device_status_manager.add_listener(fleet_view.on_status_changed)
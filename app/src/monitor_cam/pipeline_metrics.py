@@ -0,0 +1,187 @@
+"""
+MQTT入站管道指标模块
+统计状态监听器每类主题的消息速率、各处理阶段耗时（解码 / 设备查询 / 分发处理 / 写数据库）、
+设备上报时间与接收时间的延迟、未知设备比例以及断线重连次数，由 /metrics 导出
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from app.src.metrics import registry, histogram_quantile
+from app.src.sqllite.sqllite_time import to_epoch_ms
+
+# 统计速率的消息类型（主题最后一段，另加未知设备和无效消息）
+MESSAGE_TYPES = ('resp', 'state', 'upload_file_status')
+
+# 监听器的处理阶段（handle 包含 db_write）
+STAGES = ('decode', 'lookup', 'handle', 'db_write')
+
+# 设备消息中可能携带的上报时间字段（epoch秒/毫秒或时间字符串），按顺序取第一个
+REPORT_TIME_FIELDS = ('timestamp', 'ts', 'report_time', 'time')
+
+# 各处理阶段耗时分桶（秒），单条消息通常在毫秒以内
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# 上报延迟分桶（秒）
+LAG_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+mqtt_messages_total = registry.counter(
+    'camlink_mqtt_messages_total', 'Inbound MQTT messages by topic type', ('type',))
+mqtt_message_rate = registry.gauge(
+    'camlink_mqtt_messages_per_second', 'Inbound MQTT messages per second over the last window', ('type',))
+mqtt_stage_duration = registry.histogram(
+    'camlink_mqtt_stage_duration_seconds',
+    'Time spent per message in each listener stage (decode, lookup, handle, db_write; handle includes db_write)',
+    ('stage',), buckets=STAGE_BUCKETS)
+mqtt_report_lag = registry.histogram(
+    'camlink_mqtt_report_lag_seconds', 'Received time minus device-reported time', ('type',), buckets=LAG_BUCKETS)
+mqtt_unknown_clients_total = registry.counter(
+    'camlink_mqtt_unknown_client_messages_total', 'Messages from client ids with no device record')
+mqtt_errors_total = registry.counter(
+    'camlink_mqtt_message_errors_total', 'Messages that failed by reason (invalid_topic, decode, handler)', ('reason',))
+mqtt_connects_total = registry.counter(
+    'camlink_mqtt_connects_total', 'Successful connections of the status listener (reconnects = value - 1)')
+mqtt_disconnects_total = registry.counter(
+    'camlink_mqtt_disconnects_total', 'Disconnections of the status listener')
+mqtt_connected = registry.gauge(
+    'camlink_mqtt_connected', 'Whether the status listener is connected')
+
+
+class _RateWindow:
+    """按秒分桶的滑动窗口计数，用于计算最近 window 秒的平均速率"""
+
+    def __init__(self, window: int = 60):
+        self.window = window
+        self._buckets: Dict[int, Dict[str, int]] = {}
+
+    def add(self, key: str, now: float):
+        second = int(now)
+        bucket = self._buckets.get(second)
+        if bucket is None:
+            bucket = self._buckets[second] = {}
+            for old in [s for s in self._buckets if s <= second - self.window]:
+                del self._buckets[old]
+        bucket[key] = bucket.get(key, 0) + 1
+
+    def rates(self, now: float) -> Dict[str, float]:
+        start = int(now) - self.window
+        totals: Dict[str, int] = {}
+        for second, bucket in self._buckets.items():
+            if second > start:
+                for key, count in bucket.items():
+                    totals[key] = totals.get(key, 0) + count
+        return {key: count / self.window for key, count in totals.items()}
+
+
+class MqttPipelineMetrics:
+    """状态监听器的入站指标，线程安全"""
+
+    def __init__(self, rate_window: int = 60):
+        """
+        Args:
+            rate_window: 计算消息速率的滑动窗口（秒）
+        """
+        self._lock = threading.Lock()
+        self._window = _RateWindow(rate_window)
+
+    def received(self, message_type: str):
+        """收到一条消息（message_type 为 resp / state / upload_file_status）"""
+        mqtt_messages_total.inc(message_type)
+        with self._lock:
+            self._window.add(message_type, time.time())
+
+    def unknown_client(self):
+        mqtt_unknown_clients_total.inc()
+        with self._lock:
+            self._window.add('unknown_client', time.time())
+
+    def error(self, reason: str):
+        mqtt_errors_total.inc(reason)
+
+    @contextmanager
+    def stage(self, name: str):
+        """记录一个处理阶段的耗时：with pipeline_metrics.stage('lookup'): ..."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            mqtt_stage_duration.observe(time.perf_counter() - started, name)
+
+    def report_lag(self, message_type: str, data: dict, received_at: Optional[float] = None) -> Optional[float]:
+        """
+        消息中带有上报时间时记录上报延迟
+
+        Returns:
+            延迟秒数（设备时钟超前时记为0）；消息中没有可解析的上报时间时返回None
+        """
+        for field in REPORT_TIME_FIELDS:
+            if field in data:
+                try:
+                    reported_ms = to_epoch_ms(data[field])
+                except (TypeError, ValueError):
+                    continue
+                if reported_ms is None:
+                    continue
+                received_at = received_at if received_at is not None else time.time()
+                lag = max(0.0, received_at - reported_ms / 1000)
+                mqtt_report_lag.observe(lag, message_type)
+                return lag
+        return None
+
+    def connected(self):
+        mqtt_connects_total.inc()
+        mqtt_connected.set(1)
+
+    def disconnected(self):
+        mqtt_disconnects_total.inc()
+        mqtt_connected.set(0)
+
+    def rate_samples(self) -> Dict[tuple, float]:
+        """{(消息类型,): 每秒消息数}，供 camlink_mqtt_messages_per_second 导出"""
+        with self._lock:
+            rates = self._window.rates(time.time())
+        return {(key,): round(rate, 3) for key, rate in rates.items()}
+
+    def stage_snapshot(self) -> Dict[str, dict]:
+        """各阶段耗时直方图的当前快照，作为 stage_stats 的起点"""
+        return {name: mqtt_stage_duration.snapshot(name) for name in STAGES}
+
+    def stage_stats(self, since: Optional[Dict[str, dict]] = None) -> Dict[str, dict]:
+        """
+        各阶段耗时汇总 {stage: {count, avg_ms, p50_ms, p99_ms}}，分位数按分桶插值估算
+
+        Args:
+            since: 之前的 stage_snapshot()，只统计此后处理的消息
+        """
+        result = {}
+        for name, snapshot in self.stage_snapshot().items():
+            before = since.get(name) if since else None
+            count = snapshot['count'] - (before['count'] if before else 0)
+            total = snapshot['sum'] - (before['sum'] if before else 0)
+            result[name] = {
+                'count': count,
+                'avg_ms': round(total / count * 1000, 4) if count else 0.0,
+                'p50_ms': round(histogram_quantile(0.5, snapshot, before) * 1000, 4),
+                'p99_ms': round(histogram_quantile(0.99, snapshot, before) * 1000, 4)
+            }
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            rates = self._window.rates(time.time())
+        connects = mqtt_connects_total.value()
+        return {
+            'messages': {t: mqtt_messages_total.value(t) for t in MESSAGE_TYPES},
+            'messages_per_second': {k: round(v, 3) for k, v in rates.items()},
+            'unknown_client_messages': mqtt_unknown_clients_total.value(),
+            'connects': connects,
+            'reconnects': max(0, connects - 1),
+            'disconnects': mqtt_disconnects_total.value(),
+            'connected': bool(mqtt_connected.value())
+        }
+
+
+# 全局单例
+pipeline_metrics = MqttPipelineMetrics()
+mqtt_message_rate.set_function(pipeline_metrics.rate_samples)
@@ -0,0 +1,230 @@
+"""
+MQTT入站流量抓包模块
+把状态监听器收到的每条消息（接收时间、主题、原始内容）追加写入分段的二进制抓包文件，
+供 replay_capture.py 离线按原速 / N倍速 / 最快速度回放，作为入站链路可复现的性能基准
+
+文件格式（每个分段独立可读）:
+    文件头 b'CAMCAP1\\n'
+    记录   struct '!dHI'（接收时间epoch秒, 主题字节数, 内容字节数） + 主题(UTF-8) + 内容
+"""
+import atexit
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple, Union
+
+from app.src.logger import get_logger
+
+log = get_logger('mqtt.capture')
+
+MAGIC = b'CAMCAP1\n'
+RECORD_HEADER = struct.Struct('!dHI')
+SEGMENT_SUFFIX = '.camcap'
+
+# 默认单个分段大小（字节）
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+
+# 写缓冲超过该大小、写满当前分段或距上次落盘超过该间隔时写入文件
+FLUSH_BYTES = 256 * 1024
+FLUSH_INTERVAL = 1.0
+
+
+class TrafficCapture:
+    """
+    入站消息抓包器，线程安全
+
+    未开启时 record 前只需检查 enabled 属性，不影响监听器的处理路径；
+    开启后记录先进入内存缓冲，按大小或时间批量写入当前分段，分段写满后滚动到新文件
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enabled = False
+        self._directory: Optional[Path] = None
+        self._segment_bytes = DEFAULT_SEGMENT_BYTES
+        self._max_segments = 0
+        self._file = None
+        self._segment_path: Optional[Path] = None
+        self._segment_size = 0
+        self._segment_seq = 0
+        self._prefix = ''
+        self._buffer = bytearray()
+        self._last_flush = 0.0
+        self._started_at: Optional[float] = None
+        self.messages = 0
+        self.bytes = 0
+        self.segments: List[str] = []
+
+    def start(self, directory: Union[str, Path], segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+              max_segments: int = 0) -> dict:
+        """
+        开始抓包（已在抓包时先结束当前抓包）
+
+        Args:
+            directory: 抓包文件目录（不存在时创建）
+            segment_bytes: 单个分段文件的大小上限
+            max_segments: 最多保留的分段数，超出时删除最早的分段；0表示不限制
+        """
+        self.stop()
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._directory = directory
+            self._segment_bytes = max(int(segment_bytes), 4096)
+            self._max_segments = max(int(max_segments), 0)
+            self._started_at = time.time()
+            # 文件名含毫秒，同一目录内重新开始抓包不会覆盖之前的分段
+            self._prefix = time.strftime('capture-%Y%m%d-%H%M%S', time.localtime(self._started_at)) + \
+                f'{int(self._started_at * 1000) % 1000:03d}'
+            self._segment_seq = 0
+            self.messages = 0
+            self.bytes = 0
+            self.segments = []
+            self._open_segment()
+            self.enabled = True
+        log.info('开始抓取MQTT入站流量', directory=str(directory), segment_bytes=self._segment_bytes)
+        return self.status()
+
+    def stop(self) -> dict:
+        """结束抓包并关闭当前分段"""
+        with self._lock:
+            if self.enabled:
+                self.enabled = False
+                self._close_segment()
+                log.info('已停止抓取MQTT入站流量', messages=self.messages, segments=len(self.segments))
+        return self.status()
+
+    def flush(self):
+        """把缓冲中的记录写入文件"""
+        with self._lock:
+            if self.enabled:
+                self._flush()
+
+    def record(self, topic: str, payload: bytes, received_at: Optional[float] = None):
+        """追加一条入站消息（未开启时直接返回；写盘或滚动分段失败时停止抓包，不抛出异常）"""
+        if not self.enabled:
+            return
+        received_at = received_at if received_at is not None else time.time()
+        topic_bytes = topic.encode('utf-8')
+        payload = bytes(payload)
+        with self._lock:
+            if not self.enabled:
+                return
+            self._buffer += RECORD_HEADER.pack(received_at, len(topic_bytes), len(payload))
+            self._buffer += topic_bytes
+            self._buffer += payload
+            self.messages += 1
+            if (len(self._buffer) >= FLUSH_BYTES or self._segment_size + len(self._buffer) >= self._segment_bytes
+                    or time.monotonic() - self._last_flush >= FLUSH_INTERVAL):
+                self._flush()
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'directory': str(self._directory) if self._directory else None,
+                'started_at': self._started_at,
+                'messages': self.messages,
+                'bytes': self.bytes + len(self._buffer),
+                'segment_bytes': self._segment_bytes,
+                'max_segments': self._max_segments,
+                'segments': list(self.segments)
+            }
+
+    # ==================== 分段文件 ====================
+
+    def _open_segment(self):
+        self._segment_seq += 1
+        self._segment_path = self._directory / f'{self._prefix}-{self._segment_seq:05d}{SEGMENT_SUFFIX}'
+        self._file = open(self._segment_path, 'wb')
+        self._file.write(MAGIC)
+        self._segment_size = len(MAGIC)
+        self.segments.append(str(self._segment_path))
+        if self._max_segments and len(self.segments) > self._max_segments:
+            for old in self.segments[:-self._max_segments]:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+            self.segments = self.segments[-self._max_segments:]
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+        self._flush()
+        if self._file is None:
+            return
+        try:
+            self._file.close()
+        except OSError:
+            log.exception('关闭抓包文件失败', path=str(self._segment_path))
+        self._file = None
+
+    def _flush(self):
+        self._last_flush = time.monotonic()
+        if not self._buffer or self._file is None:
+            return
+        try:
+            self._file.write(self._buffer)
+            self._file.flush()
+            self.bytes += len(self._buffer)
+            self._segment_size += len(self._buffer)
+            self._buffer.clear()
+            if self._segment_size >= self._segment_bytes:
+                file, self._file = self._file, None
+                file.close()
+                self._open_segment()
+        except OSError:
+            # 写盘或滚动分段失败（磁盘满、目录被删除等）时停止抓包，不影响消息处理
+            log.exception('写入抓包文件失败，已停止抓包', path=str(self._segment_path))
+            self.enabled = False
+            self._buffer.clear()
+            if self._file is not None:
+                try:
+                    self._file.close()
+                except OSError:
+                    pass
+                self._file = None
+
+
+def capture_files(path: Union[str, Path]) -> List[Path]:
+    """抓包路径对应的分段文件列表（目录时按文件名排序，即按抓包时间和分段序号）"""
+    path = Path(path)
+    if path.is_dir():
+        return sorted(path.glob(f'*{SEGMENT_SUFFIX}'))
+    return [path]
+
+
+def read_capture(path: Union[str, Path]) -> Iterator[Tuple[float, str, bytes]]:
+    """
+    按顺序读取抓包文件或目录中的全部记录
+
+    末尾不完整的记录（抓包进程异常退出时可能出现）会被忽略
+
+    Yields:
+        (接收时间, 主题, 内容)
+    """
+    for file in capture_files(path):
+        with open(file, 'rb') as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f'不是抓包文件: {file}')
+        offset = len(MAGIC)
+        end = len(data)
+        while offset + RECORD_HEADER.size <= end:
+            received_at, topic_len, payload_len = RECORD_HEADER.unpack_from(data, offset)
+            start = offset + RECORD_HEADER.size
+            if start + topic_len + payload_len > end:
+                break
+            topic = data[start:start + topic_len].decode('utf-8')
+            payload = data[start + topic_len:start + topic_len + payload_len]
+            offset = start + topic_len + payload_len
+            yield received_at, topic, payload
+
+
+# 全局单例
+traffic_capture = TrafficCapture()
+# 进程退出时写入缓冲中的记录
+atexit.register(traffic_capture.stop)
@@ -0,0 +1,351 @@
+"""
+本地MQTT Broker替身模块
+在进程内启动一个最小的 MQTT 3.1.1 Broker，供状态监听器、命令发布器（paho客户端）和
+模拟摄像头在没有真实 Broker 的情况下做压测和回归测试
+
+支持：
+- CONNECT / CONNACK（不校验用户名密码，同一 client_id 重连时关闭旧连接）
+- SUBSCRIBE / UNSUBSCRIBE（支持 + 和 # 通配符，授予的 QoS 最高为1）
+- PUBLISH QoS 0/1/2（入站 QoS 2 完成 PUBREC/PUBREL/PUBCOMP 握手；出站按 min(发布QoS, 订阅QoS, 1) 投递）
+- PINGREQ / DISCONNECT
+
+不支持保留消息、遗嘱消息、持久会话和出站重传；另提供进程内订阅/发布接口，
+大量模拟设备共用一个订阅，不必为每台设备建立TCP连接
+"""
+import socket
+import socketserver
+import struct
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.src.logger import get_logger
+
+log = get_logger('mqtt.broker')
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+# CONNACK 返回码：不支持的协议版本
+CONNACK_UNACCEPTABLE_PROTOCOL = 1
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """主题是否匹配订阅过滤器（+ 匹配一级，# 匹配剩余所有级）"""
+    if topic_filter == topic:
+        return True
+    filter_parts = topic_filter.split('/')
+    topic_parts = topic.split('/')
+    for i, part in enumerate(filter_parts):
+        if part == '#':
+            return True
+        if i >= len(topic_parts):
+            return False
+        if part != '+' and part != topic_parts[i]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def _encode_length(length: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        out.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(out)
+
+
+def _encode_str(value: str) -> bytes:
+    data = value.encode('utf-8')
+    return struct.pack('!H', len(data)) + data
+
+
+def _packet(packet_type: int, flags: int, body: bytes) -> bytes:
+    return bytes([(packet_type << 4) | flags]) + _encode_length(len(body)) + body
+
+
+class _Session:
+    """一个TCP连接：订阅列表和发送锁"""
+
+    def __init__(self, broker: 'LocalMqttBroker', sock: socket.socket):
+        self.broker = broker
+        self.sock = sock
+        self.client_id = ''
+        self.subscriptions: Dict[str, int] = {}
+        self._send_lock = threading.Lock()
+        self._next_mid = 0
+        self.closed = False
+
+    def send(self, data: bytes) -> bool:
+        with self._send_lock:
+            if self.closed:
+                return False
+            try:
+                self.sock.sendall(data)
+                return True
+            except OSError:
+                self.closed = True
+                return False
+
+    def deliver(self, topic: str, payload: bytes, qos: int) -> bool:
+        """向该连接投递一条消息（QoS 1 时分配报文标识，不等待也不重传 PUBACK）"""
+        body = _encode_str(topic)
+        if qos:
+            with self._send_lock:
+                self._next_mid = self._next_mid % 65535 + 1
+                mid = self._next_mid
+            body += struct.pack('!H', mid)
+        return self.send(_packet(PUBLISH, qos << 1, body + payload))
+
+    def close(self):
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class LocalMqttBroker:
+    """
+    进程内MQTT Broker替身
+
+    用法:
+        broker = LocalMqttBroker().start()
+        os.environ['MQTT_BROKER_HOST'], os.environ['MQTT_BROKER_PORT'] = broker.host, str(broker.port)
+        broker.subscribe('camera/+/cmd', on_command)     # 进程内订阅
+        broker.publish('camera/CAM-1/state', b'{...}')    # 进程内发布
+        ...
+        broker.stop()
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示自动分配
+        """
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, _Session] = {}
+        # 进程内订阅: (过滤器, 回调(topic, payload))
+        self._local_subscriptions: List[Tuple[str, Callable[[str, bytes], None]]] = []
+        self.connections = 0
+        self.messages_in = 0
+        self.messages_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.dropped = 0
+        self._server = socketserver.ThreadingTCPServer((host, port), self._make_handler(), bind_and_activate=False)
+        self._server.allow_reuse_address = True
+        self._server.daemon_threads = True
+        self._server.server_bind()
+        self._server.server_activate()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self):
+        """在后台线程中启动服务"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, name='local-mqtt-broker', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务并断开所有连接"""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    # ==================== 进程内接口 ====================
+
+    def subscribe(self, topic_filter: str, callback: Callable[[str, bytes], None]):
+        """进程内订阅，回调在发布方的线程中同步执行，应尽快返回"""
+        with self._lock:
+            self._local_subscriptions.append((topic_filter, callback))
+
+    def publish(self, topic: str, payload: bytes, qos: int = 0):
+        """进程内发布，投递给所有匹配的TCP连接和进程内订阅"""
+        with self._lock:
+            self.messages_in += 1
+            self.bytes_in += len(payload)
+        self._route(topic, payload, qos)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'clients': len(self._sessions),
+                'connections': self.connections,
+                'messages_in': self.messages_in,
+                'messages_out': self.messages_out,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'dropped': self.dropped
+            }
+
+    # ==================== 路由 ====================
+
+    def _route(self, topic: str, payload: bytes, qos: int):
+        with self._lock:
+            targets = []
+            for session in self._sessions.values():
+                granted = max((q for f, q in session.subscriptions.items() if topic_matches(f, topic)), default=None)
+                if granted is not None:
+                    targets.append((session, min(qos, granted, 1)))
+            callbacks = [cb for f, cb in self._local_subscriptions if topic_matches(f, topic)]
+        delivered = dropped = 0
+        for session, out_qos in targets:
+            if session.deliver(topic, payload, out_qos):
+                delivered += 1
+            else:
+                dropped += 1
+        for callback in callbacks:
+            try:
+                callback(topic, payload)
+                delivered += 1
+            except Exception:
+                dropped += 1
+                log.exception('本地Broker订阅回调出错', key=f'callback:{topic}', topic=topic)
+        with self._lock:
+            self.messages_out += delivered
+            self.bytes_out += len(payload) * delivered
+            self.dropped += dropped
+
+    def _register(self, session: _Session):
+        with self._lock:
+            old = self._sessions.get(session.client_id)
+            self._sessions[session.client_id] = session
+            self.connections += 1
+        if old is not None and old is not session:
+            old.close()
+
+    def _unregister(self, session: _Session):
+        with self._lock:
+            if self._sessions.get(session.client_id) is session:
+                del self._sessions[session.client_id]
+        session.close()
+
+    # ==================== 协议处理 ====================
+
+    def _make_handler(self):
+        broker = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                session = _Session(broker, self.request)
+                rfile = self.request.makefile('rb')
+                try:
+                    broker._serve(session, rfile)
+                except (OSError, ValueError, struct.error):
+                    pass
+                finally:
+                    rfile.close()
+                    if session.client_id:
+                        broker._unregister(session)
+
+        return Handler
+
+    @staticmethod
+    def _read_packet(rfile) -> Optional[Tuple[int, int, bytes]]:
+        header = rfile.read(1)
+        if not header:
+            return None
+        length, multiplier = 0, 1
+        while True:
+            byte = rfile.read(1)
+            if not byte:
+                return None
+            length += (byte[0] & 0x7F) * multiplier
+            if not byte[0] & 0x80:
+                break
+            multiplier *= 128
+        body = rfile.read(length) if length else b''
+        if len(body) < length:
+            return None
+        return header[0] >> 4, header[0] & 0x0F, body
+
+    def _serve(self, session: _Session, rfile):
+        first = self._read_packet(rfile)
+        if first is None or first[0] != CONNECT:
+            return
+        body = first[2]
+        name_len = struct.unpack_from('!H', body)[0]
+        level = body[2 + name_len]
+        if level not in (3, 4):
+            session.send(_packet(CONNACK, 0, bytes([0, CONNACK_UNACCEPTABLE_PROTOCOL])))
+            return
+        offset = 2 + name_len + 4
+        id_len = struct.unpack_from('!H', body, offset)[0]
+        session.client_id = body[offset + 2:offset + 2 + id_len].decode('utf-8') or f'anonymous-{id(session)}'
+        self._register(session)
+        session.send(_packet(CONNACK, 0, bytes([0, 0])))
+
+        while not session.closed:
+            packet = self._read_packet(rfile)
+            if packet is None:
+                return
+            packet_type, flags, body = packet
+            if packet_type == PUBLISH:
+                self._on_publish(session, flags, body)
+            elif packet_type == PUBREL:
+                session.send(_packet(PUBCOMP, 0, body[:2]))
+            elif packet_type == SUBSCRIBE:
+                self._on_subscribe(session, body)
+            elif packet_type == UNSUBSCRIBE:
+                mid, offset = body[:2], 2
+                with self._lock:
+                    while offset < len(body):
+                        length = struct.unpack_from('!H', body, offset)[0]
+                        session.subscriptions.pop(body[offset + 2:offset + 2 + length].decode('utf-8'), None)
+                        offset += 2 + length
+                session.send(_packet(UNSUBACK, 0, mid))
+            elif packet_type == PINGREQ:
+                session.send(_packet(PINGRESP, 0, b''))
+            elif packet_type == DISCONNECT:
+                return
+            # PUBACK / PUBREC / PUBCOMP（对出站消息的确认）直接忽略
+
+    def _on_publish(self, session: _Session, flags: int, body: bytes):
+        qos = (flags >> 1) & 0x03
+        topic_len = struct.unpack_from('!H', body)[0]
+        topic = body[2:2 + topic_len].decode('utf-8')
+        offset = 2 + topic_len
+        mid = b''
+        if qos:
+            mid = body[offset:offset + 2]
+            offset += 2
+        payload = body[offset:]
+        with self._lock:
+            self.messages_in += 1
+            self.bytes_in += len(payload)
+        self._route(topic, payload, qos)
+        if qos == 1:
+            session.send(_packet(PUBACK, 0, mid))
+        elif qos == 2:
+            session.send(_packet(PUBREC, 0, mid))
+
+    def _on_subscribe(self, session: _Session, body: bytes):
+        mid, offset = body[:2], 2
+        granted = bytearray()
+        with self._lock:
+            while offset < len(body):
+                length = struct.unpack_from('!H', body, offset)[0]
+                topic_filter = body[offset + 2:offset + 2 + length].decode('utf-8')
+                qos = min(body[offset + 2 + length] & 0x03, 1)
+                session.subscriptions[topic_filter] = qos
+                granted.append(qos)
+                offset += 3 + length
+        session.send(_packet(SUBACK, 0, mid + bytes(granted)))
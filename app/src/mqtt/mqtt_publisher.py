@@ -4,25 +4,38 @@ MQTT发布器模块
 """
 from paho.mqtt import client as mqtt_client
 import json
+import os
 import random
 import time
-import threading
 from app.src.sqllite import get_client_id_by_hardware_id
-from app.src.record_control import create_command_task
+from app.src.record_control import create_command_task, request_meta_cache, command_tracer
+from app.src.logger import get_logger
+from app.src.profiling import ProfiledLock
+
+log = get_logger('mqtt.publisher')
 
 class MQTTPublisher:
     """MQTT发布器，用于发送命令到设备"""
     
-    def __init__(self, broker='121.36.170.241', port=1883, username='camlink', password='camlink'):
-        self.broker = broker
-        self.port = port
+    def __init__(self, broker=None, port=None, username='camlink', password='camlink'):
+        self._broker = broker
+        self._port = port
         self.username = username
         self.password = password
         self.client_id = f'python-mqtt-publisher-{random.randint(0, 10000)}'
         self.client = None
-        self._lock = threading.Lock()
+        self._lock = ProfiledLock('mqtt_publisher')
         self._connected = False
     
+    @property
+    def broker(self) -> str:
+        """未指定时在连接时读取 MQTT_BROKER_HOST（压测、回放可指向本地 Broker）"""
+        return self._broker or os.getenv('MQTT_BROKER_HOST', '121.36.170.241')
+
+    @property
+    def port(self) -> int:
+        return self._port or int(os.getenv('MQTT_BROKER_PORT', '1883'))
+
     def connect(self):
         """连接到MQTT broker"""
         if self._connected and self.client is not None:
@@ -35,17 +48,22 @@ class MQTTPublisher:
             def on_connect(client, userdata, flags, rc):
                 if rc == 0:
                     self._connected = True
-                    print(f"MQTT Publisher connected successfully!")
+                    log.info('发布器已连接', broker=self.broker, client_id=self.client_id)
                 else:
                     self._connected = False
-                    print(f"MQTT Publisher failed to connect, return code {rc}")
+                    log.error('发布器连接失败', broker=self.broker, rc=rc)
             
             def on_disconnect(client, userdata, rc):
                 self._connected = False
-                print(f"MQTT Publisher disconnected, return code {rc}")
+                log.warning('发布器已断开', broker=self.broker, rc=rc)
+            
+            def on_publish(client, userdata, mid, *args):
+                # QoS 1：收到 broker 的 PUBACK
+                command_tracer.on_puback(mid)
             
             self.client.on_connect = on_connect
             self.client.on_disconnect = on_disconnect
+            self.client.on_publish = on_publish
             
             self.client.connect(self.broker, self.port, keepalive=60)
             self.client.loop_start()
@@ -58,10 +76,19 @@ class MQTTPublisher:
             
             return self._connected
         except Exception as e:
-            print(f"MQTT Publisher connection error: {e}")
+            log.exception('发布器连接异常', broker=self.broker)
             self._connected = False
             return False
     
+    def _publish(self, topic: str, payload: dict, camera_id: str):
+        """以QoS 1发布命令（调用方持有 self._lock），并开始追踪到 PUBACK 为止的发布阶段"""
+        started = time.time()
+        result = self.client.publish(topic, json.dumps(payload), qos=1, retain=False)
+        if result.rc == 0:
+            command_tracer.publish_started(payload['request_id'], result.mid, started,
+                                           camera_id=camera_id, action=payload['action'])
+        return result
+    
     def publish_command(self, camera_id: str, action: str, request_id: str = None) -> bool:
         """
         发布命令到设备
@@ -81,7 +108,7 @@ class MQTTPublisher:
         # 将hardware_id转换为client_id（MQTT topic使用client_id）
         client_id = get_client_id_by_hardware_id(camera_id)
         if not client_id:
-            print(f"❌ 未找到设备的client_id (hardware_id: {camera_id})")
+            log.warning('未找到设备的client_id', key=f'no_client_id:{camera_id}', hardware_id=camera_id)
             return False
         
         if request_id is None:
@@ -95,17 +122,19 @@ class MQTTPublisher:
         }
         
         try:
+            # 发布前记录请求元数据，响应到达时无需查询tasks表
+            request_meta_cache.put(request_id, client_id, action, camera_id)
             with self._lock:
-                result = self.client.publish(topic, json.dumps(payload), qos=1, retain=False)
+                result = self._publish(topic, payload, camera_id)
                 if result.rc == 0:
-                    print(f"✅ 发送命令成功 - hardware_id: {camera_id}, client_id: {client_id}")
-                    print(f"   Topic: {topic}, Payload: {payload}")
+                    log.info('命令已发送', action=payload['action'], hardware_id=camera_id, client_id=client_id, request_id=request_id)
+                    log.debug('命令内容', topic=topic, payload=payload)
                     return True
                 else:
-                    print(f"❌ 发送命令失败 - Topic: {topic}, return code: {result.rc}")
+                    log.error('命令发送失败', action=payload['action'], topic=topic, rc=result.rc, request_id=request_id)
                     return False
         except Exception as e:
-            print(f"❌ 发送命令异常: {e}")
+            log.exception('命令发送异常', action=payload['action'], hardware_id=camera_id, request_id=request_id)
             return False
     
     def get_status(self, camera_id: str, request_id: str = None) -> bool:
@@ -141,7 +170,7 @@ class MQTTPublisher:
         # 将hardware_id转换为client_id（MQTT topic使用client_id）
         client_id = get_client_id_by_hardware_id(camera_id)
         if not client_id:
-            print(f"❌ 未找到设备的client_id (hardware_id: {camera_id})")
+            log.warning('未找到设备的client_id', key=f'no_client_id:{camera_id}', hardware_id=camera_id)
             return (False, None)
         
         if request_id is None:
@@ -156,11 +185,12 @@ class MQTTPublisher:
         }
         
         try:
+            request_meta_cache.put(request_id, client_id, 'start_record', camera_id)
             with self._lock:
-                result = self.client.publish(topic, json.dumps(payload), qos=1, retain=False)
+                result = self._publish(topic, payload, camera_id)
                 if result.rc == 0:
-                    print(f"✅ 发送开始录制命令 - hardware_id: {camera_id}, client_id: {client_id}")
-                    print(f"   Topic: {topic}, Payload: {payload}")
+                    log.info('命令已发送', action=payload['action'], hardware_id=camera_id, client_id=client_id, request_id=request_id)
+                    log.debug('命令内容', topic=topic, payload=payload)
                     
                     # 创建任务记录
                     create_command_task(
@@ -172,10 +202,10 @@ class MQTTPublisher:
                     
                     return (True, request_id)
                 else:
-                    print(f"❌ 发送开始录制命令失败 - Topic: {topic}, return code: {result.rc}")
+                    log.error('命令发送失败', action=payload['action'], topic=topic, rc=result.rc, request_id=request_id)
                     return (False, request_id)
         except Exception as e:
-            print(f"❌ 发送开始录制命令异常: {e}")
+            log.exception('命令发送异常', action=payload['action'], hardware_id=camera_id, request_id=request_id)
             return (False, request_id)
     
     def stop_record(self, camera_id: str, request_id: str = None) -> tuple:
@@ -196,7 +226,7 @@ class MQTTPublisher:
         # 将hardware_id转换为client_id（MQTT topic使用client_id）
         client_id = get_client_id_by_hardware_id(camera_id)
         if not client_id:
-            print(f"❌ 未找到设备的client_id (hardware_id: {camera_id})")
+            log.warning('未找到设备的client_id', key=f'no_client_id:{camera_id}', hardware_id=camera_id)
             return (False, None)
         
         if request_id is None:
@@ -210,11 +240,12 @@ class MQTTPublisher:
         }
         
         try:
+            request_meta_cache.put(request_id, client_id, 'stop_record', camera_id)
             with self._lock:
-                result = self.client.publish(topic, json.dumps(payload), qos=1, retain=False)
+                result = self._publish(topic, payload, camera_id)
                 if result.rc == 0:
-                    print(f"✅ 发送停止录制命令 - hardware_id: {camera_id}, client_id: {client_id}")
-                    print(f"   Topic: {topic}, Payload: {payload}")
+                    log.info('命令已发送', action=payload['action'], hardware_id=camera_id, client_id=client_id, request_id=request_id)
+                    log.debug('命令内容', topic=topic, payload=payload)
                     
                     # 创建任务记录
                     create_command_task(
@@ -226,10 +257,10 @@ class MQTTPublisher:
                     
                     return (True, request_id)
                 else:
-                    print(f"❌ 发送停止录制命令失败 - Topic: {topic}, return code: {result.rc}")
+                    log.error('命令发送失败', action=payload['action'], topic=topic, rc=result.rc, request_id=request_id)
                     return (False, request_id)
         except Exception as e:
-            print(f"❌ 发送停止录制命令异常: {e}")
+            log.exception('命令发送异常', action=payload['action'], hardware_id=camera_id, request_id=request_id)
             return (False, request_id)
     
     def list_videos(self, camera_id: str, start_time: str = None, end_time: str = None, 
@@ -255,7 +286,7 @@ class MQTTPublisher:
         # 将hardware_id转换为client_id（MQTT topic使用client_id）
         client_id = get_client_id_by_hardware_id(camera_id)
         if not client_id:
-            print(f"❌ 未找到设备的client_id (hardware_id: {camera_id})")
+            log.warning('未找到设备的client_id', key=f'no_client_id:{camera_id}', hardware_id=camera_id)
             return (False, None)
         
         if request_id is None:
@@ -280,11 +311,12 @@ class MQTTPublisher:
             payload["params"]["max_size"] = max_size
         
         try:
+            request_meta_cache.put(request_id, client_id, 'list_videos', camera_id)
             with self._lock:
-                result = self.client.publish(topic, json.dumps(payload), qos=1, retain=False)
+                result = self._publish(topic, payload, camera_id)
                 if result.rc == 0:
-                    print(f"✅ 发送查询视频列表命令 - hardware_id: {camera_id}, client_id: {client_id}")
-                    print(f"   Topic: {topic}, Payload: {payload}")
+                    log.info('命令已发送', action=payload['action'], hardware_id=camera_id, client_id=client_id, request_id=request_id)
+                    log.debug('命令内容', topic=topic, payload=payload)
                     
                     # 创建任务记录
                     create_command_task(
@@ -296,10 +328,10 @@ class MQTTPublisher:
                     
                     return (True, request_id)
                 else:
-                    print(f"❌ 发送查询视频列表命令失败 - Topic: {topic}, return code: {result.rc}")
+                    log.error('命令发送失败', action=payload['action'], topic=topic, rc=result.rc, request_id=request_id)
                     return (False, request_id)
         except Exception as e:
-            print(f"❌ 发送查询视频列表命令异常: {e}")
+            log.exception('命令发送异常', action=payload['action'], hardware_id=camera_id, request_id=request_id)
             return (False, request_id)
     
     def upload_file(self, camera_id: str, file_name_list: list, request_id: str = None) -> tuple:
@@ -321,7 +353,7 @@ class MQTTPublisher:
         # 将hardware_id转换为client_id（MQTT topic使用client_id）
         client_id = get_client_id_by_hardware_id(camera_id)
         if not client_id:
-            print(f"❌ 未找到设备的client_id (hardware_id: {camera_id})")
+            log.warning('未找到设备的client_id', key=f'no_client_id:{camera_id}', hardware_id=camera_id)
             return (False, None)
         
         if request_id is None:
@@ -338,11 +370,12 @@ class MQTTPublisher:
         }
         
         try:
+            request_meta_cache.put(request_id, client_id, 'upload_file', camera_id)
             with self._lock:
-                result = self.client.publish(topic, json.dumps(payload), qos=1, retain=False)
+                result = self._publish(topic, payload, camera_id)
                 if result.rc == 0:
-                    print(f"✅ 发送上传文件命令 - hardware_id: {camera_id}, client_id: {client_id}")
-                    print(f"   Topic: {topic}, Payload: {payload}")
+                    log.info('命令已发送', action=payload['action'], hardware_id=camera_id, client_id=client_id, request_id=request_id)
+                    log.debug('命令内容', topic=topic, payload=payload)
                     
                     # 创建任务记录
                     file_count = len(file_name_list)
@@ -355,10 +388,10 @@ class MQTTPublisher:
                     
                     return (True, request_id)
                 else:
-                    print(f"❌ 发送上传文件命令失败 - Topic: {topic}, return code: {result.rc}")
+                    log.error('命令发送失败', action=payload['action'], topic=topic, rc=result.rc, request_id=request_id)
                     return (False, request_id)
         except Exception as e:
-            print(f"❌ 发送上传文件命令异常: {e}")
+            log.exception('命令发送异常', action=payload['action'], hardware_id=camera_id, request_id=request_id)
             return (False, request_id)
     
     def get_upload_status(self, camera_id: str, file_name_list: list = None, request_id: str = None) -> tuple:
@@ -380,7 +413,7 @@ class MQTTPublisher:
         # 将hardware_id转换为client_id（MQTT topic使用client_id）
         client_id = get_client_id_by_hardware_id(camera_id)
         if not client_id:
-            print(f"❌ 未找到设备的client_id (hardware_id: {camera_id})")
+            log.warning('未找到设备的client_id', key=f'no_client_id:{camera_id}', hardware_id=camera_id)
             return (False, None)
         
         if request_id is None:
@@ -399,11 +432,12 @@ class MQTTPublisher:
             payload["params"]["file_name_list"] = file_name_list
         
         try:
+            request_meta_cache.put(request_id, client_id, 'get_upload_status', camera_id)
             with self._lock:
-                result = self.client.publish(topic, json.dumps(payload), qos=1, retain=False)
+                result = self._publish(topic, payload, camera_id)
                 if result.rc == 0:
-                    print(f"✅ 发送获取上传状态命令 - hardware_id: {camera_id}, client_id: {client_id}")
-                    print(f"   Topic: {topic}, Payload: {payload}")
+                    log.info('命令已发送', action=payload['action'], hardware_id=camera_id, client_id=client_id, request_id=request_id)
+                    log.debug('命令内容', topic=topic, payload=payload)
                     
                     # 创建任务记录
                     create_command_task(
@@ -415,10 +449,10 @@ class MQTTPublisher:
                     
                     return (True, request_id)
                 else:
-                    print(f"❌ 发送获取上传状态命令失败 - Topic: {topic}, return code: {result.rc}")
+                    log.error('命令发送失败', action=payload['action'], topic=topic, rc=result.rc, request_id=request_id)
                     return (False, request_id)
         except Exception as e:
-            print(f"❌ 发送获取上传状态命令异常: {e}")
+            log.exception('命令发送异常', action=payload['action'], hardware_id=camera_id, request_id=request_id)
             return (False, request_id)
     
     def disconnect(self):
@@ -0,0 +1,340 @@
+"""
+上传调度模块
+按站点（devices.hotel）排队下发 upload_file 命令，限制同一站点的并发上传数，
+避免同一酒店的摄像头同时占满同一条上行链路
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+from app.src.logger import get_logger
+from app.src.sqllite import get_device
+from app.src.video_manage import video_list_manager
+from app.src.profiling import ProfiledLock
+from .mqtt_publisher import mqtt_publisher
+
+log = get_logger('mqtt.upload')
+
+
+def _file_key(file_name: str) -> str:
+    """匹配上传进度用的文件名：设备上报的可能带目录、扩展名或大小写不同"""
+    name = str(file_name).replace('\\', '/').rsplit('/', 1)[-1]
+    if '.' in name:
+        name = name.rsplit('.', 1)[0]
+    return name.lower()
+
+
+class UploadScheduler:
+    """
+    上传调度器，线程安全
+
+    - 每个站点最多同时有 max_per_site 个上传任务在执行
+    - 排队任务按 "排队时间 + 文件大小折算的等待时间" 排序：小文件优先，
+      但排队久的大文件也会逐渐前移，不会被饿死
+    - 设备上报所有文件进度达到 1.0、命令执行失败或长时间无进度时释放名额
+    """
+
+    def __init__(self, publisher=None, max_per_site: int = 2,
+                 default_file_size: int = 100 * 1024 * 1024,
+                 size_weight: int = 1024 * 1024,
+                 slot_timeout: int = 1800):
+        """
+        Args:
+            publisher: 实际下发命令的发布器，默认使用全局 mqtt_publisher
+            max_per_site: 每个站点允许的最大并发上传数
+            default_file_size: 无法从视频列表得知文件大小时使用的估计值（字节）
+            size_weight: 每 size_weight 字节的文件大小相当于晚排队 1 秒
+            slot_timeout: 上传名额在多少秒内无进度上报即视为超时并释放
+        """
+        self._publisher = publisher or mqtt_publisher
+        self.max_per_site = max_per_site
+        self.default_file_size = default_file_size
+        self.size_weight = size_weight
+        self.slot_timeout = slot_timeout
+
+        self._queues: Dict[str, list] = {}              # site -> heap[(priority, seq, request_id)]
+        self._active: Dict[str, Dict[str, dict]] = {}   # site -> {request_id: job}
+        self._jobs: Dict[str, dict] = {}                # request_id -> job
+        self._seq = itertools.count()
+        self._lock = ProfiledLock('upload_scheduler')
+        self._reaper_started = False
+
+    # ==================== 提交与下发 ====================
+
+    def submit(self, camera_id: str, file_name_list: list, request_id: str = None) -> tuple:
+        """
+        提交上传请求，站点有空闲名额时立即下发，否则进入排队
+
+        Args:
+            camera_id: 摄像头ID (hardware_id)
+            file_name_list: 要上传的文件名列表
+            request_id: 请求ID，如果不提供则自动生成
+
+        Returns:
+            (是否接受, request_id, 排队位置)，排队位置为0表示已立即下发
+        """
+        device = get_device(camera_id)
+        if not device:
+            log.warning('未找到设备', key=f'missing_device:{camera_id}', camera_id=camera_id)
+            return (False, None, 0)
+
+        if request_id is None:
+            request_id = f"req_{int(time.time() * 1000)}_{random.randint(1000, 9999)}"
+
+        # 未配置酒店的设备各自独立成一个站点，互不影响
+        site = device.get('hotel') or f"camera:{camera_id}"
+        now = time.time()
+        total_size = self._estimate_size(camera_id, file_name_list)
+        job = {
+            'request_id': request_id,
+            'camera_id': camera_id,
+            'site': site,
+            'file_name_list': list(file_name_list),
+            'total_size': total_size,
+            'progress': {},
+            'state': 'queued',
+            'enqueued_at': now,
+            'dispatched_at': None,
+            'last_progress_at': None,
+            'finished_at': None
+        }
+        priority = now + total_size / float(self.size_weight)
+
+        with self._lock:
+            self._jobs[request_id] = job
+            active = self._active.setdefault(site, {})
+            if len(active) < self.max_per_site:
+                self._activate(job)
+                dispatch_now = True
+            else:
+                heapq.heappush(self._queues.setdefault(site, []), (priority, next(self._seq), request_id))
+                dispatch_now = False
+            self._ensure_reaper()
+
+        if not dispatch_now:
+            position = self.get_queue_position(request_id)
+            log.info('上传请求已排队', site=site, camera_id=camera_id, request_id=request_id, position=position)
+            return (True, request_id, position)
+
+        if self._dispatch(job):
+            return (True, request_id, 0)
+
+        # 立即下发失败，释放名额并把机会让给排队中的请求
+        self._release(request_id, 'failed')
+        return (False, request_id, 0)
+
+    def _activate(self, job: dict):
+        """将任务标记为执行中（调用方需持有锁）"""
+        now = time.time()
+        job['state'] = 'uploading'
+        job['dispatched_at'] = now
+        job['last_progress_at'] = now
+        self._active.setdefault(job['site'], {})[job['request_id']] = job
+
+    def _dispatch(self, job: dict) -> bool:
+        """通过发布器下发 upload_file 命令"""
+        success, _ = self._publisher.upload_file(job['camera_id'], job['file_name_list'], job['request_id'])
+        if success:
+            log.info('已下发排队上传', site=job['site'], camera_id=job['camera_id'], request_id=job['request_id'])
+        return success
+
+    def _dispatch_async(self, job: dict):
+        """在后台线程中下发，避免阻塞MQTT回调线程"""
+        def run():
+            if not self._dispatch(job):
+                self._release(job['request_id'], 'failed')
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _pump(self, site: str) -> List[dict]:
+        """从站点队列中取出可以执行的任务（调用方需持有锁）"""
+        ready = []
+        queue = self._queues.get(site)
+        active = self._active.setdefault(site, {})
+        while queue and len(active) < self.max_per_site:
+            _, _, request_id = heapq.heappop(queue)
+            job = self._jobs.get(request_id)
+            if job is None or job['state'] != 'queued':
+                continue
+            self._activate(job)
+            ready.append(job)
+        if queue is not None and not queue:
+            del self._queues[site]
+        return ready
+
+    def _release(self, request_id: str, state: str):
+        """释放任务占用的名额，并下发同站点排队中的下一个任务"""
+        with self._lock:
+            job = self._jobs.get(request_id)
+            if job is None:
+                return
+            active = self._active.get(job['site'], {})
+            if active.pop(request_id, None) is None:
+                return
+            job['state'] = state
+            job['finished_at'] = time.time()
+            ready = self._pump(job['site'])
+
+        log.info('上传名额已释放', site=job['site'], request_id=request_id, state=state)
+        for next_job in ready:
+            self._dispatch_async(next_job)
+
+    # ==================== 设备反馈 ====================
+
+    def on_progress(self, camera_id: str, file_progress: dict, request_id: str = None):
+        """
+        处理设备上报的上传进度，所有文件完成后释放名额
+
+        文件名按去掉目录和扩展名、忽略大小写后匹配；消息带有执行中任务的 request_id 时只更新该任务
+
+        Args:
+            camera_id: 摄像头ID (hardware_id)
+            file_progress: 文件进度字典，格式: {file_name: progress, ...}
+            request_id: 上传命令的请求ID（可选）
+        """
+        reported = {}
+        for file_name, progress in file_progress.items():
+            try:
+                reported[_file_key(file_name)] = float(progress)
+            except (TypeError, ValueError):
+                continue
+        completed = []
+        now = time.time()
+        with self._lock:
+            job = self._jobs.get(request_id) if request_id else None
+            if job is not None and job['state'] == 'uploading' and job['camera_id'] == camera_id:
+                candidates = [job]
+            else:
+                candidates = [job for site_active in self._active.values() for job in site_active.values()
+                              if job['camera_id'] == camera_id]
+            for job in candidates:
+                for file_name in job['file_name_list']:
+                    progress = reported.get(_file_key(file_name))
+                    if progress is not None:
+                        job['progress'][file_name] = progress
+                        job['last_progress_at'] = now
+                if all(job['progress'].get(f, 0.0) >= 1.0 for f in job['file_name_list']):
+                    completed.append(job['request_id'])
+
+        for request_id in completed:
+            self._release(request_id, 'completed')
+
+    def on_command_failed(self, request_id: str):
+        """设备拒绝或执行 upload_file 命令失败时释放名额"""
+        with self._lock:
+            job = self._jobs.get(request_id)
+            if job is None or job['state'] != 'uploading':
+                return
+        self._release(request_id, 'failed')
+
+    # ==================== 超时回收 ====================
+
+    def _ensure_reaper(self):
+        """按需启动超时回收线程（调用方需持有锁）"""
+        if self._reaper_started:
+            return
+        self._reaper_started = True
+        threading.Thread(target=self._reap_loop, daemon=True).start()
+
+    def _reap_loop(self):
+        interval = max(1, min(60, self.slot_timeout // 10))
+        while True:
+            time.sleep(interval)
+            self.reap_stale()
+
+    def reap_stale(self, finished_ttl: int = 3600):
+        """
+        释放长时间没有进度上报的上传名额，并清理已结束的任务记录
+
+        Args:
+            finished_ttl: 已结束任务的保留时间（秒）
+        """
+        now = time.time()
+        deadline = now - self.slot_timeout
+        with self._lock:
+            expired = [
+                request_id for request_id, job in self._jobs.items()
+                if job['finished_at'] is not None and job['finished_at'] < now - finished_ttl
+            ]
+            for request_id in expired:
+                del self._jobs[request_id]
+
+            stale = [
+                request_id
+                for site_active in self._active.values()
+                for request_id, job in site_active.items()
+                if job['last_progress_at'] < deadline
+            ]
+        for request_id in stale:
+            self._release(request_id, 'timeout')
+
+    # ==================== 查询 ====================
+
+    def _estimate_size(self, camera_id: str, file_name_list: list) -> int:
+        """根据最近一次视频列表估算待上传文件的总大小"""
+        sizes = {}
+        latest = video_list_manager.get_camera_latest_videos(camera_id)
+        if latest:
+            for video in latest.get('videos', []):
+                name = video.get('file_name')
+                if name:
+                    sizes[name] = video.get('size') or 0
+                    sizes[name.rsplit('.', 1)[0]] = video.get('size') or 0
+
+        total = 0
+        for file_name in file_name_list:
+            size = sizes.get(file_name)
+            try:
+                total += int(size) if size else self.default_file_size
+            except (TypeError, ValueError):
+                total += self.default_file_size
+        return total
+
+    def get_queue_position(self, request_id: str) -> int:
+        """获取排队位置（从1开始），未排队返回0"""
+        with self._lock:
+            job = self._jobs.get(request_id)
+            if job is None or job['state'] != 'queued':
+                return 0
+            ordered = sorted(self._queues.get(job['site'], []))
+            for index, (_, _, rid) in enumerate(ordered):
+                if rid == request_id:
+                    return index + 1
+            return 0
+
+    def get_job(self, request_id: str) -> Optional[dict]:
+        """获取上传调度任务信息"""
+        with self._lock:
+            job = self._jobs.get(request_id)
+            return dict(job) if job else None
+
+    def snapshot(self) -> Dict[str, dict]:
+        """
+        获取所有站点的调度状态
+
+        Returns:
+            {site: {'active': [...], 'queued': [...]}, ...}
+        """
+        with self._lock:
+            sites = set(self._active) | set(self._queues)
+            result = {}
+            for site in sites:
+                active = list(self._active.get(site, {}).values())
+                queued = [
+                    self._jobs[rid] for _, _, rid in sorted(self._queues.get(site, []))
+                    if self._jobs.get(rid, {}).get('state') == 'queued'
+                ]
+                if not active and not queued:
+                    continue
+                result[site] = {
+                    'active': [dict(job) for job in active],
+                    'queued': [dict(job) for job in queued]
+                }
+            return result
+
+
+# 全局单例
+upload_scheduler = UploadScheduler()
@@ -0,0 +1,336 @@
+"""
+模拟摄像头设备群模块
+N 台虚拟摄像头按现有协议工作，用于在没有真实设备时对 CamLink 做压测：
+- 定期向 camera/<client_id>/state 上报状态
+- 响应 camera/<client_id>/cmd 的 get_status / start_record / stop_record / list_videos /
+  upload_file / get_upload_status，回复到 camera/<client_id>/resp
+- 执行 upload_file 后按步长向 camera/<client_id>/upload_file_status 上报进度直到完成
+
+所有设备共用一个命令订阅和一个定时线程（状态上报、延迟响应、上传进度都是定时事件），
+可挂到进程内的 LocalMqttBroker，也可通过一个 paho 连接接入外部 Broker
+"""
+import heapq
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from paho.mqtt import client as mqtt_client
+
+from app.src.logger import get_logger
+from app.src.sqllite import upsert_devices
+from app.src.provisioning import make_client_id
+
+log = get_logger('mqtt.fleet')
+
+# 命令失败时回复的错误码
+SIMULATED_ERROR_CODE = 101
+
+
+def _video(started: datetime, index: int, pre_name: str, duration: int, size: int) -> dict:
+    name = f"{started.strftime('%Y%m%d%H%M%S')}{index:04d}"
+    return {
+        'file_name': f"{name}_{pre_name}.mp4" if pre_name else f"{name}.mp4",
+        'start_time': started.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'duration': duration,
+        'size': size
+    }
+
+
+class VirtualCamera:
+    """一台虚拟摄像头的状态（视频列表按种子生成，不常驻内存）"""
+
+    __slots__ = ('hardware_id', 'client_id', 'run_state', 'pre_name', 'left_storage', 'electric_percent',
+                 'network_signal_strength', 'video_seed', 'recorded', 'uploads')
+
+    def __init__(self, hardware_id: str, rng: random.Random):
+        self.hardware_id = hardware_id
+        self.client_id = make_client_id(hardware_id)
+        self.run_state = 'stopped'
+        self.pre_name = ''
+        self.left_storage = rng.randint(8_000, 64_000)
+        self.electric_percent = round(rng.uniform(0.3, 1.0), 2)
+        self.network_signal_strength = rng.randint(-85, -40)
+        self.video_seed = rng.getrandbits(32)
+        # 压测期间录制产生的视频
+        self.recorded: List[dict] = []
+        # 文件名 -> 上传进度（0~1）
+        self.uploads: Dict[str, float] = {}
+
+    def videos(self) -> List[dict]:
+        """设备上的视频：按种子生成的历史视频加上压测期间录制的视频"""
+        rng = random.Random(self.video_seed)
+        started = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=rng.randint(1, 7))
+        videos = [
+            _video(started + timedelta(hours=i), i, '', rng.randint(60, 3600), rng.randint(5, 500) * 1024 * 1024)
+            for i in range(rng.randint(3, 12))
+        ]
+        return videos + self.recorded
+
+    def state(self) -> dict:
+        return {
+            'status': 'online',
+            'run_state': self.run_state,
+            'left_storage': self.left_storage,
+            'electric_percent': self.electric_percent,
+            'network_signal_strength': self.network_signal_strength,
+            'timestamp': int(time.time() * 1000)
+        }
+
+
+class VirtualFleet:
+    """
+    虚拟摄像头群，线程安全
+
+    用法:
+        fleet = VirtualFleet(10000, state_interval=60)
+        fleet.seed_devices()                 # 在设备表中批量登记这些设备
+        fleet.attach(broker)                 # 或 fleet.connect(host, port)
+        fleet.start()
+        ...
+        fleet.stop()
+    """
+
+    def __init__(self, size: int, prefix: str = 'SIM', hotels: int = 50, state_interval: float = 60.0,
+                 response_delay: Tuple[float, float] = (0.005, 0.05), fail_rate: float = 0.0,
+                 upload_step: float = 0.25, upload_interval: float = 0.5, seed: Optional[int] = None):
+        """
+        Args:
+            size: 设备数
+            prefix: hardware_id 前缀（hardware_id = <prefix>-<序号>）
+            hotels: 设备平均分布到多少个站点（酒店）
+            state_interval: 每台设备主动上报状态的间隔（秒），0 表示不主动上报
+            response_delay: 收到命令到回复的随机延迟范围（秒）
+            fail_rate: 控制类命令（start_record / stop_record / upload_file）回复失败的比例
+            upload_step: 每次上报增加的上传进度
+            upload_interval: 上传进度上报间隔（秒）
+            seed: 随机数种子（设备属性和失败分布可复现）
+        """
+        self.prefix = prefix
+        self.hotels = max(1, hotels)
+        self.state_interval = state_interval
+        self.response_delay = response_delay
+        self.fail_rate = fail_rate
+        self.upload_step = upload_step
+        self.upload_interval = upload_interval
+        self._rng = random.Random(seed)
+        self.cameras: Dict[str, VirtualCamera] = {}
+        for i in range(size):
+            camera = VirtualCamera(f'{prefix}-{i:06d}', self._rng)
+            self.cameras[camera.client_id] = camera
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # 定时事件: (到期时间, 序号, 回调, 参数)
+        self._events: List[tuple] = []
+        self._seq = 0
+        self._publish: Optional[Callable[[str, bytes, int], None]] = None
+        self._client = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self.commands_received = 0
+        self.messages_sent = {'resp': 0, 'state': 0, 'upload_file_status': 0}
+        self.unknown_commands = 0
+
+    # ==================== 设备登记 ====================
+
+    def hardware_ids(self) -> List[str]:
+        return [camera.hardware_id for camera in self.cameras.values()]
+
+    def seed_devices(self, chunk_size: int = 5000) -> dict:
+        """
+        在设备表中批量登记所有虚拟设备（已存在的不覆盖）
+
+        Returns:
+            {'total', 'created', 'exists'}
+        """
+        summary = {'total': len(self.cameras), 'created': 0, 'exists': 0}
+        cameras = list(self.cameras.values())
+        for i in range(0, len(cameras), chunk_size):
+            rows = [{
+                'hardware_id': camera.hardware_id,
+                'client_id': camera.client_id,
+                'hotel': f'{self.prefix} Hotel {n % self.hotels:03d}',
+                'location': f'Room {n // self.hotels + 100}',
+                'wifi': f'{self.prefix}-WIFI',
+                'fw': 'v2.1.3'
+            } for n, camera in enumerate(cameras[i:i + chunk_size], start=i)]
+            for status in upsert_devices(rows).values():
+                summary[status] = summary.get(status, 0) + 1
+        return summary
+
+    # ==================== 接入 Broker ====================
+
+    def attach(self, broker):
+        """挂到进程内的 LocalMqttBroker（进程内订阅和发布，不建立TCP连接）"""
+        self._publish = broker.publish
+        broker.subscribe('camera/+/cmd', self.on_command)
+
+    def connect(self, host: str, port: int = 1883, username: str = 'camlink', password: str = 'camlink',
+                timeout: float = 10.0) -> bool:
+        """通过一个 paho 连接接入外部 Broker，所有设备共用该连接"""
+        connected = threading.Event()
+        client = mqtt_client.Client(client_id=f'camlink-virtual-fleet-{random.randint(0, 100000)}')
+        client.username_pw_set(username, password)
+
+        def on_connect(c, userdata, flags, rc):
+            if rc == 0:
+                c.subscribe('camera/+/cmd', qos=1)
+                connected.set()
+
+        client.on_connect = on_connect
+        client.on_message = lambda c, userdata, msg: self.on_command(msg.topic, msg.payload)
+        client.connect(host, port)
+        client.loop_start()
+        self._client = client
+        self._publish = lambda topic, payload, qos: client.publish(topic, payload, qos=qos)
+        return connected.wait(timeout)
+
+    def start(self):
+        """启动定时线程；开启状态上报时各设备的首次上报在一个间隔内均匀错开"""
+        if self._publish is None:
+            raise RuntimeError('请先调用 attach() 或 connect()')
+        with self._lock:
+            if self._running:
+                return self
+            self._running = True
+            if self.state_interval > 0:
+                now = time.time()
+                step = self.state_interval / max(1, len(self.cameras))
+                for n, camera in enumerate(self.cameras.values()):
+                    self._schedule_locked(now + n * step, self._report_state, camera)
+        self._thread = threading.Thread(target=self._run, name='virtual-fleet', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+            self._events.clear()
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._client is not None:
+            self._client.loop_stop()
+            self._client.disconnect()
+            self._client = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'cameras': len(self.cameras),
+                'commands_received': self.commands_received,
+                'unknown_commands': self.unknown_commands,
+                'messages_sent': dict(self.messages_sent),
+                'pending_events': len(self._events)
+            }
+
+    # ==================== 定时事件 ====================
+
+    def _schedule_locked(self, due: float, callback: Callable, *args):
+        self._seq += 1
+        heapq.heappush(self._events, (due, self._seq, callback, args))
+
+    def _schedule(self, delay: float, callback: Callable, *args):
+        with self._lock:
+            if not self._running:
+                return
+            self._schedule_locked(time.time() + delay, callback, *args)
+            if self._events[0][1] == self._seq:
+                self._wakeup.notify()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while self._running and (not self._events or self._events[0][0] > time.time()):
+                    self._wakeup.wait(self._events[0][0] - time.time() if self._events else None)
+                if not self._running:
+                    return
+                _, _, callback, args = heapq.heappop(self._events)
+            try:
+                callback(*args)
+            except Exception:
+                log.exception('虚拟设备事件出错', key='event', callback=getattr(callback, '__name__', repr(callback)))
+
+    def _send(self, camera: VirtualCamera, kind: str, payload: dict, qos: int):
+        self._publish(f'camera/{camera.client_id}/{kind}', json.dumps(payload, ensure_ascii=False).encode('utf-8'), qos)
+        with self._lock:
+            self.messages_sent[kind] += 1
+
+    def _report_state(self, camera: VirtualCamera):
+        camera.left_storage = max(0, camera.left_storage - (1 if camera.run_state == 'recording' else 0))
+        self._send(camera, 'state', camera.state(), 0)
+        self._schedule(self.state_interval, self._report_state, camera)
+
+    def _report_upload(self, camera: VirtualCamera, request_id: str, files: List[str]):
+        progress = {}
+        for name in files:
+            camera.uploads[name] = min(1.0, round(camera.uploads.get(name, 0.0) + self.upload_step, 4))
+            progress[name] = camera.uploads[name]
+        self._send(camera, 'upload_file_status', {'request_id': request_id, 'file_upload_progress': progress}, 0)
+        if any(p < 1.0 for p in progress.values()):
+            self._schedule(self.upload_interval, self._report_upload, camera, request_id, files)
+
+    # ==================== 命令处理 ====================
+
+    def on_command(self, topic: str, payload: bytes):
+        """camera/<client_id>/cmd 的订阅回调：解析命令并在随机延迟后回复"""
+        parts = topic.split('/')
+        camera = self.cameras.get(parts[1]) if len(parts) == 3 else None
+        try:
+            command = json.loads(payload)
+        except (ValueError, UnicodeDecodeError):
+            command = None
+        with self._lock:
+            self.commands_received += 1
+            if camera is None or not isinstance(command, dict):
+                self.unknown_commands += 1
+                return
+        low, high = self.response_delay
+        self._schedule(self._rng.uniform(low, high), self._respond, camera, command)
+
+    def _failed(self) -> bool:
+        return self.fail_rate > 0 and self._rng.random() < self.fail_rate
+
+    def _respond(self, camera: VirtualCamera, command: dict):
+        action = command.get('action')
+        request_id = command.get('request_id')
+        params = command.get('params') or {}
+        response = {'request_id': request_id}
+
+        if action in ('start_record', 'stop_record', 'upload_file') and self._failed():
+            response.update({'result': 'failed', 'error_code': SIMULATED_ERROR_CODE, 'error_msg': '模拟设备执行失败'})
+        elif action == 'get_status':
+            response.update(camera.state())
+        elif action == 'start_record':
+            camera.run_state = 'recording'
+            camera.pre_name = command.get('pre_name', '')
+            response.update({'result': 'success', 'error_code': 0})
+        elif action == 'stop_record':
+            if camera.run_state == 'recording':
+                camera.recorded.append(_video(datetime.now(), len(camera.recorded), camera.pre_name,
+                                              self._rng.randint(60, 3600), self._rng.randint(5, 500) * 1024 * 1024))
+            camera.run_state = 'stopped'
+            response.update({'result': 'success', 'error_code': 0})
+        elif action == 'list_videos':
+            min_size = params.get('min_size') or 0
+            max_size = params.get('max_size')
+            response['videos'] = [
+                v for v in camera.videos()
+                if v['size'] >= min_size and (max_size is None or v['size'] <= max_size)
+            ]
+        elif action == 'upload_file':
+            files = list(params.get('file_name_list') or [])
+            for name in files:
+                camera.uploads[name] = 0.0
+            response.update({'result': 'success', 'error_code': 0})
+            if files:
+                self._schedule(self.upload_interval, self._report_upload, camera, request_id, files)
+        elif action == 'get_upload_status':
+            files = params.get('file_name_list') or list(camera.uploads) or [camera.videos()[-1]['file_name']]
+            response['file_list_upload_progress'] = {name: camera.uploads.get(name, 0.0) for name in files}
+        else:
+            response.update({'result': 'failed', 'error_code': SIMULATED_ERROR_CODE, 'error_msg': f'不支持的命令: {action}'})
+        self._send(camera, 'resp', response, 1)
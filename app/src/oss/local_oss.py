@@ -0,0 +1,325 @@
+"""
+本地OSS替身模块
+在进程内启动一个兼容OSS分片上传协议的HTTP服务，用于在没有阿里云OSS的情况下
+对上传链路做基准测试和回归测试
+
+支持的操作（path-style 地址: http://host:port/<bucket>/<key>）：
+- POST   ?uploads                 初始化分片上传 (InitiateMultipartUpload)
+- PUT    ?partNumber=N&uploadId=U 上传分片 (UploadPart)
+- POST   ?uploadId=U              完成分片上传 (CompleteMultipartUpload)
+- GET    ?uploadId=U              列举已上传分片 (ListParts)
+- DELETE ?uploadId=U              取消分片上传 (AbortMultipartUpload)
+- GET/HEAD                        读取合并后的对象（keep_data=True 时返回内容）
+
+不校验签名，预签名URL中的签名参数会被忽略
+"""
+import hashlib
+import threading
+import uuid
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import urlsplit, parse_qs, unquote
+from xml.sax.saxutils import escape
+
+import alibabacloud_oss_v2 as oss
+
+
+def _crc64(data: bytes) -> int:
+    crc = oss.crc.Crc64(0)
+    crc.update(data)
+    return crc.sum64()
+
+
+class LocalOssServer:
+    """
+    进程内OSS替身服务
+
+    用法:
+        server = LocalOssServer()
+        server.start()
+        os.environ['OSS_ENDPOINT'] = server.endpoint
+        ...
+        server.stop()
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, keep_data: bool = True):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示自动分配
+            keep_data: 是否在内存中保留分片和对象内容（基准测试时可关闭以节省内存）
+        """
+        self.keep_data = keep_data
+        self.fail_part_uploads = 0   # 接下来多少次分片上传返回500（用于测试重试）
+        self._uploads: Dict[str, dict] = {}   # upload_id -> {bucket, key, parts: {n: {...}}}
+        self._objects: Dict[tuple, dict] = {}  # (bucket, key) -> {size, etag, crc64, data}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint(self) -> str:
+        """服务地址，如 http://127.0.0.1:54321"""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """在后台线程中启动服务"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务"""
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ==================== 查询（测试使用） ====================
+
+    def get_object(self, bucket: str, key: str) -> Optional[dict]:
+        """获取已合并对象的元信息（含内容，如果保留）"""
+        with self._lock:
+            obj = self._objects.get((bucket, key))
+            return dict(obj) if obj else None
+
+    def pending_uploads(self) -> int:
+        """尚未完成或取消的分片上传数量"""
+        with self._lock:
+            return len(self._uploads)
+
+    # ==================== 协议处理 ====================
+
+    def _initiate(self, bucket: str, key: str):
+        upload_id = uuid.uuid4().hex.upper()
+        with self._lock:
+            self._uploads[upload_id] = {'bucket': bucket, 'key': key, 'parts': {}}
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<InitiateMultipartUploadResult>'
+            f'<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>'
+            '</InitiateMultipartUploadResult>'
+        )
+        return 200, {}, body.encode('utf-8')
+
+    def _upload_part(self, upload_id: str, part_number: int, data: bytes):
+        with self._lock:
+            if self.fail_part_uploads > 0:
+                self.fail_part_uploads -= 1
+                return self._error(500, 'InternalError', 'Injected failure.')
+        etag = '"' + hashlib.md5(data).hexdigest().upper() + '"'
+        crc = _crc64(data)
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            if upload is None:
+                return self._error(404, 'NoSuchUpload', 'The specified upload does not exist.')
+            upload['parts'][part_number] = {
+                'etag': etag,
+                'size': len(data),
+                'crc64': crc,
+                'last_modified': datetime.now(timezone.utc),
+                'data': data if self.keep_data else None
+            }
+        return 200, {'ETag': etag, 'x-oss-hash-crc64ecma': str(crc)}, b''
+
+    def _complete(self, upload_id: str, body: bytes):
+        try:
+            root = ET.fromstring(body)
+            requested = [
+                (int(p.findtext('PartNumber')), p.findtext('ETag'))
+                for p in root.findall('Part')
+            ]
+        except (ET.ParseError, TypeError, ValueError):
+            return self._error(400, 'MalformedXML', 'The XML you provided was not well-formed.')
+
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            if upload is None:
+                return self._error(404, 'NoSuchUpload', 'The specified upload does not exist.')
+            if not requested or [n for n, _ in requested] != sorted(n for n, _ in requested):
+                return self._error(400, 'InvalidPartOrder', 'The list of parts was not in ascending order.')
+
+            crc = 0
+            size = 0
+            md5s = b''
+            chunks = []
+            for number, etag in requested:
+                part = upload['parts'].get(number)
+                if part is None or (etag or '').strip('"').upper() != part['etag'].strip('"'):
+                    return self._error(400, 'InvalidPart', f'One or more of the specified parts could not be found (part {number}).')
+                crc = oss.crc.Crc64.combine(crc, part['crc64'], part['size']) if size else part['crc64']
+                size += part['size']
+                md5s += bytes.fromhex(part['etag'].strip('"'))
+                chunks.append(part['data'])
+
+            etag = '"' + hashlib.md5(md5s).hexdigest().upper() + f'-{len(requested)}"'
+            bucket, key = upload['bucket'], upload['key']
+            self._objects[(bucket, key)] = {
+                'size': size,
+                'etag': etag,
+                'crc64': crc,
+                'data': b''.join(chunks) if self.keep_data else None
+            }
+            del self._uploads[upload_id]
+
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<CompleteMultipartUploadResult>'
+            f'<Location>/{escape(bucket)}/{escape(key)}</Location>'
+            f'<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key><ETag>{escape(etag)}</ETag>'
+            '</CompleteMultipartUploadResult>'
+        )
+        return 200, {'ETag': etag, 'x-oss-hash-crc64ecma': str(crc)}, body.encode('utf-8')
+
+    def _list_parts(self, upload_id: str):
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            if upload is None:
+                return self._error(404, 'NoSuchUpload', 'The specified upload does not exist.')
+            parts = sorted(upload['parts'].items())
+            bucket, key = upload['bucket'], upload['key']
+
+        items = ''.join(
+            '<Part>'
+            f'<PartNumber>{number}</PartNumber>'
+            f'<LastModified>{part["last_modified"].strftime("%Y-%m-%dT%H:%M:%S.000Z")}</LastModified>'
+            f'<ETag>{escape(part["etag"])}</ETag><Size>{part["size"]}</Size>'
+            f'<HashCrc64ecma>{part["crc64"]}</HashCrc64ecma>'
+            '</Part>'
+            for number, part in parts
+        )
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<ListPartsResult>'
+            f'<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>'
+            f'<MaxParts>1000</MaxParts><IsTruncated>false</IsTruncated>{items}'
+            '</ListPartsResult>'
+        )
+        return 200, {}, body.encode('utf-8')
+
+    def _abort(self, upload_id: str):
+        with self._lock:
+            if self._uploads.pop(upload_id, None) is None:
+                return self._error(404, 'NoSuchUpload', 'The specified upload does not exist.')
+        return 204, {}, b''
+
+    def _read_object(self, bucket: str, key: str, head: bool):
+        with self._lock:
+            obj = self._objects.get((bucket, key))
+        if obj is None:
+            return self._error(404, 'NoSuchKey', 'The specified key does not exist.')
+        headers = {
+            'ETag': obj['etag'],
+            'x-oss-hash-crc64ecma': str(obj['crc64']),
+            'Content-Length': str(obj['size'])
+        }
+        if head or obj['data'] is None:
+            return 200, headers, b''
+        return 200, headers, obj['data']
+
+    @staticmethod
+    def _error(status: int, code: str, message: str):
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<Error><Code>{code}</Code><Message>{escape(message)}</Message>'
+            f'<RequestId>{uuid.uuid4().hex.upper()}</RequestId></Error>'
+        )
+        return status, {'Content-Type': 'application/xml'}, body.encode('utf-8')
+
+    def _route(self, method: str, path: str, query: dict, body: bytes):
+        """根据请求方法和查询参数分发到对应操作"""
+        parts = unquote(path).lstrip('/').split('/', 1)
+        if len(parts) < 2 or not parts[0] or not parts[1]:
+            return self._error(400, 'InvalidArgument', 'Path-style bucket and key are required.')
+        bucket, key = parts
+        upload_id = query.get('uploadId', [None])[0]
+
+        if method == 'POST' and 'uploads' in query:
+            return self._initiate(bucket, key)
+        if method == 'PUT' and upload_id and 'partNumber' in query:
+            try:
+                part_number = int(query['partNumber'][0])
+            except ValueError:
+                return self._error(400, 'InvalidArgument', 'partNumber must be an integer.')
+            return self._upload_part(upload_id, part_number, body)
+        if method == 'POST' and upload_id:
+            return self._complete(upload_id, body)
+        if method == 'GET' and upload_id:
+            return self._list_parts(upload_id)
+        if method == 'DELETE' and upload_id:
+            return self._abort(upload_id)
+        if method in ('GET', 'HEAD'):
+            return self._read_object(bucket, key, head=(method == 'HEAD'))
+        return self._error(405, 'MethodNotAllowed', f'{method} is not supported by the local OSS stand-in.')
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _read_body(self) -> bytes:
+                if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+                    chunks = []
+                    while True:
+                        size = int(self.rfile.readline().split(b';', 1)[0].strip() or b'0', 16)
+                        if size == 0:
+                            # 跳过 trailer
+                            while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                                pass
+                            return b''.join(chunks)
+                        chunks.append(self.rfile.read(size))
+                        self.rfile.readline()
+                length = int(self.headers.get('Content-Length') or 0)
+                return self.rfile.read(length) if length else b''
+
+            def _handle(self):
+                url = urlsplit(self.path)
+                query = parse_qs(url.query, keep_blank_values=True)
+                body = self._read_body()
+                status, headers, payload = server._route(self.command, url.path, query, body)
+
+                self.send_response(status)
+                headers.setdefault('x-oss-request-id', uuid.uuid4().hex.upper())
+                if self.command != 'HEAD' or 'Content-Length' not in headers:
+                    headers['Content-Length'] = str(len(payload))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if self.command != 'HEAD' and payload:
+                    self.wfile.write(payload)
+
+            do_GET = do_PUT = do_POST = do_DELETE = do_HEAD = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    # 独立运行: python -m app.src.oss.local_oss [port]
+    import sys
+    import time
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 9000
+    server = LocalOssServer(port=port).start()
+    print(f"Local OSS stand-in listening on {server.endpoint}")
+    print(f"export OSS_ENDPOINT={server.endpoint} OSS_USE_PATH_STYLE=true")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -1,8 +1,17 @@
 import os
+import mmap
+import logging
+import time
+import random
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 import alibabacloud_oss_v2 as oss
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
+from app.src.logger import get_logger
+
+log = get_logger('oss')
 
 def getOssClient():
     # 从 .env 文件加载环境变量
@@ -12,9 +21,9 @@ def getOssClient():
     # print('os.environ["OSS_ACCESS_KEY_ID"]:', os.environ.get("OSS_ACCESS_KEY_ID"))
     # print('os.environ["OSS_ACCESS_KEY_SECRET"]:', os.environ.get("OSS_ACCESS_KEY_SECRET"))
 
-    # 从命令行参数获取区域和endpoint
-    region = 'cn-beijing'
-    endpoint = 'oss-cn-beijing.aliyuncs.com'
+    # 区域和endpoint，可通过环境变量覆盖（如指向本地OSS替身 local_oss.LocalOssServer）
+    region = os.environ.get('OSS_REGION', 'cn-beijing')
+    endpoint = os.environ.get('OSS_ENDPOINT', 'oss-cn-beijing.aliyuncs.com')
 
     # 从环境变量中加载访问OSS所需的认证信息，用于身份验证
     credentials_provider = oss.credentials.EnvironmentVariableCredentialsProvider()
@@ -30,6 +39,10 @@ def getOssClient():
     if endpoint is not None:
         cfg.endpoint = endpoint
 
+    # 本地替身服务不支持虚拟主机风格的bucket域名，需使用path-style地址
+    if os.environ.get('OSS_USE_PATH_STYLE', '').lower() in ('1', 'true', 'yes'):
+        cfg.use_path_style = True
+
     # 使用上述配置初始化OSS客户端，准备与OSS交互
     client = oss.Client(cfg)
 
@@ -121,29 +134,41 @@ def confirmCompleteMultipartUpload(bucket, key, upload_id, upload_parts):
 
     # 发送完成上传请求
     with requests.post(complete_pre_result.url, headers=complete_pre_result.signed_headers, data=op_input.body) as complete_resp:
+        server_crc = complete_resp.headers.get("x-oss-hash-crc64ecma")
+        complete_info = {
+            "status_code": complete_resp.status_code,
+            "etag": complete_resp.headers.get("ETag"),
+            "crc64": int(server_crc) if server_crc else None
+        }
         result = oss.CompleteMultipartUploadResult()
         oss.serde.deserialize_xml(xml_data=complete_resp.content, obj=result)
-        print(f'status code: {complete_resp.status_code},'
-                f' request id: {complete_resp.headers.get("x-oss-request-id")},'
-                f' hash crc64: {complete_resp.headers.get("x-oss-hash-crc64ecma")},'
-                f' content md5: {complete_resp.headers.get("Content-MD5")},'
-                f' etag: {complete_resp.headers.get("ETag")},'
-                f' content length: {complete_resp.headers.get("content-length")},'
-                f' content type: {complete_resp.headers.get("Content-Type")},'
-                f' url: {result.location},'
-                f' encoding type: {result.encoding_type},'
-                f' server time: {complete_resp.headers.get("x-oss-server-time")}'
-        )
-
-    # 打印完成请求的方法、过期时间和URL
-    print(f'method: {complete_pre_result.method},'
-            f' expiration: {complete_pre_result.expiration.strftime("%Y-%m-%dT%H:%M:%S.000Z")},'
-            f' url: {complete_pre_result.url}'
-    )
-
-    # 打印完成请求的已签名头信息
-    for key, value in complete_pre_result.signed_headers.items():
-        print(f'------>>>>signed headers key: {key}, signed headers value: {value}')
+        log.info('完成分片上传', key=key, status_code=complete_resp.status_code,
+                 oss_request_id=complete_resp.headers.get("x-oss-request-id"),
+                 crc64=complete_resp.headers.get("x-oss-hash-crc64ecma"),
+                 etag=complete_resp.headers.get("ETag"),
+                 location=result.location,
+                 server_time=complete_resp.headers.get("x-oss-server-time"))
+
+    # 预签名请求的方法、过期时间和已签名头信息（含签名，只在DEBUG级别输出）
+    if log.is_enabled(logging.DEBUG):
+        log.debug('完成上传预签名请求', method=complete_pre_result.method,
+                  expiration=complete_pre_result.expiration.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                  url=complete_pre_result.url, signed_headers=dict(complete_pre_result.signed_headers))
+
+    return complete_info
+
+def abortMultipartUpload(bucket, key, upload_id):
+    """取消分片上传，删除已上传的分片；返回HTTP状态码"""
+    client = getOssClient()
+    abort_pre_result = client.presign(oss.AbortMultipartUploadRequest(
+        bucket=bucket,
+        key=key,
+        upload_id=upload_id,
+    ))
+    with requests.delete(abort_pre_result.url, headers=abort_pre_result.signed_headers) as resp:
+        log.info('已取消分片上传', key=key, upload_id=upload_id, status_code=resp.status_code,
+                 oss_request_id=resp.headers.get("x-oss-request-id"))
+        return resp.status_code
 
 def split_number(n, k):
     """
@@ -161,66 +186,250 @@ def split_number(n, k):
     parts.sort(reverse=True)  # 确保最后一份最小
     return parts
 
-def testPost(presignUrls, file_path):
-    presignUrls_upload_parts = presignUrls["upload_parts"]
-    print("presignUrls_upload_parts.size():", len(presignUrls_upload_parts))
-    # 分块大小为1MB
-    # part_size = 1024 * 1024
-    # part_size = 512 * 512
+class MmapSectionReader:
+    """
+    基于mmap的分片读取器
+    直接切片内存映射的文件区域（零拷贝），在读取的同时流式计算CRC64
+    """
+
+    def __init__(self, view: memoryview, on_read=None):
+        """
+        Args:
+            view: 文件某一段的 memoryview（来自 mmap）
+            on_read: 每读出一块数据时的回调，参数为本次读取的字节数
+        """
+        self._view = view
+        self._on_read = on_read
+        self._off = 0
+        self._crc = oss.crc.Crc64(0)
+        self._chunk = None
+
+    def read(self, n: int = -1):
+        # 上一块已发送完毕，释放其视图（映射存在未释放的视图时无法关闭）
+        self._release_chunk()
+        if self._off >= len(self._view):
+            return b''
+        end = len(self._view) if n is None or n < 0 else min(len(self._view), self._off + n)
+        chunk = self._chunk = self._view[self._off:end]
+        self._off = end
+        self._crc.update(chunk)
+        if self._on_read is not None:
+            self._on_read(len(chunk))
+        return chunk
+
+    def reset(self):
+        """重试前回到分片起始位置，并回退已上报的进度"""
+        self._release_chunk()
+        if self._on_read is not None and self._off:
+            self._on_read(-self._off)
+        self._off = 0
+        self._crc.reset()
+
+    def close(self):
+        """释放最后读出的数据块视图"""
+        self._release_chunk()
+
+    def _release_chunk(self):
+        if self._chunk is not None:
+            self._chunk.release()
+            self._chunk = None
+
+    @property
+    def crc64(self) -> int:
+        """已读取部分的CRC64（读取完毕后即为整个分片的CRC64）"""
+        return self._crc.sum64()
+
+    def __len__(self):
+        return len(self._view)
+
+
+def combineCrc64(upload_parts):
+    """
+    按分片顺序合并各分片的CRC64，得到整个文件的CRC64
 
-    # 获取文件大小
+    Args:
+        upload_parts: uploadParts() 返回的分片列表（包含 crc64 和 size）
+    """
+    crc = 0
+    for i, part in enumerate(sorted(upload_parts, key=lambda p: p["partNumber"])):
+        crc = part["crc64"] if i == 0 else oss.crc.Crc64.combine(crc, part["crc64"], part["size"])
+    return crc
+
+
+_session_local = threading.local()
+
+
+def _getSession():
+    """每个上传线程复用自己的HTTP连接"""
+    session = getattr(_session_local, 'session', None)
+    if session is None:
+        session = _session_local.session = requests.Session()
+    return session
+
+
+def _uploadPart(url, view, part_number, max_retries, backoff, on_read, cancelled=None):
+    """上传单个分片，失败时指数退避重试（cancelled 被设置后不再重试），返回分片信息"""
+    reader = MmapSectionReader(view, on_read)
+    attempt = 0
+    try:
+        while True:
+            try:
+                resp = _getSession().put(url, data=reader)
+                # 4xx（除限流外）重试无意义，直接失败
+                if resp.status_code >= 500 or resp.status_code == 429:
+                    raise requests.HTTPError(f"part {part_number} status code {resp.status_code}", response=resp)
+                resp.raise_for_status()
+            except requests.RequestException as e:
+                retriable = e.response is None or e.response.status_code >= 500 or e.response.status_code == 429
+                if not retriable or attempt >= max_retries or (cancelled is not None and cancelled.is_set()):
+                    raise
+                delay = backoff * (2 ** attempt) * (1 + random.random() * 0.2)
+                log.warning('分片上传失败，稍后重试', part=part_number, delay_s=round(delay, 2),
+                            attempt=attempt + 1, max_retries=max_retries, error=str(e))
+                if cancelled is None:
+                    time.sleep(delay)
+                elif cancelled.wait(delay):
+                    raise
+                attempt += 1
+                reader.reset()
+                continue
+
+            local_crc = reader.crc64
+            server_crc = resp.headers.get("x-oss-hash-crc64ecma")
+            if server_crc is not None and int(server_crc) != local_crc:
+                raise ValueError(f"分片 {part_number} CRC64校验失败: local={local_crc}, server={server_crc}")
+            return {
+                "partNumber": part_number,
+                "etag": resp.headers.get("ETag"),
+                "crc64": local_crc,
+                "size": len(view)
+            }
+    finally:
+        reader.close()
+
+
+def uploadParts(presignUrls, file_path, max_workers=4, max_retries=3, backoff=0.5, progress_callback=None):
+    """
+    并发上传文件的各个分片
+
+    使用 mmap 映射文件，各分片直接切片映射区域发送，不复制到内存；
+    分片在有界线程池中并发上传，失败时指数退避重试
+
+    Args:
+        presignUrls: getMultipartUploadPresignUrls() 的返回值
+        file_path: 本地文件路径
+        max_workers: 并发上传的分片数上限
+        max_retries: 每个分片的最大重试次数
+        backoff: 首次重试的等待时间（秒），之后每次翻倍
+        progress_callback: 进度回调 callback(uploaded_bytes, total_bytes)
+
+    Returns:
+        按分片编号排序的分片列表 [{partNumber, etag, crc64, size}, ...]
+    """
+    presignUrls_upload_parts = presignUrls["upload_parts"]
     data_size = os.path.getsize(file_path)
-    print("data_size:", data_size)
+    if data_size == 0:
+        raise ValueError("不能分片上传空文件")
 
-    # 获取每份大小的最小整数
     part_number = len(presignUrls_upload_parts)
+    split_numbers = split_number(data_size, part_number)
+    log.info('开始分片上传', file=file_path, size=data_size, parts=part_number, workers=max_workers)
 
-    upload_parts = []
+    progress_lock = threading.Lock()
+    uploaded = [0]
 
-    split_numbers = split_number(data_size, part_number)
-    print("split_numbers:", split_numbers)
+    def on_read(n):
+        if progress_callback is None:
+            return
+        with progress_lock:
+            uploaded[0] += n
+            current = uploaded[0]
+        progress_callback(current, data_size)
 
-    # 打开文件进行读取
     with open(file_path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mm)
+        slices = []
+        cancelled = threading.Event()
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, part_number))) as pool:
+                futures = []
+                start = 0
+                for i, n in enumerate(split_numbers):
+                    url = presignUrls_upload_parts[i]["uploadUrl"]
+                    slices.append(view[start:start + n])
+                    futures.append(pool.submit(
+                        _uploadPart, url, slices[-1], i + 1, max_retries, backoff, on_read, cancelled
+                    ))
+                    start += n
+                try:
+                    upload_parts = [future.result() for future in futures]
+                except BaseException:
+                    # 任一分片失败后整个分片上传会被放弃：取消排队中的分片，进行中的分片不再重试
+                    cancelled.set()
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            # 线程池退出时所有分片已结束，先释放全部视图再关闭映射
+            for part_view in slices:
+                part_view.release()
+            view.release()
+            try:
+                mm.close()
+            except BufferError:
+                log.warning('文件映射仍被引用，交给垃圾回收释放', file=file_path)
+
+    log.info('分片上传完成', parts=len(upload_parts), crc64=combineCrc64(upload_parts))
+    return upload_parts
 
-        start = 0
-        for i in range(len(split_numbers)):
-            print("i:", i)
-            print("start:", start)
-            n = split_numbers[i]
-            print("n:", n)
-
-            up_pre_result_url = presignUrls_upload_parts[i]["uploadUrl"]            
-            reader = oss.io_utils.SectionReader(oss.io_utils.ReadAtReader(f), start, n)
-
-            # 上传分块数据
-            print("up_pre_result.url:", up_pre_result_url)
-            with requests.put(up_pre_result_url, data=reader) as up_result:
-                print(f'status code: {up_result.status_code},'
-                        f' request id: {up_result.headers.get("x-oss-request-id")},'
-                        f' part number: {i + 1},'
-                        f' hash crc64: {up_result.headers.get("x-oss-hash-crc64ecma")},'
-                        f' content md5: {up_result.headers.get("Content-MD5")},'
-                        f' etag: {up_result.headers.get("ETag")},'
-                        f' server time: {up_result.headers.get("x-oss-server-time")}'
-                )
-
-                print('-'*90)
-                print('up_result.headers.get("ETag"):', up_result.headers.get("ETag"))
-
-                # 记录每个部分的ETag和编号
-                upload_parts.append({
-                    "partNumber": i + 1,
-                    "etag": up_result.headers.get("ETag")
-                })
 
-                print('upload_parts:', upload_parts)
-                print('-'*90)
+def testPost(presignUrls, file_path, **kwargs):
+    """兼容旧接口，等同于 uploadParts()"""
+    return uploadParts(presignUrls, file_path, **kwargs)
 
-            # 移动文件指针到下一个分块的起始位置
-            start = start + n
 
-    return upload_parts
+def multipartUploadFile(bucket, key, file_path, part_number, **kwargs):
+    """
+    服务端完整上传一个文件（用于SD卡找回视频的重新入库）：
+    初始化 → 并发上传分片 → 完成上传 → 校验整个对象的CRC64；
+    分片上传或完成上传失败时取消分片上传，不在OSS上留下已上传的分片
+
+    Args:
+        bucket: 存储桶名称
+        key: 对象键
+        file_path: 本地文件路径
+        part_number: 分片数量
+        **kwargs: 透传给 uploadParts()（max_workers, max_retries, backoff, progress_callback）
+
+    Returns:
+        完成上传的结果字典（status_code, etag, crc64）
+
+    Raises:
+        requests.HTTPError: 分片上传或完成上传失败（已取消分片上传）
+        ValueError: 服务端没有返回CRC64或与本地计算的不一致
+    """
+    presignUrls = getMultipartUploadPresignUrls(bucket, key, part_number)
+    upload_id = presignUrls["upload_id"]
+    try:
+        upload_parts = uploadParts(presignUrls, file_path, **kwargs)
+        result = confirmCompleteMultipartUpload(bucket, key, upload_id, upload_parts)
+        if result["status_code"] != 200:
+            raise requests.HTTPError(f"完成分片上传失败: HTTP {result['status_code']} (key: {key})")
+    except Exception:
+        try:
+            abortMultipartUpload(bucket, key, upload_id)
+        except Exception:
+            log.exception('取消分片上传失败', key='abort', object_key=key, upload_id=upload_id)
+        raise
+
+    local_crc = combineCrc64(upload_parts)
+    if result.get("crc64") is None:
+        raise ValueError(f"服务端未返回对象CRC64，无法校验 (key: {key})")
+    if result["crc64"] != local_crc:
+        raise ValueError(f"对象CRC64校验失败: local={local_crc}, server={result['crc64']} (key: {key})")
+    return result
+
 
 # 当此脚本被直接执行时，调用main函数开始处理逻辑
 if __name__ == "__main__":
@@ -0,0 +1,20 @@
+"""
+运行时剖析模块
+采样CPU剖析、tracemalloc 内存快照与对比，以及锁等待/持有时间统计，供管理接口按需采集
+"""
+from .cpu_profiler import cpu_profiler, CpuProfiler, CpuProfile
+from .memory_profiler import memory_profiler, MemoryProfiler, container_sizes, deep_sizeof
+from .lock_stats import lock_profiler, LockProfiler, ProfiledLock
+
+__all__ = [
+    'cpu_profiler',
+    'CpuProfiler',
+    'CpuProfile',
+    'memory_profiler',
+    'MemoryProfiler',
+    'container_sizes',
+    'deep_sizeof',
+    'lock_profiler',
+    'LockProfiler',
+    'ProfiledLock'
+]
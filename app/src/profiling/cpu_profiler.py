@@ -0,0 +1,148 @@
+"""
+采样CPU剖析
+在指定时长内定期抓取所有线程（状态监听器、MQTT发布器网络循环、Web请求线程等）的调用栈，
+导出为 folded stacks 文本（flamegraph.pl / speedscope 可直接打开）或 speedscope JSON
+
+按墙钟时间采样：阻塞在锁、socket 或 sleep 上的线程同样会被计入
+"""
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# 单次剖析的最长时间（秒）
+MAX_SECONDS = 60
+
+# 调用栈的一帧：(文件名, 函数名, 函数首行号)
+Frame = Tuple[str, str, int]
+
+
+class CpuProfile:
+    """一次采样的结果：{(线程名, 调用栈（根在前）): 采样次数}"""
+
+    def __init__(self, stacks: Dict[Tuple[str, Tuple[Frame, ...]], int], samples: int,
+                 interval: float, duration: float):
+        self.stacks = stacks
+        self.samples = samples
+        self.interval = interval
+        self.duration = duration
+
+    @staticmethod
+    def _frame_name(frame: Frame) -> str:
+        filename, name, line = frame
+        return f'{name} ({filename}:{line})'
+
+    def folded(self) -> str:
+        """每行 "线程;根函数;...;叶函数 次数"，按次数降序"""
+        lines = []
+        for (thread, stack), count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+            names = [thread.replace(';', '_')] + [self._frame_name(f).replace(';', '_') for f in stack]
+            lines.append(f"{';'.join(names)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def speedscope(self) -> dict:
+        """speedscope 文件格式（每个线程一个 sampled profile）"""
+        frames: List[dict] = []
+        index: Dict[Frame, int] = {}
+        profiles: Dict[str, dict] = {}
+        for (thread, stack), count in self.stacks.items():
+            ids = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({'name': frame[1], 'file': frame[0], 'line': frame[2]})
+                ids.append(index[frame])
+            profile = profiles.setdefault(thread, {
+                'type': 'sampled', 'name': thread, 'unit': 'seconds',
+                'startValue': 0, 'endValue': round(self.duration, 6), 'samples': [], 'weights': []
+            })
+            profile['samples'].append(ids)
+            profile['weights'].append(round(count * self.interval, 6))
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': f'camlink cpu profile ({self.samples} samples)',
+            'exporter': 'camlink',
+            'activeProfileIndex': 0,
+            'shared': {'frames': frames},
+            'profiles': sorted(profiles.values(), key=lambda p: -sum(p['weights']))
+        }
+
+    def summary(self, limit: int = 20) -> dict:
+        """按线程的采样数，以及采样最多的叶子函数"""
+        threads: Counter = Counter()
+        leaves: Counter = Counter()
+        for (thread, stack), count in self.stacks.items():
+            threads[thread] += count
+            if stack:
+                leaves[self._frame_name(stack[-1])] += count
+        return {
+            'samples': self.samples,
+            'duration_s': round(self.duration, 3),
+            'threads': dict(threads.most_common()),
+            'top_leaf_functions': [{'function': name, 'samples': n} for name, n in leaves.most_common(limit)]
+        }
+
+
+class CpuProfiler:
+    """采样剖析器；同一时间只允许一次剖析"""
+
+    def __init__(self):
+        self._running = threading.Lock()
+
+    def profile(self, seconds: float = 10, interval: float = 0.005,
+                include_idle: bool = True) -> Optional[CpuProfile]:
+        """
+        采样所有线程的调用栈
+
+        Args:
+            seconds: 采样时长（最长 MAX_SECONDS）
+            interval: 采样间隔（秒）
+            include_idle: 是否保留叶子帧为等待/休眠（threading / selectors / socket 的等待函数）的样本
+
+        Returns:
+            CpuProfile；已有剖析在运行时返回None
+        """
+        if not self._running.acquire(blocking=False):
+            return None
+        try:
+            seconds = max(0.05, min(seconds, MAX_SECONDS))
+            interval = max(0.001, interval)
+            me = threading.get_ident()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks: Counter = Counter()
+            samples = 0
+            started = time.monotonic()
+            deadline = started + seconds
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append((code.co_filename, code.co_name, code.co_firstlineno))
+                        frame = frame.f_back
+                    if not include_idle and stack and _is_idle(stack[0]):
+                        continue
+                    if ident not in names:
+                        names.update((t.ident, t.name) for t in threading.enumerate())
+                    stacks[(names.get(ident, f'thread-{ident}'), tuple(reversed(stack)))] += 1
+                samples += 1
+                time.sleep(interval)
+            return CpuProfile(dict(stacks), samples, interval, time.monotonic() - started)
+        finally:
+            self._running.release()
+
+
+_IDLE_FUNCTIONS = {'wait', 'select', 'poll', 'accept', 'recv', 'recv_into', 'sleep', '_wait_for_tstate_lock', 'get'}
+_IDLE_MODULES = ('threading.py', 'selectors.py', 'socket.py', 'queue.py', 'socketserver.py')
+
+
+def _is_idle(leaf: Frame) -> bool:
+    filename, name, _ = leaf
+    return name in _IDLE_FUNCTIONS and filename.endswith(_IDLE_MODULES)
+
+
+# 全局单例
+cpu_profiler = CpuProfiler()
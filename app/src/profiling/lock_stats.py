@@ -0,0 +1,149 @@
+"""
+锁等待 / 持有时间统计
+ProfiledLock 可直接替换 threading.Lock；统计关闭时只多一次属性判断，
+开启后记录获取次数、竞争次数、等待时间和持有时间（统计数据只在持有该锁时修改，无需额外加锁）
+"""
+import os
+import threading
+import time
+from typing import Dict, List
+
+
+class _LockStats:
+    __slots__ = ('name', 'acquisitions', 'contended', 'wait_total', 'wait_max', 'hold_total', 'hold_max')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.hold_total = 0.0
+        self.hold_max = 0.0
+
+
+class LockProfiler:
+    """ProfiledLock 的统计开关和汇总"""
+
+    def __init__(self):
+        self.enabled = os.getenv('LOCK_PROFILING', '0') == '1'
+        self._lock = threading.Lock()
+        self._stats: List[_LockStats] = []
+        self.enabled_at = time.time() if self.enabled else None
+
+    def register(self, name: str) -> _LockStats:
+        stats = _LockStats(name)
+        with self._lock:
+            self._stats.append(stats)
+        return stats
+
+    def enable(self, enabled: bool = True):
+        self.enabled = enabled
+        self.enabled_at = time.time() if enabled else None
+
+    def reset(self):
+        with self._lock:
+            stats = list(self._stats)
+        for s in stats:
+            s.reset()
+        if self.enabled:
+            self.enabled_at = time.time()
+
+    def report(self) -> Dict[str, object]:
+        """
+        Returns:
+            {'enabled', 'enabled_at', 'locks': [{name, acquisitions, contended, contention_rate,
+              wait_total_ms, wait_max_ms, hold_total_ms, hold_avg_ms, hold_max_ms}, ...]}（按总等待时间降序）
+        """
+        merged: Dict[str, dict] = {}
+        with self._lock:
+            stats = list(self._stats)
+        for s in stats:
+            m = merged.setdefault(s.name, {'name': s.name, 'acquisitions': 0, 'contended': 0, 'wait_total': 0.0,
+                                           'wait_max': 0.0, 'hold_total': 0.0, 'hold_max': 0.0})
+            m['acquisitions'] += s.acquisitions
+            m['contended'] += s.contended
+            m['wait_total'] += s.wait_total
+            m['wait_max'] = max(m['wait_max'], s.wait_max)
+            m['hold_total'] += s.hold_total
+            m['hold_max'] = max(m['hold_max'], s.hold_max)
+        locks = []
+        for m in merged.values():
+            n = m['acquisitions']
+            locks.append({
+                'name': m['name'],
+                'acquisitions': n,
+                'contended': m['contended'],
+                'contention_rate': round(m['contended'] / n, 4) if n else 0.0,
+                'wait_total_ms': round(m['wait_total'] * 1000, 3),
+                'wait_max_ms': round(m['wait_max'] * 1000, 3),
+                'hold_total_ms': round(m['hold_total'] * 1000, 3),
+                'hold_avg_ms': round(m['hold_total'] * 1000 / n, 4) if n else 0.0,
+                'hold_max_ms': round(m['hold_max'] * 1000, 3)
+            })
+        locks.sort(key=lambda l: (l['wait_total_ms'], l['hold_total_ms']), reverse=True)
+        return {'enabled': self.enabled, 'enabled_at': self.enabled_at, 'locks': locks}
+
+
+# 全局单例
+lock_profiler = LockProfiler()
+
+
+class ProfiledLock:
+    """带等待 / 持有时间统计的非重入锁（接口同 threading.Lock）"""
+
+    __slots__ = ('_lock', '_stats', '_acquired_at')
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name: 统计中显示的名称，如 'device_status_manager'
+        """
+        self._lock = threading.Lock()
+        self._stats = lock_profiler.register(name)
+        self._acquired_at = 0.0
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if not lock_profiler.enabled:
+            return self._lock.acquire(blocking, timeout)
+        waited = 0.0
+        contended = False
+        if not self._lock.acquire(False):
+            if not blocking:
+                return False
+            contended = True
+            started = time.perf_counter()
+            if not self._lock.acquire(True, timeout):
+                return False
+            waited = time.perf_counter() - started
+        stats = self._stats
+        stats.acquisitions += 1
+        if contended:
+            stats.contended += 1
+            stats.wait_total += waited
+            if waited > stats.wait_max:
+                stats.wait_max = waited
+        self._acquired_at = time.perf_counter()
+        return True
+
+    def release(self):
+        if self._acquired_at:
+            held = time.perf_counter() - self._acquired_at
+            self._acquired_at = 0.0
+            stats = self._stats
+            stats.hold_total += held
+            if held > stats.hold_max:
+                stats.hold_max = held
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
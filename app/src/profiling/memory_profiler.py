@@ -0,0 +1,165 @@
+"""
+内存剖析
+基于 tracemalloc：开启跟踪后可查看按代码位置统计的内存占用、与基线快照的差异，
+并可导出快照文件（tracemalloc.Snapshot.load 读取）；另统计各内存管理器中容器的条目数和占用
+"""
+import os
+import sys
+import tempfile
+import threading
+import tracemalloc
+import types
+from collections import deque
+from typing import Dict, Optional
+
+# 快照中忽略的帧（跟踪本身和导入机制的分配）
+_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+GROUP_BY = ('lineno', 'filename', 'traceback')
+
+
+def _stat_to_dict(stat) -> dict:
+    frames = stat.traceback.format()
+    return {
+        'location': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+        'size_kb': round(stat.size / 1024, 1),
+        'count': stat.count,
+        **({'traceback': frames} if len(stat.traceback) > 1 else {})
+    }
+
+
+def _diff_to_dict(stat) -> dict:
+    return {
+        'location': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+        'size_kb': round(stat.size / 1024, 1),
+        'size_diff_kb': round(stat.size_diff / 1024, 1),
+        'count': stat.count,
+        'count_diff': stat.count_diff
+    }
+
+
+class MemoryProfiler:
+    """tracemalloc 的启停、快照与基线对比，线程安全"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+
+    def start(self, frames: int = 10) -> dict:
+        """开始跟踪（已在跟踪时只重置基线），并把当前状态记为基线"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+            self._baseline = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+        return self.status()
+
+    def stop(self) -> dict:
+        with self._lock:
+            tracemalloc.stop()
+            self._baseline = None
+        return self.status()
+
+    def status(self) -> dict:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {
+            'tracing': tracing,
+            'frames': tracemalloc.get_traceback_limit() if tracing else 0,
+            'traced_current_kb': round(current / 1024, 1),
+            'traced_peak_kb': round(peak / 1024, 1),
+            'tracemalloc_overhead_kb': round(tracemalloc.get_tracemalloc_memory() / 1024, 1),
+            'has_baseline': self._baseline is not None
+        }
+
+    def report(self, limit: int = 30, group_by: str = 'lineno', reset_baseline: bool = False) -> Optional[dict]:
+        """
+        当前内存占用最多的代码位置，以及与基线相比增长最多的位置
+
+        Args:
+            limit: 返回条数
+            group_by: lineno / filename / traceback
+            reset_baseline: 报告后把当前快照设为新的基线
+
+        Returns:
+            {status, top: [...], diff: [...]}；未开启跟踪时返回None
+        """
+        if not tracemalloc.is_tracing():
+            return None
+        group_by = group_by if group_by in GROUP_BY else 'lineno'
+        snapshot = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+        with self._lock:
+            baseline = self._baseline
+            if reset_baseline or baseline is None:
+                self._baseline = snapshot
+        result = {
+            'status': self.status(),
+            'group_by': group_by,
+            'top': [_stat_to_dict(s) for s in snapshot.statistics(group_by)[:limit]]
+        }
+        if baseline is not None:
+            diff = snapshot.compare_to(baseline, group_by)
+            result['diff'] = [_diff_to_dict(s) for s in diff[:limit] if s.size_diff or s.count_diff]
+        return result
+
+    def dump_snapshot(self) -> Optional[str]:
+        """把当前快照写入临时文件并返回路径（调用方负责删除）；未开启跟踪时返回None"""
+        if not tracemalloc.is_tracing():
+            return None
+        snapshot = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+        fd, path = tempfile.mkstemp(prefix='camlink-', suffix='.tracemalloc')
+        os.close(fd)
+        snapshot.dump(path)
+        return path
+
+
+def deep_sizeof(obj, max_objects: int = 200000) -> int:
+    """对象及其引用的容器、字符串等的总大小（字节，近似值；最多遍历 max_objects 个对象）"""
+    seen = set()
+    pending = deque([obj])
+    total = 0
+    while pending and len(seen) < max_objects:
+        item = pending.popleft()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            pending.extend(item)
+        elif hasattr(item, '__dict__') and not isinstance(item, (type, types.ModuleType)) and not callable(item):
+            pending.append(vars(item))
+        elif hasattr(item, '__slots__'):
+            pending.extend(getattr(item, slot) for slot in item.__slots__ if hasattr(item, slot))
+    return total
+
+
+def container_sizes(manager) -> Dict[str, dict]:
+    """
+    管理器中各容器属性的条目数和深度大小
+
+    在管理器的 _lock 下浅拷贝容器，计算大小时不持有锁
+    """
+    lock = getattr(manager, '_lock', None)
+    if lock is not None:
+        lock.acquire()
+    try:
+        containers = {
+            name: (len(value), list(value.items()) if isinstance(value, dict) else list(value))
+            for name, value in vars(manager).items()
+            if isinstance(value, (dict, list, set, deque)) and not name.startswith('_listeners')
+        }
+    finally:
+        if lock is not None:
+            lock.release()
+    return {name: {'entries': n, 'bytes': deep_sizeof(items)} for name, (n, items) in containers.items()}
+
+
+# 全局单例
+memory_profiler = MemoryProfiler()
@@ -0,0 +1,25 @@
+"""
+设备开通模块
+用于单台和批量生成摄像头配置并写入设备表
+"""
+from .device_provisioning import (
+    make_client_id,
+    build_config,
+    parse_device_list,
+    validate_devices,
+    provision_devices,
+    iter_ndjson,
+    iter_zip,
+    MAX_BATCH_DEVICES
+)
+
+__all__ = [
+    'make_client_id',
+    'build_config',
+    'parse_device_list',
+    'validate_devices',
+    'provision_devices',
+    'iter_ndjson',
+    'iter_zip',
+    'MAX_BATCH_DEVICES'
+]
@@ -0,0 +1,252 @@
+"""
+设备批量开通模块
+解析CSV/JSON设备清单，校验后计算所有client_id，在一个事务中批量写入设备表，
+并生成每台设备的配置（与 /api/generate_config 返回的配置相同）
+"""
+import csv
+import hashlib
+import io
+import json
+import re
+import zipfile
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.src.sqllite import upsert_devices
+from app.src.sqllite.sqllite_time import to_epoch_ms
+
+# 单次请求最多开通的设备数
+MAX_BATCH_DEVICES = 5000
+
+HARDWARE_ID_MAX_LEN = 128
+
+# 清单中可用的字段（与 generate_config 的表单字段同名）
+FIELDS = ('hardware_id', 'hotel_name', 'location', 'wifi_ssid', 'wifi_password', 'runtime', 'fw', 'last_online')
+
+# 常见的列名写法 -> 字段
+FIELD_ALIASES = {
+    'hotel': 'hotel_name',
+    'ssid': 'wifi_ssid',
+    'wifi': 'wifi_ssid',
+    'password': 'wifi_password',
+    'wifi_pwd': 'wifi_password',
+    'firmware': 'fw'
+}
+
+_INVALID_HARDWARE_ID = re.compile(r'[\s\x00-\x1f]')
+_UNSAFE_FILENAME = re.compile(r'[^A-Za-z0-9._-]')
+
+
+def make_client_id(hardware_id: str) -> str:
+    """client_id = CAM- + md5(hardware_id) 的前12位"""
+    return 'CAM-' + hashlib.md5(hardware_id.encode('utf-8')).hexdigest()[:12]
+
+
+def build_config(item: dict, client_id: str) -> dict:
+    """生成下发给摄像头的配置"""
+    return {
+        'hardware_id': item['hardware_id'],
+        'client_id': client_id,
+        'hotel_name': item.get('hotel_name'),
+        'location': item.get('location'),
+        'wifi': {
+            'ssid': item.get('wifi_ssid'),
+            'password': item.get('wifi_password')
+        }
+    }
+
+
+def _device_row(item: dict, client_id: str) -> dict:
+    """清单字段 -> 设备表字段"""
+    return {
+        'hardware_id': item['hardware_id'],
+        'client_id': client_id,
+        'hotel': item.get('hotel_name'),
+        'location': item.get('location'),
+        'wifi': item.get('wifi_ssid'),
+        'runtime': item.get('runtime'),
+        'fw': item.get('fw'),
+        'last_online': item.get('last_online')
+    }
+
+
+def parse_device_list(data: bytes, content_type: str = '') -> List[dict]:
+    """
+    解析设备清单
+
+    支持:
+    - CSV（首行为列名，至少包含 hardware_id 列）
+    - JSON 数组，或 {"devices": [...]}
+    - NDJSON（每行一个JSON对象）
+
+    Raises:
+        ValueError: 内容无法解析
+    """
+    text = data.decode('utf-8-sig').strip()
+    if not text:
+        return []
+
+    if 'csv' in content_type or not text.startswith(('[', '{')):
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames:
+            raise ValueError('CSV缺少列名')
+        return [dict(row) for row in reader]
+
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        try:
+            parsed = [json.loads(line) for line in text.splitlines() if line.strip()]
+        except json.JSONDecodeError as e:
+            raise ValueError(f'JSON格式错误: {e}')
+    if isinstance(parsed, dict):
+        parsed = parsed.get('devices', [parsed] if 'hardware_id' in parsed else None)
+    if not isinstance(parsed, list) or not all(isinstance(item, dict) for item in parsed):
+        raise ValueError('设备清单应为对象数组')
+    return parsed
+
+
+def _normalize(item: dict, defaults: dict) -> dict:
+    """统一列名、去除首尾空白，并用请求级默认值补齐空字段"""
+    out = {}
+    for key, value in item.items():
+        if key is None:
+            continue
+        key = key.strip().lower()
+        key = FIELD_ALIASES.get(key, key)
+        if key in FIELDS:
+            out[key] = value.strip() if isinstance(value, str) else value
+    for key, value in defaults.items():
+        if key in FIELDS and key != 'hardware_id' and out.get(key) in (None, '') and value not in (None, ''):
+            out[key] = value
+    return {k: v for k, v in out.items() if v not in (None, '')}
+
+
+def validate_devices(items: List[dict], defaults: Optional[dict] = None) -> Tuple[List[dict], List[dict]]:
+    """
+    校验设备清单
+
+    Args:
+        items: parse_device_list 的结果
+        defaults: 所有设备共用的默认值，如 {'hotel_name': ..., 'wifi_ssid': ...}
+
+    Returns:
+        (有效设备列表, 错误列表 [{index, hardware_id, error}, ...])
+    """
+    defaults = defaults or {}
+    valid, errors = [], []
+    seen = {}
+    for index, raw in enumerate(items):
+        item = _normalize(raw, defaults)
+        hardware_id = item.get('hardware_id')
+        error = None
+        if not hardware_id or not isinstance(hardware_id, str):
+            error = '缺少 hardware_id'
+        elif len(hardware_id) > HARDWARE_ID_MAX_LEN:
+            error = f'hardware_id 超过 {HARDWARE_ID_MAX_LEN} 个字符'
+        elif _INVALID_HARDWARE_ID.search(hardware_id):
+            error = 'hardware_id 不能包含空白或控制字符'
+        elif hardware_id in seen:
+            error = f'hardware_id 与第 {seen[hardware_id] + 1} 行重复'
+        elif 'last_online' in item:
+            try:
+                to_epoch_ms(item['last_online'])
+            except (TypeError, ValueError):
+                error = f"last_online 格式错误: {item['last_online']}"
+        if error:
+            errors.append({'index': index, 'hardware_id': hardware_id, 'error': error})
+            continue
+        seen[hardware_id] = index
+        valid.append({'index': index, **item})
+    return valid, errors
+
+
+def provision_devices(items: List[dict], overwrite: bool = False) -> dict:
+    """
+    批量开通已校验的设备（validate_devices 的有效设备列表）
+
+    Args:
+        items: 有效设备列表
+        overwrite: 已存在的设备是否用清单中的非空字段覆盖
+
+    Returns:
+        {
+            'summary': {'total', 'created', 'updated', 'exists'},
+            'devices': [{index, hardware_id, client_id, status, config}, ...]
+        }
+        status 为 created / updated / exists（未覆盖的已有设备）
+    """
+    client_ids = {item['hardware_id']: make_client_id(item['hardware_id']) for item in items}
+    statuses = upsert_devices(
+        [_device_row(item, client_ids[item['hardware_id']]) for item in items],
+        overwrite=overwrite
+    )
+    devices = []
+    summary = {'total': len(items), 'created': 0, 'updated': 0, 'exists': 0}
+    for item in items:
+        hardware_id = item['hardware_id']
+        status = statuses[hardware_id]
+        summary[status] += 1
+        devices.append({
+            'index': item['index'],
+            'hardware_id': hardware_id,
+            'client_id': client_ids[hardware_id],
+            'status': status,
+            'config': build_config(item, client_ids[hardware_id])
+        })
+    return {'summary': summary, 'devices': devices}
+
+
+def iter_ndjson(result: dict) -> Iterator[str]:
+    """逐行输出每台设备的开通结果，最后一行为 {"summary": ...}"""
+    for device in result['devices']:
+        yield json.dumps(device, ensure_ascii=False) + '\n'
+    yield json.dumps({'summary': result['summary']}, ensure_ascii=False) + '\n'
+
+
+class _ChunkWriter:
+    """zipfile 的只写输出目标，写入的数据由 iter_zip 分块取出（不可seek，zipfile会使用数据描述符）"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _config_filename(hardware_id: str, used: Dict[str, int]) -> str:
+    """hardware_id -> 压缩包内的安全文件名（清理后重名时追加序号）"""
+    name = _UNSAFE_FILENAME.sub('_', hardware_id) or 'device'
+    count = used.get(name, 0)
+    used[name] = count + 1
+    return f"configs/{name}.json" if count == 0 else f"configs/{name}_{count}.json"
+
+
+def iter_zip(result: dict) -> Iterator[bytes]:
+    """
+    以ZIP流的形式输出配置：每台设备一个 configs/<hardware_id>.json，
+    另附 summary.json（汇总和每台设备的状态）；边生成边输出，不在内存中保留整个压缩包
+    """
+    out = _ChunkWriter()
+    used: Dict[str, int] = {}
+    statuses = []
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for device in result['devices']:
+            filename = _config_filename(device['hardware_id'], used)
+            zf.writestr(filename, json.dumps(device['config'], ensure_ascii=False, indent=2))
+            statuses.append({**{k: device[k] for k in ('hardware_id', 'client_id', 'status')}, 'file': filename})
+            chunk = out.drain()
+            if chunk:
+                yield chunk
+        zf.writestr('summary.json', json.dumps(
+            {'summary': result['summary'], 'devices': statuses}, ensure_ascii=False, indent=2
+        ))
+    yield out.drain()
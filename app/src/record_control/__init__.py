@@ -9,6 +9,11 @@ from .task_tracker import (
     update_command_task_failed,
     update_command_task_description
 )
+from .task_writer import task_writer, TaskEventWriter
+from .request_cache import request_meta_cache, RequestMetaCache
+from .command_analytics import command_analytics, CommandAnalytics
+from .task_retention import task_retention, TaskRetentionManager
+from .command_trace import command_tracer, CommandTracer
 
 __all__ = [
     'command_response_manager',
@@ -16,6 +21,16 @@ __all__ = [
     'create_command_task',
     'update_command_task_success',
     'update_command_task_failed',
-    'update_command_task_description'
+    'update_command_task_description',
+    'task_writer',
+    'TaskEventWriter',
+    'request_meta_cache',
+    'RequestMetaCache',
+    'command_analytics',
+    'CommandAnalytics',
+    'task_retention',
+    'TaskRetentionManager',
+    'command_tracer',
+    'CommandTracer'
 ]
 
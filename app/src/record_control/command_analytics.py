@@ -0,0 +1,281 @@
+"""
+命令时延分析模块
+按摄像头、酒店、命令类型统计命令响应时延分位数、超时率、失败率和时间趋势
+
+统计随任务事件增量更新（在 task_writer 的写入线程中执行），查询时只读取内存中的汇总结果，
+不扫描tasks表；启动时可用 bootstrap() 从最近的任务记录恢复一次
+"""
+import bisect
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.src.logger import get_logger
+from app.src.sqllite import get_device_by_client_id, list_tasks_since
+from app.src.profiling import ProfiledLock
+from .task_writer import task_writer
+
+log = get_logger('analytics')
+
+# 时延直方图的桶上界（毫秒），最后一个桶收集更慢的响应
+LATENCY_BUCKETS_MS = (
+    50, 100, 200, 300, 500, 750, 1000, 1500, 2000, 3000,
+    5000, 7500, 10000, 15000, 20000, 30000, 60000, 120000
+)
+
+# 统计维度
+DIMENSIONS = ('camera', 'hotel', 'requesttype')
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class LatencyStats:
+    """一组命令的计数和固定分桶时延直方图"""
+
+    __slots__ = ('count', 'success', 'failed', 'timeouts', 'late', 'sum_ms', 'max_ms', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.success = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.late = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, latency_ms: float, ok: bool, late: bool = False):
+        self.count += 1
+        if ok:
+            self.success += 1
+        else:
+            self.failed += 1
+        if late:
+            self.late += 1
+        self.sum_ms += latency_ms
+        self.max_ms = max(self.max_ms, latency_ms)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """按直方图估算分位数（桶内线性插值），没有样本时返回None"""
+        if not self.count:
+            return None
+        rank = pct / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            if n and seen + n >= rank:
+                lower = LATENCY_BUCKETS_MS[i - 1] if i > 0 else 0
+                upper = LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else self.max_ms
+                return round(min(lower + (upper - lower) * (rank - seen) / n, self.max_ms), 1)
+            seen += n
+        return round(self.max_ms, 1)
+
+    def summary(self) -> dict:
+        completed = self.count + self.timeouts - self.late
+        return {
+            'count': self.count,
+            'success': self.success,
+            'failed': self.failed,
+            'timeouts': self.timeouts,
+            'late': self.late,
+            'failure_rate': round(self.failed / self.count, 4) if self.count else 0.0,
+            'timeout_rate': round(self.timeouts / completed, 4) if completed else 0.0,
+            'avg_ms': round(self.sum_ms / self.count, 1) if self.count else None,
+            'p50_ms': self.percentile(50),
+            'p90_ms': self.percentile(90),
+            'p99_ms': self.percentile(99),
+            'max_ms': round(self.max_ms, 1) if self.count else None
+        }
+
+
+class CommandAnalytics:
+    """命令时延统计管理器，线程安全"""
+
+    def __init__(self, timeout_seconds: float = 30.0, bucket_seconds: int = 300,
+                 retention_hours: int = 24, device_ttl: float = 600.0):
+        """
+        Args:
+            timeout_seconds: 超过该时间仍未响应的命令记为超时
+            bucket_seconds: 趋势统计的时间桶宽度（秒）
+            retention_hours: 趋势数据保留时长（小时）
+            device_ttl: client_id → 摄像头/酒店映射的缓存时间（秒）
+        """
+        self.timeout_seconds = timeout_seconds
+        self.bucket_seconds = bucket_seconds
+        self.retention_seconds = retention_hours * 3600
+        self.device_ttl = device_ttl
+        self._lock = ProfiledLock('command_analytics')
+        # request_id -> (下发时间戳, 维度 {'camera': ..., 'hotel': ..., 'requesttype': ...})
+        self._inflight: Dict[str, Tuple[float, dict]] = {}
+        # 已判定超时的请求，迟到的响应计入 late
+        self._timed_out: Dict[str, Tuple[float, dict]] = {}
+        # (维度, 取值) -> 累计统计；('all', '*') 为全部命令
+        self._totals: Dict[Tuple[str, str], LatencyStats] = {}
+        # (维度, 取值) -> {时间桶起点: 统计}
+        self._trends: Dict[Tuple[str, str], Dict[int, LatencyStats]] = {}
+        self._devices: Dict[str, Tuple[float, dict]] = {}
+        self._last_sweep = 0.0
+
+    # ==================== 事件处理 ====================
+
+    def _device_dims(self, client_id: str) -> dict:
+        """client_id → {'camera', 'hotel'}（带过期时间的缓存，只在写入线程中查询数据库）"""
+        cached = self._devices.get(client_id)
+        now = time.time()
+        if cached and now - cached[0] < self.device_ttl:
+            return cached[1]
+        device = None
+        try:
+            device = get_device_by_client_id(client_id)
+        except Exception:
+            log.exception('查询设备信息失败', key=f'device:{client_id}', client_id=client_id)
+        dims = {
+            'camera': (device or {}).get('hardware_id') or client_id,
+            'hotel': (device or {}).get('hotel') or '未知'
+        }
+        self._devices[client_id] = (now, dims)
+        return dims
+
+    def _keys(self, dims: dict) -> List[Tuple[str, str]]:
+        return [('all', '*')] + [(dim, dims[dim]) for dim in DIMENSIONS if dims.get(dim)]
+
+    def _record(self, dims: dict, ended_at: float, latency_ms: Optional[float], ok: bool,
+                timeout: bool = False, late: bool = False):
+        """把一次完成或超时记录到各维度的累计统计和时间桶（调用方需持有锁）"""
+        bucket = int(ended_at // self.bucket_seconds * self.bucket_seconds)
+        for key in self._keys(dims):
+            targets = (
+                self._totals.setdefault(key, LatencyStats()),
+                self._trends.setdefault(key, {}).setdefault(bucket, LatencyStats())
+            )
+            for stats in targets:
+                if timeout:
+                    stats.timeouts += 1
+                else:
+                    stats.add(latency_ms, ok, late)
+
+    def on_dispatch(self, request_id: str, client_id: str, request_type: str, dispatched_at: float):
+        """命令下发"""
+        dims = {'requesttype': request_type or 'unknown', **self._device_dims(client_id)}
+        with self._lock:
+            self._inflight[request_id] = (dispatched_at, dims)
+
+    def on_complete(self, request_id: str, ok: bool, completed_at: float):
+        """命令完成（成功或失败）；同一请求的后续响应（如上传进度查询）只统计第一次"""
+        with self._lock:
+            entry = self._inflight.pop(request_id, None)
+            late = False
+            if entry is None:
+                # 超时后才到达的响应：计入时延分布但不改变超时计数
+                entry = self._timed_out.pop(request_id, None)
+                late = True
+            if entry is not None:
+                dispatched_at, dims = entry
+                self._record(dims, completed_at, (completed_at - dispatched_at) * 1000, ok, late=late)
+
+    def on_task_events(self, events: List[tuple]):
+        """task_writer 监听器：根据落库的任务事件增量更新统计"""
+        for event, ts in events:
+            if event[0] == 'create':
+                data = event[1]
+                self.on_dispatch(data['requestid'], data['clientid'], data.get('requesttype'), ts)
+            else:
+                state = event[2].get('state')
+                if state in ('success', 'failed'):
+                    self.on_complete(event[1], state == 'success', ts)
+        self.sweep()
+
+    def sweep(self, now: float = None):
+        """把超时未响应的命令记为超时，并清理过期的趋势数据（最多每秒一次）"""
+        now = now or time.time()
+        with self._lock:
+            if now - self._last_sweep < 1.0:
+                return
+            self._last_sweep = now
+            deadline = now - self.timeout_seconds
+            expired = [rid for rid, (t0, _) in self._inflight.items() if t0 < deadline]
+            for request_id in expired:
+                dispatched_at, dims = self._inflight.pop(request_id)
+                self._record(dims, dispatched_at + self.timeout_seconds, None, False, timeout=True)
+                self._timed_out[request_id] = (dispatched_at, dims)
+            # 迟到响应只跟踪一个保留周期
+            cutoff = now - self.retention_seconds
+            for request_id in [rid for rid, (t0, _) in self._timed_out.items() if t0 < cutoff]:
+                del self._timed_out[request_id]
+            oldest = int(cutoff // self.bucket_seconds * self.bucket_seconds)
+            for buckets in self._trends.values():
+                for bucket in [b for b in buckets if b < oldest]:
+                    del buckets[bucket]
+
+    def bootstrap(self, hours: int = None) -> int:
+        """
+        从最近的任务记录恢复统计（仅在启动时调用一次）
+
+        Returns:
+            恢复的任务数
+        """
+        hours = hours or self.retention_seconds // 3600
+        tasks = list_tasks_since(time.time() - hours * 3600)
+        now = time.time()
+        with self._lock:
+            for task in tasks:
+                created = task['created_at_ms'] / 1000
+                updated = task['updated_at_ms'] / 1000
+                dims = {
+                    'requesttype': task.get('requesttype') or 'unknown',
+                    'camera': task.get('hardware_id') or task['clientid'],
+                    'hotel': task.get('hotel') or '未知'
+                }
+                if task['state'] in ('success', 'failed'):
+                    self._record(dims, updated, max(updated - created, 0) * 1000, task['state'] == 'success')
+                elif created < now - self.timeout_seconds:
+                    self._record(dims, created + self.timeout_seconds, None, False, timeout=True)
+                    self._timed_out[task['requestid']] = (created, dims)
+                else:
+                    self._inflight[task['requestid']] = (created, dims)
+        return len(tasks)
+
+    # ==================== 查询 ====================
+
+    def summary(self, group: str = 'requesttype', sort: str = 'p90_ms', limit: int = 50) -> List[dict]:
+        """
+        按维度汇总
+
+        Args:
+            group: camera / hotel / requesttype / all
+            sort: 排序字段（降序），如 p90_ms、p99_ms、failure_rate、timeout_rate、count
+            limit: 返回条数
+
+        Returns:
+            [{key, count, success, failed, timeouts, late, failure_rate, timeout_rate,
+              avg_ms, p50_ms, p90_ms, p99_ms, max_ms}, ...]
+        """
+        self.sweep()
+        with self._lock:
+            rows = [{'key': value, **stats.summary()} for (dim, value), stats in self._totals.items() if dim == group]
+        rows.sort(key=lambda r: r.get(sort) if r.get(sort) is not None else -1, reverse=True)
+        return rows[:limit]
+
+    def trend(self, group: str, key: str) -> List[dict]:
+        """
+        某个维度取值的时间桶趋势，按时间升序
+
+        Returns:
+            [{bucket_start, count, failed, timeouts, failure_rate, timeout_rate, p50_ms, p90_ms, ...}, ...]
+        """
+        self.sweep()
+        with self._lock:
+            buckets = sorted(self._trends.get((group, key), {}).items())
+            return [
+                {'bucket_start': datetime.fromtimestamp(start).strftime(TIME_FORMAT), **stats.summary()}
+                for start, stats in buckets
+            ]
+
+    def inflight_count(self) -> int:
+        with self._lock:
+            return len(self._inflight)
+
+
+# 全局单例，任务事件落库后自动更新
+command_analytics = CommandAnalytics()
+task_writer.add_listener(command_analytics.on_task_events)
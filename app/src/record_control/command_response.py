@@ -2,16 +2,16 @@
 命令响应管理模块
 用于存储和管理摄像头命令的响应结果
 """
-import threading
 from datetime import datetime
 from typing import Dict, Optional
+from app.src.profiling import ProfiledLock
 
 class CommandResponseManager:
     """命令响应管理器，线程安全"""
     
     def __init__(self):
         self._responses: Dict[str, dict] = {}
-        self._lock = threading.Lock()
+        self._lock = ProfiledLock('command_response_manager')
     
     def store_response(self, request_id: str, camera_id: str, response_data: dict):
         """
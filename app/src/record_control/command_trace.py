@@ -0,0 +1,233 @@
+"""
+命令链路追踪模块
+以 request_id 为键记录一条命令从HTTP请求到客户端取回结果的各阶段耗时：
+
+- http: 路由收到请求 -> 命令已发布（routes）
+- publish: 调用 publish -> 收到 broker 的 PUBACK（MQTTPublisher.on_publish）
+- response: 收到设备响应 -> 响应处理完毕（status_listener）
+- task_create / task_update: 任务事件入队 -> 落库（task_writer 监听器）
+- client_retrieval: 客户端首次取回命令结果（routes；之后的轮询只累计次数和最后一次时间）
+
+据此把命令时延拆分到我们的代码、broker 和设备；可通过 /api/trace/<request_id> 查询，
+设置环境变量 COMMAND_TRACE_FILE 时，每条命令完成（任务状态落库）后以JSON行追加写入该文件
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.src.logger import get_logger
+from .task_writer import task_writer
+
+log = get_logger('trace')
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _format_time(ts: float) -> str:
+    return datetime.fromtimestamp(ts).strftime(TIME_FORMAT) + f'.{int(ts * 1000) % 1000:03d}'
+
+
+class CommandTracer:
+    """命令链路追踪，线程安全；只保留最近 max_traces 条命令"""
+
+    def __init__(self, max_traces: int = 5000, export_path: Optional[str] = None):
+        """
+        Args:
+            max_traces: 内存中保留的命令数
+            export_path: 完成的追踪追加写入的文件，默认读取 COMMAND_TRACE_FILE（未设置则不写文件）
+        """
+        self.max_traces = max_traces
+        self.export_path = export_path or os.getenv('COMMAND_TRACE_FILE')
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        # request_id -> {'camera_id', 'spans': [...], 'exported': bool}
+        self._traces: 'OrderedDict[str, dict]' = OrderedDict()
+        # 等待 PUBACK 的消息：mid -> (request_id, 发布时间)
+        self._pending_publish: Dict[int, tuple] = {}
+        # publish 返回前就到达的 PUBACK：mid -> 到达时间
+        self._early_acks: Dict[int, float] = {}
+
+    # ==================== 记录 ====================
+
+    def _trace_locked(self, request_id: str) -> dict:
+        trace = self._traces.get(request_id)
+        if trace is None:
+            trace = self._traces[request_id] = {'camera_id': None, 'spans': [], 'exported': False}
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+        return trace
+
+    def span(self, request_id: str, name: str, start: float, end: Optional[float] = None, **attrs):
+        """记录一个阶段（end 为空时表示瞬时事件）"""
+        if not request_id:
+            return
+        end = start if end is None else end
+        with self._lock:
+            trace = self._trace_locked(request_id)
+            if attrs.get('camera_id'):
+                trace['camera_id'] = attrs['camera_id']
+            trace['spans'].append({'name': name, 'start': start, 'end': end, **attrs})
+
+    def retrieved(self, request_id: str, at: float, **attrs):
+        """客户端取回命令结果：首次记录 client_retrieval，之后的轮询只更新次数和最后一次时间"""
+        if not request_id:
+            return
+        with self._lock:
+            trace = self._trace_locked(request_id)
+            retrieval = next((s for s in trace['spans'] if s['name'] == 'client_retrieval'), None)
+            if retrieval is None:
+                trace['spans'].append({'name': 'client_retrieval', 'start': at, 'end': at, 'count': 1, 'last': at, **attrs})
+            else:
+                retrieval['count'] += 1
+                retrieval['last'] = max(retrieval['last'], at)
+
+    def publish_started(self, request_id: str, mid: int, started: float, **attrs):
+        """命令已交给MQTT客户端，等待 PUBACK 结束 publish 阶段"""
+        with self._lock:
+            acked_at = self._early_acks.pop(mid, None)
+            if acked_at is None:
+                self._pending_publish[mid] = (request_id, started, attrs)
+                if len(self._pending_publish) > self.max_traces:
+                    # 长时间收不到 PUBACK（如连接断开）的消息不再等待
+                    self._pending_publish.pop(next(iter(self._pending_publish)))
+                return
+        self.span(request_id, 'publish', started, acked_at, mid=mid, **attrs)
+
+    def on_puback(self, mid: int):
+        """MQTT on_publish 回调：QoS 1 消息收到 PUBACK"""
+        now = time.time()
+        with self._lock:
+            pending = self._pending_publish.pop(mid, None)
+            if pending is None:
+                self._early_acks[mid] = now
+                if len(self._early_acks) > 1000:
+                    self._early_acks.pop(next(iter(self._early_acks)))
+                return
+        request_id, started, attrs = pending
+        self.span(request_id, 'publish', started, now, mid=mid, **attrs)
+
+    def on_task_events(self, events: List[tuple]):
+        """task_writer 监听器：任务事件从入队到落库"""
+        committed_at = time.time()
+        completed = []
+        for event, queued_at in events:
+            if event[0] == 'create':
+                request_id = event[1]['requestid']
+                self.span(request_id, 'task_create', queued_at, committed_at)
+            else:
+                request_id, patch = event[1], event[2]
+                state = patch.get('state')
+                with self._lock:
+                    traced = request_id in self._traces
+                if traced:
+                    self.span(request_id, 'task_update', queued_at, committed_at, state=state)
+                    if state in ('success', 'failed'):
+                        completed.append(request_id)
+        if self.export_path:
+            for request_id in completed:
+                self._export(request_id)
+
+    # ==================== 查询与导出 ====================
+
+    def get_trace(self, request_id: str) -> Optional[dict]:
+        """
+        Returns:
+            {
+                'request_id', 'camera_id', 'started_at',
+                'spans': [{name, start, offset_ms, duration_ms, ...}, ...],   # 按开始时间排序
+                'breakdown': {阶段: 毫秒}
+            }
+            未记录过该命令时返回None
+        """
+        with self._lock:
+            trace = self._traces.get(request_id)
+            if trace is None:
+                return None
+            raw = list(trace['spans'])
+            camera_id = trace['camera_id']
+        spans = sorted((dict(s) for s in raw), key=lambda s: (s['start'], s['end']))
+        origin = spans[0]['start']
+        for s in spans:
+            s['offset_ms'] = round((s['start'] - origin) * 1000, 1)
+            s['duration_ms'] = round((s['end'] - s['start']) * 1000, 1)
+            if 'last' in s:
+                s['last_offset_ms'] = round((s.pop('last') - origin) * 1000, 1)
+            s['start'] = _format_time(s.pop('start'))
+            s.pop('end')
+        return {
+            'request_id': request_id,
+            'camera_id': camera_id,
+            'started_at': _format_time(origin),
+            'spans': spans,
+            'breakdown': self._breakdown(raw)
+        }
+
+    @staticmethod
+    def _breakdown(spans: List[dict]) -> Dict[str, float]:
+        """
+        时延归属（毫秒）:
+        - server_dispatch: HTTP处理（含发布调用）
+        - broker_ack: 发布 -> PUBACK
+        - device_round_trip: PUBACK -> 收到设备响应（broker投递 + 设备处理 + 回传）
+        - response_handling: 设备响应的处理
+        - db_commit: 任务最终状态从入队到落库
+        - client_wait: 落库 -> 客户端首次取回结果
+        - total: 第一个阶段开始 -> 最后一个阶段结束
+        """
+        first: Dict[str, dict] = {}
+        for s in sorted(spans, key=lambda s: s['start']):
+            first.setdefault(s['name'], s)
+        final_update = next((s for s in sorted(spans, key=lambda s: s['start'])
+                             if s['name'] == 'task_update' and s.get('state') in ('success', 'failed')), None)
+
+        def ms(start, end):
+            return round((end - start) * 1000, 1)
+
+        result = {}
+        if 'http' in first:
+            result['server_dispatch'] = ms(first['http']['start'], first['http']['end'])
+        if 'publish' in first:
+            result['broker_ack'] = ms(first['publish']['start'], first['publish']['end'])
+        if 'response' in first:
+            if 'publish' in first:
+                result['device_round_trip'] = ms(first['publish']['end'], first['response']['start'])
+            result['response_handling'] = ms(first['response']['start'], first['response']['end'])
+        if final_update:
+            result['db_commit'] = ms(final_update['start'], final_update['end'])
+        if 'client_retrieval' in first:
+            ready = final_update or first.get('response')
+            if ready:
+                result['client_wait'] = ms(ready['end'], first['client_retrieval']['start'])
+        if spans:
+            result['total'] = ms(min(s['start'] for s in spans), max(s['end'] for s in spans))
+        return result
+
+    def _export(self, request_id: str):
+        with self._lock:
+            trace = self._traces.get(request_id)
+            if trace is None or trace['exported']:
+                return
+            trace['exported'] = True
+        data = self.get_trace(request_id)
+        try:
+            with self._export_lock, open(self.export_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(data, ensure_ascii=False) + '\n')
+        except OSError as e:
+            log.error('写入命令追踪文件失败', key='export', path=self.export_path, error=str(e))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'traces': len(self._traces),
+                'pending_puback': len(self._pending_publish),
+                'export_path': self.export_path
+            }
+
+
+# 全局单例，任务事件落库时自动记录
+command_tracer = CommandTracer()
+task_writer.add_listener(command_tracer.on_task_events)
@@ -0,0 +1,89 @@
+"""
+请求元数据缓存模块
+在内存中记录 request_id 对应的命令类型等信息，命令响应到达时不必再查询tasks表
+"""
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from app.src.profiling import ProfiledLock
+from .task_writer import task_writer
+
+
+class RequestMetaCache:
+    """有界的 request_id → 请求元数据缓存（LRU淘汰），线程安全"""
+
+    def __init__(self, max_size: int = 10000):
+        """
+        Args:
+            max_size: 最多缓存的请求数，超出后淘汰最久未使用的
+        """
+        self.max_size = max_size
+        self._items: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = ProfiledLock('request_meta_cache')
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, request_id: str, client_id: str, request_type: str, camera_id: str = None):
+        """
+        记录下发的命令（由 MQTTPublisher 在发布前调用，确保响应到达时已可查到）
+
+        Args:
+            request_id: 请求ID
+            client_id: 摄像头client_id
+            request_type: 命令类型 (start_record/stop_record/...)
+            camera_id: 摄像头hardware_id（可选）
+        """
+        meta = {
+            'request_id': request_id,
+            'client_id': client_id,
+            'camera_id': camera_id,
+            'request_type': request_type,
+            'created_at': datetime.now().isoformat()
+        }
+        with self._lock:
+            self._items[request_id] = meta
+            self._items.move_to_end(request_id)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def get(self, request_id: str) -> Optional[dict]:
+        """
+        获取请求元数据，缓存未命中时回退到tasks表（例如服务重启前下发的命令）
+
+        Returns:
+            元数据字典，数据库中也不存在时返回None
+        """
+        with self._lock:
+            meta = self._items.get(request_id)
+            if meta is not None:
+                self._items.move_to_end(request_id)
+                self.hits += 1
+                return meta
+            self.misses += 1
+
+        task = task_writer.get_task(request_id)
+        if not task:
+            return None
+        self.put(request_id, task.get('clientid'), task.get('requesttype'))
+        with self._lock:
+            return self._items.get(request_id)
+
+    def get_request_type(self, request_id: str) -> Optional[str]:
+        """获取请求的命令类型"""
+        meta = self.get(request_id)
+        return meta.get('request_type') if meta else None
+
+    def stats(self) -> dict:
+        """缓存命中统计"""
+        with self._lock:
+            return {
+                'size': len(self._items),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+# 全局单例
+request_meta_cache = RequestMetaCache()
@@ -0,0 +1,143 @@
+"""
+任务记录保留与归档模块
+tasks表只保留最近的任务，超过保留期的记录按月批量移入归档表（tasks_archive_YYYYMM），
+并在 task_rollup 中保留按月/设备/命令类型/状态的汇总；
+数据库开启 auto_vacuum=INCREMENTAL 后（见 compact），每次归档后把空闲页归还给系统
+
+配置（环境变量）:
+- TASK_RETENTION_DAYS: tasks表保留天数（默认90）
+- TASK_ARCHIVE_DB: 归档数据库文件路径；未设置时归档表放在主数据库中
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from app.src.logger import get_logger
+from app.src.sqllite import archive_tasks, compact_database, enable_incremental_vacuum
+from .task_writer import task_writer
+
+log = get_logger('task_retention')
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class TaskRetentionManager:
+    """任务归档管理器，线程安全；同一时间只运行一次归档"""
+
+    def __init__(self, retention_days: int = None, archive_db_path: Optional[str] = None,
+                 batch_size: int = 5000):
+        """
+        Args:
+            retention_days: tasks表保留天数，默认读取 TASK_RETENTION_DAYS（90）
+            archive_db_path: 归档数据库文件，默认读取 TASK_ARCHIVE_DB（未设置则使用主数据库）
+            batch_size: 每个事务移动的记录数
+        """
+        self.retention_days = retention_days or int(os.getenv('TASK_RETENTION_DAYS', '90'))
+        archive_db_path = archive_db_path or os.getenv('TASK_ARCHIVE_DB')
+        self.archive_db_path = Path(archive_db_path) if archive_db_path else None
+        self.batch_size = batch_size
+        self._run_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_run: Optional[dict] = None
+
+    def run_once(self, retention_days: int = None, max_batches: int = None) -> dict:
+        """
+        执行一次归档：先等待 task_writer 落库，再移动超过保留期的记录并回收空间
+
+        Args:
+            retention_days: 本次使用的保留天数（默认使用配置值）
+            max_batches: 最多执行的批次数（None 表示全部移完）
+
+        Returns:
+            {cutoff, moved, batches, months, compact, duration_ms}，已有归档在运行时返回 {busy: True}
+        """
+        if not self._run_lock.acquire(blocking=False):
+            return {'busy': True}
+        try:
+            started = time.time()
+            task_writer.flush()
+            days = retention_days or self.retention_days
+            cutoff = (datetime.now() - timedelta(days=days)).strftime(TIME_FORMAT)
+            result = {'cutoff': cutoff, 'retention_days': days}
+            result.update(archive_tasks(cutoff, batch_size=self.batch_size, max_batches=max_batches,
+                                        archive_db_path=self.archive_db_path))
+            if result['moved']:
+                task_writer.touch()
+            result['compact'] = compact_database() if result['moved'] else None
+            result['duration_ms'] = round((time.time() - started) * 1000, 1)
+            result['finished_at'] = datetime.now().strftime(TIME_FORMAT)
+            with self._lock:
+                self._last_run = result
+            if result['moved']:
+                log.info('已归档任务记录', moved=result['moved'], cutoff=cutoff, batches=result['batches'])
+            return result
+        finally:
+            self._run_lock.release()
+
+    def compact(self, enable_incremental: bool = False) -> dict:
+        """
+        回收主数据库的空闲页（维护入口）
+
+        默认创建的数据库没有开启 auto_vacuum，归档删除的页只会被复用而不会归还给系统；
+        enable_incremental 为True时先切换为 auto_vacuum=INCREMENTAL（执行一次完整 VACUUM，
+        会重写数据库文件并阻塞写入，写入期间 task_writer 会重试），之后每次归档都会回收空间
+
+        Returns:
+            {enable?, compact}，已有归档在运行时返回 {busy: True}
+        """
+        if not self._run_lock.acquire(blocking=False):
+            return {'busy': True}
+        try:
+            result = {}
+            if enable_incremental:
+                task_writer.flush()
+                result['enable'] = enable_incremental_vacuum()
+            result['compact'] = compact_database()
+            return result
+        finally:
+            self._run_lock.release()
+
+    def start(self, interval_hours: float = 24, initial_delay: float = 60):
+        """启动后台定时归档线程（重复调用无副作用）"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._loop, args=(interval_hours * 3600, initial_delay),
+                name='task-retention', daemon=True
+            )
+            self._thread.start()
+        log.info('任务归档已启动', retention_days=self.retention_days, interval_hours=interval_hours)
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self, interval: float, initial_delay: float):
+        if self._stop.wait(initial_delay):
+            return
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                log.exception('任务归档失败', key='run')
+            if self._stop.wait(interval):
+                return
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                'retention_days': self.retention_days,
+                'archive_db': str(self.archive_db_path) if self.archive_db_path else None,
+                'running': self._run_lock.locked(),
+                'scheduled': self._thread is not None,
+                'last_run': self._last_run
+            }
+
+
+# 全局单例
+task_retention = TaskRetentionManager()
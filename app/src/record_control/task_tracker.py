@@ -1,9 +1,14 @@
 """
 任务跟踪器模块
 负责在MQTT命令生命周期中记录和更新task表
+
+写入通过 task_writer 异步批量落库，调用方（HTTP处理、MQTT回调）只需入队
 """
-from datetime import datetime
-from app.src.sqllite import create_task, update_task
+from app.src.sqllite.sqllite_time import now_ms
+from app.src.logger import get_logger
+from .task_writer import task_writer
+
+log = get_logger('task')
 
 
 def create_command_task(client_id: str, request_id: str, request_type: str, description: str = None) -> int:
@@ -17,7 +22,7 @@ def create_command_task(client_id: str, request_id: str, request_type: str, desc
         description: 操作描述
         
     Returns:
-        task_id: 创建的任务ID
+        事件序号（task_writer.flush() 后可在数据库中查到），失败返回-1
     """
     # 操作类型的中文描述映射
     type_desc_map = {
@@ -37,16 +42,15 @@ def create_command_task(client_id: str, request_id: str, request_type: str, desc
         'requestid': request_id,
         'requesttype': request_type,
         'state': 'calling',  # 初始状态：调用中
-        'description': description,
-        'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        'description': description
     }
     
     try:
-        task_id = create_task(task_data)
-        print(f"✅ 创建任务记录: task_id={task_id}, request_id={request_id}, type={request_type}")
-        return task_id
+        seq = task_writer.create(task_data)
+        log.info('创建任务记录', seq=seq, request_id=request_id, type=request_type)
+        return seq
     except Exception as e:
-        print(f"❌ 创建任务记录失败: {e}")
+        log.exception('创建任务记录失败', request_id=request_id, type=request_type)
         return -1
 
 
@@ -60,7 +64,7 @@ def update_command_task_success(request_id: str, description: str = None, result
         result_data: 响应数据（可选，用于生成更详细的描述）
         
     Returns:
-        是否更新成功
+        是否已提交更新（找不到任务记录时由写入线程打印警告）
     """
     if description is None:
         description = "命令执行成功"
@@ -77,19 +81,15 @@ def update_command_task_success(request_id: str, description: str = None, result
     patch = {
         'state': 'success',
         'description': description,
-        'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        'updated_at_ms': now_ms()
     }
     
     try:
-        rows_updated = update_task(request_id, patch)
-        if rows_updated > 0:
-            print(f"✅ 更新任务状态为成功: request_id={request_id}")
-            return True
-        else:
-            print(f"⚠️  未找到对应的任务记录: request_id={request_id}")
-            return False
+        task_writer.update(request_id, patch)
+        log.info('任务执行成功', request_id=request_id)
+        return True
     except Exception as e:
-        print(f"❌ 更新任务状态失败: {e}")
+        log.exception('更新任务状态失败', request_id=request_id)
         return False
 
 
@@ -103,7 +103,7 @@ def update_command_task_failed(request_id: str, error_msg: str = None, error_cod
         error_code: 错误代码
         
     Returns:
-        是否更新成功
+        是否已提交更新（找不到任务记录时由写入线程打印警告）
     """
     if error_msg is None:
         error_msg = "命令执行失败"
@@ -116,19 +116,15 @@ def update_command_task_failed(request_id: str, error_msg: str = None, error_cod
     patch = {
         'state': 'failed',
         'description': description,
-        'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        'updated_at_ms': now_ms()
     }
     
     try:
-        rows_updated = update_task(request_id, patch)
-        if rows_updated > 0:
-            print(f"✅ 更新任务状态为失败: request_id={request_id}, error={error_msg}")
-            return True
-        else:
-            print(f"⚠️  未找到对应的任务记录: request_id={request_id}")
-            return False
+        task_writer.update(request_id, patch)
+        log.info('任务执行失败', request_id=request_id, error_code=error_code, error=error_msg)
+        return True
     except Exception as e:
-        print(f"❌ 更新任务状态失败: {e}")
+        log.exception('更新任务状态失败', request_id=request_id)
         return False
 
 
@@ -141,17 +137,17 @@ def update_command_task_description(request_id: str, description: str) -> bool:
         description: 新的描述信息
         
     Returns:
-        是否更新成功
+        是否已提交更新（找不到任务记录时由写入线程打印警告）
     """
     patch = {
         'description': description,
-        'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        'updated_at_ms': now_ms()
     }
     
     try:
-        rows_updated = update_task(request_id, patch)
-        return rows_updated > 0
+        task_writer.update(request_id, patch)
+        return True
     except Exception as e:
-        print(f"❌ 更新任务描述失败: {e}")
+        log.exception('更新任务描述失败', request_id=request_id)
         return False
 
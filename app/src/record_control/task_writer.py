@@ -0,0 +1,345 @@
+"""
+任务事件写入模块
+task表的写入统一进入队列，由单个后台线程合并成批量事务写入，
+HTTP处理和MQTT回调线程只负责入队，不再等待SQLite
+
+读取时把尚未落库的事件叠加到数据库结果上，保证写入后立即可读；
+写入失败（如数据库被锁）时按退避持续重试同一批事件，事件保留在叠加层中，不会丢失或乱序；
+进程退出时自动把队列中的事件写完，退出时仍无法写入的事件记入 dead_letter
+"""
+import atexit
+import itertools
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.src.logger import get_logger
+from app.src.sqllite import apply_task_events, get_task_by_requestid, list_tasks
+from app.src.sqllite.sqllite_time import to_epoch_ms, format_ms, now_ms
+
+log = get_logger('task_writer')
+
+_STOP = object()
+
+# 写入持续失败时两次重试之间的最长等待（秒）
+MAX_RETRY_DELAY = 5.0
+
+
+class TaskEventWriter:
+    """task表批量写入器，线程安全"""
+
+    def __init__(self, max_batch: int = 500, linger: float = 0.02, max_retries: int = 3):
+        """
+        Args:
+            max_batch: 单个事务最多包含的事件数
+            linger: 收到第一个事件后最多再等待多久凑批（秒）
+            max_retries: 数据库忙时快速重试的次数，超过后按最长 MAX_RETRY_DELAY 秒的间隔持续重试
+                （关闭后不再持续重试，剩余事件记入 dead_letter）
+        """
+        self.max_batch = max_batch
+        self.linger = linger
+        self.max_retries = max_retries
+        self._queue: "queue.Queue" = queue.Queue()
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self._committed = threading.Condition(self._lock)
+        self._last_seq = 0
+        self._committed_seq = 0
+        # request_id -> {'seq': 最后一个事件序号, 'create_seq': 插入事件序号,
+        #                'create': 待插入的行或None, 'patch': 合并后的待更新字段}
+        self._pending: Dict[str, dict] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._listeners: List[Callable[[List[tuple]], None]] = []
+        self.batches = 0
+        self.events_written = 0
+        self.write_errors = 0
+        # 关闭时仍无法写入的事件 [(seq, event, 入队时间戳)]，对应的叠加层记录保留
+        self.dead_letter: List[tuple] = []
+        # 条件GET用：变化计数为最后一个事件序号加外部变化次数
+        self._touches = 0
+        self._modified_at = time.time()
+
+    # ==================== 写入 ====================
+
+    def _enqueue(self, event: tuple, request_id: str) -> int:
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name='task-writer', daemon=True)
+                self._thread.start()
+            seq = next(self._seq)
+            self._last_seq = seq
+            self._modified_at = time.time()
+            entry = self._pending.setdefault(request_id, {'seq': seq, 'create_seq': 0, 'create': None, 'patch': {}})
+            entry['seq'] = seq
+            if event[0] == 'create':
+                if entry['create'] is None:
+                    entry['create'] = dict(event[1])
+                    entry['create_seq'] = seq
+            else:
+                entry['patch'].update(event[2])
+            closed = self._closed
+        item = (seq, event, time.time())
+        if closed:
+            # 退出流程已经开始，直接同步写入
+            self._write([item])
+        else:
+            self._queue.put(item)
+        return seq
+
+    def create(self, data: dict) -> int:
+        """
+        排队插入一条任务记录
+
+        Args:
+            data: 同 create_task 的参数（clientid、requestid 必填）
+
+        Returns:
+            事件序号（可用于 flush 等待落库）
+        """
+        data = dict(data)
+        self._fill_time(data, 'created_at', now_ms())
+        self._fill_time(data, 'updated_at', data['created_at_ms'])
+        return self._enqueue(('create', data), data['requestid'])
+
+    def update(self, request_id: str, patch: dict) -> int:
+        """排队更新一条任务记录，返回事件序号"""
+        patch = dict(patch)
+        if 'updated_at' in patch or 'updated_at_ms' in patch:
+            self._fill_time(patch, 'updated_at', now_ms())
+        return self._enqueue(('update', request_id, patch), request_id)
+
+    @staticmethod
+    def _fill_time(data: dict, column: str, default_ms: int):
+        """同时填写毫秒时间戳（column_ms）和格式化文本（column），叠加层与数据库读出的记录格式一致"""
+        ms = to_epoch_ms(data.get(f'{column}_ms', data.get(column)))
+        data[f'{column}_ms'] = default_ms if ms is None else ms
+        data[column] = format_ms(data[f'{column}_ms'])
+
+    def _run(self):
+        """后台写入线程：阻塞等待第一个事件，再在 linger 时间内尽量凑满一批"""
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch: List[tuple]):
+        """在一个事务中写入一批事件，成功后才从叠加层中移除记录并通知监听器"""
+        events = [event for _, event, _ in batch]
+        attempt = 0
+        while True:
+            try:
+                summary = apply_task_events(events)
+                break
+            except Exception:
+                attempt += 1
+                with self._lock:
+                    self.write_errors += 1
+                    closed = self._closed
+                if attempt > self.max_retries:
+                    if closed:
+                        # 退出流程中不再等待，事件保留在叠加层并记入 dead_letter
+                        log.exception('批量写入任务记录失败，事件未落库', events=len(events))
+                        with self._lock:
+                            self.dead_letter.extend(batch)
+                        return
+                    log.exception('批量写入任务记录失败，稍后重试', key='write_failed',
+                                  events=len(events), attempt=attempt)
+                time.sleep(min(0.05 * 2 ** (attempt - 1), MAX_RETRY_DELAY))
+
+        for request_id in summary['duplicates']:
+            log.warning('任务记录已存在', key=f'duplicate:{request_id}', request_id=request_id)
+        for request_id in summary['missing']:
+            log.warning('未找到对应的任务记录', key=f'missing:{request_id}', request_id=request_id)
+
+        max_seq = max(seq for seq, _, _ in batch)
+        with self._lock:
+            for _, event, _ in batch:
+                request_id = event[1]['requestid'] if event[0] == 'create' else event[1]
+                entry = self._pending.get(request_id)
+                if entry is not None and entry['seq'] <= max_seq:
+                    del self._pending[request_id]
+            self.batches += 1
+            self.events_written += len(batch)
+            self._committed_seq = max(self._committed_seq, max_seq)
+            self._committed.notify_all()
+
+        for listener in self._listeners:
+            try:
+                listener([(event, ts) for _, event, ts in batch])
+            except Exception:
+                log.exception('任务事件监听器出错', key='listener')
+
+    def add_listener(self, callback: Callable[[List[tuple]], None]):
+        """
+        注册任务事件监听器，每批事件落库后在写入线程中调用
+
+        Args:
+            callback: 参数为 [(event, 入队时间戳), ...]，event 格式同 apply_task_events
+        """
+        self._listeners.append(callback)
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        等待当前已入队的事件全部落库
+
+        Returns:
+            是否在超时前完成（有事件记入 dead_letter 时返回False）
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            target = self._last_seq
+            while self._committed_seq < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._thread is None or self.dead_letter:
+                    return False
+                self._committed.wait(remaining)
+            return not self.dead_letter
+
+    def close(self, timeout: float = 10.0):
+        """停止写入线程并写完队列中剩余的事件（注册为退出钩子）"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+            if thread.is_alive():
+                log.warning('任务写入线程未在超时前退出', timeout_s=timeout, queued=self._queue.qsize())
+
+    # ==================== 读取（叠加未落库的事件） ====================
+
+    @staticmethod
+    def _overlay(row: Optional[dict], entry: dict) -> Optional[dict]:
+        if row is None:
+            if entry['create'] is None:
+                return None
+            row = {'id': None, **entry['create']}
+        else:
+            row = dict(row)
+        row.update(entry['patch'])
+        return row
+
+    def get_task(self, request_id: str) -> Optional[dict]:
+        """按 request_id 查询任务（包含尚未落库的修改）"""
+        with self._lock:
+            entry = self._pending.get(request_id)
+            entry = {'create': entry['create'], 'patch': dict(entry['patch'])} if entry else None
+        row = get_task_by_requestid(request_id)
+        return self._overlay(row, entry) if entry else row
+
+    @staticmethod
+    def _matches(row: dict, filters: dict) -> bool:
+        """在内存中按 list_tasks 的过滤条件检查一条叠加后的记录"""
+        for column in ('state', 'requesttype'):
+            if filters.get(column) and row.get(column) != filters[column]:
+                return False
+        created_at = row.get('created_at_ms') or 0
+        if filters.get('since') and created_at < to_epoch_ms(filters['since']):
+            return False
+        if filters.get('until') and created_at >= to_epoch_ms(filters['until']):
+            return False
+        return True
+
+    def list_tasks(self, clientid: Optional[str] = None, limit: int = 200, **filters) -> List[dict]:
+        """
+        查询任务列表（包含尚未落库的任务），按创建顺序倒序
+
+        Args:
+            clientid, limit, **filters: 同 sqllite.list_tasks（before_id、state、requesttype、
+                since、until、hotel、columns）
+
+        未落库的新任务只出现在第一页（没有 before_id 时）；按 hotel 过滤时不包含未落库的新任务。
+        先复制叠加层再查数据库：两者之间刚好落库的事件会在两边同时出现，按 request_id 去重。
+        已落库的任务按叠加后的 state / requesttype 过滤：待落库的修改使其满足条件时单独查出，
+        使其不再满足条件时多取的行补足一页
+        """
+        with self._lock:
+            pending = [
+                (request_id, entry['create_seq'], {'create': entry['create'], 'patch': dict(entry['patch'])})
+                for request_id, entry in self._pending.items()
+            ]
+        if not pending:
+            return list_tasks(clientid=clientid, limit=limit, **filters)
+
+        # 叠加需要完整的行，投影在最后进行
+        columns = filters.pop('columns', None)
+        # 叠加后不再满足条件的行最多 len(pending) 条，多取这些行保证过滤后仍有一整页
+        rows = list_tasks(clientid=clientid, limit=limit + len(pending), **filters)
+        overlay = {request_id: entry for request_id, _, entry in pending}
+        # 待落库的修改改变了被过滤的列：数据库中的行可能不满足条件，去掉这两个条件按 request_id 查出
+        seen = {row['requestid'] for row in rows}
+        changed = [
+            request_id for request_id, _, entry in pending
+            if request_id not in seen and any(filters.get(c) and c in entry['patch'] for c in ('state', 'requesttype'))
+        ]
+        if changed:
+            unfiltered = {k: v for k, v in filters.items() if k not in ('state', 'requesttype')}
+            rows += list_tasks(clientid=clientid, limit=len(changed), requestids=changed, **unfiltered)
+            rows.sort(key=lambda row: row['id'], reverse=True)
+        rows = [self._overlay(row, overlay[row['requestid']]) if row['requestid'] in overlay else row for row in rows]
+        rows = [row for row in rows if self._matches(row, filters)]
+        fresh = []
+        if filters.get('before_id') is None and not filters.get('hotel'):
+            seen = {row['requestid'] for row in rows}
+            for request_id, _, entry in sorted(pending, key=lambda p: p[1], reverse=True):
+                if request_id in seen or entry['create'] is None:
+                    continue
+                if clientid is not None and entry['create'].get('clientid') != clientid:
+                    continue
+                row = self._overlay(None, entry)
+                if self._matches(row, filters):
+                    fresh.append(row)
+        rows = (fresh + rows)[:limit]
+        if columns:
+            keep = {'id', *columns}
+            rows = [{k: v for k, v in row.items() if k in keep} for row in rows]
+        return rows
+
+    def touch(self):
+        """任务数据在写入器之外发生变化（如归档）时调用，使条件GET的版本失效"""
+        with self._lock:
+            self._touches += 1
+            self._modified_at = time.time()
+
+    def version_info(self) -> Tuple[int, float]:
+        """返回 (变化计数, 最后修改时间戳)，任何任务的创建或更新都会改变"""
+        with self._lock:
+            return self._last_seq + self._touches, self._modified_at
+
+    def stats(self) -> dict:
+        """队列与写入统计"""
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'pending_requests': len(self._pending),
+                'batches': self.batches,
+                'events_written': self.events_written,
+                'write_errors': self.write_errors,
+                'dead_letter': len(self.dead_letter),
+                'avg_batch': round(self.events_written / self.batches, 2) if self.batches else 0
+            }
+
+
+# 全局单例
+task_writer = TaskEventWriter()
+atexit.register(task_writer.close)
@@ -0,0 +1,283 @@
+"""
+MAC厂商索引模块
+把 mac.json 预编译成紧凑的二进制索引文件，按需通过 mmap 加载，
+支持 IEEE MA-L(24位)、MA-M(28位)、MA-S(36位) 三种前缀的最长前缀匹配
+
+索引文件格式（小端）:
+    header          <4sHHII>   magic, version, 分段数, 厂商数, 字符串区大小
+    sections        <BxxxI>[]  每个分段的前缀位数和条目数（按位数从长到短）
+    每个分段（8字节对齐）:
+        prefixes    uint32/uint64[条目数]  已排序的前缀（<=32位用uint32，否则uint64）
+        vendor_ids  uint32[条目数]         每个前缀对应的厂商编号
+    vendor_offsets  uint32[厂商数 + 1]     厂商名称在字符串区中的偏移
+    strings         utf-8                 去重后的厂商名称
+
+mac.json 中的前缀可以是:
+    "28-6F-B9"          MA-L (24位)
+    "70-B3-D5-1"        MA-M (28位)
+    "70-B3-D5-12-3"     MA-S (36位)
+    "70-B3-D5-12-30-00/36" 显式指定位数
+
+重新生成索引:
+    python -m app.src.spy_blocker.mac_index
+"""
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+MAC_JSON_PATH = Path(__file__).parent / 'mac.json'
+MAC_INDEX_PATH = Path(__file__).parent / 'mac.idx'
+
+_MAGIC = b'CLMI'
+_VERSION = 2
+_HEADER = struct.Struct('<4sHHII')
+_SECTION = struct.Struct('<BxxxI')
+
+# IEEE 注册类型
+REGISTRIES = {24: 'MA-L', 28: 'MA-M', 36: 'MA-S'}
+
+_HEX_RE = re.compile(r'[0-9A-Fa-f]+')
+_SEPARATORS = str.maketrans('', '', '-:. \t')
+
+
+def parse_mac(mac: str) -> Tuple[Optional[int], int]:
+    """
+    解析任意常见格式的MAC地址（或MAC前缀）
+
+    支持 'AA-BB-CC-DD-EE-FF'、'aa:bb:cc:dd:ee:ff'、'aabb.ccdd.eeff'、'AABBCCDDEEFF'，
+    不区分大小写；不足12位十六进制时视为前缀，低位补0
+
+    Args:
+        mac: MAC地址字符串
+
+    Returns:
+        (48位整数形式的MAC, 有效十六进制位数)，格式非法时整数为None
+    """
+    # 链式 replace 比 str.translate 删除字符快得多（热点路径）
+    digits = mac.replace('-', '').replace(':', '').replace('.', '').replace(' ', '')
+    count = len(digits)
+    if count == 12:
+        # 快速路径：bytes.fromhex 只接受合法的十六进制字符
+        try:
+            return int.from_bytes(bytes.fromhex(digits), 'big'), 12
+        except ValueError:
+            return None, 12
+    if count == 0 or count > 12 or not _HEX_RE.fullmatch(digits):
+        return None, count
+    return int(digits, 16) << (4 * (12 - count)), count
+
+
+def format_prefix(value: int, bits: int) -> str:
+    """把前缀格式化为 'XX-XX-XX'、'XX-XX-XX-X' 或 'XX-XX-XX-XX-X'"""
+    digits = f'{value:0{bits // 4}X}'
+    return '-'.join(digits[i:i + 2] for i in range(0, len(digits), 2))
+
+
+def _parse_prefix(prefix: str) -> Optional[Tuple[int, int]]:
+    """把 mac.json 中的前缀转换为 (位数, 前缀整数)，格式不正确返回None"""
+    bits = None
+    if '/' in prefix:
+        prefix, _, bits_str = prefix.partition('/')
+        try:
+            bits = int(bits_str)
+        except ValueError:
+            return None
+
+    digits = prefix.translate(_SEPARATORS)
+    if not digits or not _HEX_RE.fullmatch(digits):
+        return None
+    if bits is None:
+        bits = len(digits) * 4
+    if bits not in REGISTRIES or bits > len(digits) * 4:
+        return None
+    return bits, int(digits, 16) >> (len(digits) * 4 - bits)
+
+
+def build_index(json_path: Path = MAC_JSON_PATH, index_path: Path = MAC_INDEX_PATH) -> int:
+    """
+    从 mac.json 生成二进制索引文件
+
+    Args:
+        json_path: mac.json 路径（格式: [{"28-6F-B9": "厂商名"}, ...]）
+        index_path: 输出的索引文件路径
+
+    Returns:
+        写入的前缀条目数
+    """
+    with Path(json_path).open('r', encoding='utf-8') as f:
+        raw = json.load(f)
+
+    # 与原来的合并逻辑一致：后出现的条目覆盖先出现的
+    merged: Dict[int, Dict[int, str]] = {}
+    for item in raw:
+        for prefix, vendor in item.items():
+            parsed = _parse_prefix(prefix)
+            if parsed is not None:
+                bits, value = parsed
+                merged.setdefault(bits, {})[value] = vendor
+
+    vendor_ids: Dict[str, int] = {}
+    vendors = []
+    sections = []
+    for bits in sorted(merged, reverse=True):
+        prefixes = sorted(merged[bits])
+        ids = []
+        for prefix in prefixes:
+            vendor = merged[bits][prefix]
+            if vendor not in vendor_ids:
+                vendor_ids[vendor] = len(vendors)
+                vendors.append(vendor)
+            ids.append(vendor_ids[vendor])
+        sections.append((bits, prefixes, ids))
+
+    encoded = [v.encode('utf-8') for v in vendors]
+    offsets = [0]
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+    strings = b''.join(encoded)
+
+    index_path = Path(index_path)
+    # 临时文件名带上进程和线程号，多个worker同时重建时互不覆盖
+    tmp_path = index_path.with_suffix(f'{index_path.suffix}.{os.getpid()}.{threading.get_ident()}.tmp')
+    with tmp_path.open('wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(sections), len(vendors), len(strings)))
+        for bits, prefixes, _ in sections:
+            f.write(_SECTION.pack(bits, len(prefixes)))
+        for bits, prefixes, ids in sections:
+            f.write(b'\0' * (-f.tell() % 8))
+            f.write(struct.pack(f'<{len(prefixes)}{"I" if bits <= 32 else "Q"}', *prefixes))
+            f.write(struct.pack(f'<{len(ids)}I', *ids))
+        f.write(struct.pack(f'<{len(offsets)}I', *offsets))
+        f.write(strings)
+    # 原子替换，正在读取旧索引的进程不受影响
+    os.replace(tmp_path, index_path)
+    return sum(len(prefixes) for _, prefixes, _ in sections)
+
+
+class MacIndex:
+    """基于 mmap 的只读MAC前缀索引，按最长前缀匹配"""
+
+    def __init__(self, index_path: Path = MAC_INDEX_PATH):
+        with Path(index_path).open('rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, section_count, vendor_count, strings_size = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self._mm.close()
+            raise ValueError(f"不支持的MAC索引文件: {index_path}")
+
+        view = memoryview(self._mm)
+        pos = _HEADER.size
+        headers = []
+        for _ in range(section_count):
+            headers.append(_SECTION.unpack_from(self._mm, pos))
+            pos += _SECTION.size
+
+        # 分段按前缀位数从长到短排列: [(bits, shift, count, prefixes, vendor_ids), ...]
+        self._sections = []
+        for bits, count in headers:
+            pos += -pos % 8
+            width = 4 if bits <= 32 else 8
+            prefixes = view[pos:pos + width * count].cast('I' if width == 4 else 'Q')
+            pos += width * count
+            vendor_ids = view[pos:pos + 4 * count].cast('I')
+            pos += 4 * count
+            self._sections.append((bits, 48 - bits, count, prefixes, vendor_ids))
+
+        self._offsets = view[pos:pos + 4 * (vendor_count + 1)].cast('I')
+        pos += 4 * (vendor_count + 1)
+        self._strings = view[pos:pos + strings_size]
+        self._vendor_cache: Dict[int, str] = {}
+
+        self.count = sum(section[2] for section in self._sections)
+        self.vendor_count = vendor_count
+        self.section_counts = {REGISTRIES.get(section[0], section[0]): section[2] for section in self._sections}
+
+    def vendor(self, vendor_id: int) -> str:
+        """按编号取厂商名称（解码结果会被缓存，相同厂商共享同一个字符串）"""
+        name = self._vendor_cache.get(vendor_id)
+        if name is None:
+            start, end = self._offsets[vendor_id], self._offsets[vendor_id + 1]
+            name = self._vendor_cache[vendor_id] = str(self._strings[start:end], 'utf-8')
+        return name
+
+    def lookup(self, mac: int, max_bits: int = 48) -> Optional[Tuple[str, int, int]]:
+        """
+        最长前缀匹配：依次尝试 MA-S(36位)、MA-M(28位)、MA-L(24位)
+
+        Args:
+            mac: 48位整数形式的MAC地址（parse_mac 的返回值）
+            max_bits: MAC中有效的位数，超过该位数的前缀不参与匹配
+
+        Returns:
+            (厂商名称, 前缀位数, 前缀整数)，未找到返回None
+        """
+        for bits, shift, count, prefixes, vendor_ids in self._sections:
+            if bits > max_bits:
+                continue
+            prefix = mac >> shift
+            i = bisect_left(prefixes, prefix)
+            if i < count and prefixes[i] == prefix:
+                return self.vendor(vendor_ids[i]), bits, prefix
+        return None
+
+    def lookup_many(self, macs: List[int]) -> List[Optional[Tuple[str, int, int]]]:
+        """
+        批量最长前缀匹配（输入均为完整的48位MAC）
+
+        先对输入排序，再按分段顺序与有序前缀数组做归并式查找：
+        每次二分都从上一个命中位置开始，批量越大单次查找越便宜
+
+        Args:
+            macs: 48位整数形式的MAC列表
+
+        Returns:
+            与输入顺序一致的结果列表，元素同 lookup()
+        """
+        results: List[Optional[Tuple[str, int, int]]] = [None] * len(macs)
+        pending = sorted(range(len(macs)), key=macs.__getitem__)
+        for bits, shift, count, prefixes, vendor_ids in self._sections:
+            lo = 0
+            remaining = []
+            for i in pending:
+                prefix = macs[i] >> shift
+                lo = bisect_left(prefixes, prefix, lo)
+                if lo < count and prefixes[lo] == prefix:
+                    results[i] = (self.vendor(vendor_ids[lo]), bits, prefix)
+                else:
+                    remaining.append(i)
+            pending = remaining
+            if not pending:
+                break
+        return results
+
+
+def index_is_stale(json_path: Path = MAC_JSON_PATH, index_path: Path = MAC_INDEX_PATH) -> bool:
+    """索引文件不存在、比 mac.json 旧或格式版本不匹配时需要重新生成"""
+    if not index_path.exists():
+        return True
+    if json_path.exists() and json_path.stat().st_mtime > index_path.stat().st_mtime:
+        return True
+    with index_path.open('rb') as f:
+        header = f.read(_HEADER.size)
+    return len(header) < _HEADER.size or _HEADER.unpack(header)[:2] != (_MAGIC, _VERSION)
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    json_path = Path(sys.argv[1]) if len(sys.argv) > 1 else MAC_JSON_PATH
+    index_path = Path(sys.argv[2]) if len(sys.argv) > 2 else MAC_INDEX_PATH
+
+    start = time.perf_counter()
+    count = build_index(json_path, index_path)
+    print(f"Built {index_path} from {json_path}: {count} prefixes, "
+          f"{index_path.stat().st_size} bytes, {(time.perf_counter() - start) * 1000:.1f} ms")
@@ -1,73 +1,268 @@
+import codecs
 import json
-import re
-from pathlib import Path
-from typing import List, Dict, Any
-import sys
+from collections import OrderedDict
+from typing import List, Dict, Any, Iterable, Iterator
 
+from .mac_index import parse_mac, format_prefix, REGISTRIES
+from .vendor_db import vendor_db
 
-def _load_mac_json(json_path: Path = None) -> Dict[str, Any]:
-    """Load mac.json and normalize keys to 8-hex-digit prefix (4 bytes).
 
-    Returns a map: canonical_prefix (8 hex chars, uppercase) -> value
-    """
-    if json_path is None:
-        json_path = Path(__file__).parent / 'mac.json'
+def lookup_mac(mac: str, db=None) -> Dict[str, Any]:
+    """Lookup a single MAC (any common notation) with longest-prefix matching.
 
-    if not json_path.exists():
-        return {}
+    Accepts 'F4-E1-FC-01-02-09', 'f4:e1:fc:01:02:09', 'f4e1.fc01.0209' or
+    'F4E1FC010209'. The most specific IEEE assignment wins: MA-S (36 bit),
+    then MA-M (28 bit), then MA-L (24 bit).
 
-    try:
-        with json_path.open('r', encoding='utf-8') as f:
-            raw = json.load(f)
-            # print("raw:", raw)
-    except Exception:
-        print("Failed to load mac.json")
-        return {}
+    Args:
+        mac: the MAC string
+        db: VendorDatabase snapshot; defaults to the current vendor_db version.
+            Batch callers pass one snapshot so a hot reload mid-request cannot
+            mix results from two versions.
 
-    out = {}
-    for item in raw:
-        out.update(item) 
+    Returns:
+        { 'mac': original_mac, 'prefix': 'F4-E1-FC', 'value': vendor,
+          'registry': 'MA-L', 'suspicious': False } -- registry and suspicious
+        are omitted when nothing matched. suspicious is True when the vendor
+        is on the spy camera watchlist (spy_vendors.json).
+    """
+    if db is None:
+        db = vendor_db.get()
 
-    return out
+    value, digits = parse_mac(mac)
+    if digits < 6:
+        return {'mac': mac, 'prefix': mac, 'value': "MAC length too short"}
+    if value is None:
+        return {'mac': mac, 'prefix': mac, 'value': "Invalid MAC"}
 
+    match = db.lookup(value, digits * 4) if db is not None else None
+    if match is None:
+        return {'mac': mac, 'prefix': format_prefix(value >> 24, 24), 'value': "Unknown MAC"}
 
-# load mac.json once into memory (prefix -> value)
-MAC_PREFIX_MAP: Dict[str, Any] = _load_mac_json()
+    vendor, bits, prefix = match
+    return {'mac': mac, 'prefix': format_prefix(prefix, bits), 'value': vendor,
+            'registry': REGISTRIES[bits], 'suspicious': db.is_watched(vendor)}
 
 
 def lookup_macs_from_string(mac_list_string: str) -> List[Dict[str, Any]]:
-    """Given a comma-separated MAC string, lookup each MAC's 4-byte prefix in mac.json.
+    """Given a comma-separated MAC string, lookup each MAC's vendor in the OUI index.
+
+    The vendor database is loaded lazily on first lookup and hot-reloaded
+    when mac.json changes (see vendor_db). MACs may use any notation
+    lookup_mac accepts.
 
     Args:
-        mac_list_string: 'F4-E1-FC-01-02-09,F4-EA-B5-F1-21-C2'
+        mac_list_string: 'F4-E1-FC-01-02-09,f4:ea:b5:f1:21:c2'
 
     Returns:
-        A list of dicts: [{ 'mac': original_mac, 'prefix': 'F4E1FC01', 'value': matched_value }, ...]
-        If no match for a mac, it will be omitted from the result.
+        A list of dicts: [{ 'mac': original_mac, 'prefix': 'F4-E1-FC', 'value': matched_value,
+        'registry': 'MA-L', 'suspicious': False }, ...]
+        If no match for a mac, value is "Unknown MAC".
     """
     if not mac_list_string:
         return []
 
-    mapping = MAC_PREFIX_MAP
-    if not mapping:
+    db = vendor_db.get()
+    if db is None:
         return []
 
     parts = [p.strip() for p in mac_list_string.split(',') if p.strip()]
-    results: List[Dict[str, Any]] = []
+    return [lookup_mac(mac, db) for mac in parts]
 
-    for mac in parts:
-        if len(mac) < 8:
-            results.append({'mac': mac, 'prefix': mac, 'value': "MAC length too short"})
-            continue
-        prefix = mac[:8]
-        if prefix in mapping:
-            results.append({'mac': mac, 'prefix': prefix, 'value': mapping[prefix]})
+
+def iter_mac_tokens(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Incrementally split a request body into MAC strings.
+
+    Two input formats are accepted and detected from the first non-blank
+    character:
+      - JSON array: ["aa:bb:cc:dd:ee:ff", {"mac": "..."}, ...]
+      - newline-delimited: one MAC per line (commas also separate), where a
+        line may also be a JSON string or an NDJSON object with a "mac" key
+
+    Only the current chunk and the unfinished tail are held in memory.
+
+    Raises:
+        ValueError: the body is not valid in the detected format
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    json_decoder = json.JSONDecoder()
+    buf = ''
+    mode = None
+    it = iter(chunks)
+    eof = False
+
+    def token_from(obj):
+        if isinstance(obj, dict):
+            obj = obj.get('mac')
+        return obj.strip() if isinstance(obj, str) and obj.strip() else None
+
+    while not eof:
+        chunk = next(it, None)
+        if chunk is None:
+            eof = True
+            buf += decoder.decode(b'', final=True)
         else:
-            results.append({'mac': mac, 'prefix': prefix, 'value': "Unknown MAC"})
+            buf += decoder.decode(chunk)
+
+        if mode is None:
+            stripped = buf.lstrip()
+            if not stripped and not eof:
+                continue
+            mode = 'array' if stripped.startswith('[') else 'lines'
+            if mode == 'array':
+                buf = stripped[1:]
+
+        if mode == 'lines':
+            lines = buf.split('\n')
+            buf = '' if eof else lines.pop()
+            for line in lines:
+                line = line.strip()
+                if not line:
+                    continue
+                if line[0] in '{"':
+                    try:
+                        token = token_from(json.loads(line))
+                    except json.JSONDecodeError:
+                        raise ValueError(f"无法解析的行: {line[:80]}")
+                    if token:
+                        yield token
+                    continue
+                for part in line.split(','):
+                    part = part.strip()
+                    if part:
+                        yield part
+            continue
+
+        # JSON 数组：逐个解析元素，元素不完整时等待更多数据
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buf):
+                break
+            if buf[pos] == ']':
+                mode = 'done'
+                pos = len(buf)
+                break
+            try:
+                obj, end = json_decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise ValueError("JSON数组格式错误或不完整")
+                break
+            if end == len(buf) and not eof and not isinstance(obj, (str, dict, list)):
+                # 数字等标量可能被截断，等下一块数据
+                break
+            token = token_from(obj)
+            if token:
+                yield token
+            pos = end
+        buf = buf[pos:]
+        if mode == 'done':
+            return
+        if eof:
+            raise ValueError("JSON数组缺少结尾的 ]")
+
+
+def lookup_macs_stream(tokens: Iterable[str], batch_size: int = 4096,
+                       dedup_window: int = 262144, db=None) -> Iterator[Dict[str, Any]]:
+    """Lookup a (possibly huge) stream of MACs in batches.
+
+    Each batch is parsed, de-duplicated by normalised MAC value and resolved
+    with MacIndex.lookup_many, so repeated MACs are looked up and reported
+    only once. Memory is bounded by batch_size plus the de-duplication
+    window (the most recently seen dedup_window distinct MACs); a MAC seen
+    again after falling out of the window is reported again.
+
+    Yields:
+        Result dicts in the same shape as lookup_mac(), in input order of
+        first sighting.
+
+    The whole stream is resolved against one vendor database snapshot
+    (db, or the current version when omitted).
+    """
+    if db is None:
+        db = vendor_db.get()
+    seen = OrderedDict()
+    # (位数, 前缀) -> 结果中除 mac 以外的字段，同一厂商前缀只格式化一次
+    templates: Dict[tuple, Dict[str, Any]] = {}
+
+    def template(match, value):
+        key = match[1:] if match is not None else (0, value >> 24)
+        cached = templates.get(key)
+        if cached is None:
+            if len(templates) >= 65536:
+                templates.clear()
+            if match is None:
+                cached = {'prefix': format_prefix(value >> 24, 24), 'value': "Unknown MAC"}
+            else:
+                vendor, bits, prefix = match
+                cached = {'prefix': format_prefix(prefix, bits), 'value': vendor,
+                          'registry': REGISTRIES[bits], 'suspicious': db.is_watched(vendor)}
+            templates[key] = cached
+        return cached
+
+    def flush(batch):
+        values = [value for _, value, digits in batch if digits == 12]
+        matches = db.lookup_many(values) if db is not None else [None] * len(values)
+        resolved = iter(matches)
+        for mac, value, digits in batch:
+            if digits != 12:
+                # 不完整的MAC（仅前缀）或非法输入走单个查询路径
+                yield lookup_mac(mac, db)
+            else:
+                yield {'mac': mac, **template(next(resolved), value)}
+
+    batch = []
+    try:
+        for mac in tokens:
+            value, digits = parse_mac(mac)
+            if value is None:
+                digits = -1
+            key = value if value is not None else mac
+            if key in seen:
+                seen.move_to_end(key)
+                continue
+            seen[key] = None
+            if len(seen) > dedup_window:
+                seen.popitem(last=False)
+            batch.append((mac, value, digits))
+            if len(batch) >= batch_size:
+                yield from flush(batch)
+                batch = []
+    except ValueError:
+        # 输入在中途出错时，先返回已经读到的部分再抛出
+        yield from flush(batch)
+        raise
+    if batch:
+        yield from flush(batch)
+
+
+def classify_scan(macs: Iterable[str], db=None) -> List[Dict[str, Any]]:
+    """Resolve the MACs of one room scan into sightings for the scan history.
+
+    MACs are normalised to 'AA-BB-CC-DD-EE-FF' so different notations of the
+    same device are stored once. Partial or invalid MACs are dropped.
+
+    Returns:
+        [{ 'mac': 'AA-BB-CC-DD-EE-FF', 'vendor': ..., 'registry': ..., 'suspicious': bool }, ...]
+    """
+    if db is None:
+        db = vendor_db.get()
+    sightings = []
+    for result in lookup_macs_stream(macs, db=db):
+        value, digits = parse_mac(result['mac'])
+        if value is None or digits != 12:
+            continue
+        sightings.append({
+            'mac': format_prefix(value, 48),
+            'vendor': result['value'],
+            'registry': result.get('registry'),
+            'suspicious': result.get('suspicious', False)
+        })
+    return sightings
 
-    return results
 
-sys.argv = ["spy.py", "B8-7C-F2-AB-12-09,28-6F-B9-F1-21-C2,00-7C-F2-AB-12-09,00-7C"]
 if __name__ == '__main__':
     # simple CLI for manual testing
     import sys
@@ -79,4 +274,3 @@ if __name__ == '__main__':
 
     matches = lookup_macs_from_string(inp)
     print(json.dumps(matches, ensure_ascii=False, indent=2))
-
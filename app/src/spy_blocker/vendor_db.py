@@ -0,0 +1,208 @@
+"""
+厂商数据库模块
+把MAC索引和偷拍设备厂商关注名单打包成一个不可变快照，支持后台热更新
+
+- 首次查询时加载；源文件（mac.json / spy_vendors.json）变化时由后台线程自动重载，
+  也可以通过管理接口手动触发
+- 重载时先在旁边完整构建新快照，再一次性替换引用：读者拿到的要么是旧版本，
+  要么是新版本，不会看到构建到一半的数据
+"""
+import json
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from app.src.logger import get_logger
+from .mac_index import MacIndex, build_index, index_is_stale, MAC_JSON_PATH, MAC_INDEX_PATH
+
+log = get_logger('vendor_db')
+
+
+WATCHLIST_PATH = Path(__file__).parent / 'spy_vendors.json'
+
+
+def _load_watchlist(path: Path) -> Tuple[str, ...]:
+    """
+    加载偷拍设备厂商关注名单
+
+    文件格式: {"vendors": ["Espressif", "Hikvision", ...]}，按厂商名称子串匹配（不区分大小写）
+    """
+    if not path.exists():
+        return ()
+    with path.open('r', encoding='utf-8') as f:
+        raw = json.load(f)
+    vendors = raw.get('vendors', []) if isinstance(raw, dict) else raw
+    return tuple(sorted({v.strip().lower() for v in vendors if isinstance(v, str) and v.strip()}))
+
+
+def _mtime(path: Path) -> Optional[float]:
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+
+class VendorDatabase:
+    """厂商数据库快照（创建后不再修改）"""
+
+    def __init__(self, index: MacIndex, watchlist: Tuple[str, ...] = (), version: int = 0,
+                 load_ms: float = 0.0, source_mtimes: Dict[str, Optional[float]] = None):
+        self.index = index
+        self.watchlist = watchlist
+        self.version = version
+        self.load_ms = load_ms
+        self.loaded_at = datetime.now().isoformat()
+        self.source_mtimes = source_mtimes or {}
+        self._watched: Dict[str, bool] = {}
+
+    def lookup(self, mac: int, max_bits: int = 48):
+        return self.index.lookup(mac, max_bits)
+
+    def lookup_many(self, macs):
+        return self.index.lookup_many(macs)
+
+    def is_watched(self, vendor: str) -> bool:
+        """厂商是否在偷拍设备关注名单中（结果按厂商缓存，数量不超过厂商总数）"""
+        watched = self._watched.get(vendor)
+        if watched is None:
+            name = vendor.lower()
+            watched = self._watched[vendor] = any(keyword in name for keyword in self.watchlist)
+        return watched
+
+    def stats(self) -> dict:
+        """加载耗时和条目统计"""
+        return {
+            'version': self.version,
+            'loaded_at': self.loaded_at,
+            'load_ms': round(self.load_ms, 2),
+            'entries': self.index.count,
+            'entries_by_registry': self.index.section_counts,
+            'vendors': self.index.vendor_count,
+            'watchlist_entries': len(self.watchlist)
+        }
+
+
+class VendorDatabaseManager:
+    """厂商数据库管理器，负责懒加载、热更新和原子替换"""
+
+    def __init__(self, json_path: Path = MAC_JSON_PATH, index_path: Path = MAC_INDEX_PATH,
+                 watchlist_path: Path = WATCHLIST_PATH):
+        self.json_path = Path(json_path)
+        self.index_path = Path(index_path)
+        self.watchlist_path = Path(watchlist_path)
+        self._db: Optional[VendorDatabase] = None
+        self._version = 0
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self.last_error: Optional[str] = None
+        self._failed_mtimes = None
+
+    def get(self) -> Optional[VendorDatabase]:
+        """
+        获取当前快照（首次调用时加载）
+
+        Returns:
+            VendorDatabase，mac.json 和索引文件都不存在时返回None
+        """
+        db = self._db
+        if db is None:
+            with self._reload_lock:
+                if self._db is None:
+                    self._db = self._load()
+                db = self._db
+        return db
+
+    def _source_mtimes(self) -> Dict[str, Optional[float]]:
+        return {
+            'mac_json': _mtime(self.json_path),
+            'watchlist': _mtime(self.watchlist_path)
+        }
+
+    def _load(self) -> Optional[VendorDatabase]:
+        """完整构建一个新快照（调用方需持有 _reload_lock）"""
+        start = time.perf_counter()
+        mtimes = self._source_mtimes()
+        if index_is_stale(self.json_path, self.index_path):
+            if mtimes['mac_json'] is None:
+                return None
+            count = build_index(self.json_path, self.index_path)
+            log.info('已生成MAC索引', path=str(self.index_path), count=count)
+        index = MacIndex(self.index_path)
+        watchlist = _load_watchlist(self.watchlist_path)
+        self._version += 1
+        db = VendorDatabase(index, watchlist, self._version,
+                            (time.perf_counter() - start) * 1000, mtimes)
+        log.info('已加载厂商数据库', version=db.version, prefixes=index.count,
+                 watchlist=len(watchlist), load_ms=round(db.load_ms, 1))
+        return db
+
+    def reload(self, force: bool = False) -> dict:
+        """
+        重新加载厂商数据库，新快照构建完成后原子替换
+
+        Args:
+            force: 即使源文件未变化也重新生成索引
+
+        Returns:
+            {'reloaded': bool, 'stats': {...}}，加载失败时保留旧版本并返回 error
+        """
+        with self._reload_lock:
+            current = self._db
+            mtimes = self._source_mtimes()
+            if not force and current is not None and current.source_mtimes == mtimes:
+                return {'reloaded': False, 'stats': current.stats()}
+            try:
+                if force and self.index_path.exists():
+                    # 重新生成到新文件后原子替换，旧快照的 mmap 仍指向旧文件，不受影响
+                    build_index(self.json_path, self.index_path)
+                db = self._load()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                self._failed_mtimes = mtimes
+                log.exception('厂商数据库重载失败，继续使用旧版本', key='reload',
+                              version=current.version if current else None)
+                return {'reloaded': False, 'error': self.last_error,
+                        'stats': current.stats() if current else None}
+            self.last_error = None
+            if db is not None:
+                self._db = db
+            return {'reloaded': db is not None, 'stats': db.stats() if db else None}
+
+    def status(self) -> dict:
+        """当前版本信息（不会触发加载）"""
+        db = self._db
+        return {
+            'loaded': db is not None,
+            'stats': db.stats() if db else None,
+            'watching': self._watcher is not None,
+            'last_error': self.last_error
+        }
+
+    def start_watcher(self, interval: float = 5.0):
+        """
+        启动后台线程，源文件变化时自动重载（只在已经加载过之后才会重载）
+
+        Args:
+            interval: 检查源文件修改时间的间隔（秒）
+        """
+        if self._watcher is not None:
+            return
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                db = self._db
+                mtimes = self._source_mtimes()
+                # 同一份损坏的源文件只尝试一次，等文件再次修改后再重载
+                if db is not None and mtimes != db.source_mtimes and mtimes != self._failed_mtimes:
+                    log.info('检测到厂商数据源文件变化，后台重载', version=db.version)
+                    self.reload()
+
+        self._watcher = threading.Thread(target=watch, daemon=True)
+        self._watcher.start()
+
+
+# 全局单例
+vendor_db = VendorDatabaseManager()
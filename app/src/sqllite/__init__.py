@@ -5,12 +5,15 @@ SQLite 数据库模块
 from .sqllite_device import (
     init_db,
     insert_device,
+    upsert_devices,
     get_device,
     get_device_by_client_id,
     get_client_id_by_hardware_id,
     list_devices,
+    list_stale_devices,
     update_device,
-    delete_device
+    delete_device,
+    add_device_listener
 )
 
 from .sqllite_task import (
@@ -18,27 +21,66 @@ from .sqllite_task import (
     create_task,
     get_task_by_requestid,
     list_tasks,
+    list_tasks_since,
     update_task,
-    delete_task
+    delete_task,
+    apply_task_events
+)
+
+from .sqllite_scan import (
+    init_scan_tables,
+    record_scan,
+    top_suspicious_rooms,
+    list_room_sightings
+)
+
+from .sqllite_archive import (
+    init_archive_tables,
+    archive_tasks,
+    compact_database,
+    enable_incremental_vacuum,
+    list_archive_months,
+    list_archived_tasks,
+    get_task_rollup
 )
 
 __all__ = [
     # Device functions
     'init_db',
     'insert_device',
+    'upsert_devices',
     'get_device',
     'get_device_by_client_id',
     'get_client_id_by_hardware_id',
     'list_devices',
+    'list_stale_devices',
     'update_device',
     'delete_device',
+    'add_device_listener',
     
     # Task functions
     'init_task_table',
     'create_task',
     'get_task_by_requestid',
     'list_tasks',
+    'list_tasks_since',
     'update_task',
-    'delete_task'
+    'delete_task',
+    'apply_task_events',
+
+    # Scan history functions
+    'init_scan_tables',
+    'record_scan',
+    'top_suspicious_rooms',
+    'list_room_sightings',
+
+    # Task archive functions
+    'init_archive_tables',
+    'archive_tasks',
+    'compact_database',
+    'enable_incremental_vacuum',
+    'list_archive_months',
+    'list_archived_tasks',
+    'get_task_rollup'
 ]
 
@@ -0,0 +1,278 @@
+import re
+import sqlite3
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+from pathlib import Path
+
+from .sqllite_path import DB_PATH
+from .sqllite_task import task_row
+from .sqllite_time import to_epoch_ms, format_ms, sql_text_to_ms
+
+
+ARCHIVE_PREFIX = 'tasks_archive_'
+_MONTH_RE = re.compile(r'^\d{6}$')
+
+
+def get_connection(db_path: Path = DB_PATH) -> sqlite3.Connection:
+	"""Return a sqlite3 connection with sensible defaults."""
+	conn = sqlite3.connect(str(db_path), timeout=30)
+	conn.row_factory = sqlite3.Row
+	return conn
+
+
+def _connect(db_path: Path, archive_db_path: Optional[Path]) -> sqlite3.Connection:
+	"""Open the main database, attaching the archive file as `archive` when one is configured.
+
+	Archive tables live in `archive.` (separate file) or `main.` (same file).
+	"""
+	conn = get_connection(db_path)
+	if archive_db_path is not None:
+		Path(archive_db_path).parent.mkdir(parents=True, exist_ok=True)
+		conn.execute("ATTACH DATABASE ? AS archive", (str(archive_db_path),))
+	return conn
+
+
+def _schema(archive_db_path: Optional[Path]) -> str:
+	return 'archive' if archive_db_path is not None else 'main'
+
+
+def init_archive_tables(db_path: Path = DB_PATH) -> None:
+	"""Create the rollup table kept in the main database.
+
+	`task_rollup` summarises archived rows per month, device, request type and
+	final state so dashboards never have to open the archives.
+	"""
+	schema = """
+	CREATE TABLE IF NOT EXISTS task_rollup (
+		month TEXT NOT NULL,
+		clientid TEXT NOT NULL,
+		requesttype TEXT NOT NULL,
+		state TEXT NOT NULL,
+		count INTEGER DEFAULT 0,
+		first_created_ms INTEGER,
+		last_created_ms INTEGER,
+		PRIMARY KEY (month, clientid, requesttype, state)
+	) WITHOUT ROWID;
+	"""
+	db_path.parent.mkdir(parents=True, exist_ok=True)
+	with get_connection(db_path) as conn:
+		conn.executescript(schema)
+		_migrate_text_timestamps(conn)
+
+
+def _migrate_text_timestamps(conn: sqlite3.Connection) -> None:
+	"""Add epoch ms columns to rollup/archive tables created while timestamps were text."""
+	legacy = {
+		'task_rollup': ('first_created', 'last_created'),
+	}
+	for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?", (f"{ARCHIVE_PREFIX}%",)):
+		legacy[r['name']] = ('created_at', 'updated_at')
+	for table, text_columns in legacy.items():
+		cols = {r['name'] for r in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+		for column in text_columns:
+			if column in cols and f'{column}_ms' not in cols:
+				conn.execute(f"ALTER TABLE {table} ADD COLUMN {column}_ms INTEGER")
+				conn.execute(f"UPDATE {table} SET {column}_ms = {sql_text_to_ms(column)}")
+
+
+def _ensure_archive_table(conn: sqlite3.Connection, schema: str, month: str) -> str:
+	"""Create `tasks_archive_YYYYMM` (same columns as tasks, original ids kept) and return its qualified name."""
+	if not _MONTH_RE.match(month):
+		raise ValueError(f"invalid archive month: {month}")
+	table = f"{schema}.{ARCHIVE_PREFIX}{month}"
+	conn.execute(f"""
+	CREATE TABLE IF NOT EXISTS {table} (
+		id INTEGER PRIMARY KEY,
+		clientid TEXT NOT NULL,
+		requestid TEXT UNIQUE NOT NULL,
+		requesttype TEXT,
+		state TEXT,
+		description TEXT,
+		created_at_ms INTEGER NOT NULL,
+		updated_at_ms INTEGER NOT NULL
+	)""")
+	conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_{ARCHIVE_PREFIX}{month}_clientid ON {ARCHIVE_PREFIX}{month} (clientid, id)")
+	return table
+
+
+def archive_tasks(cutoff: Any, batch_size: int = 5000, max_batches: Optional[int] = None,
+				  archive_db_path: Optional[Path] = None, db_path: Path = DB_PATH) -> Dict[str, Any]:
+	"""Move tasks created before `cutoff` into monthly archive tables.
+
+	Each batch is one short transaction: copy the oldest `batch_size` rows to
+	their month's archive table, add them to task_rollup, delete them from
+	tasks. Writers are blocked for one batch at a time, never the whole run.
+
+	Args:
+		cutoff: 'YYYY-MM-DD HH:MM:SS' or epoch; rows created before it are moved
+		batch_size: rows per transaction
+		max_batches: stop after this many batches (None = until done)
+		archive_db_path: archive to this separate database file instead of the main one
+
+	Returns:
+		{'moved': n, 'batches': n, 'months': {'YYYYMM': n, ...}}
+	"""
+	schema = _schema(archive_db_path)
+	columns = 'id, clientid, requestid, requesttype, state, description, created_at_ms, updated_at_ms'
+	cutoff_ms = to_epoch_ms(cutoff)
+	summary: Dict[str, Any] = {'moved': 0, 'batches': 0, 'months': {}}
+	conn = _connect(db_path, archive_db_path)
+	try:
+		while max_batches is None or summary['batches'] < max_batches:
+			with conn:
+				rows = conn.execute(
+					f"SELECT {columns} FROM tasks WHERE created_at_ms < ? ORDER BY created_at_ms, id LIMIT ?",
+					(cutoff_ms, batch_size)
+				).fetchall()
+				if not rows:
+					break
+
+				by_month: Dict[str, List[tuple]] = {}
+				rollup: Dict[tuple, list] = {}
+				for r in rows:
+					created = r['created_at_ms']
+					month = datetime.fromtimestamp(created / 1000).strftime('%Y-%m')
+					by_month.setdefault(month.replace('-', ''), []).append(tuple(r))
+					key = (month, r['clientid'], r['requesttype'] or '', r['state'] or '')
+					agg = rollup.setdefault(key, [0, created, created])
+					agg[0] += 1
+					agg[1] = min(agg[1], created)
+					agg[2] = max(agg[2], created)
+
+				for month, month_rows in by_month.items():
+					table = _ensure_archive_table(conn, schema, month)
+					conn.executemany(f"INSERT OR REPLACE INTO {table} ({columns}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", month_rows)
+					summary['months'][month] = summary['months'].get(month, 0) + len(month_rows)
+
+				conn.executemany("""
+					INSERT INTO task_rollup (month, clientid, requesttype, state, count, first_created_ms, last_created_ms)
+					VALUES (?, ?, ?, ?, ?, ?, ?)
+					ON CONFLICT (month, clientid, requesttype, state) DO UPDATE SET
+						count = count + excluded.count,
+						first_created_ms = MIN(first_created_ms, excluded.first_created_ms),
+						last_created_ms = MAX(last_created_ms, excluded.last_created_ms)
+				""", [(*key, *agg) for key, agg in rollup.items()])
+
+				conn.executemany("DELETE FROM tasks WHERE id = ?", [(r['id'],) for r in rows])
+				summary['moved'] += len(rows)
+				summary['batches'] += 1
+	finally:
+		conn.close()
+	return summary
+
+
+_AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+
+def compact_database(db_path: Path = DB_PATH, vacuum_pages: int = 0) -> Dict[str, Any]:
+	"""Return freed pages to the OS after archiving.
+
+	Runs `PRAGMA incremental_vacuum` when the database uses auto_vacuum=INCREMENTAL
+	and checkpoints/truncates the WAL when in WAL mode. A database created without
+	auto_vacuum (the default) only keeps freed pages for reuse; `auto_vacuum` in the
+	result shows which case applies, and enable_incremental_vacuum switches it once.
+
+	Args:
+		vacuum_pages: pages to free (0 = all free pages)
+	"""
+	result: Dict[str, Any] = {}
+	with get_connection(db_path) as conn:
+		mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+		result['auto_vacuum'] = _AUTO_VACUUM_MODES.get(mode, str(mode))
+		result['journal_mode'] = conn.execute("PRAGMA journal_mode").fetchone()[0].lower()
+		result['freelist_before'] = conn.execute("PRAGMA freelist_count").fetchone()[0]
+		if mode == 2:
+			# execute() steps the pragma once (one page); executescript runs it to completion
+			conn.executescript(f"PRAGMA incremental_vacuum({int(vacuum_pages)});" if vacuum_pages else "PRAGMA incremental_vacuum;")
+			result['incremental_vacuum'] = True
+		else:
+			result['incremental_vacuum'] = False
+		if result['journal_mode'] == 'wal':
+			busy, log, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+			result['wal_checkpoint'] = {'busy': busy, 'log': log, 'checkpointed': checkpointed}
+		result['freelist_after'] = conn.execute("PRAGMA freelist_count").fetchone()[0]
+	return result
+
+
+def enable_incremental_vacuum(db_path: Path = DB_PATH) -> Dict[str, Any]:
+	"""Switch the database to auto_vacuum=INCREMENTAL so compact_database can shrink the file.
+
+	Needs one full VACUUM (rewrites the file, blocks writers); run it once during
+	maintenance (POST /api/admin/tasks/compact with enable_incremental_vacuum).
+	Does nothing when the database already uses incremental mode.
+
+	Returns:
+		{'auto_vacuum': mode after the call, 'vacuumed': whether VACUUM ran}
+	"""
+	conn = get_connection(db_path)
+	try:
+		if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+			return {'auto_vacuum': 'incremental', 'vacuumed': False}
+		conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+		conn.execute("VACUUM")
+		mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+	finally:
+		conn.close()
+	return {'auto_vacuum': _AUTO_VACUUM_MODES.get(mode, str(mode)), 'vacuumed': True}
+
+
+def list_archive_months(archive_db_path: Optional[Path] = None, db_path: Path = DB_PATH) -> List[str]:
+	"""Months ('YYYYMM') that have an archive table, newest first."""
+	schema = _schema(archive_db_path)
+	conn = _connect(db_path, archive_db_path)
+	try:
+		rows = conn.execute(
+			f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table' AND name LIKE ?",
+			(f"{ARCHIVE_PREFIX}%",)
+		).fetchall()
+	finally:
+		conn.close()
+	months = [r['name'][len(ARCHIVE_PREFIX):] for r in rows]
+	return sorted((m for m in months if _MONTH_RE.match(m)), reverse=True)
+
+
+def list_archived_tasks(month: str, clientid: Optional[str] = None, before_id: Optional[int] = None,
+						limit: int = 200, archive_db_path: Optional[Path] = None,
+						db_path: Path = DB_PATH) -> List[Dict[str, Any]]:
+	"""Archived tasks of one month, newest first, with the same keyset cursor as list_tasks."""
+	if not _MONTH_RE.match(month) or month not in list_archive_months(archive_db_path, db_path):
+		return []
+	table = f"{_schema(archive_db_path)}.{ARCHIVE_PREFIX}{month}"
+	where = []
+	params: List[Any] = []
+	if clientid:
+		where.append("clientid = ?")
+		params.append(clientid)
+	if before_id is not None:
+		where.append("id < ?")
+		params.append(before_id)
+	sql = f"SELECT * FROM {table} {'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY id DESC LIMIT ?"
+	params.append(limit)
+	conn = _connect(db_path, archive_db_path)
+	try:
+		return [task_row(r) for r in conn.execute(sql, params).fetchall()]
+	finally:
+		conn.close()
+
+
+def get_task_rollup(month: Optional[str] = None, clientid: Optional[str] = None,
+					db_path: Path = DB_PATH) -> List[Dict[str, Any]]:
+	"""Rollup rows of archived tasks, optionally for one month ('YYYY-MM') and/or device.
+
+	first_created / last_created are added as formatted text next to the *_ms columns.
+	"""
+	where = []
+	params: List[Any] = []
+	if month:
+		where.append("month = ?")
+		params.append(month)
+	if clientid:
+		where.append("clientid = ?")
+		params.append(clientid)
+	sql = f"SELECT * FROM task_rollup {'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY month DESC, clientid, requesttype, state"
+	with get_connection(db_path) as conn:
+		rows = [dict(r) for r in conn.execute(sql, params).fetchall()]
+	for row in rows:
+		row['first_created'] = format_ms(row['first_created_ms'])
+		row['last_created'] = format_ms(row['last_created_ms'])
+	return rows
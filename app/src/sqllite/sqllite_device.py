@@ -1,10 +1,15 @@
 import sqlite3
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable
 from pathlib import Path
 from datetime import datetime
 
+from app.src.logger import get_logger
+from .sqllite_path import DB_PATH
+from .sqllite_time import (
+	to_epoch_ms, format_ms, to_int, to_percent, now_ms, sql_text_to_ms, sql_ms_to_text
+)
 
-DB_PATH = Path(__file__).resolve().parents[3] / 'camlink.db'
+log = get_logger('sqllite.device')
 
 
 def get_connection(db_path: Path = DB_PATH) -> sqlite3.Connection:
@@ -14,89 +19,239 @@ def get_connection(db_path: Path = DB_PATH) -> sqlite3.Connection:
 	return conn
 
 
+DEVICE_TABLE = """
+CREATE TABLE IF NOT EXISTS devices (
+	id INTEGER PRIMARY KEY AUTOINCREMENT,
+	hardware_id TEXT UNIQUE NOT NULL,
+	client_id TEXT,
+	hotel TEXT,
+	location TEXT,
+	wifi TEXT,
+	runtime TEXT,
+	fw TEXT,
+	last_online_ms INTEGER CHECK (last_online_ms IS NULL OR typeof(last_online_ms) = 'integer'),
+	status TEXT,
+	run_state TEXT,
+	left_storage INTEGER CHECK (left_storage IS NULL OR typeof(left_storage) = 'integer'),
+	electric_percent INTEGER CHECK (electric_percent IS NULL OR
+		(typeof(electric_percent) = 'integer' AND electric_percent BETWEEN 0 AND 100)),
+	network_signal_strength INTEGER CHECK (network_signal_strength IS NULL OR typeof(network_signal_strength) = 'integer')
+);
+"""
+
+# Readers that still expect the formatted text `last_online` can select from this view
+DEVICE_COMPAT_VIEW = f"""
+CREATE VIEW IF NOT EXISTS devices_compat AS
+SELECT id, hardware_id, client_id, hotel, location, wifi, runtime, fw,
+	{sql_ms_to_text('last_online_ms')} AS last_online, last_online_ms,
+	status, run_state, left_storage, electric_percent, network_signal_strength
+FROM devices;
+"""
+
+
+def _sql_int(column: str) -> str:
+	"""SQL expression coercing a loosely typed legacy column to INTEGER (NULL for NULL/'')."""
+	return f"CASE WHEN {column} IS NULL OR TRIM({column}) = '' THEN NULL ELSE CAST(ROUND(CAST({column} AS REAL)) AS INTEGER) END"
+
+
+def _migrate_devices(conn: sqlite3.Connection) -> bool:
+	"""One-time rebuild of a legacy `devices` table (text last_online, untyped numbers).
+
+	Converts last_online to epoch ms and coerces the numeric columns, keeping ids
+	and the AUTOINCREMENT sequence. Returns True if a migration ran.
+	"""
+	cols = {r['name'] for r in conn.execute("PRAGMA table_info(devices)").fetchall()}
+	if 'last_online_ms' in cols:
+		return False
+
+	# Very old tables may predate these columns
+	extras = {
+		'status': 'TEXT',
+		'run_state': 'TEXT',
+		'left_storage': 'INTEGER',
+		'electric_percent': 'INTEGER',
+		'network_signal_strength': 'INTEGER'
+	}
+	for name, typ in extras.items():
+		if name not in cols:
+			conn.execute(f"ALTER TABLE devices ADD COLUMN {name} {typ}")
+	conn.commit()
+
+	script = f"""
+	BEGIN;
+	DROP VIEW IF EXISTS devices_compat;
+	DROP INDEX IF EXISTS idx_devices_hotel_id;
+	DROP INDEX IF EXISTS idx_devices_status_id;
+	DROP INDEX IF EXISTS idx_devices_client_id;
+	ALTER TABLE devices RENAME TO devices_legacy;
+	{DEVICE_TABLE}
+	INSERT INTO devices (id, hardware_id, client_id, hotel, location, wifi, runtime, fw, last_online_ms,
+		status, run_state, left_storage, electric_percent, network_signal_strength)
+	SELECT id, hardware_id, client_id, hotel, location, wifi, runtime, fw, {sql_text_to_ms('last_online')},
+		status, run_state, {_sql_int('left_storage')},
+		MAX(0, MIN(100, {_sql_int('electric_percent')})), {_sql_int('network_signal_strength')}
+	FROM devices_legacy;
+	UPDATE sqlite_sequence SET seq = MAX(seq, COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'devices_legacy'), 0))
+	WHERE name = 'devices';
+	DROP TABLE devices_legacy;
+	COMMIT;
+	"""
+	try:
+		conn.executescript(script)
+	except Exception:
+		if conn.in_transaction:
+			conn.execute("ROLLBACK")
+		raise
+	return True
+
+
 def init_db(db_path: Path = DB_PATH) -> None:
 	"""Create tables if they do not exist.
 
 	Creates a `devices` table suitable for storing basic device info used
-	by the demo pages.
-	"""
-	schema = """
-	CREATE TABLE IF NOT EXISTS devices (
-		id INTEGER PRIMARY KEY AUTOINCREMENT,
-		hardware_id TEXT UNIQUE NOT NULL,
-		client_id TEXT,
-		hotel TEXT,
-		location TEXT,
-		wifi TEXT,
-		runtime TEXT,
-		fw TEXT,
-		last_online TEXT,
-		status TEXT,
-		left_storage INTEGER,
-		electric_percent INTEGER,
-		network_signal_strength INTEGER
-	);
+	by the demo pages. Timestamps are stored as integer epoch milliseconds;
+	a legacy table with text timestamps is migrated once on first start.
 	"""
 	db_path.parent.mkdir(parents=True, exist_ok=True)
 	with get_connection(db_path) as conn:
-		conn.executescript(schema)
-
-		# Ensure newer columns exist (safe to run multiple times)
-		cur = conn.execute("PRAGMA table_info(devices)")
-		cols = {r['name'] for r in cur.fetchall()}
-		extras = {
-			'status': 'TEXT',
-			'run_state': 'TEXT',
-			'left_storage': 'INTEGER',
-			'electric_percent': 'INTEGER',
-			'network_signal_strength': 'INTEGER'
-		}
-		for name, typ in extras.items():
-			if name not in cols:
-				conn.execute(f"ALTER TABLE devices ADD COLUMN {name} {typ}")
+		conn.executescript(DEVICE_TABLE)
+		if _migrate_devices(conn):
+			print('Migrated devices table to integer timestamps')
+		conn.executescript(DEVICE_COMPAT_VIEW)
+
+		# Keyset pagination filtered by hotel / status, staleness checks
+		conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_hotel_id ON devices (hotel, id)")
+		conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_status_id ON devices (status, id)")
+		conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_client_id ON devices (client_id)")
+		conn.execute("CREATE INDEX IF NOT EXISTS idx_devices_last_online ON devices (last_online_ms)")
+
+
+# Change listeners: callback(hardware_ids, deleted, patch) after a committed write to the main database
+_listeners: List[Callable[[List[str], bool, Optional[Dict[str, Any]]], None]] = []
+
+
+def add_device_listener(callback: Callable[[List[str], bool, Optional[Dict[str, Any]]], None]) -> None:
+	"""Register a callback run (in the writing thread) after devices in the main
+	database are inserted, updated or deleted.
+
+	`patch` is the set of stored columns an update_device call applied (in the same
+	format as get_device rows), so listeners holding the row can merge it without
+	reading it back; it is None for inserts, upserts and deletes.
+	"""
+	_listeners.append(callback)
+
+
+def _notify(hardware_ids: List[str], db_path: Path, deleted: bool = False,
+			patch: Optional[Dict[str, Any]] = None) -> None:
+	if not hardware_ids or db_path != DB_PATH:
+		return
+	for callback in _listeners:
+		try:
+			callback(hardware_ids, deleted, patch)
+		except Exception:
+			log.exception('Device listener failed', key='listener', hardware_ids=len(hardware_ids), deleted=deleted)
+
+
+# Writable columns; last_online is accepted as text, datetime or epoch and stored as last_online_ms
+_WRITABLE = (
+	'client_id', 'hotel', 'location', 'wifi', 'runtime', 'fw', 'last_online_ms',
+	'status', 'run_state', 'left_storage', 'electric_percent', 'network_signal_strength'
+)
+
+
+def _coerce_device_fields(data: Dict[str, Any]) -> Dict[str, Any]:
+	"""Normalise input values to the stored types (raises ValueError on bad input)."""
+	out = {}
+	for k, v in data.items():
+		if k == 'last_online':
+			if 'last_online_ms' not in data:
+				out['last_online_ms'] = to_epoch_ms(v)
+		elif k == 'last_online_ms':
+			out[k] = to_epoch_ms(v)
+		elif k == 'electric_percent':
+			out[k] = to_percent(v)
+		elif k in ('left_storage', 'network_signal_strength'):
+			out[k] = to_int(v)
+		else:
+			out[k] = v
+	return out
+
+
+def _device_row(row: sqlite3.Row) -> Dict[str, Any]:
+	"""Row -> dict, adding the formatted `last_online` next to `last_online_ms`."""
+	device = dict(row)
+	if 'last_online_ms' in device:
+		device['last_online'] = format_ms(device['last_online_ms'])
+	return device
 
 
 def insert_device(data: Dict[str, Any], db_path: Path = DB_PATH) -> int:
 	"""Insert a device row. Returns the inserted row id.
 
-	data keys: hardware_id (required), client_id, hotel, location, wifi, runtime, fw, last_online
+	data keys: hardware_id (required), client_id, hotel, location, wifi, runtime, fw,
+	last_online (text/datetime/epoch) or last_online_ms, status, run_state, left_storage,
+	electric_percent, network_signal_strength
 	"""
-	sql = """
-	INSERT INTO devices (hardware_id, client_id, hotel, location, wifi, runtime, fw, last_online)
-	VALUES (:hardware_id, :client_id, :hotel, :location, :wifi, :runtime, :fw, :last_online)
+	fields = _coerce_device_fields(data)
+	values = {k: fields.get(k) for k in _WRITABLE}
+	sql = f"""
+	INSERT INTO devices (hardware_id, {', '.join(_WRITABLE)})
+	VALUES (:hardware_id, {', '.join(':' + k for k in _WRITABLE)})
 	"""
 	with get_connection(db_path) as conn:
-		cur = conn.execute(sql, {
-			'hardware_id': data['hardware_id'],
-			'client_id': data.get('client_id'),
-			'hotel': data.get('hotel'),
-			'location': data.get('location'),
-			'wifi': data.get('wifi'),
-			'runtime': data.get('runtime'),
-			'fw': data.get('fw'),
-			'last_online': data.get('last_online')
-		})
+		cur = conn.execute(sql, {'hardware_id': data['hardware_id'], **values})
 		rowid = cur.lastrowid
+	_notify([data['hardware_id']], db_path)
+	return rowid
+
+
+# Keep IN (...) lists well below SQLITE_MAX_VARIABLE_NUMBER
+_CHUNK = 500
+
+
+def upsert_devices(rows: List[Dict[str, Any]], overwrite: bool = False,
+				   db_path: Path = DB_PATH) -> Dict[str, str]:
+	"""Insert many devices in one transaction with a single executemany.
 
-		# If optional new fields provided, update them (INSERT with missing columns for compatibility)
-		patch = {}
-		if 'status' in data:
-			patch['status'] = data['status']
-		if 'run_state' in data:
-			patch['run_state'] = data['run_state']
-		if 'left_storage' in data:
-			patch['left_storage'] = data['left_storage']
-		if 'electric_percent' in data:
-			patch['electric_percent'] = data['electric_percent']
-		if 'network_signal_strength' in data:
-			patch['network_signal_strength'] = data['network_signal_strength']
-		if patch:
-			# update the newly inserted row
-			conn.execute(
-				f"UPDATE devices SET " + ", ".join([f"{k} = :{k}" for k in patch.keys()]) + " WHERE id = :id",
-				{**patch, 'id': rowid}
+	Rows take the same keys as insert_device. Existing hardware_ids are left
+	untouched unless `overwrite` is set, in which case every non-None field of
+	the row replaces the stored value (same as update_device with those fields).
+
+	Returns:
+		{hardware_id: 'created' | 'updated' | 'exists'}
+	"""
+	params = []
+	for row in rows:
+		fields = _coerce_device_fields(row)
+		params.append({'hardware_id': row['hardware_id'], **{k: fields.get(k) for k in _WRITABLE}})
+	if not params:
+		return {}
+
+	if overwrite:
+		conflict = "DO UPDATE SET " + ", ".join(f"{k} = COALESCE(excluded.{k}, devices.{k})" for k in _WRITABLE)
+	else:
+		conflict = "DO NOTHING"
+	sql = f"""
+	INSERT INTO devices (hardware_id, {', '.join(_WRITABLE)})
+	VALUES (:hardware_id, {', '.join(':' + k for k in _WRITABLE)})
+	ON CONFLICT (hardware_id) {conflict}
+	"""
+	hardware_ids = [p['hardware_id'] for p in params]
+	with get_connection(db_path) as conn:
+		# Take the write lock first so the existence check and the upsert see the same rows
+		conn.execute("BEGIN IMMEDIATE")
+		existing = set()
+		for i in range(0, len(hardware_ids), _CHUNK):
+			chunk = hardware_ids[i:i + _CHUNK]
+			cur = conn.execute(
+				f"SELECT hardware_id FROM devices WHERE hardware_id IN ({','.join('?' * len(chunk))})", chunk
 			)
-		return rowid
+			existing.update(r['hardware_id'] for r in cur.fetchall())
+		conn.executemany(sql, params)
+	on_existing = 'updated' if overwrite else 'exists'
+	statuses = {hid: (on_existing if hid in existing else 'created') for hid in hardware_ids}
+	_notify([hid for hid, status in statuses.items() if status != 'exists'], db_path)
+	return statuses
 
 
 def get_device(hardware_id: str, db_path: Path = DB_PATH) -> Optional[Dict[str, Any]]:
@@ -104,7 +259,7 @@ def get_device(hardware_id: str, db_path: Path = DB_PATH) -> Optional[Dict[str,
 	with get_connection(db_path) as conn:
 		cur = conn.execute(sql, (hardware_id,))
 		row = cur.fetchone()
-		return dict(row) if row else None
+		return _device_row(row) if row else None
 
 
 def get_device_by_client_id(client_id: str, db_path: Path = DB_PATH) -> Optional[Dict[str, Any]]:
@@ -113,7 +268,7 @@ def get_device_by_client_id(client_id: str, db_path: Path = DB_PATH) -> Optional
 	with get_connection(db_path) as conn:
 		cur = conn.execute(sql, (client_id,))
 		row = cur.fetchone()
-		return dict(row) if row else None
+		return _device_row(row) if row else None
 
 
 def get_client_id_by_hardware_id(hardware_id: str, db_path: Path = DB_PATH) -> Optional[str]:
@@ -125,35 +280,99 @@ def get_client_id_by_hardware_id(hardware_id: str, db_path: Path = DB_PATH) -> O
 		return row['client_id'] if row else None
 
 
-def list_devices(limit: int = 100, db_path: Path = DB_PATH) -> List[Dict[str, Any]]:
-	sql = "SELECT * FROM devices ORDER BY id DESC LIMIT ?"
+DEVICE_COLUMNS = (
+	'id', 'hardware_id', 'client_id', 'hotel', 'location', 'wifi', 'runtime', 'fw', 'last_online',
+	'status', 'run_state', 'left_storage', 'electric_percent', 'network_signal_strength'
+)
+
+# API status filter -> stored values (devices written by older code use Chinese labels)
+_STATUS_VALUES = {
+	'online': ('online', '在线'),
+	'offline': ('offline', '离线')
+}
+
+
+def list_devices(limit: int = 100, db_path: Path = DB_PATH, before_id: Optional[int] = None,
+				 hotel: Optional[str] = None, status: Optional[str] = None,
+				 columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+	"""List devices newest first with keyset pagination.
+
+	Args:
+		limit: page size
+		before_id: cursor -- only rows with id < before_id (the last id of the previous page)
+		hotel: exact hotel match
+		status: 'online' / 'offline' (also matches the Chinese labels)
+		columns: projection; unknown names are ignored and `id` is always included
+	"""
+	where = []
+	params: List[Any] = []
+	if before_id is not None:
+		where.append("id < ?")
+		params.append(before_id)
+	if hotel:
+		where.append("hotel = ?")
+		params.append(hotel)
+	if status:
+		values = _STATUS_VALUES.get(status, (status,))
+		where.append(f"status IN ({','.join('?' * len(values))})")
+		params.extend(values)
+
+	select = '*'
+	if columns:
+		wanted = [c for c in DEVICE_COLUMNS if c in columns and c != 'id']
+		select = ', '.join(['id'] + ['last_online_ms' if c == 'last_online' else c for c in wanted])
+	sql = f"SELECT {select} FROM devices {'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY id DESC LIMIT ?"
+	params.append(limit)
+	with get_connection(db_path) as conn:
+		cur = conn.execute(sql, params)
+		return [_device_row(r) for r in cur.fetchall()]
+
+
+def list_stale_devices(max_age_seconds: float, hotel: Optional[str] = None, limit: int = 1000,
+					   db_path: Path = DB_PATH) -> List[Dict[str, Any]]:
+	"""Devices still marked online whose last report is older than `max_age_seconds`
+	(or that never reported), oldest first. Used for offline detection."""
+	where = ["status IN ('online', '在线')", "(last_online_ms IS NULL OR last_online_ms < ?)"]
+	params: List[Any] = [now_ms() - int(max_age_seconds * 1000)]
+	if hotel:
+		where.append("hotel = ?")
+		params.append(hotel)
+	sql = f"SELECT * FROM devices WHERE {' AND '.join(where)} ORDER BY last_online_ms LIMIT ?"
+	params.append(limit)
 	with get_connection(db_path) as conn:
-		cur = conn.execute(sql, (limit,))
-		return [dict(r) for r in cur.fetchall()]
+		cur = conn.execute(sql, params)
+		return [_device_row(r) for r in cur.fetchall()]
 
 
 def update_device(hardware_id: str, patch: Dict[str, Any], db_path: Path = DB_PATH) -> int:
-	"""Update device fields. Returns number of rows updated."""
-	allowed = ['client_id', 'hotel', 'location', 'wifi', 'runtime', 'fw', 'last_online', 'status', 'run_state', 'left_storage', 'electric_percent', 'network_signal_strength']
-	sets = []
-	params = {}
-	for k, v in patch.items():
-		if k in allowed:
-			sets.append(f"{k} = :{k}")
-			params[k] = v
-	if not sets:
+	"""Update device fields. Returns number of rows updated.
+
+	last_online may be given as text, datetime or epoch; numbers may be strings.
+	"""
+	params = {k: v for k, v in _coerce_device_fields(patch).items() if k in _WRITABLE}
+	if not params:
 		return 0
+	sets = [f"{k} = :{k}" for k in params]
 	params['hardware_id'] = hardware_id
 	sql = f"UPDATE devices SET {', '.join(sets)} WHERE hardware_id = :hardware_id"
 	with get_connection(db_path) as conn:
 		cur = conn.execute(sql, params)
-		return cur.rowcount
+		rowcount = cur.rowcount
+	if rowcount:
+		del params['hardware_id']
+		if 'last_online_ms' in params:
+			params['last_online'] = format_ms(params['last_online_ms'])
+		_notify([hardware_id], db_path, patch=params)
+	return rowcount
 
 def delete_device(hardware_id: str, db_path: Path = DB_PATH) -> int:
 	sql = "DELETE FROM devices WHERE hardware_id = ?"
 	with get_connection(db_path) as conn:
 		cur = conn.execute(sql, (hardware_id,))
-		return cur.rowcount
+		rowcount = cur.rowcount
+	if rowcount:
+		_notify([hardware_id], db_path, deleted=True)
+	return rowcount
 	
 if __name__ == '__main__':
 	# small demo when run as script
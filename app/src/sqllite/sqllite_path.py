@@ -0,0 +1,7 @@
+import os
+from pathlib import Path
+
+
+# Database file shared by all sqllite modules.
+# CAMLINK_DB overrides it (load tests and replays use a scratch copy).
+DB_PATH = Path(os.getenv('CAMLINK_DB') or Path(__file__).resolve().parents[3] / 'camlink.db')
@@ -0,0 +1,234 @@
+import sqlite3
+from typing import Optional, List, Dict, Any, Iterable
+from pathlib import Path
+from datetime import datetime
+
+from .sqllite_path import DB_PATH
+
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Scoring weights. A sighting's contribution to its room score is
+#   weight * (1 + PERSIST_BONUS * min(scan_count - 1, PERSIST_CAP) + (SPAN_BONUS if seen over >= SPAN_SECONDS))
+# so a watchlisted vendor that keeps showing up across scans (a device that
+# stays in the room) outweighs a phone passing by once.
+WEIGHT_WATCHLIST = 10.0
+WEIGHT_UNKNOWN = 1.0
+PERSIST_BONUS = 0.2
+PERSIST_CAP = 9
+SPAN_BONUS = 0.5
+SPAN_SECONDS = 24 * 3600
+
+# Keep IN (...) lists well below SQLITE_MAX_VARIABLE_NUMBER
+_CHUNK = 500
+
+
+def get_connection(db_path: Path = DB_PATH) -> sqlite3.Connection:
+	"""Return a sqlite3 connection with sensible defaults."""
+	conn = sqlite3.connect(str(db_path), timeout=30)
+	conn.row_factory = sqlite3.Row
+	return conn
+
+
+def init_scan_tables(db_path: Path = DB_PATH) -> None:
+	"""Create the scan history tables if they do not exist.
+
+	- `scans`: one row per ingested scan
+	- `scan_sightings`: one row per (hotel, location, mac) with first/last seen
+	  times, how many scans saw it and its scoring weight
+	- `room_scores`: running suspicion score per (hotel, location), updated
+	  incrementally on ingest so ranking rooms never touches raw sightings
+	"""
+	schema = """
+	CREATE TABLE IF NOT EXISTS scans (
+		id INTEGER PRIMARY KEY AUTOINCREMENT,
+		hotel TEXT NOT NULL,
+		location TEXT NOT NULL,
+		hardware_id TEXT,
+		mac_count INTEGER,
+		scanned_at TEXT DEFAULT (datetime('now', 'localtime'))
+	);
+	CREATE INDEX IF NOT EXISTS idx_scans_room ON scans (hotel, location, id);
+
+	CREATE TABLE IF NOT EXISTS scan_sightings (
+		hotel TEXT NOT NULL,
+		location TEXT NOT NULL,
+		mac TEXT NOT NULL,
+		vendor TEXT,
+		registry TEXT,
+		suspicious INTEGER DEFAULT 0,
+		weight REAL DEFAULT 0,
+		scan_count INTEGER DEFAULT 1,
+		first_seen TEXT,
+		last_seen TEXT,
+		last_scan_id INTEGER,
+		PRIMARY KEY (hotel, location, mac)
+	) WITHOUT ROWID;
+	CREATE INDEX IF NOT EXISTS idx_sightings_mac ON scan_sightings (mac);
+
+	CREATE TABLE IF NOT EXISTS room_scores (
+		hotel TEXT NOT NULL,
+		location TEXT NOT NULL,
+		score REAL DEFAULT 0,
+		suspicious_macs INTEGER DEFAULT 0,
+		total_macs INTEGER DEFAULT 0,
+		scan_count INTEGER DEFAULT 0,
+		first_scan TEXT,
+		last_scan TEXT,
+		PRIMARY KEY (hotel, location)
+	) WITHOUT ROWID;
+	CREATE INDEX IF NOT EXISTS idx_room_scores_rank ON room_scores (hotel, score DESC);
+	"""
+	db_path.parent.mkdir(parents=True, exist_ok=True)
+	with get_connection(db_path) as conn:
+		conn.executescript(schema)
+
+
+def sighting_weight(suspicious: bool, vendor: Optional[str], mac: str) -> float:
+	"""Base weight of a single sighting.
+
+	Watchlisted vendors weigh the most. Unknown vendors count a little, except
+	locally administered (randomised) MACs, which phones rotate constantly.
+	"""
+	if suspicious:
+		return WEIGHT_WATCHLIST
+	if vendor in (None, 'Unknown MAC'):
+		try:
+			locally_administered = int(mac[:2], 16) & 0x02
+		except ValueError:
+			return 0.0
+		return 0.0 if locally_administered else WEIGHT_UNKNOWN
+	return 0.0
+
+
+def sighting_score(weight: float, scan_count: int, first_seen: str, last_seen: str) -> float:
+	"""Contribution of one sighting row to its room score."""
+	if not weight:
+		return 0.0
+	factor = 1 + PERSIST_BONUS * min(scan_count - 1, PERSIST_CAP)
+	span = (datetime.strptime(last_seen, TIME_FORMAT) - datetime.strptime(first_seen, TIME_FORMAT)).total_seconds()
+	if span >= SPAN_SECONDS:
+		factor += SPAN_BONUS
+	return weight * factor
+
+
+def record_scan(hotel: str, location: str, sightings: Iterable[Dict[str, Any]], hardware_id: Optional[str] = None,
+				scanned_at: Optional[str] = None, db_path: Path = DB_PATH) -> Dict[str, Any]:
+	"""Store one room scan and update the room score incrementally.
+
+	Only the sightings of this scan are read and written: the score delta of
+	each touched MAC (new contribution minus old one) is added to the room's
+	running score, so cost is O(scan size) regardless of history length.
+
+	Args:
+		hotel, location: the room that was scanned
+		sightings: [{mac, vendor, registry, suspicious}, ...]; mac must be
+			normalised ('AA-BB-CC-DD-EE-FF'), duplicates within a scan count once
+		hardware_id: the scanning device, if any
+		scanned_at: 'YYYY-MM-DD HH:MM:SS', defaults to now
+
+	Returns:
+		{scan_id, macs, new_macs, suspicious_macs, score}
+	"""
+	scanned_at = scanned_at or datetime.now().strftime(TIME_FORMAT)
+	unique: Dict[str, Dict[str, Any]] = {}
+	for s in sightings:
+		unique[s['mac']] = s
+	macs = list(unique)
+
+	with get_connection(db_path) as conn:
+		cur = conn.execute(
+			"INSERT INTO scans (hotel, location, hardware_id, mac_count, scanned_at) VALUES (?, ?, ?, ?, ?)",
+			(hotel, location, hardware_id, len(macs), scanned_at)
+		)
+		scan_id = cur.lastrowid
+
+		existing: Dict[str, sqlite3.Row] = {}
+		for i in range(0, len(macs), _CHUNK):
+			chunk = macs[i:i + _CHUNK]
+			placeholders = ','.join('?' * len(chunk))
+			rows = conn.execute(
+				f"SELECT * FROM scan_sightings WHERE hotel = ? AND location = ? AND mac IN ({placeholders})",
+				(hotel, location, *chunk)
+			).fetchall()
+			existing.update((r['mac'], r) for r in rows)
+
+		delta = 0.0
+		new_macs = 0
+		new_suspicious = 0
+		upserts = []
+		for mac, s in unique.items():
+			suspicious = 1 if s.get('suspicious') else 0
+			weight = sighting_weight(suspicious, s.get('vendor'), mac)
+			old = existing.get(mac)
+			if old is None:
+				new_macs += 1
+				new_suspicious += suspicious
+				scan_count, first_seen = 1, scanned_at
+			else:
+				delta -= sighting_score(old['weight'], old['scan_count'], old['first_seen'], old['last_seen'])
+				new_suspicious += suspicious - (old['suspicious'] or 0)
+				scan_count, first_seen = old['scan_count'] + 1, min(old['first_seen'], scanned_at)
+			last_seen = max(old['last_seen'], scanned_at) if old is not None else scanned_at
+			delta += sighting_score(weight, scan_count, first_seen, last_seen)
+			upserts.append((hotel, location, mac, s.get('vendor'), s.get('registry'), suspicious, weight,
+							scan_count, first_seen, last_seen, scan_id))
+
+		conn.executemany("""
+			INSERT OR REPLACE INTO scan_sightings
+				(hotel, location, mac, vendor, registry, suspicious, weight, scan_count, first_seen, last_seen, last_scan_id)
+			VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+		""", upserts)
+
+		conn.execute("""
+			INSERT INTO room_scores (hotel, location, score, suspicious_macs, total_macs, scan_count, first_scan, last_scan)
+			VALUES (:hotel, :location, :delta, :new_suspicious, :new_macs, 1, :scanned_at, :scanned_at)
+			ON CONFLICT (hotel, location) DO UPDATE SET
+				score = MAX(score + :delta, 0),
+				suspicious_macs = suspicious_macs + :new_suspicious,
+				total_macs = total_macs + :new_macs,
+				scan_count = scan_count + 1,
+				first_scan = MIN(first_scan, :scanned_at),
+				last_scan = MAX(last_scan, :scanned_at)
+		""", {
+			'hotel': hotel, 'location': location, 'delta': delta, 'new_suspicious': new_suspicious,
+			'new_macs': new_macs, 'scanned_at': scanned_at
+		})
+		room = conn.execute(
+			"SELECT score, suspicious_macs FROM room_scores WHERE hotel = ? AND location = ?", (hotel, location)
+		).fetchone()
+
+	return {
+		'scan_id': scan_id,
+		'macs': len(macs),
+		'new_macs': new_macs,
+		'suspicious_macs': room['suspicious_macs'],
+		'score': round(room['score'], 2)
+	}
+
+
+def top_suspicious_rooms(hotel: str, limit: int = 10, min_score: float = 0.0, db_path: Path = DB_PATH) -> List[Dict[str, Any]]:
+	"""Rooms of a hotel ordered by suspicion score (served from room_scores via its rank index)."""
+	sql = """
+	SELECT * FROM room_scores
+	WHERE hotel = ? AND score > ?
+	ORDER BY score DESC
+	LIMIT ?
+	"""
+	with get_connection(db_path) as conn:
+		cur = conn.execute(sql, (hotel, min_score, limit))
+		return [dict(r) for r in cur.fetchall()]
+
+
+def list_room_sightings(hotel: str, location: str, suspicious_only: bool = False, limit: int = 200,
+						db_path: Path = DB_PATH) -> List[Dict[str, Any]]:
+	"""MACs seen in one room, most heavily weighted and most persistent first."""
+	sql = f"""
+	SELECT mac, vendor, registry, suspicious, scan_count, first_seen, last_seen FROM scan_sightings
+	WHERE hotel = ? AND location = ? {'AND suspicious = 1' if suspicious_only else ''}
+	ORDER BY weight DESC, scan_count DESC, last_seen DESC
+	LIMIT ?
+	"""
+	with get_connection(db_path) as conn:
+		cur = conn.execute(sql, (hotel, location, limit))
+		return [dict(r) for r in cur.fetchall()]
@@ -2,8 +2,8 @@ import sqlite3
 from typing import Optional, List, Dict, Any
 from pathlib import Path
 
-
-DB_PATH = Path(__file__).resolve().parents[3] / 'camlink.db'
+from .sqllite_path import DB_PATH
+from .sqllite_time import to_epoch_ms, format_ms, SQL_NOW_MS, sql_text_to_ms, sql_ms_to_text
 
 
 def get_connection(db_path: Path = DB_PATH) -> sqlite3.Connection:
@@ -13,23 +13,103 @@ def get_connection(db_path: Path = DB_PATH) -> sqlite3.Connection:
 	return conn
 
 
+TASK_TABLE = f"""
+CREATE TABLE IF NOT EXISTS tasks (
+	id INTEGER PRIMARY KEY AUTOINCREMENT,
+	clientid TEXT NOT NULL,
+	requestid TEXT UNIQUE NOT NULL,
+	requesttype TEXT,
+	state TEXT,
+	description TEXT,
+	created_at_ms INTEGER NOT NULL DEFAULT {SQL_NOW_MS} CHECK (typeof(created_at_ms) = 'integer'),
+	updated_at_ms INTEGER NOT NULL DEFAULT {SQL_NOW_MS} CHECK (typeof(updated_at_ms) = 'integer')
+);
+"""
+
+TASK_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_tasks_clientid_id ON tasks (clientid, id);
+CREATE INDEX IF NOT EXISTS idx_tasks_state_id ON tasks (state, id);
+CREATE INDEX IF NOT EXISTS idx_tasks_created_at_ms ON tasks (created_at_ms);
+"""
+
+# Readers that still expect the formatted text created_at / updated_at can select from this view
+TASK_COMPAT_VIEW = f"""
+CREATE VIEW IF NOT EXISTS tasks_compat AS
+SELECT id, clientid, requestid, requesttype, state, description,
+	{sql_ms_to_text('created_at_ms')} AS created_at, {sql_ms_to_text('updated_at_ms')} AS updated_at,
+	created_at_ms, updated_at_ms
+FROM tasks;
+"""
+
+
+def _migrate_tasks(conn: sqlite3.Connection) -> bool:
+	"""One-time rebuild of a legacy `tasks` table with text created_at / updated_at.
+
+	Timestamps become epoch ms (unparsable values fall back to the other timestamp,
+	then to now); ids and the AUTOINCREMENT sequence are kept. Returns True if a migration ran.
+	"""
+	cols = {r['name'] for r in conn.execute("PRAGMA table_info(tasks)").fetchall()}
+	if 'created_at_ms' in cols:
+		return False
+	created = sql_text_to_ms('created_at')
+	updated = sql_text_to_ms('updated_at')
+	script = f"""
+	BEGIN;
+	DROP VIEW IF EXISTS tasks_compat;
+	DROP INDEX IF EXISTS idx_tasks_clientid_id;
+	DROP INDEX IF EXISTS idx_tasks_state_id;
+	DROP INDEX IF EXISTS idx_tasks_created_at;
+	ALTER TABLE tasks RENAME TO tasks_legacy;
+	{TASK_TABLE}
+	INSERT INTO tasks (id, clientid, requestid, requesttype, state, description, created_at_ms, updated_at_ms)
+	SELECT id, clientid, requestid, requesttype, state, description,
+		COALESCE({created}, {updated}, {SQL_NOW_MS}), COALESCE({updated}, {created}, {SQL_NOW_MS})
+	FROM tasks_legacy;
+	UPDATE sqlite_sequence SET seq = MAX(seq, COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'tasks_legacy'), 0))
+	WHERE name = 'tasks';
+	DROP TABLE tasks_legacy;
+	COMMIT;
+	"""
+	try:
+		conn.executescript(script)
+	except Exception:
+		if conn.in_transaction:
+			conn.execute("ROLLBACK")
+		raise
+	return True
+
+
 def init_task_table(db_path: Path = DB_PATH) -> None:
-	"""Create tasks table if it does not exist."""
-	schema = """
-	CREATE TABLE IF NOT EXISTS tasks (
-		id INTEGER PRIMARY KEY AUTOINCREMENT,
-		clientid TEXT NOT NULL,
-		requestid TEXT UNIQUE NOT NULL,
-		requesttype TEXT,
-		state TEXT,
-		description TEXT,
-		created_at TEXT DEFAULT (datetime('now', 'localtime')),
-		updated_at TEXT DEFAULT (datetime('now', 'localtime'))
-	);
+	"""Create tasks table if it does not exist.
+
+	created_at / updated_at are stored as integer epoch milliseconds (created_at_ms,
+	updated_at_ms); a legacy table with text timestamps is migrated once on first start.
 	"""
 	db_path.parent.mkdir(parents=True, exist_ok=True)
 	with get_connection(db_path) as conn:
-		conn.executescript(schema)
+		conn.executescript(TASK_TABLE)
+		if _migrate_tasks(conn):
+			print('Migrated tasks table to integer timestamps')
+		conn.executescript(TASK_INDEXES + TASK_COMPAT_VIEW)
+
+
+def task_row(row: sqlite3.Row) -> Dict[str, Any]:
+	"""Row -> dict, adding formatted created_at / updated_at next to the epoch ms columns."""
+	task = dict(row)
+	for column in ('created_at', 'updated_at'):
+		if f'{column}_ms' in task:
+			task[column] = format_ms(task[f'{column}_ms'])
+	return task
+
+
+def _coerce_task_patch(patch: Dict[str, Any]) -> Dict[str, Any]:
+	"""Map updatable fields to stored columns; updated_at may be text, datetime or epoch."""
+	out = {k: v for k, v in patch.items() if k in ('clientid', 'requesttype', 'state', 'description')}
+	if patch.get('updated_at_ms') is not None:
+		out['updated_at_ms'] = to_epoch_ms(patch['updated_at_ms'])
+	elif patch.get('updated_at') is not None:
+		out['updated_at_ms'] = to_epoch_ms(patch['updated_at'])
+	return out
 
 
 def drop_task_table(db_path: Path = DB_PATH) -> None:
@@ -63,32 +143,82 @@ def get_task_by_requestid(requestid: str, db_path: Path = DB_PATH) -> Optional[D
 	with get_connection(db_path) as conn:
 		cur = conn.execute(sql, (requestid,))
 		row = cur.fetchone()
-		return dict(row) if row else None
+		return task_row(row) if row else None
+
 
+TASK_COLUMNS = ('id', 'clientid', 'requestid', 'requesttype', 'state', 'description', 'created_at', 'updated_at')
 
-def list_tasks(clientid: Optional[str] = None, limit: int = 200, db_path: Path = DB_PATH) -> List[Dict[str, Any]]:
-	if clientid:
-		sql = "SELECT * FROM tasks WHERE clientid = ? ORDER BY id DESC LIMIT ?"
-		params = (clientid, limit)
-	else:
-		sql = "SELECT * FROM tasks ORDER BY id DESC LIMIT ?"
-		params = (limit,)
+
+def list_tasks(clientid: Optional[str] = None, limit: int = 200, db_path: Path = DB_PATH,
+			   before_id: Optional[int] = None, state: Optional[str] = None, requesttype: Optional[str] = None,
+			   since: Optional[str] = None, until: Optional[str] = None, hotel: Optional[str] = None,
+			   columns: Optional[List[str]] = None, requestids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+	"""List tasks newest first with keyset pagination.
+
+	Args:
+		clientid: only tasks of this device
+		limit: page size
+		before_id: cursor -- only rows with id < before_id (the last id of the previous page)
+		state, requesttype: exact matches
+		since, until: created_at range (inclusive / exclusive), 'YYYY-MM-DD HH:MM:SS' or epoch
+		hotel: only tasks of devices in this hotel
+		columns: projection; unknown names are ignored and `id` is always included
+		requestids: only these tasks
+	"""
+	where = []
+	params: List[Any] = []
+	for column, value in (('clientid', clientid), ('state', state), ('requesttype', requesttype)):
+		if value:
+			where.append(f"{column} = ?")
+			params.append(value)
+	if before_id is not None:
+		where.append("id < ?")
+		params.append(before_id)
+	if since:
+		where.append("created_at_ms >= ?")
+		params.append(to_epoch_ms(since))
+	if until:
+		where.append("created_at_ms < ?")
+		params.append(to_epoch_ms(until))
+	if hotel:
+		where.append("clientid IN (SELECT client_id FROM devices WHERE hotel = ?)")
+		params.append(hotel)
+	if requestids is not None:
+		where.append(f"requestid IN ({', '.join('?' * len(requestids)) or 'NULL'})")
+		params.extend(requestids)
+
+	select = '*'
+	if columns:
+		wanted = [c for c in TASK_COLUMNS if c in columns and c != 'id']
+		select = ', '.join(['id'] + [f'{c}_ms' if c in ('created_at', 'updated_at') else c for c in wanted])
+	sql = f"SELECT {select} FROM tasks {'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY id DESC LIMIT ?"
+	params.append(limit)
 	with get_connection(db_path) as conn:
 		cur = conn.execute(sql, params)
-		return [dict(r) for r in cur.fetchall()]
+		return [task_row(r) for r in cur.fetchall()]
+
+
+def list_tasks_since(since: Any, db_path: Path = DB_PATH) -> List[Dict[str, Any]]:
+	"""Tasks created at or after `since` ('YYYY-MM-DD HH:MM:SS' or epoch), oldest first,
+	joined with the owning device's hardware_id and hotel."""
+	sql = """
+	SELECT t.requestid, t.clientid, t.requesttype, t.state, t.created_at_ms, t.updated_at_ms,
+		d.hardware_id, d.hotel
+	FROM tasks t LEFT JOIN devices d ON d.client_id = t.clientid
+	WHERE t.created_at_ms >= ?
+	ORDER BY t.id
+	"""
+	with get_connection(db_path) as conn:
+		cur = conn.execute(sql, (to_epoch_ms(since),))
+		return [task_row(r) for r in cur.fetchall()]
 
 
 def update_task(requestid: str, patch: Dict[str, Any], db_path: Path = DB_PATH) -> int:
 	"""Update task fields by requestid. Returns number of rows updated."""
-	allowed = ['clientid', 'requesttype', 'state', 'description', 'updated_at']
-	sets = []
-	params = {}
-	for k, v in patch.items():
-		if k in allowed:
-			sets.append(f"{k} = :{k}")
-			params[k] = v
-	if not sets:
+	params = _coerce_task_patch(patch)
+	if not params:
 		return 0
+	sets = [f"{k} = :{k}" for k in params]
 	params['requestid'] = requestid
 	sql = f"UPDATE tasks SET {', '.join(sets)} WHERE requestid = :requestid"
 	with get_connection(db_path) as conn:
@@ -96,6 +226,57 @@ def update_task(requestid: str, patch: Dict[str, Any], db_path: Path = DB_PATH)
 		return cur.rowcount
 
 
+def apply_task_events(events: List[tuple], db_path: Path = DB_PATH) -> Dict[str, Any]:
+	"""Apply a batch of task events in a single transaction.
+
+	Events are applied in order:
+	  ('create', data)             -- same keys as create_task plus optional
+	                                  created_at/updated_at (text, datetime or epoch,
+	                                  or *_ms); duplicates are ignored
+	  ('update', requestid, patch) -- same keys as update_task
+
+	Returns {'created': n, 'updated': n, 'duplicates': [...], 'missing': [...]}
+	"""
+	insert_sql = f"""
+	INSERT OR IGNORE INTO tasks (clientid, requestid, requesttype, state, description, created_at_ms, updated_at_ms)
+	VALUES (:clientid, :requestid, :requesttype, :state, :description,
+		COALESCE(:created_at_ms, {SQL_NOW_MS}), COALESCE(:updated_at_ms, :created_at_ms, {SQL_NOW_MS}))
+	"""
+	summary = {'created': 0, 'updated': 0, 'duplicates': [], 'missing': []}
+	with get_connection(db_path) as conn:
+		for event in events:
+			if event[0] == 'create':
+				data = event[1]
+				created = data.get('created_at_ms', data.get('created_at'))
+				updated = data.get('updated_at_ms', data.get('updated_at'))
+				cur = conn.execute(insert_sql, {
+					'clientid': data['clientid'],
+					'requestid': data['requestid'],
+					'requesttype': data.get('requesttype'),
+					'state': data.get('state'),
+					'description': data.get('description'),
+					'created_at_ms': to_epoch_ms(created),
+					'updated_at_ms': to_epoch_ms(updated)
+				})
+				if cur.rowcount:
+					summary['created'] += 1
+				else:
+					summary['duplicates'].append(data['requestid'])
+			else:
+				_, requestid, patch = event
+				params = _coerce_task_patch(patch)
+				if not params:
+					continue
+				sets = ', '.join(f"{k} = :{k}" for k in params)
+				params['requestid'] = requestid
+				cur = conn.execute(f"UPDATE tasks SET {sets} WHERE requestid = :requestid", params)
+				if cur.rowcount:
+					summary['updated'] += 1
+				else:
+					summary['missing'].append(requestid)
+	return summary
+
+
 def delete_task(requestid: str, db_path: Path = DB_PATH) -> int:
 	sql = "DELETE FROM tasks WHERE requestid = ?"
 	with get_connection(db_path) as conn:
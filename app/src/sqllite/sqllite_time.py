@@ -0,0 +1,79 @@
+import time
+from datetime import datetime
+from typing import Any, Optional
+
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Values below this are taken as epoch seconds, above as milliseconds (1973-03-03 in ms)
+_MS_THRESHOLD = 100_000_000_000
+
+# SQL expression for "now" in epoch milliseconds (column defaults)
+SQL_NOW_MS = "(CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER))"
+
+
+def now_ms() -> int:
+	"""Current time in epoch milliseconds."""
+	return int(time.time() * 1000)
+
+
+def to_epoch_ms(value: Any) -> Optional[int]:
+	"""Normalise a timestamp to epoch milliseconds.
+
+	Accepts None/'' (-> None), epoch seconds or milliseconds (int, float or
+	digit string), datetime objects and local-time strings in
+	'YYYY-MM-DD HH:MM:SS' or ISO format. Raises ValueError for anything else.
+	"""
+	if value is None or value == '':
+		return None
+	if isinstance(value, bool):
+		raise ValueError(f"invalid timestamp: {value!r}")
+	if isinstance(value, datetime):
+		return int(value.timestamp() * 1000)
+	if isinstance(value, str):
+		text = value.strip()
+		try:
+			value = float(text)
+		except ValueError:
+			try:
+				parsed = datetime.strptime(text, TIME_FORMAT)
+			except ValueError:
+				parsed = datetime.fromisoformat(text)
+			return int(parsed.timestamp() * 1000)
+	if isinstance(value, (int, float)):
+		return int(value if abs(value) >= _MS_THRESHOLD else value * 1000)
+	raise ValueError(f"invalid timestamp: {value!r}")
+
+
+def format_ms(ms: Optional[int]) -> Optional[str]:
+	"""Epoch milliseconds -> local 'YYYY-MM-DD HH:MM:SS' (None stays None)."""
+	if ms is None:
+		return None
+	return datetime.fromtimestamp(ms / 1000).strftime(TIME_FORMAT)
+
+
+def to_int(value: Any) -> Optional[int]:
+	"""Coerce numeric input (possibly a string such as '42' or '42.0') to int; None/'' -> None."""
+	if value is None or value == '':
+		return None
+	if isinstance(value, str):
+		value = float(value.strip())
+	return int(round(value))
+
+
+def to_percent(value: Any) -> Optional[int]:
+	"""Coerce a 0-100 percentage to an int clamped to that range; None/'' -> None."""
+	value = to_int(value)
+	if value is None:
+		return None
+	return max(0, min(100, value))
+
+
+def sql_text_to_ms(column: str) -> str:
+	"""SQL expression converting a legacy local-time text column to epoch ms (NULL if unparsable)."""
+	return f"CAST(strftime('%s', {column}, 'utc') AS INTEGER) * 1000"
+
+
+def sql_ms_to_text(column: str) -> str:
+	"""SQL expression formatting an epoch ms column as local 'YYYY-MM-DD HH:MM:SS'."""
+	return f"datetime({column} / 1000, 'unixepoch', 'localtime')"
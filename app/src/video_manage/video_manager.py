@@ -2,9 +2,10 @@
 视频管理模块
 用于存储和管理视频列表和上传进度
 """
-import threading
+import time
 from datetime import datetime
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
+from app.src.profiling import ProfiledLock
 
 class VideoListManager:
     """视频列表管理器，线程安全"""
@@ -12,7 +13,9 @@ class VideoListManager:
     def __init__(self):
         self._video_lists: Dict[str, dict] = {}  # key: request_id, value: video_list_data
         self._camera_videos: Dict[str, dict] = {}  # key: camera_id, value: latest video list
-        self._lock = threading.Lock()
+        # key: camera_id, value: (变化计数, 最后修改时间戳)，用于条件GET
+        self._camera_versions: Dict[str, Tuple[int, float]] = {}
+        self._lock = ProfiledLock('video_list_manager')
     
     def store_video_list(self, request_id: str, camera_id: str, videos: list):
         """
@@ -32,6 +35,8 @@ class VideoListManager:
             }
             self._video_lists[request_id] = data
             self._camera_videos[camera_id] = data
+            version, _ = self._camera_versions.get(camera_id, (0, 0.0))
+            self._camera_versions[camera_id] = (version + 1, time.time())
     
     def get_video_list(self, request_id: str) -> Optional[dict]:
         """
@@ -59,6 +64,15 @@ class VideoListManager:
         with self._lock:
             return self._camera_videos.get(camera_id, None)
 
+    def get_camera_latest_videos_versioned(self, camera_id: str) -> Tuple[Optional[dict], int, float]:
+        """
+        同一次加锁内返回 (最新视频列表, 变化计数, 最后修改时间戳)，保证列表与条件GET的版本号对应；
+        没有数据时为 (None, 0, 0.0)
+        """
+        with self._lock:
+            version, modified_at = self._camera_versions.get(camera_id, (0, 0.0))
+            return self._camera_videos.get(camera_id, None), version, modified_at
+
 
 class UploadProgressManager:
     """上传进度管理器，线程安全"""
@@ -70,7 +84,7 @@ class UploadProgressManager:
         # 存储历史上传任务记录
         # key: request_id, value: {camera_id, file_list, status, ...}
         self._upload_tasks: Dict[str, dict] = {}
-        self._lock = threading.Lock()
+        self._lock = ProfiledLock('upload_progress_manager')
     
     def create_upload_task(self, request_id: str, camera_id: str, file_name_list: list, success: bool):
         """
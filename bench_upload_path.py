@@ -0,0 +1,146 @@
+"""
+上传链路基准测试
+在本地启动OSS替身服务和Flask接口，模拟大量设备并发执行分片上传：
+getMulUploadUrls → 分片PUT → confirmCmplMulUpload
+
+用法:
+    python bench_upload_path.py --uploads 200 --concurrency 32 --parts 4 --part-size 262144
+"""
+import sys
+import os
+import math
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+from flask import Flask
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+from app.src.oss.local_oss import LocalOssServer
+
+
+def percentile(values, pct):
+    """计算百分位数（最近秩法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """不打印每个请求的访问日志"""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def start_api_server():
+    """只注册路由蓝图启动Flask，不启动MQTT监听器"""
+    from app.routes import main
+
+    app = Flask('camlink-bench')
+    app.register_blueprint(main)
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def run_upload(api_base, index, parts, payload, local):
+    """执行一次完整的分片上传，返回各阶段耗时（秒）"""
+    session = getattr(local, 'session', None)
+    if session is None:
+        session = local.session = requests.Session()
+
+    client_id = f"CAM-BENCH{index % 1000:04d}"
+    file_name = f"bench_{index}.mp4"
+    timings = {}
+
+    start = time.perf_counter()
+    resp = session.post(f"{api_base}/v1/devices/getMulUploadUrls", json={
+        'client_id': client_id,
+        'fileName': file_name,
+        'partNumber': parts
+    })
+    resp.raise_for_status()
+    data = resp.json()['data']
+    timings['get_urls'] = time.perf_counter() - start
+
+    etag_list = []
+    part_start = time.perf_counter()
+    for part in data['presignUrls']:
+        put = session.put(part['uploadUrl'], data=payload)
+        put.raise_for_status()
+        etag_list.append({'partNumber': part['partNumber'], 'etag': put.headers.get('ETag')})
+    timings['parts'] = time.perf_counter() - part_start
+
+    confirm_start = time.perf_counter()
+    resp = session.post(f"{api_base}/v1/devices/confirmCmplMulUpload", json={
+        'client_id': client_id,
+        'fileName': file_name,
+        'uploadId': data['uploadId'],
+        'etagList': etag_list
+    })
+    resp.raise_for_status()
+    timings['confirm'] = time.perf_counter() - confirm_start
+    timings['total'] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CamLink 上传链路基准测试')
+    parser.add_argument('--uploads', type=int, default=200, help='模拟上传次数')
+    parser.add_argument('--concurrency', type=int, default=32, help='并发上传数')
+    parser.add_argument('--parts', type=int, default=4, help='每个文件的分片数')
+    parser.add_argument('--part-size', type=int, default=256 * 1024, help='每个分片大小（字节）')
+    args = parser.parse_args()
+
+    oss_server = LocalOssServer(keep_data=False).start()
+    os.environ['OSS_ENDPOINT'] = oss_server.endpoint
+    os.environ['OSS_USE_PATH_STYLE'] = 'true'
+    os.environ.setdefault('OSS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('OSS_ACCESS_KEY_SECRET', 'bench')
+
+    api_server, api_base = start_api_server()
+    payload = os.urandom(args.part_size)
+    local = threading.local()
+
+    print(f"OSS替身: {oss_server.endpoint}, API: {api_base}")
+    print(f"上传次数: {args.uploads}, 并发: {args.concurrency}, 分片: {args.parts} x {args.part_size} 字节")
+
+    results = []
+    errors = 0
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [
+            pool.submit(run_upload, api_base, i, args.parts, payload, local)
+            for i in range(args.uploads)
+        ]
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                errors += 1
+                print(f"❌ 上传失败: {e}")
+    wall = time.perf_counter() - wall_start
+
+    api_server.shutdown()
+    oss_server.stop()
+
+    total_bytes = len(results) * args.parts * args.part_size
+    print("-" * 72)
+    print(f"{'阶段':<12} {'p50 (ms)':>12} {'p99 (ms)':>12} {'max (ms)':>12}")
+    for stage in ('get_urls', 'parts', 'confirm', 'total'):
+        values = [r[stage] * 1000 for r in results]
+        print(f"{stage:<12} {percentile(values, 50):>12.2f} {percentile(values, 99):>12.2f} "
+              f"{max(values) if values else 0:>12.2f}")
+    print("-" * 72)
+    print(f"完成: {len(results)}, 失败: {errors}, 耗时: {wall:.2f}s")
+    print(f"吞吐: {len(results) / wall:.1f} uploads/s, {total_bytes / wall / 1024 / 1024:.1f} MB/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,367 @@
+"""
+摄像头设备群压测
+在本地启动MQTT Broker替身、状态监听器和Flask接口，模拟 N 台虚拟摄像头：
+设备定期上报状态，HTTP接口按设定速率下发命令（start_record / stop_record / list_videos /
+upload_file / get_upload_status），虚拟设备经 Broker 回复，监听器处理响应并更新任务记录
+
+报告端到端吞吐、命令往返时延分位数（HTTP下发 -> 任务状态落库）、监听器各阶段耗时和进程资源占用
+
+用法:
+    python load_generator.py --cameras 10000 --duration 60 --command-rate 200 --state-interval 30
+    python load_generator.py --cameras 1000 --broker 127.0.0.1:1883      # 使用外部 Broker
+
+默认使用临时数据库（CAMLINK_DB），不影响 camlink.db；同一进程内的虚拟设备和 Broker 也计入资源占用
+"""
+import sys
+import os
+import math
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+from flask import Flask
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+# 命令类型 -> 默认权重
+DEFAULT_MIX = 'start_record=2,stop_record=2,list_videos=3,upload_file=1,get_upload_status=2'
+DEFAULT_MIX_ACTIONS = [item.split('=')[0] for item in DEFAULT_MIX.split(',')]
+
+
+def percentile(values, pct):
+    """计算百分位数（最近秩法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """不打印每个请求的访问日志"""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def parse_mix(text):
+    """'start_record=2,list_videos=1' -> ([命令], [权重])"""
+    actions, weights = [], []
+    for item in text.split(','):
+        action, _, weight = item.partition('=')
+        if float(weight or 1) > 0:
+            actions.append(action.strip())
+            weights.append(float(weight or 1))
+    unknown = set(actions) - set(DEFAULT_MIX_ACTIONS)
+    if unknown:
+        raise ValueError(f"不支持的命令: {', '.join(sorted(unknown))}")
+    return actions, weights
+
+
+def start_api_server():
+    """只注册路由蓝图启动Flask（监听器单独启动）"""
+    from app.routes import main
+
+    app = Flask('camlink-load')
+    app.register_blueprint(main)
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+class CommandTracker:
+    """记录已下发的命令，在任务状态变为 success / failed 并落库时计算往返时延"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}   # request_id -> (action, 发送时间)
+        self.completed = []  # (action, 往返秒数, state)
+
+    def sent(self, request_id, action, started):
+        with self._lock:
+            self._pending[request_id] = (action, started)
+
+    def on_task_events(self, events):
+        """task_writer 监听器"""
+        now = time.perf_counter()
+        with self._lock:
+            for event, _ in events:
+                if event[0] != 'update' or event[2].get('state') not in ('success', 'failed'):
+                    continue
+                entry = self._pending.pop(event[1], None)
+                if entry is not None:
+                    self.completed.append((entry[0], now - entry[1], event[2]['state']))
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+
+def send_command(session_local, api_base, fleet_camera, action, tracker, http_latencies, errors):
+    """通过HTTP接口下发一条命令"""
+    session = getattr(session_local, 'session', None)
+    if session is None:
+        session = session_local.session = requests.Session()
+    camera_id = fleet_camera.hardware_id
+    base = f"{api_base}/api/camera/{camera_id}"
+    if action == 'start_record':
+        url, body = f"{base}/record/start", {'pre_name': f"LOAD-{random.randint(100, 999)}"}
+    elif action == 'stop_record':
+        url, body = f"{base}/record/stop", {}
+    elif action == 'list_videos':
+        url, body = f"{base}/videos/list", {}
+    elif action == 'upload_file':
+        url, body = f"{base}/videos/upload", {'file_name_list': [fleet_camera.videos()[-1]['file_name']]}
+    else:
+        url, body = f"{base}/videos/upload/status", {'query_device': 'true'}
+
+    started = time.perf_counter()
+    try:
+        resp = session.post(url, json=body, timeout=30)
+        data = resp.json()
+    except (requests.RequestException, ValueError) as e:
+        errors.append(f"{action}: {e}")
+        return
+    http_latencies.append(time.perf_counter() - started)
+    if resp.status_code != 200 or not data.get('success'):
+        errors.append(f"{action}: HTTP {resp.status_code} {data.get('message')}")
+        return
+    tracker.sent(data['request_id'], action, started)
+
+
+def wait_listener_idle(pipeline_metrics, quiet=0.5, timeout=30):
+    """等待监听器处理完 socket 中积压的消息（入站计数在 quiet 秒内不再变化）"""
+    deadline = time.time() + timeout
+    last = None
+    while time.time() < deadline:
+        stats = pipeline_metrics.stats()
+        count = sum(stats['messages'].values()) + stats['unknown_client_messages']
+        if count == last:
+            return
+        last = count
+        time.sleep(quiet)
+
+
+def resource_usage():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        'cpu_user_s': usage.ru_utime,
+        'cpu_system_s': usage.ru_stime,
+        'max_rss_mb': round(usage.ru_maxrss / 1024, 1),  # Linux 上 ru_maxrss 单位为KB
+        'threads': threading.active_count()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CamLink 摄像头设备群压测')
+    parser.add_argument('--cameras', type=int, default=1000, help='虚拟摄像头数量')
+    parser.add_argument('--duration', type=float, default=30, help='下发命令的时长（秒）')
+    parser.add_argument('--command-rate', type=float, default=50, help='每秒下发的命令数（0 表示只上报状态）')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'命令比例（默认 {DEFAULT_MIX}）')
+    parser.add_argument('--state-interval', type=float, default=30, help='每台设备上报状态的间隔（秒，0 表示不上报）')
+    parser.add_argument('--response-delay-ms', default='5,50', help='设备回复延迟范围（毫秒），如 5,50')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='控制类命令回复失败的比例')
+    parser.add_argument('--hotels', type=int, default=50, help='设备分布的站点数')
+    parser.add_argument('--concurrency', type=int, default=32, help='并发HTTP请求数')
+    parser.add_argument('--drain', type=float, default=15, help='停止下发后等待未完成命令的时间（秒）')
+    parser.add_argument('--broker', help='外部 Broker host:port（默认启动进程内 Broker 替身）')
+    parser.add_argument('--db', help='数据库文件（默认使用临时文件，结束后删除）')
+    parser.add_argument('--seed', type=int, default=None, help='随机数种子')
+    parser.add_argument('--json', dest='json_path', help='把报告另存为JSON文件')
+    args = parser.parse_args()
+    actions, weights = parse_mix(args.mix)
+    low, _, high = args.response_delay_ms.partition(',')
+    response_delay = (float(low) / 1000, float(high or low) / 1000)
+
+    # 必须在导入任何 app 模块之前设置（数据库路径在导入时读取）
+    scratch_db = None
+    if args.db:
+        os.environ['CAMLINK_DB'] = os.path.abspath(args.db)
+    else:
+        fd, scratch_db = tempfile.mkstemp(prefix='camlink-load-', suffix='.db')
+        os.close(fd)
+        os.environ['CAMLINK_DB'] = scratch_db
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    broker = None
+    if args.broker:
+        host, _, port = args.broker.partition(':')
+        broker_host, broker_port = host, int(port or 1883)
+    else:
+        from app.src.mqtt.local_broker import LocalMqttBroker
+        broker = LocalMqttBroker().start()
+        broker_host, broker_port = broker.host, broker.port
+    os.environ['MQTT_BROKER_HOST'] = broker_host
+    os.environ['MQTT_BROKER_PORT'] = str(broker_port)
+
+    from app.src.logger import configure_logging, flush_logging
+    from app.src.sqllite import init_db, init_task_table
+    from app.src.mqtt.virtual_fleet import VirtualFleet
+    from app.src.monitor_cam import create_status_listener, pipeline_metrics
+    from app.src.record_control import task_writer
+
+    configure_logging()
+    init_db()
+    init_task_table()
+
+    print(f"数据库: {os.environ['CAMLINK_DB']}, Broker: {broker_host}:{broker_port}"
+          f"{'（进程内替身）' if broker else ''}")
+    build_start = time.perf_counter()
+    fleet = VirtualFleet(args.cameras, hotels=args.hotels, state_interval=args.state_interval,
+                         response_delay=response_delay, fail_rate=args.fail_rate, seed=args.seed)
+    build_seconds = time.perf_counter() - build_start
+    seed_start = time.perf_counter()
+    seeded = fleet.seed_devices()
+    seed_seconds = time.perf_counter() - seed_start
+    print(f"虚拟设备: {args.cameras} 台（构建 {build_seconds:.2f}s），登记设备表 {seeded} 用时 {seed_seconds:.2f}s")
+
+    if broker:
+        fleet.attach(broker)
+    elif not fleet.connect(broker_host, broker_port):
+        print(f"❌ 虚拟设备无法连接 Broker {broker_host}:{broker_port}")
+        return 1
+
+    tracker = CommandTracker()
+    task_writer.add_listener(tracker.on_task_events)
+    threading.Thread(target=create_status_listener, name='status-listener', daemon=True).start()
+    deadline = time.time() + 10
+    while not pipeline_metrics.stats()['connected'] and time.time() < deadline:
+        time.sleep(0.05)
+    if not pipeline_metrics.stats()['connected']:
+        print("❌ 状态监听器未能连接 Broker")
+        return 1
+    api_server, api_base = start_api_server()
+
+    stage_baseline = pipeline_metrics.stage_snapshot()
+    messages_baseline = pipeline_metrics.stats()['messages']
+    broker_baseline = broker.stats() if broker else None
+    usage_baseline = resource_usage()
+    fleet.start()
+    print(f"API: {api_base}, 命令速率: {args.command_rate}/s, 比例: {dict(zip(actions, weights))}, "
+          f"状态上报间隔: {args.state_interval}s, 持续: {args.duration}s")
+
+    rng = random.Random(args.seed)
+    cameras = list(fleet.cameras.values())
+    http_latencies, errors = [], []
+    session_local = threading.local()
+    wall_start = time.perf_counter()
+    sent = 0
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        # 开环下发：按固定速率排期，不等待前一条命令完成
+        while True:
+            elapsed = time.perf_counter() - wall_start
+            if elapsed >= args.duration:
+                break
+            due = int(elapsed * args.command_rate) + 1 - sent if args.command_rate > 0 else 0
+            for _ in range(max(0, due)):
+                action = rng.choices(actions, weights)[0]
+                pool.submit(send_command, session_local, api_base, rng.choice(cameras), action,
+                            tracker, http_latencies, errors)
+                sent += 1
+            time.sleep(0.005)
+    send_seconds = time.perf_counter() - wall_start
+
+    drain_deadline = time.time() + args.drain
+    while tracker.pending() and time.time() < drain_deadline:
+        time.sleep(0.1)
+    fleet.stop()
+    wait_listener_idle(pipeline_metrics)
+    task_writer.flush()
+    wall = time.perf_counter() - wall_start
+
+    usage = resource_usage()
+    messages = pipeline_metrics.stats()['messages']
+    inbound = {t: messages[t] - messages_baseline.get(t, 0) for t in messages}
+    cpu_seconds = (usage['cpu_user_s'] - usage_baseline['cpu_user_s']) + (usage['cpu_system_s'] - usage_baseline['cpu_system_s'])
+    completed = tracker.completed
+    report = {
+        'config': {k: v for k, v in vars(args).items() if k != 'json_path'},
+        'seed': {'devices': args.cameras, 'seconds': round(seed_seconds, 3),
+                 'rows_per_second': round(args.cameras / seed_seconds, 1) if seed_seconds else None},
+        'commands': {
+            'sent': sent,
+            'accepted': len(http_latencies) - sum(1 for e in errors if 'HTTP' in e),
+            'completed': len(completed),
+            'device_failed': sum(1 for c in completed if c[2] == 'failed'),
+            'http_errors': len(errors),
+            'timed_out': tracker.pending(),
+            'completed_per_second': round(len(completed) / wall, 2)
+        },
+        'round_trip_ms': {},
+        'http_submit_ms': {
+            'p50': round(percentile(http_latencies, 50) * 1000, 2),
+            'p99': round(percentile(http_latencies, 99) * 1000, 2),
+            'max': round(max(http_latencies) * 1000, 2) if http_latencies else 0.0
+        },
+        'mqtt_inbound': {'messages': inbound, 'per_second': round(sum(inbound.values()) / wall, 1)},
+        'listener_stages': pipeline_metrics.stage_stats(since=stage_baseline),
+        'fleet': fleet.stats(),
+        'resources': {
+            'wall_s': round(wall, 2),
+            'cpu_s': round(cpu_seconds, 2),
+            'cpu_percent': round(cpu_seconds / wall * 100, 1),
+            'max_rss_mb': usage['max_rss_mb'],
+            'threads': usage['threads'],
+            'db_mb': round(os.path.getsize(os.environ['CAMLINK_DB']) / 1024 / 1024, 2)
+        }
+    }
+    if broker:
+        stats = broker.stats()
+        report['broker'] = {k: stats[k] - broker_baseline.get(k, 0) if k not in ('clients',) else stats[k] for k in stats}
+    for action in actions + ['total']:
+        values = [c[1] * 1000 for c in completed if action == 'total' or c[0] == action]
+        report['round_trip_ms'][action] = {
+            'count': len(values),
+            'p50': round(percentile(values, 50), 2),
+            'p90': round(percentile(values, 90), 2),
+            'p99': round(percentile(values, 99), 2),
+            'max': round(max(values), 2) if values else 0.0
+        }
+
+    c = report['commands']
+    print("-" * 72)
+    print(f"命令: 下发 {c['sent']}, 完成 {c['completed']}（设备失败 {c['device_failed']}）, "
+          f"HTTP错误 {c['http_errors']}, 超时未完成 {c['timed_out']}；下发 {send_seconds:.1f}s, 总计 {wall:.1f}s")
+    print(f"{'往返时延':<18} {'count':>7} {'p50 (ms)':>10} {'p90 (ms)':>10} {'p99 (ms)':>10} {'max (ms)':>10}")
+    for action, s in report['round_trip_ms'].items():
+        print(f"{action:<22} {s['count']:>7} {s['p50']:>10.2f} {s['p90']:>10.2f} {s['p99']:>10.2f} {s['max']:>10.2f}")
+    h = report['http_submit_ms']
+    print(f"HTTP下发: p50 {h['p50']}ms, p99 {h['p99']}ms, max {h['max']}ms")
+    print("-" * 72)
+    print(f"{'监听器阶段':<17} {'count':>8} {'avg (ms)':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    for stage, s in report['listener_stages'].items():
+        print(f"{stage:<22} {s['count']:>8} {s['avg_ms']:>10.3f} {s['p50_ms']:>10.3f} {s['p99_ms']:>10.3f}")
+    print("-" * 72)
+    print(f"吞吐: 命令 {c['completed_per_second']}/s, MQTT入站 {report['mqtt_inbound']['per_second']} msg/s "
+          f"{report['mqtt_inbound']['messages']}")
+    if broker:
+        print(f"Broker: {report['broker']}")
+    r = report['resources']
+    print(f"资源: CPU {r['cpu_s']}s（{r['cpu_percent']}% 单核）, 最大RSS {r['max_rss_mb']} MB, "
+          f"线程 {r['threads']}, 数据库 {r['db_mb']} MB")
+    for error in errors[:5]:
+        print(f"❌ {error}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已保存: {args.json_path}")
+    api_server.shutdown()
+    if broker:
+        broker.stop()
+    flush_logging()
+    if scratch_db:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(scratch_db + suffix):
+                os.remove(scratch_db + suffix)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+MQTT入站流量回放
+把状态监听器抓取的流量（MQTT_CAPTURE_DIR 或 /api/admin/capture/start 生成的 .camcap 文件）
+不经 Broker 直接交给监听器的 handle_message 处理，按原速、N倍速或最快速度回放，
+报告处理吞吐、排期延迟和监听器各阶段耗时，作为入站链路改动的可复现基准
+
+用法:
+    python replay_capture.py captures/                      # 按原速回放目录下全部分段
+    python replay_capture.py captures/ --speed 10           # 10倍速
+    python replay_capture.py captures/ --max --repeat 3     # 最快速度回放3遍
+    python replay_capture.py capture.camcap --db camlink.db --max --json replay.json
+
+默认使用临时数据库，并为抓包中出现但设备表中没有的 client_id 登记设备；
+--db 指定的数据库会先复制到临时文件再回放，不修改原文件
+"""
+import sys
+import os
+import math
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    """计算百分位数（最近秩法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def seed_missing_devices(records):
+    """为抓包中出现但设备表中没有的 client_id 登记设备（hardware_id 为 REPLAY-<client_id>）"""
+    from app.src.monitor_cam.status_listener import TOPIC_PATTERN
+    from app.src.sqllite import get_device_by_client_id, upsert_devices
+
+    client_ids = set()
+    for _, topic, _ in records:
+        match = TOPIC_PATTERN.match(topic)
+        if match:
+            client_ids.add(match.group(1))
+    rows = [{
+        'hardware_id': f'REPLAY-{client_id}',
+        'client_id': client_id,
+        'hotel': 'Replay',
+        'location': 'Replay'
+    } for client_id in sorted(client_ids) if not get_device_by_client_id(client_id)]
+    if rows:
+        upsert_devices(rows)
+    return len(client_ids), len(rows)
+
+
+def replay(records, handle_message, speed=1.0, repeat=1):
+    """
+    按接收时间间隔回放记录
+
+    Args:
+        records: [(接收时间, 主题, 内容)]，按接收时间排序
+        handle_message: 消息处理函数 (topic, payload)
+        speed: 回放倍速，0 表示不等待、最快速度回放
+        repeat: 回放遍数
+
+    Returns:
+        (处理条数, 用时秒数, 排期延迟列表（秒，仅按倍速回放时记录）)
+    """
+    lags = []
+    count = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        if not records:
+            break
+        first = records[0][0]
+        pass_start = time.perf_counter()
+        for received_at, topic, payload in records:
+            if speed > 0:
+                due = pass_start + (received_at - first) / speed
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                lags.append(max(0.0, time.perf_counter() - due))
+            handle_message(topic, payload)
+            count += 1
+    return count, time.perf_counter() - start, lags
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CamLink MQTT入站流量回放')
+    parser.add_argument('capture', help='抓包文件或目录')
+    parser.add_argument('--speed', type=float, default=1.0, help='回放倍速（默认1，即原速；0 表示最快速度）')
+    parser.add_argument('--max', action='store_true', help='最快速度回放（等同 --speed 0）')
+    parser.add_argument('--repeat', type=int, default=1, help='回放遍数')
+    parser.add_argument('--limit', type=int, default=0, help='只回放前 N 条消息（0 表示全部）')
+    parser.add_argument('--db', help='回放前复制的数据库文件（默认使用空的临时数据库）')
+    parser.add_argument('--no-seed', action='store_true', help='不为抓包中的未知 client_id 登记设备')
+    parser.add_argument('--json', dest='json_path', help='把报告另存为JSON文件')
+    args = parser.parse_args()
+    speed = 0.0 if args.max else max(args.speed, 0.0)
+
+    # 必须在导入任何 app 模块之前设置（数据库路径在导入时读取）
+    fd, scratch_db = tempfile.mkstemp(prefix='camlink-replay-', suffix='.db')
+    os.close(fd)
+    if args.db:
+        shutil.copyfile(args.db, scratch_db)
+    os.environ['CAMLINK_DB'] = scratch_db
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    from app.src.logger import configure_logging, flush_logging
+    from app.src.sqllite import init_db, init_task_table
+    from app.src.monitor_cam import handle_message, pipeline_metrics, read_capture
+    from app.src.monitor_cam.pipeline_metrics import mqtt_errors_total
+    from app.src.record_control import task_writer
+
+    configure_logging()
+    init_db()
+    init_task_table()
+
+    try:
+        load_start = time.perf_counter()
+        records = list(read_capture(args.capture))
+        if args.limit:
+            records = records[:args.limit]
+        records.sort(key=lambda r: r[0])
+        load_seconds = time.perf_counter() - load_start
+        if not records:
+            print(f"❌ 抓包中没有消息: {args.capture}")
+            return 1
+        span = records[-1][0] - records[0][0]
+        payload_bytes = sum(len(r[2]) for r in records)
+        print(f"抓包: {len(records)} 条消息, {payload_bytes / 1024:.1f} KB, 时长 {span:.1f}s（读取 {load_seconds:.2f}s）")
+        if not args.no_seed:
+            clients, seeded = seed_missing_devices(records)
+            print(f"设备: 抓包中 {clients} 个 client_id，新登记 {seeded} 台")
+
+        stage_baseline = pipeline_metrics.stage_snapshot()
+        stats_baseline = pipeline_metrics.stats()
+        error_reasons = ('invalid_topic', 'decode', 'handler')
+        errors_baseline = {reason: mqtt_errors_total.value(reason) for reason in error_reasons}
+        cpu_start = cpu_seconds()
+        print(f"回放: {'最快速度' if speed == 0 else f'{speed:g}x'}, {args.repeat} 遍")
+        count, elapsed, lags = replay(records, handle_message, speed, args.repeat)
+        # 回放计时只包含监听器线程的处理；任务写入器的批量落库另计
+        flush_start = time.perf_counter()
+        task_writer.flush()
+        flush_seconds = time.perf_counter() - flush_start
+        cpu = cpu_seconds() - cpu_start
+
+        stats = pipeline_metrics.stats()
+        report = {
+            'config': {k: v for k, v in vars(args).items() if k != 'json_path'},
+            'capture': {'messages': len(records), 'payload_kb': round(payload_bytes / 1024, 1),
+                        'span_s': round(span, 3)},
+            'replay': {
+                'messages': count,
+                'seconds': round(elapsed, 3),
+                'messages_per_second': round(count / elapsed, 1) if elapsed else None,
+                'task_flush_s': round(flush_seconds, 3),
+                'cpu_s': round(cpu, 3)
+            },
+            'messages': {t: stats['messages'][t] - stats_baseline['messages'].get(t, 0) for t in stats['messages']},
+            'unknown_client_messages': stats['unknown_client_messages'] - stats_baseline['unknown_client_messages'],
+            'errors': {reason: mqtt_errors_total.value(reason) - errors_baseline[reason] for reason in error_reasons
+                       if mqtt_errors_total.value(reason) - errors_baseline[reason]},
+            'listener_stages': pipeline_metrics.stage_stats(since=stage_baseline)
+        }
+        if lags:
+            report['schedule_lag_ms'] = {
+                'p50': round(percentile(lags, 50) * 1000, 2),
+                'p99': round(percentile(lags, 99) * 1000, 2),
+                'max': round(max(lags) * 1000, 2)
+            }
+
+        r = report['replay']
+        print("-" * 72)
+        print(f"处理: {r['messages']} 条, 用时 {r['seconds']}s, {r['messages_per_second']} msg/s, "
+              f"CPU {r['cpu_s']}s, 任务落库 {r['task_flush_s']}s")
+        print(f"消息类型: {report['messages']}, 未知设备: {report['unknown_client_messages']}, "
+              f"错误: {report['errors'] or 0}")
+        if lags:
+            s = report['schedule_lag_ms']
+            print(f"排期延迟: p50 {s['p50']}ms, p99 {s['p99']}ms, max {s['max']}ms")
+        print("-" * 72)
+        print(f"{'监听器阶段':<17} {'count':>8} {'avg (ms)':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+        for stage, s in report['listener_stages'].items():
+            print(f"{stage:<22} {s['count']:>8} {s['avg_ms']:>10.3f} {s['p50_ms']:>10.3f} {s['p99_ms']:>10.3f}")
+
+        if args.json_path:
+            with open(args.json_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"报告已保存: {args.json_path}")
+        return 0
+    finally:
+        flush_logging()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(scratch_db + suffix):
+                os.remove(scratch_db + suffix)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+测试设备批量开通
+验证CSV/JSON清单解析、整批校验、一次事务写入以及NDJSON/ZIP输出
+"""
+import sys
+import os
+import io
+import json
+import zipfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from app.routes import main
+from app.src.sqllite import init_db, get_device, delete_device
+from app.src.provisioning import make_client_id
+
+
+def _client():
+    app = Flask(__name__)
+    app.register_blueprint(main)
+    return app.test_client()
+
+
+def test_bulk_provision():
+    """CSV开通新设备，重复提交时已存在的设备保持不变，force 时覆盖"""
+    print("=" * 60)
+    print("🧪 测试设备批量开通")
+    print("=" * 60)
+
+    init_db()
+    client = _client()
+    ids = [f'HW-BULK-TEST-{i:03d}' for i in range(20)]
+    for hardware_id in ids:
+        delete_device(hardware_id)
+
+    try:
+        csv_body = 'hardware_id,location,wifi\n' + '\n'.join(f'{h},房间{i},Hotel-IoT' for i, h in enumerate(ids[:15]))
+        resp = client.post('/api/devices/provision/bulk?hotel_name=批量测试酒店&wifi_password=secret',
+                           data=csv_body, content_type='text/csv')
+        assert resp.status_code == 200, resp.data
+        lines = [json.loads(line) for line in resp.data.decode('utf-8').splitlines()]
+        print(f"   汇总: {lines[-1]}")
+        assert lines[-1]['summary'] == {'total': 15, 'created': 15, 'updated': 0, 'exists': 0}
+        first = lines[0]
+        assert first['client_id'] == make_client_id(ids[0])
+        assert first['config']['wifi'] == {'ssid': 'Hotel-IoT', 'password': 'secret'}
+        assert get_device(ids[3])['hotel'] == '批量测试酒店'
+
+        # JSON + ZIP：前15台已存在（不覆盖），后5台新建
+        devices = [{'hardware_id': h, 'hotel_name': '新酒店'} for h in ids]
+        resp = client.post('/api/devices/provision/bulk?format=zip', json={'devices': devices})
+        assert resp.status_code == 200
+        with zipfile.ZipFile(io.BytesIO(resp.data)) as zf:
+            summary = json.loads(zf.read('summary.json'))
+            assert summary['summary'] == {'total': 20, 'created': 5, 'updated': 0, 'exists': 15}
+            config = json.loads(zf.read(f'configs/{ids[19]}.json'))
+            assert config['client_id'] == make_client_id(ids[19])
+        assert get_device(ids[3])['hotel'] == '批量测试酒店'
+
+        # force 时用非空字段覆盖，未提供的字段保留
+        resp = client.post('/api/devices/provision/bulk?force=true', json=devices[:2])
+        assert json.loads(resp.data.decode('utf-8').splitlines()[-1])['summary']['updated'] == 2
+        device = get_device(ids[0])
+        assert device['hotel'] == '新酒店' and device['location'] == '房间0'
+
+        # 任何一行校验失败时整批不写入
+        resp = client.post('/api/devices/provision/bulk',
+                           json=[{'hardware_id': 'HW-BULK-TEST-900'}, {'hardware_id': 'HW-BULK-TEST-900'}, {}])
+        assert resp.status_code == 400
+        assert [e['index'] for e in resp.get_json()['errors']] == [1, 2]
+        assert get_device('HW-BULK-TEST-900') is None
+    finally:
+        for hardware_id in ids:
+            delete_device(hardware_id)
+
+    print("✅ 批量开通测试通过")
+
+
+if __name__ == '__main__':
+    test_bulk_provision()
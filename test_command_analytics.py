@@ -0,0 +1,58 @@
+"""
+测试命令时延分析
+验证增量统计的分位数、失败率、超时和迟到响应
+"""
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.src.record_control import CommandAnalytics
+
+
+def test_command_analytics():
+    """模拟一批命令事件，检查各维度汇总和趋势"""
+    print("=" * 60)
+    print("🧪 测试命令时延分析")
+    print("=" * 60)
+
+    analytics = CommandAnalytics(timeout_seconds=30)
+    t0 = time.time() - 300
+    events = []
+    # 100 条 start_record: 90 条 200ms 内成功，10 条 5s 后失败
+    for i in range(100):
+        rid = f'req_analytics_{i}'
+        events.append((('create', {'requestid': rid, 'clientid': 'CAM-ANALYTICS', 'requesttype': 'start_record'}), t0 + i))
+        if i < 90:
+            events.append((('update', rid, {'state': 'success'}), t0 + i + 0.15))
+        else:
+            events.append((('update', rid, {'state': 'failed'}), t0 + i + 5))
+    # 一条 list_videos 一直没有响应
+    events.append((('create', {'requestid': 'req_analytics_slow', 'clientid': 'CAM-ANALYTICS', 'requesttype': 'list_videos'}), t0))
+    analytics.on_task_events(events)
+
+    analytics.sweep(now=t0 + 200)
+    rows = {r['key']: r for r in analytics.summary('requesttype')}
+    print(f"   start_record: {rows['start_record']}")
+    start = rows['start_record']
+    assert (start['count'], start['failed'], start['timeouts']) == (100, 10, 0)
+    assert start['failure_rate'] == 0.1
+    assert 100 <= start['p50_ms'] <= 200 and 3000 <= start['p99_ms'] <= 5000
+    assert rows['list_videos']['timeouts'] == 1 and rows['list_videos']['timeout_rate'] == 1.0
+    assert analytics.inflight_count() == 0
+
+    # 超时后才到达的响应计入时延，但不重复计数
+    analytics.on_complete('req_analytics_slow', True, t0 + 45)
+    slow = {r['key']: r for r in analytics.summary('requesttype')}['list_videos']
+    assert (slow['count'], slow['late'], slow['timeouts'], slow['timeout_rate']) == (1, 1, 1, 1.0)
+
+    camera = analytics.summary('camera')[0]
+    assert camera['key'] == 'CAM-ANALYTICS' and camera['count'] == 101
+    trend = analytics.trend('requesttype', 'start_record')
+    assert sum(b['count'] for b in trend) == 100
+
+    print("\n✅ 命令时延分析测试完成！")
+
+
+if __name__ == '__main__':
+    test_command_analytics()
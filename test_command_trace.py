@@ -0,0 +1,93 @@
+"""
+测试命令链路追踪
+模拟一条命令的完整生命周期（HTTP -> 发布/PUBACK -> 设备响应 -> 落库 -> 客户端取回），
+验证 /api/trace/<request_id> 的阶段和耗时拆分，以及完成后写入追踪文件
+"""
+import sys
+import os
+import json
+import time
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from app.routes import main
+from app.src.sqllite import init_task_table, delete_task
+from app.src.record_control import (
+    CommandTracer, command_tracer, task_writer, command_response_manager,
+    create_command_task, update_command_task_success
+)
+
+
+def test_command_trace():
+    print("=" * 60)
+    print("🧪 测试命令链路追踪")
+    print("=" * 60)
+    init_task_table()
+    app = Flask(__name__)
+    app.register_blueprint(main)
+    client = app.test_client()
+
+    export_path = os.path.join(tempfile.mkdtemp(), 'traces.jsonl')
+    command_tracer.export_path = export_path
+    request_id = f'req_trace_{int(time.time() * 1000)}'
+    try:
+        t0 = time.time()
+        command_tracer.span(request_id, 'http', t0, t0 + 0.01, camera_id='HW-TRACE-001')
+        # PUBACK 先于 publish_started 到达时同样能配对
+        command_tracer.on_puback(9001)
+        command_tracer.publish_started(request_id, 9001, t0, camera_id='HW-TRACE-001')
+        create_command_task('CAM-TRACE', request_id, 'start_record')
+
+        received = time.time()
+        command_response_manager.store_response(request_id, 'HW-TRACE-001', {'request_id': request_id, 'result': 'success'})
+        update_command_task_success(request_id)
+        command_tracer.span(request_id, 'response', received, time.time(), camera_id='HW-TRACE-001')
+        assert task_writer.flush()
+        # 监听器在落库通知之后调用，稍等追踪记录到 task_update
+        deadline = time.time() + 2
+        while time.time() < deadline and 'task_update' not in [s['name'] for s in command_tracer.get_trace(request_id)['spans']]:
+            time.sleep(0.01)
+
+        # 客户端轮询多次只保留一个 client_retrieval 阶段
+        for _ in range(3):
+            assert client.get(f'/api/command/response/{request_id}').status_code == 200
+
+        response = client.get(f'/api/trace/{request_id}')
+        assert response.status_code == 200
+        trace = response.get_json()
+        names = [s['name'] for s in trace['spans']]
+        for name in ('http', 'publish', 'task_create', 'response', 'task_update', 'client_retrieval'):
+            assert name in names, names
+        assert names.count('client_retrieval') == 1
+        retrieval = next(s for s in trace['spans'] if s['name'] == 'client_retrieval')
+        assert retrieval['count'] == 3 and retrieval['last_offset_ms'] >= retrieval['offset_ms']
+        assert trace['camera_id'] == 'HW-TRACE-001'
+        assert trace['spans'][0]['offset_ms'] == 0.0
+        for key in ('server_dispatch', 'broker_ack', 'device_round_trip', 'db_commit', 'client_wait', 'total'):
+            assert key in trace['breakdown'], trace['breakdown']
+        print(f"   ✅ 阶段: {names}")
+        print(f"   ✅ 耗时拆分: {trace['breakdown']}")
+
+        deadline = time.time() + 2
+        while time.time() < deadline and not (os.path.exists(export_path) and os.path.getsize(export_path)):
+            time.sleep(0.01)
+        with open(export_path, encoding='utf-8') as f:
+            exported = [json.loads(line) for line in f]
+        assert [e['request_id'] for e in exported] == [request_id]
+
+        assert client.get('/api/trace/req_not_exists').status_code == 404
+
+        # 超出容量时淘汰最早的命令
+        small = CommandTracer(max_traces=2)
+        for i in range(3):
+            small.span(f'r{i}', 'http', t0)
+        assert small.get_trace('r0') is None and small.get_trace('r2') is not None
+    finally:
+        command_tracer.export_path = None
+        delete_task(request_id)
+    print("✅ 命令链路追踪测试通过")
+
+
+if __name__ == '__main__':
+    test_command_trace()
@@ -0,0 +1,83 @@
+"""
+测试条件GET
+验证轮询接口返回 ETag / Last-Modified，数据未变化时返回 304，变化后返回新内容
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from app.routes import main
+from app.src.sqllite import init_db, init_task_table, insert_device, delete_device, delete_task
+from app.src.monitor_cam import device_status_manager
+from app.src.video_manage import video_list_manager
+from app.src.record_control import task_writer
+
+
+def _client():
+    app = Flask(__name__)
+    app.register_blueprint(main)
+    return app.test_client()
+
+
+def _assert_revalidates(client, url, change):
+    """首次200 -> 带ETag重复请求304 -> 数据变化后200且ETag不同"""
+    first = client.get(url)
+    assert first.status_code == 200, first.data
+    etag = first.headers['ETag']
+    assert first.headers['Last-Modified']
+
+    cached = client.get(url, headers={'If-None-Match': etag})
+    assert cached.status_code == 304 and cached.data == b''
+    assert cached.headers['ETag'] == etag
+
+    cached = client.get(url, headers={'If-Modified-Since': first.headers['Last-Modified']})
+    assert cached.status_code == 304
+
+    change()
+    fresh = client.get(url, headers={'If-None-Match': etag})
+    assert fresh.status_code == 200
+    assert fresh.headers['ETag'] != etag
+    print(f"   ✅ {url}: {etag} -> {fresh.headers['ETag']}")
+
+
+def test_conditional_get():
+    """四个轮询接口都支持基于版本号的条件GET"""
+    print("=" * 60)
+    print("🧪 测试条件GET")
+    print("=" * 60)
+
+    init_db()
+    init_task_table()
+    client = _client()
+    camera_id = 'HW-ETAG-TEST-001'
+    delete_device(camera_id)
+    insert_device({'hardware_id': camera_id, 'client_id': 'CAM-ETAG-TEST', 'hotel': 'ETag测试酒店'})
+    device_status_manager.update_status(camera_id, {'status': 'online', 'electric_percent': 0.5})
+    video_list_manager.store_video_list('req-etag-1', camera_id, [])
+
+    try:
+        _assert_revalidates(client, '/api/camera/status/all',
+                            lambda: device_status_manager.update_status(camera_id, {'status': 'offline'}))
+        _assert_revalidates(client, '/api/camera/status/list?hotel=ETag测试酒店',
+                            lambda: device_status_manager.update_status(camera_id, {'status': 'online'}))
+        _assert_revalidates(client, f'/api/camera/{camera_id}/videos/latest',
+                            lambda: video_list_manager.store_video_list('req-etag-2', camera_id, [{'file_name': 'a.mp4'}]))
+        # 列表与版本号在同一次加锁内读取
+        video_list, version, _ = video_list_manager.get_camera_latest_videos_versioned(camera_id)
+        assert video_list['videos'] == [{'file_name': 'a.mp4'}] and version == 2
+        missing = client.get('/api/camera/HW-ETAG-NO-VIDEOS/videos/latest')
+        assert missing.status_code == 404 and 'ETag' not in missing.headers
+        _assert_revalidates(client, f'/api/camera/{camera_id}/tasks',
+                            lambda: task_writer.create({'clientid': 'CAM-ETAG-TEST', 'requestid': 'req-etag-task',
+                                                        'requesttype': 'start_record', 'state': 'calling'}))
+    finally:
+        task_writer.flush()
+        delete_task('req-etag-task')
+        delete_device(camera_id)
+
+    print("✅ 条件GET测试通过")
+
+
+if __name__ == '__main__':
+    test_conditional_get()
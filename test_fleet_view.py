@@ -0,0 +1,96 @@
+"""
+测试设备列表物化视图
+验证设备表写入和实时状态变化后，增量维护的视图与“查询数据库 + 逐个合并”的结果一致
+"""
+import sys
+import os
+import json
+import importlib
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.src.sqllite import init_db, insert_device, update_device, delete_device, upsert_devices, list_devices
+from app.src.monitor_cam import device_status_manager, fleet_view
+from app.src.monitor_cam.fleet_view import convert_device_to_api_format, merge_live_status
+
+fleet_view_module = importlib.import_module('app.src.monitor_cam.fleet_view')
+
+
+def _expected(hotel=None):
+    """按原来的方式从数据库读取并合并实时状态"""
+    live = device_status_manager.get_all_statuses()
+    rows = list_devices(limit=100000, hotel=hotel)
+    return [merge_live_status(convert_device_to_api_format(r), live.get(r['hardware_id'])) for r in rows]
+
+
+def test_fleet_view_incremental():
+    """插入、批量写入、更新、实时状态和删除后视图均与全量结果一致"""
+    print("=" * 60)
+    print("🧪 测试设备列表物化视图")
+    print("=" * 60)
+
+    init_db()
+    hotel = '视图测试酒店'
+    ids = [f'HW-VIEW-TEST-{i:02d}' for i in range(6)]
+    for hardware_id in ids:
+        delete_device(hardware_id)
+    fleet_view.load()
+
+    try:
+        insert_device({'hardware_id': ids[0], 'hotel': hotel, 'status': '在线', 'electric_percent': 50})
+        upsert_devices([{'hardware_id': h, 'hotel': hotel, 'status': '离线'} for h in ids[1:]])
+        update_device(ids[1], {'location': '1201', 'last_online': '2026-01-01 08:00:00'})
+        device_status_manager.update_status(ids[2], {'status': 'online', 'electric_percent': 0.9})
+        delete_device(ids[5])
+
+        page, cursor = fleet_view.page(limit=100, hotel=hotel)
+        print(f"   视图: {[(d['camera_id'], d['status']) for d in page]}")
+        assert page == _expected(hotel)
+        assert [d['camera_id'] for d in page] == ids[4::-1]
+        assert cursor is None
+
+        # 过滤作用于合并实时状态后的状态
+        online, _ = fleet_view.page(limit=100, hotel=hotel, status='online')
+        assert [d['camera_id'] for d in online] == [ids[2], ids[0]]
+
+        # 游标翻页
+        first, cursor = fleet_view.page(limit=2, hotel=hotel)
+        second, _ = fleet_view.page(limit=2, hotel=hotel, before_id=cursor)
+        assert first + second == page[:4]
+
+        # 预序列化的响应与 page() 一致，内容变化后缓存失效
+        body = json.loads(fleet_view.render_page(limit=100, hotel=hotel))
+        assert body['data'] == page and body['count'] == 5
+        version = fleet_view.version
+        update_device(ids[3], {'hotel': '另一家酒店'})
+        assert fleet_view.version > version
+        body = json.loads(fleet_view.render_page(limit=100, hotel=hotel))
+        assert ids[3] not in [d['camera_id'] for d in body['data']]
+        assert body['data'] == _expected(hotel)
+
+        # update_device 的字段直接合并到缓存的记录，不回读数据库；
+        # 已由实时状态覆盖的字段（状态上报同时写库）不改变视图版本
+        reads = []
+        original_get_device = fleet_view_module.get_device
+        fleet_view_module.get_device = lambda hardware_id: reads.append(hardware_id) or original_get_device(hardware_id)
+        try:
+            version = fleet_view.version
+            update_device(ids[2], {'status': 'online', 'electric_percent': 90, 'last_online': '2026-01-02 09:00:00'})
+            assert fleet_view.version == version
+            update_device(ids[1], {'location': '1202', 'last_online': '2026-01-02 09:00:00'})
+            assert fleet_view.version > version
+            assert not reads
+        finally:
+            fleet_view_module.get_device = original_get_device
+        page, _ = fleet_view.page(limit=100, hotel=hotel)
+        assert page == _expected(hotel)
+        assert next(d for d in page if d['camera_id'] == ids[1])['last_update'] == '2026-01-02 09:00:00'
+    finally:
+        for hardware_id in ids:
+            delete_device(hardware_id)
+
+    print(f"   统计: {fleet_view.stats()}")
+    print("✅ 设备列表视图测试通过")
+
+
+if __name__ == '__main__':
+    test_fleet_view_incremental()
@@ -0,0 +1,137 @@
+"""
+测试分片上传链路
+使用本地OSS替身验证 初始化 → 分片上传 → 完成 全流程
+"""
+import sys
+import os
+import tempfile
+from types import SimpleNamespace
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+from app.src.oss.local_oss import LocalOssServer
+from app.src.oss import oss_manager
+from app.src.oss.oss_manager import getMultipartUploadPresignUrls, confirmCompleteMultipartUpload
+
+
+def test_oss_upload_path():
+    """测试完整分片上传流程"""
+    print("=" * 60)
+    print("🧪 测试分片上传链路（本地OSS替身）")
+    print("=" * 60)
+
+    saved_env = {k: os.environ.get(k) for k in ('OSS_ENDPOINT', 'OSS_USE_PATH_STYLE', 'OSS_ACCESS_KEY_ID', 'OSS_ACCESS_KEY_SECRET')}
+    server = LocalOssServer().start()
+    os.environ['OSS_ENDPOINT'] = server.endpoint
+    os.environ['OSS_USE_PATH_STYLE'] = 'true'
+    os.environ.setdefault('OSS_ACCESS_KEY_ID', 'test')
+    os.environ.setdefault('OSS_ACCESS_KEY_SECRET', 'test')
+
+    try:
+        content = os.urandom(3 * 1024 * 1024 + 17)
+        with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as f:
+            f.write(content)
+            file_path = f.name
+
+        # 1. 初始化并获取预签名URL
+        print("\n1️⃣ 获取分片上传地址...")
+        presign_urls = getMultipartUploadPresignUrls('camlink', 'CAM-TEST/vid_001.mp4', 3)
+        assert presign_urls['upload_id']
+        assert len(presign_urls['upload_parts']) == 3
+
+        # 2. 上传分片
+        print("\n2️⃣ 上传分片...")
+        upload_parts = oss_manager.testPost(presign_urls, file_path)
+        assert [p['partNumber'] for p in upload_parts] == [1, 2, 3]
+
+        # 3. 完成上传并校验对象内容
+        print("\n3️⃣ 完成分片上传...")
+        confirmCompleteMultipartUpload('camlink', 'CAM-TEST/vid_001.mp4', presign_urls['upload_id'], upload_parts)
+        obj = server.get_object('camlink', 'CAM-TEST/vid_001.mp4')
+        assert obj is not None and obj['data'] == content
+        assert server.pending_uploads() == 0
+
+        # 4. 取消未完成的上传
+        print("\n4️⃣ 取消分片上传...")
+        aborted = getMultipartUploadPresignUrls('camlink', 'CAM-TEST/vid_002.mp4', 1)
+        url = f"{server.endpoint}/camlink/CAM-TEST/vid_002.mp4?uploadId={aborted['upload_id']}"
+        assert requests.get(url).status_code == 200
+        assert requests.delete(url).status_code == 204
+        assert requests.get(url).status_code == 404
+
+        # 5. 服务端并发上传：注入失败验证重试、进度回调和整体CRC64校验
+        print("\n5️⃣ 并发上传（含失败重试）...")
+        server.fail_part_uploads = 2
+        progress = []
+        result = oss_manager.multipartUploadFile(
+            'camlink', 'CAM-TEST/vid_003.mp4', file_path, 4,
+            max_workers=4, backoff=0.01,
+            progress_callback=lambda done, total: progress.append((done, total))
+        )
+        obj = server.get_object('camlink', 'CAM-TEST/vid_003.mp4')
+        assert obj['data'] == content
+        assert result['crc64'] == obj['crc64']
+        assert max(p[0] for p in progress) == len(content)
+
+        # 6. 分片失败：其余排队的分片被取消，文件映射正常关闭
+        print("\n6️⃣ 分片失败后取消剩余分片...")
+        failed = getMultipartUploadPresignUrls('camlink', 'CAM-TEST/vid_004.mp4', 4)
+        server.fail_part_uploads = 1
+        warnings = []
+        original_log = oss_manager.log
+        oss_manager.log = SimpleNamespace(info=original_log.info,
+                                          warning=lambda event, **fields: warnings.append(event))
+        try:
+            oss_manager.uploadParts(failed, file_path, max_workers=1, max_retries=0)
+            assert False, '分片失败时应抛出异常'
+        except requests.HTTPError:
+            pass
+        finally:
+            oss_manager.log = original_log
+        # 失败时线程池可能已取走下一个分片，之后排队的分片不再上传
+        assert len(server._uploads[failed['upload_id']]['parts']) < 3
+        assert not warnings
+
+        # 7. 分片上传或完成上传失败时取消分片上传，已上传的分片不留在OSS上
+        print("\n7️⃣ 上传失败后取消分片上传...")
+        pending = server.pending_uploads()
+        server.fail_part_uploads = 1
+        try:
+            oss_manager.multipartUploadFile('camlink', 'CAM-TEST/vid_005.mp4', file_path, 4,
+                                            max_workers=1, max_retries=0)
+            assert False, '分片失败时应抛出异常'
+        except requests.HTTPError:
+            pass
+        assert server.pending_uploads() == pending
+        assert server.get_object('camlink', 'CAM-TEST/vid_005.mp4') is None
+
+        original_complete = oss_manager.confirmCompleteMultipartUpload
+        for complete_info, error in (({'status_code': 400, 'etag': None, 'crc64': None}, requests.HTTPError),
+                                     ({'status_code': 200, 'etag': '"X-4"', 'crc64': None}, ValueError)):
+            oss_manager.confirmCompleteMultipartUpload = lambda *args, info=complete_info: info
+            try:
+                oss_manager.multipartUploadFile('camlink', 'CAM-TEST/vid_006.mp4', file_path, 4)
+                assert False, f'{complete_info} 应抛出 {error.__name__}'
+            except error:
+                pass
+            finally:
+                oss_manager.confirmCompleteMultipartUpload = original_complete
+        # 完成上传返回错误时已取消；返回200时视为已完成不再取消（替换的完成函数没有真正合并，分片仍在）
+        assert server.pending_uploads() == pending + 1
+
+        os.unlink(file_path)
+    finally:
+        server.stop()
+        for k, v in saved_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+    print("\n" + "=" * 60)
+    print("✅ 分片上传链路测试完成！")
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    test_oss_upload_path()
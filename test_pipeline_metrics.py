@@ -0,0 +1,74 @@
+"""
+测试MQTT入站管道指标
+验证消息速率、阶段耗时、上报延迟、未知设备和重连计数，以及在 /metrics 中的输出
+"""
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.src.monitor_cam import MqttPipelineMetrics
+from app.src.metrics import registry
+
+
+def test_pipeline_metrics():
+    print("=" * 60)
+    print("🧪 测试MQTT入站管道指标")
+    print("=" * 60)
+
+    metrics = MqttPipelineMetrics(rate_window=10)
+    before = metrics.stats()
+    for _ in range(20):
+        metrics.received('state')
+    metrics.received('resp')
+    metrics.unknown_client()
+
+    stats = metrics.stats()
+    assert stats['messages']['state'] == before['messages']['state'] + 20
+    assert stats['messages_per_second']['state'] == 2.0
+    assert stats['messages_per_second']['unknown_client'] == 0.1
+    print(f"   ✅ 速率: {stats['messages_per_second']}")
+
+    stages = registry.get('camlink_mqtt_stage_duration_seconds')
+    count = stages.snapshot('lookup')['count']
+    with metrics.stage('lookup'):
+        time.sleep(0.002)
+    snap = stages.snapshot('lookup')
+    assert snap['count'] == count + 1 and snap['sum'] >= 0.002
+
+    # 只统计基线之后的消息，分位数按分桶插值
+    baseline = metrics.stage_snapshot()
+    for _ in range(3):
+        with metrics.stage('decode'):
+            time.sleep(0.003)
+    decode = metrics.stage_stats(since=baseline)['decode']
+    assert decode['count'] == 3 and decode['avg_ms'] >= 3
+    assert 2.5 <= decode['p50_ms'] <= 10 and decode['p99_ms'] <= 10, decode
+
+    # 上报时间：epoch秒 / 毫秒 / 时间字符串均可，缺失或无法解析时不记录
+    now = time.time()
+    assert abs(metrics.report_lag('state', {'timestamp': now - 2}, now) - 2) < 0.01
+    assert abs(metrics.report_lag('state', {'ts': int((now - 0.5) * 1000)}, now) - 0.5) < 0.01
+    assert metrics.report_lag('state', {'ts': now + 60}, now) == 0.0
+    assert metrics.report_lag('state', {'time': 'not a time'}, now) is None
+    assert metrics.report_lag('state', {'status': 'online'}, now) is None
+
+    connects = stats['connects']
+    metrics.connected()
+    metrics.disconnected()
+    metrics.connected()
+    stats = metrics.stats()
+    assert stats['connects'] == connects + 2 and stats['connected']
+    print(f"   ✅ 重连: {stats['reconnects']}，断开: {stats['disconnects']}")
+
+    text = registry.render()
+    assert '# TYPE camlink_mqtt_messages_per_second gauge' in text
+    assert metrics.rate_samples()[('state',)] == 2.0
+    assert 'camlink_mqtt_stage_duration_seconds_bucket{stage="lookup",le="0.001"}' in text
+    assert 'camlink_mqtt_report_lag_seconds_count{type="state"}' in text
+    assert 'camlink_mqtt_unknown_client_messages_total' in text
+    print("✅ MQTT入站管道指标测试通过")
+
+
+if __name__ == '__main__':
+    test_pipeline_metrics()
@@ -0,0 +1,184 @@
+"""
+测试运行时剖析
+CPU采样（folded / speedscope 输出）、tracemalloc 报告与基线对比、锁竞争统计，以及对应的管理接口
+"""
+import sys
+import os
+import json
+import threading
+import time
+import tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from app.routes import main
+from app.src.profiling import CpuProfiler, ProfiledLock, lock_profiler, memory_profiler, container_sizes
+from app.src.monitor_cam.device_status import DeviceStatusManager
+
+
+def _busy_loop(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(2000))
+
+
+def test_cpu_profile():
+    print("=" * 60)
+    print("🧪 测试CPU采样剖析")
+    print("=" * 60)
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_loop, args=(stop,), name='busy-worker', daemon=True)
+    worker.start()
+    try:
+        profile = CpuProfiler().profile(0.3, interval=0.005, include_idle=False)
+    finally:
+        stop.set()
+        worker.join()
+
+    assert profile.samples > 10, profile.samples
+    folded = profile.folded()
+    lines = [line for line in folded.splitlines() if '_busy_loop' in line]
+    assert lines, folded[:500]
+    stack, count = lines[0].rsplit(' ', 1)
+    assert stack.startswith('busy-worker;') and int(count) > 0
+    print(f"✅ {profile.samples} 次采样，folded 输出 {len(folded.splitlines())} 条调用栈")
+
+    doc = profile.speedscope()
+    assert doc['$schema'].startswith('https://www.speedscope.app/')
+    names = {frame['name'] for frame in doc['shared']['frames']}
+    assert any('_busy_loop' in name for name in names)
+    for prof in doc['profiles']:
+        assert len(prof['samples']) == len(prof['weights'])
+    print(f"✅ speedscope: {len(doc['profiles'])} 个线程，{len(names)} 个帧")
+
+    # 同一时间只允许一个剖析
+    profiler = CpuProfiler()
+    results = []
+    t = threading.Thread(target=lambda: results.append(profiler.profile(0.3)))
+    t.start()
+    time.sleep(0.05)
+    assert profiler.profile(0.1) is None
+    t.join()
+    assert results[0] is not None
+    print("✅ 剖析进行中时拒绝新的剖析")
+
+
+def test_memory_profile():
+    print("\n" + "=" * 60)
+    print("🧪 测试内存剖析")
+    print("=" * 60)
+    assert memory_profiler.report() is None
+    memory_profiler.start(frames=5)
+    try:
+        memory_profiler.report()  # 建立基线
+        hoard = [bytes(1024) + str(i).encode() for i in range(2000)]
+        report = memory_profiler.report(limit=10)
+        assert report['top'] and report['status']['tracing']
+        grown = [d for d in report['diff'] if 'test_profiling.py' in d['location']]
+        assert grown and grown[0]['size_diff_kb'] > 1000, report['diff'][:3]
+        print(f"✅ 基线对比找到增长位置: {grown[0]['location']} +{grown[0]['size_diff_kb']} KB")
+
+        path = memory_profiler.dump_snapshot()
+        try:
+            assert tracemalloc.Snapshot.load(path).traces
+        finally:
+            os.remove(path)
+        print("✅ 快照文件可被 tracemalloc.Snapshot.load 读取")
+        del hoard
+    finally:
+        memory_profiler.stop()
+
+    manager = DeviceStatusManager()
+    manager.update_status('profiling_cam', {'status': 'online', 'run_state': 'stopped'})
+    sizes = container_sizes(manager)
+    assert any(v['entries'] == 1 and v['bytes'] > 0 for v in sizes.values()), sizes
+    print(f"✅ 管理器容器大小: {sizes}")
+
+
+def test_lock_stats():
+    print("\n" + "=" * 60)
+    print("🧪 测试锁竞争统计")
+    print("=" * 60)
+    lock = ProfiledLock('test_profiling_lock')
+    was_enabled = lock_profiler.enabled
+    lock_profiler.enable(True)
+    try:
+        def hold():
+            for _ in range(5):
+                with lock:
+                    time.sleep(0.01)
+
+        threads = [threading.Thread(target=hold) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stats = next(l for l in lock_profiler.report()['locks'] if l['name'] == 'test_profiling_lock')
+        assert stats['acquisitions'] == 20, stats
+        assert stats['contended'] > 0 and stats['wait_total_ms'] > 10, stats
+        assert stats['hold_total_ms'] >= 200, stats
+        print(f"✅ {stats}")
+    finally:
+        lock_profiler.enable(was_enabled)
+
+
+def test_profile_routes():
+    print("\n" + "=" * 60)
+    print("🧪 测试剖析管理接口")
+    print("=" * 60)
+    app = Flask(__name__)
+    app.register_blueprint(main)
+    client = app.test_client()
+
+    # 未配置令牌时拒绝访问（即使来自本机），配置后凭 X-Admin-Token 访问
+    previous = os.environ.pop('CAMLINK_ADMIN_TOKEN', None)
+    try:
+        assert client.get('/api/admin/profile/locks').status_code == 403
+        os.environ['CAMLINK_ADMIN_TOKEN'] = 'test-admin-token'
+        assert client.get('/api/admin/profile/locks').status_code == 403
+        client.environ_base['HTTP_X_ADMIN_TOKEN'] = 'test-admin-token'
+        _check_profile_routes(client)
+    finally:
+        if previous is None:
+            os.environ.pop('CAMLINK_ADMIN_TOKEN', None)
+        else:
+            os.environ['CAMLINK_ADMIN_TOKEN'] = previous
+
+
+def _check_profile_routes(client):
+    resp = client.get('/api/admin/profile/cpu?seconds=0.1&format=speedscope')
+    assert resp.status_code == 200 and 'speedscope.json' in resp.headers['Content-Disposition']
+    assert json.loads(resp.data)['profiles']
+    resp = client.get('/api/admin/profile/cpu?seconds=0.1')
+    assert resp.status_code == 200 and resp.mimetype == 'text/plain'
+    assert client.get('/api/admin/profile/cpu?format=svg').status_code == 400
+    print("✅ CPU剖析接口")
+
+    assert client.get('/api/admin/profile/memory/snapshot').status_code == 409
+    assert client.post('/api/admin/profile/memory/start?frames=3').get_json()['tracing']
+    try:
+        data = client.get('/api/admin/profile/memory?limit=5').get_json()
+        assert data['tracemalloc']['top'] and 'device_status_manager' in data['managers']
+        resp = client.get('/api/admin/profile/memory/snapshot')
+        assert resp.status_code == 200 and resp.data
+    finally:
+        assert not client.post('/api/admin/profile/memory/stop').get_json()['tracing']
+    assert client.get('/api/admin/profile/memory').get_json()['tracemalloc'] is None
+    print("✅ 内存剖析接口")
+
+    was_enabled = lock_profiler.enabled
+    try:
+        assert client.post('/api/admin/profile/locks?enabled=1&reset=1').get_json()['enabled']
+        client.get('/api/camera/status/all')
+        names = {l['name'] for l in client.get('/api/admin/profile/locks').get_json()['locks']}
+        assert 'device_status_manager' in names, names
+    finally:
+        lock_profiler.enable(was_enabled)
+    print("✅ 锁统计接口")
+
+
+if __name__ == '__main__':
+    test_cpu_profile()
+    test_memory_profile()
+    test_lock_stats()
+    test_profile_routes()
+    print("\n🎉 全部测试通过")
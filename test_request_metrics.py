@@ -0,0 +1,77 @@
+"""
+测试请求计时中间件和 /metrics
+验证按路由记录耗时直方图、状态码、响应大小，慢请求日志，以及 Prometheus 文本格式输出
+"""
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask, Response
+from app.routes import main
+from app.src.metrics import RequestMetrics, registry, Histogram
+
+
+def test_histogram_buckets():
+    """观测值落入 le 上界对应的桶，导出时桶计数累计"""
+    h = Histogram('test_latency_seconds', 'test', ('route',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        h.observe(value, 'a')
+    snap = h.snapshot('a')
+    assert snap['count'] == 4 and snap['buckets'][0.1] == 2 and snap['buckets'][1.0] == 3
+    text = h.render()
+    assert 'test_latency_seconds_bucket{route="a",le="0.1"} 2' in text
+    assert 'test_latency_seconds_bucket{route="a",le="+Inf"} 4' in text
+    assert 'test_latency_seconds_count{route="a"} 4' in text
+    print("   ✅ 直方图分桶正常")
+
+
+def test_request_metrics():
+    """请求经过中间件后出现在 /metrics 中，慢请求被记录"""
+    app = Flask(__name__)
+    app.register_blueprint(main)
+
+    @app.route('/__test/slow')
+    def slow():
+        time.sleep(0.06)
+        return 'ok'
+
+    @app.route('/__test/stream')
+    def stream():
+        return Response((b'x' * 1000 for _ in range(5)), mimetype='application/octet-stream')
+
+    metrics = RequestMetrics(app, slow_request_ms=50)
+    # buffered=True：读完响应体后关闭，与WSGI服务器一样触发中间件结束计时
+    client = app.test_client()
+
+    durations = registry.get('camlink_http_request_duration_seconds')
+    before = durations.snapshot('slow', 'GET')['count']
+    assert client.get('/__test/slow', buffered=True).status_code == 200
+    assert durations.snapshot('slow', 'GET')['count'] == before + 1
+    assert metrics.slow_requests()[0]['path'] == '/__test/slow'
+
+    assert client.get('/__test/stream', buffered=True).data == b'x' * 5000
+    sizes = registry.get('camlink_http_response_size_bytes').snapshot('stream')
+    assert sizes['sum'] >= 5000
+
+    assert client.get('/__test/missing', buffered=True).status_code == 404
+    assert registry.get('camlink_http_requests_in_flight').value() == 0
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    text = response.get_data(as_text=True)
+    assert '# TYPE camlink_http_request_duration_seconds histogram' in text
+    assert 'camlink_http_requests_total{endpoint="slow",method="GET",status="200"}' in text
+    assert 'camlink_http_requests_total{endpoint="unmatched",method="GET",status="404"}' in text
+    assert 'camlink_http_slow_requests_total{endpoint="slow"}' in text
+    print("   ✅ /metrics 输出正常")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("🧪 测试请求计时中间件")
+    print("=" * 60)
+    test_histogram_buckets()
+    test_request_metrics()
+    print("\n✅ 所有测试通过")
@@ -0,0 +1,115 @@
+"""
+测试响应序列化与压缩
+验证 Accept-Encoding 协商、阈值以下不压缩、版本化响应的编码结果缓存，以及未安装 orjson/brotli 时的回退
+"""
+import sys
+import os
+import gzip
+import json
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask, jsonify
+from flask.json.provider import DefaultJSONProvider
+from app.routes import main
+from app.src.api_response import dumps, response_cache, FastJSONProvider, COMPRESS_MIN_SIZE
+from app.src.api_response import response_encoding
+from app.src.sqllite import init_db, insert_device, delete_device
+from app.src.monitor_cam import device_status_manager
+
+
+def _client():
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    app.register_blueprint(main)
+    return app.test_client()
+
+
+def test_dumps_fallback():
+    """标准库回退与 orjson 输出等价（中文不转义）"""
+    payload = {'name': '测试酒店', 'count': 3, 'items': [1, 2.5, None, True]}
+    assert json.loads(dumps(payload)) == payload
+    assert '测试酒店'.encode('utf-8') in dumps(payload)
+
+    orjson = response_encoding.orjson
+    response_encoding.orjson = None
+    try:
+        assert json.loads(dumps(payload)) == payload
+        assert dumps({1: 'a'}) == b'{"1":"a"}'
+    finally:
+        response_encoding.orjson = orjson
+    print("   ✅ 序列化回退正常")
+
+
+def test_gzip_negotiation_and_cache():
+    """大响应按 Accept-Encoding 压缩，相同版本重复请求命中编码缓存"""
+    init_db()
+    client = _client()
+    camera_ids = [f'HW-GZIP-TEST-{i:03d}' for i in range(30)]
+    for camera_id in camera_ids:
+        delete_device(camera_id)
+        insert_device({'hardware_id': camera_id, 'client_id': f'CAM-{camera_id}', 'hotel': '压缩测试酒店'})
+        device_status_manager.update_status(camera_id, {'status': 'online', 'electric_percent': 0.5})
+
+    try:
+        url = '/api/camera/status/list?hotel=压缩测试酒店&limit=100'
+        plain = client.get(url)
+        assert plain.status_code == 200
+        assert 'Content-Encoding' not in plain.headers
+        assert 'Accept-Encoding' in plain.headers['Vary']
+        assert len(plain.data) >= COMPRESS_MIN_SIZE
+        assert json.loads(plain.data)['count'] == 30
+
+        before = response_cache.stats()['hits']
+        zipped = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        assert zipped.headers['Content-Encoding'] == 'gzip'
+        assert zipped.headers['ETag'].startswith('W/')
+        assert gzip.decompress(zipped.data) == plain.data
+        again = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        assert again.data == zipped.data
+        assert response_cache.stats()['hits'] >= before + 2
+        print(f"   ✅ gzip: {len(plain.data)} -> {len(zipped.data)} 字节，缓存 {response_cache.stats()}")
+
+        # 弱ETag同样可用于条件GET
+        cached = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': zipped.headers['ETag']})
+        assert cached.status_code == 304
+
+        # 不接受压缩，或响应小于阈值时原样返回
+        small = client.get('/api/camera/status/list?hotel=压缩测试酒店&limit=1', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in small.headers
+        identity = client.get(url, headers={'Accept-Encoding': 'gzip;q=0'})
+        assert 'Content-Encoding' not in identity.headers
+    finally:
+        for camera_id in camera_ids:
+            delete_device(camera_id)
+
+
+def test_provider_matches_flask_default():
+    """FastJSONProvider 与 Flask 默认的 jsonify 输出相同字节（键排序、紧凑/调试缩进、末尾换行）"""
+    payload = {'b': 1, 'a': {'d': [1, 2], 'c': None}, 'e': 'x'}
+    orjson = response_encoding.orjson
+    try:
+        for backend in (orjson, None):
+            response_encoding.orjson = backend
+            for debug, sort_keys in ((False, True), (True, True), (False, False)):
+                bodies = []
+                for provider in (DefaultJSONProvider, FastJSONProvider):
+                    app = Flask(__name__)
+                    app.debug = debug
+                    app.json = provider(app)
+                    app.json.sort_keys = sort_keys
+                    with app.app_context():
+                        bodies.append(jsonify(payload).data)
+                assert bodies[0] == bodies[1], (backend, debug, sort_keys, bodies)
+    finally:
+        response_encoding.orjson = orjson
+    print("   ✅ jsonify 输出与 Flask 默认一致")
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("🧪 测试响应序列化与压缩")
+    print("=" * 60)
+    test_dumps_fallback()
+    test_gzip_negotiation_and_cache()
+    test_provider_matches_flask_default()
+    print("\n✅ 所有测试通过")
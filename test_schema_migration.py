@@ -0,0 +1,139 @@
+"""
+测试时间戳整型化迁移
+旧版数据库（文本时间、字符串数值）在初始化时一次性迁移为毫秒时间戳和整型列，
+兼容视图仍返回原来的文本时间；任务列表接口的时间参数无法解析时返回400
+"""
+import sys
+import os
+import sqlite3
+import tempfile
+from pathlib import Path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.src.sqllite.sqllite_device import init_db, get_device, update_device, list_devices, list_stale_devices
+from app.src.sqllite.sqllite_task import init_task_table, list_tasks, get_task_by_requestid
+from app.src.sqllite.sqllite_time import to_epoch_ms
+from app.src.sqllite import insert_device, delete_device
+
+
+LEGACY_SCHEMA = """
+CREATE TABLE devices (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hardware_id TEXT UNIQUE NOT NULL,
+    client_id TEXT, hotel TEXT, location TEXT, wifi TEXT, runtime TEXT, fw TEXT,
+    last_online TEXT, status TEXT, left_storage INTEGER, electric_percent INTEGER,
+    network_signal_strength INTEGER
+);
+CREATE TABLE tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    clientid TEXT NOT NULL,
+    requestid TEXT UNIQUE NOT NULL,
+    requesttype TEXT, state TEXT, description TEXT,
+    created_at TEXT DEFAULT (datetime('now', 'localtime')),
+    updated_at TEXT DEFAULT (datetime('now', 'localtime'))
+);
+CREATE INDEX idx_tasks_created_at ON tasks (created_at);
+INSERT INTO devices (hardware_id, client_id, hotel, last_online, status, electric_percent, left_storage)
+VALUES ('HW-OLD-1', 'CAM-OLD-1', '迁移测试酒店', '2025-11-08 16:28:45', '在线', '65', '1024');
+INSERT INTO devices (hardware_id, client_id, hotel, last_online, status, electric_percent)
+VALUES ('HW-OLD-2', 'CAM-OLD-2', '迁移测试酒店', NULL, 'offline', '');
+INSERT INTO tasks (clientid, requestid, requesttype, state, created_at, updated_at)
+VALUES ('CAM-OLD-1', 'REQ-OLD-1', 'start_record', 'success', '2025-11-08 10:00:00', '2025-11-08 10:00:05');
+INSERT INTO tasks (clientid, requestid, requesttype, state, created_at, updated_at)
+VALUES ('CAM-OLD-1', 'REQ-OLD-2', 'stop_record', 'calling', '2025-11-09 10:00:00', 'garbage');
+DELETE FROM tasks WHERE requestid = 'REQ-OLD-2';
+INSERT INTO tasks (clientid, requestid, requesttype, state, created_at, updated_at)
+VALUES ('CAM-OLD-1', 'REQ-OLD-3', 'stop_record', 'calling', '2025-11-09 10:00:00', 'garbage');
+"""
+
+
+def test_legacy_schema_migration():
+    """旧表迁移后数据、id序列、兼容视图都保持一致，重复初始化不会再次迁移"""
+    print("=" * 60)
+    print("🧪 测试时间戳整型化迁移")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / 'legacy.db'
+        with sqlite3.connect(str(db_path)) as conn:
+            conn.executescript(LEGACY_SCHEMA)
+
+        for _ in range(2):
+            init_db(db_path)
+            init_task_table(db_path)
+
+        device = get_device('HW-OLD-1', db_path)
+        print(f"   设备: {device}")
+        assert device['last_online_ms'] == to_epoch_ms('2025-11-08 16:28:45')
+        assert device['last_online'] == '2025-11-08 16:28:45'
+        assert device['electric_percent'] == 65 and device['left_storage'] == 1024
+        assert get_device('HW-OLD-2', db_path)['electric_percent'] is None
+
+        task = get_task_by_requestid('REQ-OLD-1', db_path)
+        assert task['updated_at_ms'] - task['created_at_ms'] == 5000
+        assert task['created_at'] == '2025-11-08 10:00:00'
+        # 无法解析的 updated_at 使用 created_at
+        broken = get_task_by_requestid('REQ-OLD-3', db_path)
+        assert broken['updated_at_ms'] == broken['created_at_ms']
+
+        # 时间范围过滤走整型列
+        assert [t['requestid'] for t in list_tasks(since='2025-11-09 00:00:00', db_path=db_path)] == ['REQ-OLD-3']
+        assert [t['requestid'] for t in list_tasks(until=to_epoch_ms('2025-11-09 00:00:00'), db_path=db_path)] == ['REQ-OLD-1']
+        projected = list_tasks(columns=['requestid', 'created_at'], db_path=db_path)[0]
+        assert set(projected) == {'id', 'requestid', 'created_at', 'created_at_ms'}
+
+        with sqlite3.connect(str(db_path)) as conn:
+            conn.row_factory = sqlite3.Row
+            # AUTOINCREMENT 序列保持（已删除的 id 2 不会被复用）
+            conn.execute("INSERT INTO tasks (clientid, requestid) VALUES ('CAM-OLD-1', 'REQ-NEW')")
+            assert conn.execute("SELECT id FROM tasks WHERE requestid = 'REQ-NEW'").fetchone()[0] == 4
+            row = conn.execute("SELECT created_at FROM tasks_compat WHERE requestid = 'REQ-OLD-1'").fetchone()
+            assert row['created_at'] == '2025-11-08 10:00:00'
+            row = conn.execute("SELECT last_online FROM devices_compat WHERE hardware_id = 'HW-OLD-1'").fetchone()
+            assert row['last_online'] == '2025-11-08 16:28:45'
+            # 类型检查约束拒绝非整数的电量
+            try:
+                conn.execute("UPDATE devices SET electric_percent = 'abc' WHERE hardware_id = 'HW-OLD-1'")
+                assert False, '应拒绝非整数电量'
+            except sqlite3.IntegrityError:
+                pass
+
+        # 写入时字符串数值会被规范化
+        update_device('HW-OLD-1', {'electric_percent': '80.4', 'last_online': '2025-11-10 08:00:00'}, db_path)
+        device = get_device('HW-OLD-1', db_path)
+        assert device['electric_percent'] == 80 and device['last_online'] == '2025-11-10 08:00:00'
+        assert [d['hardware_id'] for d in list_stale_devices(3600, db_path=db_path)] == ['HW-OLD-1']
+        assert list_devices(columns=['last_online'], db_path=db_path)[0]['last_online'] is None
+
+    print("✅ 迁移测试通过")
+
+
+def test_task_time_filter_params():
+    """任务列表接口的 since / until 无法解析时返回400，而不是查询时出错返回500"""
+    from flask import Flask
+    from app.routes import main
+
+    init_db()
+    init_task_table()
+    app = Flask(__name__)
+    app.register_blueprint(main)
+    client = app.test_client()
+    camera_id = 'HW-TIME-FILTER-001'
+    delete_device(camera_id)
+    insert_device({'hardware_id': camera_id, 'client_id': 'CAM-TIME-FILTER', 'hotel': 'Time Filter'})
+    try:
+        for url in ('/api/tasks?since=garbage', '/api/tasks?until=2025-13-40',
+                    f'/api/camera/{camera_id}/tasks?since=garbage'):
+            resp = client.get(url)
+            assert resp.status_code == 400, (url, resp.status_code)
+            assert not resp.get_json()['success']
+        assert client.get('/api/tasks?since=2025-11-09 00:00:00&until=1762700000').status_code == 200
+        assert client.get(f'/api/camera/{camera_id}/tasks?since=2025-11-09T00:00:00').status_code == 200
+    finally:
+        delete_device(camera_id)
+    print("✅ 无效的时间参数返回400")
+
+
+if __name__ == '__main__':
+    test_legacy_schema_migration()
+    test_task_time_filter_params()
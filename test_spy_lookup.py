@@ -0,0 +1,126 @@
+"""
+测试MAC厂商查询
+验证MAC格式归一化和 MA-L / MA-M / MA-S 最长前缀匹配
+"""
+import sys
+import os
+import json
+import tempfile
+from pathlib import Path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.src.spy_blocker.mac_index import build_index, MacIndex, parse_mac
+from app.src.spy_blocker.vendor_db import VendorDatabase, VendorDatabaseManager
+from app.src.spy_blocker.spy import lookup_mac, lookup_macs_from_string, iter_mac_tokens, lookup_macs_stream
+
+
+def test_parse_mac_formats():
+    """不同写法的同一个MAC解析结果一致"""
+    expected = 0xF4E1FC010209
+    for mac in ('F4-E1-FC-01-02-09', 'f4:e1:fc:01:02:09', 'f4e1.fc01.0209', 'F4E1FC010209'):
+        assert parse_mac(mac) == (expected, 12), mac
+    assert parse_mac('zz-zz-zz-00-00-00')[0] is None
+    assert parse_mac('F4-E1-FC-01-02-09-AA')[0] is None
+
+
+def test_longest_prefix_match():
+    """MA-S 优先于 MA-M，MA-M 优先于 MA-L"""
+    print("=" * 60)
+    print("🧪 测试最长前缀匹配")
+    print("=" * 60)
+
+    entries = [
+        {"70-B3-D5": "IEEE Registration Authority"},
+        {"70-B3-D5-1": "MA-M Vendor"},
+        {"70-B3-D5-12-3": "MA-S Vendor"},
+        {"28-6F-B9": "Nokia Shanghai Bell Co.,Ltd."}
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = Path(tmp) / 'mac.json'
+        index_path = Path(tmp) / 'mac.idx'
+        json_path.write_text(json.dumps(entries), encoding='utf-8')
+        assert build_index(json_path, index_path) == 4
+        index = VendorDatabase(MacIndex(index_path), ('ma-s vendor',))
+
+        cases = {
+            '70:b3:d5:12:34:56': ('MA-S Vendor', 'MA-S', '70-B3-D5-12-3'),
+            '70B3D5198765': ('MA-M Vendor', 'MA-M', '70-B3-D5-1'),
+            '70-B3-D5-F0-00-01': ('IEEE Registration Authority', 'MA-L', '70-B3-D5'),
+            '286f.b9f1.21c2': ('Nokia Shanghai Bell Co.,Ltd.', 'MA-L', '28-6F-B9'),
+        }
+        for mac, (vendor, registry, prefix) in cases.items():
+            result = lookup_mac(mac, index)
+            print(f"   - {mac}: {result}")
+            assert (result['value'], result['registry'], result['prefix']) == (vendor, registry, prefix)
+            assert result['suspicious'] == (vendor == 'MA-S Vendor')
+
+        assert lookup_mac('00-11-22-33-44-55', index)['value'] == 'Unknown MAC'
+        assert lookup_mac('00-7C', index)['value'] == 'MAC length too short'
+        assert lookup_mac('zz-zz-zz-00', index)['value'] == 'Invalid MAC'
+        # 只有前缀时不会误匹配更长的分配
+        assert lookup_mac('70-B3-D5', index)['registry'] == 'MA-L'
+
+    print("\n✅ 最长前缀匹配测试完成！")
+
+
+def test_lookup_macs_from_string():
+    """使用内置 mac.json 查询混合格式的MAC列表"""
+    results = lookup_macs_from_string('B8-7C-F2-AB-12-09,28:6f:b9:f1:21:c2,00-7C')
+    assert [r['value'] for r in results] == [
+        'Extreme Networks Headquarters',
+        'Nokia Shanghai Bell Co.,Ltd.',
+        'MAC length too short'
+    ]
+
+
+def test_lookup_macs_stream():
+    """流式批量查询：跨块切分的输入、两种格式、重复MAC只返回一次"""
+    lines = b'B8-7C-F2-AB-12-09\nb8:7c:f2:ab:12:09\n{"mac": "28-6F-B9-00-00-01"}\n00-7C\n'
+    chunks = [lines[i:i + 5] for i in range(0, len(lines), 5)]
+    results = list(lookup_macs_stream(iter_mac_tokens(chunks), batch_size=2))
+    assert [r['mac'] for r in results] == ['B8-7C-F2-AB-12-09', '28-6F-B9-00-00-01', '00-7C']
+
+    array = b'["b87cf2ab1209", {"mac": "B8-7C-F2-AB-12-09"}, "aa:bb:cc:00:00:01"]'
+    chunks = [array[i:i + 7] for i in range(0, len(array), 7)]
+    results = list(lookup_macs_stream(iter_mac_tokens(chunks)))
+    assert [r['value'] for r in results] == ['Extreme Networks Headquarters', 'Unknown MAC']
+
+
+def test_vendor_db_hot_reload():
+    """重载后新查询使用新版本，已拿到的旧快照不受影响"""
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = Path(tmp) / 'mac.json'
+        index_path = Path(tmp) / 'mac.idx'
+        watchlist_path = Path(tmp) / 'spy_vendors.json'
+        json_path.write_text(json.dumps([{"AA-BB-CC": "Old Vendor"}]), encoding='utf-8')
+        watchlist_path.write_text(json.dumps({"vendors": ["New"]}), encoding='utf-8')
+
+        manager = VendorDatabaseManager(json_path, index_path, watchlist_path)
+        old = manager.get()
+        assert old.version == 1
+        assert lookup_mac('AA-BB-CC-00-00-01', old)['suspicious'] is False
+        assert manager.reload()['reloaded'] is False  # 源文件未变化
+
+        json_path.write_text(json.dumps([{"AA-BB-CC": "New Vendor"}, {"AA-BB-CC-D": "MA-M Vendor"}]), encoding='utf-8')
+        os.utime(json_path, (old.source_mtimes['mac_json'] + 10,) * 2)
+        result = manager.reload()
+        assert result['reloaded'] and result['stats']['version'] == 2
+        assert result['stats']['entries_by_registry'] == {'MA-M': 1, 'MA-L': 1}
+
+        new = manager.get()
+        assert lookup_mac('AA-BB-CC-00-00-01', new)['value'] == 'New Vendor'
+        assert lookup_mac('AA-BB-CC-00-00-01', new)['suspicious'] is True
+        assert lookup_mac('AA-BB-CC-00-00-01', old)['value'] == 'Old Vendor'
+
+        # 源文件损坏时保留当前版本
+        json_path.write_text('[{"AA-BB-CC": ', encoding='utf-8')
+        assert 'error' in manager.reload(force=True)
+        assert manager.get() is new
+
+
+if __name__ == '__main__':
+    test_parse_mac_formats()
+    test_longest_prefix_match()
+    test_lookup_macs_from_string()
+    test_lookup_macs_stream()
+    test_vendor_db_hot_reload()
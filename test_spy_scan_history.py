@@ -0,0 +1,75 @@
+"""
+测试扫描历史与房间可疑度评分
+验证增量维护的评分与按原始记录全量重算的结果一致
+"""
+import sys
+import os
+import tempfile
+from pathlib import Path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.src.sqllite.sqllite_scan import (
+    init_scan_tables, record_scan, top_suspicious_rooms, list_room_sightings,
+    sighting_score, get_connection
+)
+
+
+def _sighting(mac, vendor='Some Vendor', suspicious=False):
+    return {'mac': mac, 'vendor': vendor, 'registry': 'MA-L', 'suspicious': suspicious}
+
+
+def _recompute(db_path, hotel, location):
+    """按原始记录全量重算房间评分"""
+    with get_connection(db_path) as conn:
+        rows = conn.execute(
+            "SELECT * FROM scan_sightings WHERE hotel = ? AND location = ?", (hotel, location)
+        ).fetchall()
+    return sum(sighting_score(r['weight'], r['scan_count'], r['first_seen'], r['last_seen']) for r in rows)
+
+
+def test_incremental_room_scores():
+    """多次扫描后增量评分等于全量重算，持续出现的可疑设备排名最高"""
+    print("=" * 60)
+    print("🧪 测试房间可疑度评分")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / 'scan.db'
+        init_scan_tables(db_path)
+        hotel = '评分测试酒店'
+        camera = _sighting('24-0A-C4-00-00-01', 'Espressif Inc.', suspicious=True)
+        phone = _sighting('DA-11-22-33-44-55', 'Unknown MAC')        # 随机化MAC，不计分
+        unknown = _sighting('00-11-22-33-44-55', 'Unknown MAC')
+        laptop = _sighting('28-6F-B9-00-00-01')
+
+        scans = [
+            ('701', [camera, phone, laptop], '2026-01-01 10:00:00'),
+            ('701', [camera, camera, unknown], '2026-01-01 22:00:00'),
+            ('701', [camera], '2026-01-02 11:00:00'),
+            ('702', [unknown, laptop], '2026-01-01 10:00:00'),
+            ('703', [_sighting('24-0A-C4-00-00-09', 'Espressif Inc.', suspicious=True)], '2026-01-01 10:00:00'),
+        ]
+        for location, sightings, scanned_at in scans:
+            result = record_scan(hotel, location, sightings, scanned_at=scanned_at, db_path=db_path)
+            print(f"   - {location} @ {scanned_at}: {result}")
+
+        rooms = top_suspicious_rooms(hotel, db_path=db_path)
+        print(f"   排名: {[(r['location'], round(r['score'], 2)) for r in rooms]}")
+        assert [r['location'] for r in rooms] == ['701', '703', '702']
+        for room in rooms:
+            assert abs(room['score'] - _recompute(db_path, hotel, room['location'])) < 1e-9
+
+        room_701 = rooms[0]
+        assert (room_701['scan_count'], room_701['total_macs'], room_701['suspicious_macs']) == (3, 4, 1)
+        # 3次扫描 + 跨度超过24小时: 10 * (1 + 0.2 * 2 + 0.5) + 未知厂商 1
+        assert abs(room_701['score'] - 20.0) < 1e-9
+
+        sightings = list_room_sightings(hotel, '701', suspicious_only=True, db_path=db_path)
+        assert [(s['mac'], s['scan_count']) for s in sightings] == [('24-0A-C4-00-00-01', 3)]
+        assert top_suspicious_rooms('其他酒店', db_path=db_path) == []
+
+    print("\n✅ 房间可疑度评分测试完成！")
+
+
+if __name__ == '__main__':
+    test_incremental_room_scores()
@@ -0,0 +1,68 @@
+"""
+测试结构化日志
+验证级别过滤、key=value / JSON 输出、按类别采样、按key限流及被跳过条数的汇报
+"""
+import sys
+import os
+import io
+import json
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.src.logger import get_logger, configure_logging, flush_logging
+
+
+def _capture(**kwargs):
+    stream = io.StringIO()
+    configure_logging(stream=stream, **kwargs)
+    return stream
+
+
+def test_structured_logger():
+    print("=" * 60)
+    print("🧪 测试结构化日志")
+    print("=" * 60)
+    log = get_logger('test.logger')
+    try:
+        stream = _capture(level='INFO', fmt='text', sampling={}, rate_limit=2, rate_window=60)
+        log.debug('不会输出', camera_id='HW-1')
+        log.info('消息已处理', camera_id='HW-1', topic='camera/x/state', count=3)
+        for _ in range(5):
+            log.warning('未知设备', key='unknown:CAM-X', client_id='CAM-X')
+        flush_logging()
+        lines = stream.getvalue().splitlines()
+        assert len(lines) == 3, lines
+        assert 'INFO' in lines[0] and 'test.logger 消息已处理 camera_id=HW-1 topic=camera/x/state count=3' in lines[0]
+        assert all('未知设备' in line for line in lines[1:])
+        print(f"   ✅ text: {lines[0]}")
+
+        # 限流窗口结束后，下一条附带被跳过的条数
+        stream = _capture(level='INFO', sampling={}, rate_limit=1, rate_window=0.05)
+        for _ in range(3):
+            log.warning('未知设备', key='unknown:CAM-Y')
+        time.sleep(0.06)
+        log.warning('未知设备', key='unknown:CAM-Y')
+        flush_logging()
+        lines = stream.getvalue().splitlines()
+        assert len(lines) == 2 and lines[-1].endswith('suppressed=2'), lines
+
+        stream = _capture(level='DEBUG', fmt='json', sampling={'test.logger': 0.0})
+        log.info('被采样丢弃')
+        log.error('错误不采样', request_id='req_1')
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            log.exception('处理失败', camera_id='HW-2')
+        flush_logging()
+        entries = [json.loads(line) for line in stream.getvalue().splitlines() if line.startswith('{')]
+        assert [e['event'] for e in entries] == ['错误不采样', '处理失败']
+        assert entries[0]['request_id'] == 'req_1' and entries[0]['level'] == 'ERROR'
+        assert 'ValueError: boom' in entries[1]['exception']
+        print(f"   ✅ json: {entries[0]}")
+    finally:
+        configure_logging()
+    print("✅ 结构化日志测试通过")
+
+
+if __name__ == '__main__':
+    test_structured_logger()
@@ -0,0 +1,91 @@
+"""
+测试任务记录归档
+验证超过保留期的记录按月移入归档表、汇总计数正确，归档后的记录仍可查询
+"""
+import sys
+import os
+import tempfile
+from pathlib import Path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.src.sqllite.sqllite_task import init_task_table, apply_task_events, list_tasks
+from app.src.sqllite.sqllite_archive import (
+    init_archive_tables, archive_tasks, compact_database, enable_incremental_vacuum, list_archive_months,
+    list_archived_tasks, get_task_rollup
+)
+
+
+def _task(i, created_at, state='success'):
+    return ('create', {
+        'clientid': f'CAM-{i % 2}',
+        'requestid': f'REQ-ARCHIVE-{i:04d}',
+        'requesttype': 'start_record',
+        'state': state,
+        'created_at': created_at,
+        'updated_at': created_at
+    })
+
+
+def test_archive_tasks(archive_in_separate_file=False):
+    """旧记录分批移入月归档表，新记录留在tasks表"""
+    print("=" * 60)
+    print(f"🧪 测试任务归档（归档文件独立: {archive_in_separate_file}）")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / 'tasks.db'
+        archive_db = Path(tmp) / 'archive.db' if archive_in_separate_file else None
+        init_task_table(db_path)
+        init_archive_tables(db_path)
+        events = [_task(i, f'2026-01-{i % 28 + 1:02d} 10:00:00') for i in range(30)]
+        events += [_task(100 + i, f'2026-02-{i + 1:02d} 10:00:00', 'failed') for i in range(5)]
+        events += [_task(200 + i, '2026-06-01 10:00:00') for i in range(4)]
+        apply_task_events(events, db_path)
+
+        result = archive_tasks('2026-03-01 00:00:00', batch_size=8, archive_db_path=archive_db, db_path=db_path)
+        print(f"   归档结果: {result}")
+        assert result['moved'] == 35
+        assert result['batches'] == 5
+        assert result['months'] == {'202601': 30, '202602': 5}
+
+        remaining = list_tasks(limit=100, db_path=db_path)
+        assert len(remaining) == 4
+        assert list_archive_months(archive_db_path=archive_db, db_path=db_path) == ['202602', '202601']
+
+        # 归档表支持与 list_tasks 相同的游标翻页
+        page1 = list_archived_tasks('202601', clientid='CAM-0', limit=10, archive_db_path=archive_db, db_path=db_path)
+        page2 = list_archived_tasks('202601', clientid='CAM-0', limit=10, before_id=page1[-1]['id'],
+                                    archive_db_path=archive_db, db_path=db_path)
+        assert len(page1) + len(page2) == 15
+        assert page1[0]['id'] > page1[-1]['id'] > page2[0]['id']
+
+        rollup = {(r['month'], r['clientid'], r['state']): r for r in get_task_rollup(db_path=db_path)}
+        assert rollup[('2026-01', 'CAM-0', 'success')]['count'] == 15
+        assert rollup[('2026-02', 'CAM-0', 'failed')]['count'] + rollup[('2026-02', 'CAM-1', 'failed')]['count'] == 5
+        assert rollup[('2026-01', 'CAM-1', 'success')]['first_created'] == '2026-01-02 10:00:00'
+
+        # 再次执行没有可移动的记录
+        assert archive_tasks('2026-03-01 00:00:00', archive_db_path=archive_db, db_path=db_path)['moved'] == 0
+        # 默认未开启 auto_vacuum，空闲页只复用不回收；切换为增量模式后可回收
+        compact = compact_database(db_path)
+        print(f"   空间回收: {compact}")
+        assert compact['auto_vacuum'] == 'none' and not compact['incremental_vacuum']
+        assert enable_incremental_vacuum(db_path) == {'auto_vacuum': 'incremental', 'vacuumed': True}
+        assert enable_incremental_vacuum(db_path)['vacuumed'] is False
+        apply_task_events([_task(300 + i, '2026-01-15 10:00:00') for i in range(200)], db_path)
+        archive_tasks('2026-03-01 00:00:00', archive_db_path=archive_db, db_path=db_path)
+        compact = compact_database(db_path)
+        print(f"   增量回收: {compact}")
+        assert compact['auto_vacuum'] == 'incremental' and compact['freelist_before'] > 0
+        assert compact['freelist_after'] == 0
+
+    print("✅ 任务归档测试通过")
+
+
+def test_archive_to_separate_file():
+    test_archive_tasks(archive_in_separate_file=True)
+
+
+if __name__ == '__main__':
+    test_archive_tasks()
+    test_archive_to_separate_file()
@@ -10,7 +10,8 @@ from app.src.sqllite import init_db, init_task_table, list_tasks, get_device_by_
 from app.src.record_control import (
     create_command_task,
     update_command_task_success,
-    update_command_task_failed
+    update_command_task_failed,
+    task_writer
 )
 
 def test_task_tracking():
@@ -45,7 +46,7 @@ def test_task_tracking():
     
     # 3. 查询任务
     print("\n3️⃣ 查询刚创建的任务...")
-    tasks = list_tasks(clientid=test_client_id, limit=10)
+    tasks = task_writer.list_tasks(clientid=test_client_id, limit=10)
     print(f"✅ 查询到 {len(tasks)} 条任务记录")
     for task in tasks[:3]:  # 只显示前3条
         print(f"   - request_id: {task['requestid']}, type: {task['requesttype']}, state: {task['state']}")
@@ -60,7 +61,7 @@ def test_task_tracking():
     
     # 5. 再次查询验证
     print("\n5️⃣ 验证任务状态更新...")
-    tasks = list_tasks(clientid=test_client_id, limit=10)
+    tasks = task_writer.list_tasks(clientid=test_client_id, limit=10)
     for task in tasks:
         if task['requestid'] == test_request_id:
             print(f"✅ 任务状态: {task['state']}, 描述: {task['description']}")
@@ -84,14 +85,15 @@ def test_task_tracking():
     )
     
     # 验证
-    tasks = list_tasks(clientid=test_client_id, limit=10)
+    tasks = task_writer.list_tasks(clientid=test_client_id, limit=10)
     for task in tasks:
         if task['requestid'] == test_request_id_2:
             print(f"✅ 任务状态: {task['state']}, 描述: {task['description']}")
             break
     
-    # 7. 显示所有任务
+    # 7. 显示所有任务（等待异步写入落库后直接查询数据库）
     print("\n7️⃣ 显示该设备的所有任务...")
+    assert task_writer.flush()
     all_tasks = list_tasks(clientid=test_client_id, limit=50)
     print(f"✅ 共有 {len(all_tasks)} 条任务记录")
     print("\n任务列表:")
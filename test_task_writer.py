@@ -0,0 +1,167 @@
+"""
+测试任务事件批量写入
+验证批量事务、未落库事件的读取叠加以及退出时写完队列
+"""
+import sys
+import os
+import time
+import sqlite3
+import importlib
+import threading
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.src.sqllite import init_task_table, get_task_by_requestid, delete_task
+from app.src.record_control import TaskEventWriter
+
+
+def test_task_writer_batches_and_overlay():
+    """写入后立即可读，多个事件合并成少量事务"""
+    print("=" * 60)
+    print("🧪 测试任务事件批量写入")
+    print("=" * 60)
+
+    init_task_table()
+    writer = TaskEventWriter(linger=0.3)
+    client_id = 'CAM-WRITER-TEST'
+    prefix = f'req_writer_{int(time.time() * 1000)}'
+
+    for i in range(50):
+        writer.create({'clientid': client_id, 'requestid': f'{prefix}_{i}', 'requesttype': 'start_record',
+                       'state': 'calling', 'description': '启动录制命令已下发'})
+    writer.update(f'{prefix}_0', {'state': 'success', 'description': '命令执行成功'})
+
+    # 1. 尚未落库时通过叠加层读取
+    print("\n1️⃣ 落库前读取...")
+    assert get_task_by_requestid(f'{prefix}_0') is None
+    task = writer.get_task(f'{prefix}_0')
+    assert (task['state'], task['requesttype']) == ('success', 'start_record')
+    tasks = writer.list_tasks(clientid=client_id, limit=10)
+    assert [t['requestid'] for t in tasks] == [f'{prefix}_{i}' for i in range(49, 39, -1)]
+
+    # 2. 落库后数据库与叠加层结果一致
+    print("\n2️⃣ 等待落库...")
+    assert writer.flush()
+    stats = writer.stats()
+    print(f"   统计: {stats}")
+    assert stats['pending_requests'] == 0
+    assert stats['events_written'] == 51 and stats['batches'] <= 2
+    assert get_task_by_requestid(f'{prefix}_0')['state'] == 'success'
+
+    # 3. 退出时写完队列中的事件
+    print("\n3️⃣ 关闭写入器...")
+    writer.update(f'{prefix}_1', {'state': 'failed'})
+    writer.close()
+    assert get_task_by_requestid(f'{prefix}_1')['state'] == 'failed'
+    # 关闭后的写入同步落库
+    writer.update(f'{prefix}_2', {'state': 'failed'})
+    assert get_task_by_requestid(f'{prefix}_2')['state'] == 'failed'
+
+    print("\n✅ 任务事件批量写入测试完成！")
+
+
+def test_task_writer_retries_failed_batches():
+    """数据库暂时不可写时事件保留在叠加层并重试，只有真正落库后才通知监听器"""
+    print("\n" + "=" * 60)
+    print("🧪 测试任务写入失败重试")
+    print("=" * 60)
+
+    init_task_table()
+    writer_module = importlib.import_module('app.src.record_control.task_writer')
+    original_apply = writer_module.apply_task_events
+    failures = [2]
+
+    def flaky_apply(events):
+        if failures[0] > 0:
+            failures[0] -= 1
+            raise sqlite3.OperationalError('database is locked')
+        return original_apply(events)
+
+    writer = TaskEventWriter(linger=0.01, max_retries=0)
+    notified = []
+    writer.add_listener(lambda events: notified.extend(event for event, _ in events))
+    request_id = f'req_writer_retry_{int(time.time() * 1000)}'
+    writer_module.apply_task_events = flaky_apply
+    try:
+        writer.create({'clientid': 'CAM-WRITER-TEST', 'requestid': request_id, 'requesttype': 'stop_record',
+                       'state': 'calling', 'description': '停止录制命令已下发'})
+        # 1. 写入失败期间仍可从叠加层读到，flush 不会误报完成
+        assert not writer.flush(timeout=0.03)
+        assert writer.get_task(request_id)['state'] == 'calling' and not notified
+        # 2. 恢复后同一批事件落库，监听器只收到一次
+        assert writer.flush()
+        assert get_task_by_requestid(request_id)['state'] == 'calling'
+        assert [event[0] for event in notified] == ['create']
+        assert writer.stats()['write_errors'] == 2 and writer.stats()['pending_requests'] == 0
+        print("   ✅ 重试后落库")
+
+        # 3. 关闭后仍无法写入的事件记入 dead_letter，叠加层保留
+        writer.close()
+        failures[0] = 10
+        writer.update(request_id, {'state': 'success'})
+        assert len(writer.dead_letter) == 1 and not writer.flush()
+        assert writer.get_task(request_id)['state'] == 'success'
+        assert get_task_by_requestid(request_id)['state'] == 'calling'
+        assert len(notified) == 1
+        print("   ✅ 退出时未写入的事件进入 dead_letter")
+    finally:
+        writer_module.apply_task_events = original_apply
+
+
+def test_task_writer_filters_pending_updates():
+    """按 state 过滤时使用叠加后的状态：已落库任务的待落库修改决定它出现在哪个结果中，且每页数量不变"""
+    print("\n" + "=" * 60)
+    print("🧪 测试按状态过滤未落库的修改")
+    print("=" * 60)
+
+    init_task_table()
+    writer_module = importlib.import_module('app.src.record_control.task_writer')
+    original_apply = writer_module.apply_task_events
+    gate = threading.Event()
+
+    def gated_apply(events):
+        gate.wait(5)
+        return original_apply(events)
+
+    writer = TaskEventWriter(linger=0.01)
+    client_id = 'CAM-WRITER-FILTER'
+    prefix = f'req_writer_filter_{int(time.time() * 1000)}'
+    for i in range(6):
+        writer.create({'clientid': client_id, 'requestid': f'{prefix}_{i}', 'requesttype': 'start_record',
+                       'state': 'sent', 'description': '启动录制命令已下发'})
+    assert writer.flush()
+    ids = {t['requestid']: t['id'] for t in writer.list_tasks(clientid=client_id, limit=10)}
+
+    writer_module.apply_task_events = gated_apply
+    try:
+        writer.update(f'{prefix}_1', {'state': 'success'})
+        writer.update(f'{prefix}_4', {'state': 'success'})
+        assert get_task_by_requestid(f'{prefix}_4')['state'] == 'sent'
+
+        tasks = writer.list_tasks(clientid=client_id, state='success')
+        assert [t['requestid'] for t in tasks] == [f'{prefix}_4', f'{prefix}_1']
+        tasks = writer.list_tasks(clientid=client_id, state='success', before_id=ids[f'{prefix}_4'])
+        assert [t['requestid'] for t in tasks] == [f'{prefix}_1']
+
+        # 改为 success 的行不再出现在 sent 中，每页仍返回 limit 条，游标连续
+        page = writer.list_tasks(clientid=client_id, state='sent', limit=2)
+        assert [t['requestid'] for t in page] == [f'{prefix}_5', f'{prefix}_3']
+        page = writer.list_tasks(clientid=client_id, state='sent', limit=2, before_id=page[-1]['id'])
+        assert [t['requestid'] for t in page] == [f'{prefix}_2', f'{prefix}_0']
+        print("   ✅ 过滤结果包含未落库的状态修改")
+    finally:
+        gate.set()
+        writer_module.apply_task_events = original_apply
+    try:
+        assert writer.flush()
+        assert [t['requestid'] for t in writer.list_tasks(clientid=client_id, state='success')] == \
+            [f'{prefix}_4', f'{prefix}_1']
+    finally:
+        writer.close()
+        for i in range(6):
+            delete_task(f'{prefix}_{i}')
+
+
+if __name__ == '__main__':
+    test_task_writer_batches_and_overlay()
+    test_task_writer_retries_failed_batches()
+    test_task_writer_filters_pending_updates()
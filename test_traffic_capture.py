@@ -0,0 +1,134 @@
+"""
+测试MQTT入站流量抓包和回放
+抓包文件按大小滚动分段、可按顺序读回（忽略末尾不完整的记录），
+回放的消息经 handle_message 走与监听器相同的处理逻辑；
+抓包接口只能在抓包根目录内创建目录
+"""
+import sys
+import os
+import json
+import time
+import tempfile
+from unittest import mock
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from app.routes import main
+from app.src.monitor_cam.traffic_capture import MAGIC
+from app.src.monitor_cam import TrafficCapture, traffic_capture, read_capture, handle_message, device_status_manager, pipeline_metrics
+from app.src.sqllite import init_db, insert_device, delete_device
+from replay_capture import replay
+
+
+def test_capture_segments():
+    print("=" * 60)
+    print("🧪 测试抓包分段写入和读取")
+    print("=" * 60)
+    with tempfile.TemporaryDirectory() as directory:
+        capture = TrafficCapture()
+        capture.record('camera/CAM-1/state', b'ignored')  # 未开启时不记录
+        capture.start(directory, segment_bytes=4096, max_segments=0)
+        payload = json.dumps({'status': 'online', 'pad': 'x' * 500}).encode()
+        base = 1700000000.0
+        for i in range(40):
+            capture.record(f'camera/CAM-{i}/state', payload, base + i * 2)
+        status = capture.stop()
+        assert status['messages'] == 40 and not status['enabled']
+        assert len(status['segments']) >= 4
+        records = list(read_capture(directory))
+        assert [r[1] for r in records] == [f'camera/CAM-{i}/state' for i in range(40)]
+        assert records[5] == (base + 10, 'camera/CAM-5/state', payload)
+        print(f"✅ 40 条消息写入 {len(status['segments'])} 个分段并按序读回")
+
+        # 末尾不完整的记录被忽略
+        last = [p for p in status['segments'] if os.path.getsize(p) > len(MAGIC)][-1]
+        size = os.path.getsize(last)
+        with open(last, 'r+b') as f:
+            f.truncate(size - 10)
+        assert len(list(read_capture(directory))) == 39
+
+        # 超出保留分段数时删除最早的分段
+        capture.start(os.path.join(directory, 'ring'), segment_bytes=4096, max_segments=2)
+        for i in range(40):
+            capture.record('camera/CAM-1/state', payload, base + i * 2)
+        status = capture.stop()
+        assert len(status['segments']) == 2
+        assert sorted(os.listdir(os.path.join(directory, 'ring'))) == [os.path.basename(p) for p in status['segments']]
+        print("✅ 截断记录被忽略，分段数上限生效")
+
+        # 滚动到新分段时无法创建文件：停止抓包，record 不抛出异常，已写入的记录仍可读回
+        capture.start(os.path.join(directory, 'broken'), segment_bytes=4096)
+        module = sys.modules[TrafficCapture.__module__]
+        with mock.patch.object(module, 'open', create=True, side_effect=OSError('disk full')):
+            for i in range(40):
+                capture.record('camera/CAM-1/state', payload, base + i * 2)
+        status = capture.stop()
+        assert not status['enabled'] and status['messages'] < 40
+        assert len(list(read_capture(os.path.join(directory, 'broken')))) == status['messages']
+        print("✅ 分段滚动失败时停止抓包")
+
+
+def test_capture_route_directory():
+    print("\n" + "=" * 60)
+    print("🧪 测试抓包接口的目录限制")
+    print("=" * 60)
+    app = Flask(__name__)
+    app.register_blueprint(main)
+    client = app.test_client()
+    client.environ_base['HTTP_X_ADMIN_TOKEN'] = 'test-admin-token'
+    with tempfile.TemporaryDirectory() as directory:
+        base = os.path.join(directory, 'captures')
+        os.makedirs(base)
+        os.symlink(directory, os.path.join(base, 'escape'))
+        env = {'CAMLINK_ADMIN_TOKEN': 'test-admin-token', 'MQTT_CAPTURE_DIR': base}
+        with mock.patch.dict(os.environ, env):
+            for bad in ('../outside', '/tmp/camlink-capture', 'a/../../outside', 'escape/inside'):
+                resp = client.post('/api/admin/capture/start', query_string={'dir': bad})
+                assert resp.status_code == 400, bad
+            assert not os.path.exists(os.path.join(directory, 'outside'))
+            assert not os.path.exists(os.path.join(directory, 'inside'))
+            try:
+                resp = client.post('/api/admin/capture/start', query_string={'dir': 'run-1'})
+                assert resp.status_code == 200 and resp.get_json()['enabled']
+                assert os.path.realpath(resp.get_json()['directory']) == os.path.realpath(os.path.join(base, 'run-1'))
+            finally:
+                traffic_capture.stop()
+    print("✅ 只能在抓包根目录内创建抓包目录")
+
+
+def test_replay_through_handler():
+    print("\n" + "=" * 60)
+    print("🧪 测试回放经监听器处理")
+    print("=" * 60)
+    init_db()
+    hardware_id, client_id = 'REPLAYTEST-HW-1', 'REPLAYTEST-CAM-1'
+    delete_device(hardware_id)
+    insert_device({'hardware_id': hardware_id, 'client_id': client_id, 'hotel': 'Replay Test', 'location': '101'})
+    base = time.time()
+    records = [
+        (base, f'camera/{client_id}/state', json.dumps({'status': 'online', 'run_state': 'stopped'}).encode()),
+        (base + 0.05, f'camera/{client_id}/state', json.dumps({'status': 'online', 'run_state': 'recording'}).encode()),
+        (base + 0.1, 'camera/REPLAYTEST-UNKNOWN/state', b'{"status": "online"}'),
+    ]
+    try:
+        before = pipeline_metrics.stats()
+        count, elapsed, lags = replay(records, handle_message, speed=1.0)
+        assert count == 3 and elapsed >= 0.09 and len(lags) == 3
+        after = pipeline_metrics.stats()
+        assert after['messages']['state'] - before['messages']['state'] == 3
+        assert after['unknown_client_messages'] - before['unknown_client_messages'] == 1
+        assert device_status_manager.get_status(hardware_id)['run_state'] == 'recording'
+        print(f"✅ 原速回放 3 条用时 {elapsed * 1000:.0f}ms，设备状态已更新")
+
+        count, elapsed, lags = replay(records, handle_message, speed=0, repeat=5)
+        assert count == 15 and not lags and elapsed < 0.1 * 5
+        print(f"✅ 最快速度回放 {count} 条用时 {elapsed * 1000:.1f}ms")
+    finally:
+        delete_device(hardware_id)
+
+
+if __name__ == '__main__':
+    test_capture_segments()
+    test_capture_route_directory()
+    test_replay_through_handler()
+    print("\n🎉 全部测试通过")
@@ -0,0 +1,123 @@
+"""
+测试上传调度器
+验证按站点限流、按文件大小的排队优先级和完成后释放名额（上报的文件名按规范化后匹配）
+"""
+import sys
+import os
+import time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.src.sqllite import init_db, insert_device, get_device
+from app.src.mqtt.upload_scheduler import UploadScheduler
+from app.src.video_manage import video_list_manager
+
+
+class FakePublisher:
+    """记录下发的上传命令，不连接MQTT"""
+
+    def __init__(self):
+        self.sent = []
+
+    def upload_file(self, camera_id, file_name_list, request_id=None):
+        self.sent.append((camera_id, request_id))
+        return (True, request_id)
+
+
+def _ensure_device(hardware_id, hotel):
+    if not get_device(hardware_id):
+        insert_device({
+            'hardware_id': hardware_id,
+            'client_id': f'CAM-TEST-{hardware_id}',
+            'hotel': hotel,
+            'location': '测试房间'
+        })
+
+
+def test_upload_scheduler():
+    """测试站点并发上限与名额释放"""
+    print("=" * 60)
+    print("🧪 测试上传调度器")
+    print("=" * 60)
+
+    init_db()
+    hotel = '调度测试酒店'
+    for i in range(4):
+        _ensure_device(f'HW-SCHED-{i}', hotel)
+    _ensure_device('HW-SCHED-OTHER', '另一家酒店')
+
+    publisher = FakePublisher()
+    scheduler = UploadScheduler(publisher=publisher, max_per_site=2)
+
+    # 1. 前两个请求立即下发，后两个排队
+    print("\n1️⃣ 同一站点提交4个上传请求...")
+    results = [
+        scheduler.submit(f'HW-SCHED-{i}', [f'vid_{i}'], f'req_sched_{i}_{int(time.time() * 1000)}')
+        for i in range(4)
+    ]
+    for ok, req_id, position in results:
+        print(f"   - {req_id}: accepted={ok}, position={position}")
+    assert [r[2] for r in results] == [0, 0, 1, 2]
+    assert len(publisher.sent) == 2
+
+    # 2. 其他站点不受影响
+    print("\n2️⃣ 其他站点提交上传请求...")
+    ok, _, position = scheduler.submit('HW-SCHED-OTHER', ['vid_x'])
+    assert ok and position == 0
+    assert len(publisher.sent) == 3
+
+    # 3. 上传完成后释放名额，排队的请求自动下发（上报的文件名带目录、扩展名且大小写不同）
+    print("\n3️⃣ 模拟第一个上传完成...")
+    scheduler.on_progress('HW-SCHED-0', {'/sdcard/DCIM/VID_0.mp4': 0.5})
+    assert scheduler.get_job(results[0][1])['progress'] == {'vid_0': 0.5}
+    scheduler.on_progress('HW-SCHED-0', {'/sdcard/DCIM/VID_0.mp4': 1.0}, results[0][1])
+    time.sleep(0.2)
+    assert scheduler.get_job(results[0][1])['state'] == 'completed'
+    assert scheduler.get_job(results[2][1])['state'] == 'uploading'
+    assert len(publisher.sent) == 4
+
+    # 4. 命令失败同样释放名额
+    print("\n4️⃣ 模拟第二个上传命令失败...")
+    scheduler.on_command_failed(results[1][1])
+    time.sleep(0.2)
+    assert scheduler.get_job(results[3][1])['state'] == 'uploading'
+    assert len(publisher.sent) == 5
+
+    print("\n" + "=" * 60)
+    print("✅ 上传调度器测试完成！")
+    print("=" * 60)
+
+
+def test_upload_priority_by_size():
+    """排队时小文件优先：后提交的小文件先于先提交的大文件下发"""
+    print("\n" + "=" * 60)
+    print("🧪 测试按文件大小排队")
+    print("=" * 60)
+
+    init_db()
+    hotel = '调度优先级测试酒店'
+    for i in range(3):
+        _ensure_device(f'HW-SCHED-PRIO-{i}', hotel)
+    mb = 1024 * 1024
+    video_list_manager.store_video_list('req-sched-prio-1', 'HW-SCHED-PRIO-1', [{'file_name': 'big.mp4', 'size': 500 * mb}])
+    video_list_manager.store_video_list('req-sched-prio-2', 'HW-SCHED-PRIO-2', [{'file_name': 'small.mp4', 'size': mb}])
+
+    publisher = FakePublisher()
+    scheduler = UploadScheduler(publisher=publisher, max_per_site=1)
+    suffix = int(time.time() * 1000)
+    assert scheduler.submit('HW-SCHED-PRIO-0', ['first'], f'req_prio_first_{suffix}')[2] == 0
+    big = scheduler.submit('HW-SCHED-PRIO-1', ['big'], f'req_prio_big_{suffix}')
+    small = scheduler.submit('HW-SCHED-PRIO-2', ['small'], f'req_prio_small_{suffix}')
+    # 小文件提交时直接排到大文件前面
+    assert big[2] == 1 and small[2] == 1
+    assert scheduler.get_queue_position(small[1]) == 1 and scheduler.get_queue_position(big[1]) == 2
+
+    scheduler.on_progress('HW-SCHED-PRIO-0', {'first': 1.0})
+    time.sleep(0.2)
+    assert [request_id for _, request_id in publisher.sent] == [f'req_prio_first_{suffix}', small[1]]
+    assert scheduler.get_job(big[1])['state'] == 'queued'
+    print("   ✅ 后提交的小文件先下发")
+
+
+if __name__ == '__main__':
+    test_upload_scheduler()
+    test_upload_priority_by_size()
@@ -0,0 +1,172 @@
+"""
+测试本地MQTT Broker替身和虚拟摄像头群
+paho客户端经 Broker 互发消息（通配符订阅、QoS 1 确认），虚拟设备按协议响应各类命令、
+上报状态和上传进度，并能在设备表中批量登记
+"""
+import sys
+import os
+import json
+import time
+import threading
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from paho.mqtt import client as mqtt_client
+from app.src.mqtt.local_broker import LocalMqttBroker, topic_matches
+from app.src.mqtt.virtual_fleet import VirtualFleet
+from app.src.sqllite import init_db, get_device_by_client_id, delete_device
+
+
+def _wait(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def _client(broker, client_id, topics=(), on_message=None):
+    subscribed = threading.Event()
+    client = mqtt_client.Client(client_id=client_id)
+    client.on_connect = lambda c, u, f, rc: c.subscribe(list(topics)) if topics else subscribed.set()
+    client.on_subscribe = lambda *args: subscribed.set()
+    client.on_message = on_message
+    client.connect(broker.host, broker.port)
+    client.loop_start()
+    assert subscribed.wait(5)
+    return client
+
+
+def test_local_broker():
+    print("=" * 60)
+    print("🧪 测试本地MQTT Broker替身")
+    print("=" * 60)
+    assert topic_matches('camera/+/resp', 'camera/CAM-1/resp')
+    assert not topic_matches('camera/+/resp', 'camera/CAM-1/state')
+    assert topic_matches('camera/#', 'camera/CAM-1/upload_file_status')
+    assert not topic_matches('camera/+', 'camera/CAM-1/resp')
+
+    broker = LocalMqttBroker().start()
+    received, acked = [], []
+    sub = _client(broker, 'test-sub', [('camera/+/resp', 1)], lambda c, u, m: received.append((m.topic, m.payload, m.qos)))
+    pub = _client(broker, 'test-pub')
+    pub.on_publish = lambda c, u, mid, *args: acked.append(mid)
+    local = []
+    broker.subscribe('camera/+/state', lambda topic, payload: local.append(payload))
+    try:
+        pub.publish('camera/CAM-1/resp', b'{"result": "success"}', qos=1)
+        pub.publish('camera/CAM-1/state', b'{"status": "online"}', qos=0)
+        pub.publish('camera/CAM-1/other', b'ignored', qos=0)
+        broker.publish('camera/CAM-2/resp', b'from-broker', qos=1)
+        assert _wait(lambda: len(received) == 2 and len(acked) == 3 and local and broker.stats()['messages_in'] == 4)
+        assert ('camera/CAM-1/resp', b'{"result": "success"}', 1) in received
+        assert ('camera/CAM-2/resp', b'from-broker', 1) in received
+        assert local == [b'{"status": "online"}']
+        stats = broker.stats()
+        assert stats['clients'] == 2 and stats['messages_out'] == 3 and stats['dropped'] == 0
+        print(f"✅ 路由和确认正常: {stats}")
+    finally:
+        sub.disconnect()
+        pub.disconnect()
+        broker.stop()
+
+
+def test_virtual_fleet():
+    print("\n" + "=" * 60)
+    print("🧪 测试虚拟摄像头群")
+    print("=" * 60)
+    broker = LocalMqttBroker().start()
+    fleet = VirtualFleet(20, prefix='FLEETTEST', hotels=4, state_interval=0.2, response_delay=(0, 0.01),
+                         upload_step=0.5, upload_interval=0.05, seed=7)
+    fleet.attach(broker)
+    messages = []
+    server = _client(broker, 'test-server', [('camera/+/resp', 1), ('camera/+/state', 0),
+                                             ('camera/+/upload_file_status', 0)],
+                     lambda c, u, m: messages.append((m.topic.split('/')[1], m.topic.split('/')[2], json.loads(m.payload))))
+    fleet.start()
+    try:
+        # 所有设备在一个间隔内错开上报状态
+        assert _wait(lambda: len({cid for cid, kind, _ in messages if kind == 'state'}) == 20)
+        state = next(data for _, kind, data in messages if kind == 'state')
+        assert state['status'] == 'online' and 'timestamp' in state and 0 < state['electric_percent'] <= 1
+        print("✅ 20 台设备均已上报状态")
+
+        camera = next(iter(fleet.cameras.values()))
+        topic = f'camera/{camera.client_id}/cmd'
+
+        def command(action, **extra):
+            request_id = f'fleet-test-{action}'
+            server.publish(topic, json.dumps({'action': action, 'request_id': request_id, **extra}), qos=1)
+            assert _wait(lambda: any(kind == 'resp' and data.get('request_id') == request_id
+                                     for _, kind, data in messages))
+            return next(data for _, kind, data in messages if kind == 'resp' and data.get('request_id') == request_id)
+
+        assert command('start_record', pre_name='702房间') == {'request_id': 'fleet-test-start_record',
+                                                             'result': 'success', 'error_code': 0}
+        assert camera.run_state == 'recording'
+        assert command('stop_record')['result'] == 'success' and camera.run_state == 'stopped'
+        videos = command('list_videos', params={'min_size': 0})['videos']
+        assert videos and videos[-1]['file_name'].endswith('_702房间.mp4')
+        assert set(videos[0]) == {'file_name', 'start_time', 'duration', 'size'}
+        print(f"✅ 录制控制和视频列表（{len(videos)} 个视频）")
+
+        file_name = videos[0]['file_name']
+        assert command('upload_file', params={'file_name_list': [file_name]})['result'] == 'success'
+        assert _wait(lambda: any(kind == 'upload_file_status' and data['file_upload_progress'][file_name] == 1.0
+                                 for _, kind, data in messages))
+        progress = [data['file_upload_progress'][file_name] for _, kind, data in messages if kind == 'upload_file_status']
+        assert progress == [0.5, 1.0]
+        status = command('get_upload_status', params={'file_name_list': [file_name]})
+        assert status['file_list_upload_progress'] == {file_name: 1.0}
+        assert command('get_status')['run_state'] == 'stopped'
+        print("✅ 上传进度上报和查询")
+
+        # 未知设备的命令不回复
+        server.publish('camera/CAM-unknown/cmd', json.dumps({'action': 'get_status', 'request_id': 'x'}), qos=1)
+        assert _wait(lambda: fleet.stats()['unknown_commands'] == 1)
+    finally:
+        fleet.stop()
+        server.disconnect()
+        broker.stop()
+
+    # 失败比例为1时控制类命令全部回复失败
+    broker = LocalMqttBroker().start()
+    failing = VirtualFleet(1, prefix='FLEETFAIL', state_interval=0, response_delay=(0, 0), fail_rate=1.0)
+    failing.attach(broker)
+    replies = []
+    broker.subscribe('camera/+/resp', lambda topic, payload: replies.append(json.loads(payload)))
+    failing.start()
+    try:
+        client_id = next(iter(failing.cameras))
+        broker.publish(f'camera/{client_id}/cmd', json.dumps({'action': 'start_record', 'request_id': 'f1'}).encode())
+        assert _wait(lambda: replies)
+        assert replies[0]['result'] == 'failed' and replies[0]['error_code'] == 101
+        print("✅ 模拟命令失败")
+    finally:
+        failing.stop()
+        broker.stop()
+
+
+def test_seed_devices():
+    print("\n" + "=" * 60)
+    print("🧪 测试虚拟设备批量登记")
+    print("=" * 60)
+    init_db()
+    fleet = VirtualFleet(50, prefix='SEEDTEST', hotels=5, seed=1)
+    try:
+        assert fleet.seed_devices(chunk_size=20) == {'total': 50, 'created': 50, 'exists': 0}
+        assert fleet.seed_devices()['exists'] == 50
+        camera = next(iter(fleet.cameras.values()))
+        device = get_device_by_client_id(camera.client_id)
+        assert device['hardware_id'] == camera.hardware_id and device['hotel'].startswith('SEEDTEST Hotel')
+        print("✅ 50 台设备已登记，重复登记不覆盖")
+    finally:
+        for hardware_id in fleet.hardware_ids():
+            delete_device(hardware_id)
+
+
+if __name__ == '__main__':
+    test_local_broker()
+    test_virtual_fleet()
+    test_seed_devices()
+    print("\n🎉 全部测试通过")